@@ -0,0 +1,440 @@
+"""
+异步提示词优化客户端
+在专用事件循环中并发调用 DeepSeek：信号量限制并发、连接池保持长连接、相同请求合并为一次上游调用
+"""
+
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import requests
+
+import prompt_optimizer
+from circuit_breaker import CircuitBreaker
+from prompt_optimizer import (
+    PROMPT_FIELD_NAMES,
+    _build_optimization_prompt,
+    _simple_combine,
+    get_api_settings,
+    optimization_cache_key,
+    request_optimized_prompt,
+    request_packed_prompts,
+)
+
+
+class AsyncPromptOptimizer:
+    """
+    异步提示词优化客户端
+
+    所有调用方（协程或 Flask 请求线程）共享同一个后台事件循环，
+    因此并发上限与请求合并在整个进程内生效。
+    """
+
+    def __init__(self, max_concurrency: int = 8, connect_timeout: float = 5.0, latency_budget: float = 30.0,
+                 hedge: bool = False, breaker: Optional[CircuitBreaker] = None):
+        """
+        初始化客户端
+
+        Args:
+            max_concurrency: 同时进行的上游请求数量，同时也是连接池大小
+            connect_timeout: 连接超时（秒）
+            latency_budget: 单次优化（含对冲请求）的总耗时预算（秒），超出后降级
+            hedge: 是否在超过近期 p95 延迟仍未返回时发送一个对冲请求
+            breaker: 熔断器，默认与同步优化路径共用 prompt_optimizer.deepseek_breaker
+        """
+        self._max_concurrency = max(1, max_concurrency)
+        self._connect_timeout = connect_timeout
+        self._latency_budget = latency_budget
+        self._hedge = hedge
+        self._breaker = breaker or prompt_optimizer.deepseek_breaker
+        self._session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=2, pool_maxsize=self._max_concurrency, max_retries=0
+        )
+        self._session.mount("https://", adapter)
+        self._session.mount("http://", adapter)
+        # requests 是阻塞调用，放在与并发上限同样大小的线程池中执行，保证信号量就是真实并发数。
+        self._executor = ThreadPoolExecutor(
+            max_workers=self._max_concurrency, thread_name_prefix="prompt-http"
+        )
+        # 缓存读写是 SQLite 磁盘 I/O，放在单独的小线程池中，不阻塞事件循环，也不占用 HTTP 线程。
+        self._cache_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="prompt-cache")
+        self._lock = threading.Lock()
+        self._loop = None
+        self._loop_thread = None
+        self._semaphore = None
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        self._stats = {
+            "requests": 0, "upstream_calls": 0, "coalesced": 0, "cache_hits": 0, "fallbacks": 0,
+            "short_circuited": 0, "hedged": 0, "budget_exceeded": 0,
+            "packed_calls": 0, "packed_items": 0, "pack_repairs": 0,
+        }
+
+    # ---------- 事件循环 ----------
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                ready = threading.Event()
+
+                def run():
+                    asyncio.set_event_loop(loop)
+                    self._semaphore = asyncio.Semaphore(self._max_concurrency)
+                    loop.call_soon(ready.set)
+                    loop.run_forever()
+
+                self._loop_thread = threading.Thread(target=run, name="prompt-optimizer-loop", daemon=True)
+                self._loop_thread.start()
+                ready.wait()
+                self._loop = loop
+            return self._loop
+
+    async def _cache_get(self, cache_keys):
+        """在缓存线程池中依次查询多个键，返回与输入顺序一致的结果。"""
+        cache = prompt_optimizer.prompt_cache
+        return await asyncio.get_running_loop().run_in_executor(
+            self._cache_executor, lambda: [cache.get(cache_key) for cache_key in cache_keys]
+        )
+
+    async def _cache_put(self, cache_key, value):
+        await asyncio.get_running_loop().run_in_executor(
+            self._cache_executor, prompt_optimizer.prompt_cache.put, cache_key, value
+        )
+
+    def _run_blocking(self, coroutine):
+        loop = self._ensure_loop()
+        return asyncio.run_coroutine_threadsafe(coroutine, loop).result()
+
+    # ---------- 协程接口 ----------
+
+    async def optimize(self, prompt: str, **fields: str) -> Tuple[str, str]:
+        """
+        优化单个提示词
+
+        Args:
+            prompt: 原始提示词
+            **fields: art_style、character 等，与 optimize_with_custom_input 参数一致
+
+        Returns:
+            (优化后的提示词, 来源)，来源为 "api"、"cache" 或 "fallback"
+        """
+        loop = self._ensure_loop()
+        if asyncio.get_running_loop() is not loop:
+            return await asyncio.wrap_future(
+                asyncio.run_coroutine_threadsafe(self.optimize(prompt, **fields), loop)
+            )
+
+        values = [fields.get(name, "") or "" for name in PROMPT_FIELD_NAMES]
+        self._stats["requests"] += 1
+
+        api_key, api_url = get_api_settings()
+        if not api_key:
+            self._stats["fallbacks"] += 1
+            return _simple_combine(prompt, *values), "fallback"
+
+        cache_key = optimization_cache_key(prompt, *values)
+        cached_prompt, = await self._cache_get([cache_key])
+        if cached_prompt:
+            self._stats["cache_hits"] += 1
+            return cached_prompt, "cache"
+
+        # 相同请求正在进行时直接等待其结果（singleflight）。
+        future = self._in_flight.get(cache_key)
+        if future is not None:
+            self._stats["coalesced"] += 1
+        else:
+            future = loop.create_future()
+            self._in_flight[cache_key] = future
+            loop.create_task(self._fetch(cache_key, future, _build_optimization_prompt(prompt, *values),
+                                         api_key, api_url))
+
+        optimized_prompt = await asyncio.shield(future)
+        if optimized_prompt is None:
+            self._stats["fallbacks"] += 1
+            return _simple_combine(prompt, *values), "fallback"
+        return optimized_prompt, "api"
+
+    async def _fetch(self, cache_key, future, optimization_prompt, api_key, api_url):
+        optimized_prompt = None
+        try:
+            if not self._breaker.allow_request():
+                self._stats["short_circuited"] += 1
+            else:
+                optimized_prompt = await self._call_with_hedging(
+                    functools.partial(self._request, optimization_prompt, api_key, api_url)
+                )
+                await self._cache_put(cache_key, optimized_prompt)
+        except asyncio.TimeoutError:
+            self._stats["budget_exceeded"] += 1
+            print("⚠️ 提示词优化超出延迟预算,使用简单组合方式")
+        except Exception as error:
+            print(f"⚠️ 异步提示词优化失败,使用简单组合方式: {error}")
+        finally:
+            self._in_flight.pop(cache_key, None)
+            if not future.done():
+                future.set_result(optimized_prompt)
+
+    async def _call_with_hedging(self, request, hedge=True, weight=1):
+        """
+        在延迟预算内获取结果
+
+        主请求超过近期 p95 延迟仍未返回（或很快失败）时，再发送一个对冲请求，取先成功者。
+
+        Args:
+            request: 阻塞的请求函数，参数为读取超时
+            hedge: 是否允许对冲
+            weight: 一次请求包含的提示词条数，熔断器按条数折算延迟
+        """
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        deadline = start + self._latency_budget
+        hedge_at = None
+        if self._hedge and hedge:
+            p95 = self._breaker.latency_percentile(0.95)
+            if p95 is not None:
+                hedge_at = start + p95
+
+        attempts = {loop.create_task(self._attempt(request, deadline, weight))}
+        last_error = None
+        try:
+            while attempts:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                wait_timeout = remaining
+                if hedge_at is not None:
+                    wait_timeout = max(0.0, min(remaining, hedge_at - loop.time()))
+                done, attempts = await asyncio.wait(
+                    attempts, timeout=wait_timeout, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    last_error = task.exception()
+                if hedge_at is not None and (done or loop.time() >= hedge_at):
+                    hedge_at = None
+                    if self._breaker.allow_request():
+                        self._stats["hedged"] += 1
+                        attempts.add(loop.create_task(self._attempt(request, deadline, weight)))
+        finally:
+            for task in attempts:
+                task.cancel()
+        if last_error is not None:
+            raise last_error
+        raise asyncio.TimeoutError()
+
+    async def _attempt(self, request, deadline, weight=1):
+        loop = asyncio.get_running_loop()
+        call = None
+        start = loop.time()
+        try:
+            await self._semaphore.acquire()
+            try:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    raise asyncio.TimeoutError()
+                call = self._executor.submit(request, remaining)
+            except BaseException:
+                self._semaphore.release()
+                raise
+            # 被取消的请求仍在 HTTP 线程中运行，名额一直占用到它真正结束，
+            # 后续请求不会在线程池中排队，排队时间也不会被计入上游延迟。
+            call.add_done_callback(lambda _call: self._release_slot(loop))
+            self._stats["upstream_calls"] += 1
+            start = loop.time()
+            result = await asyncio.wrap_future(call)
+        except BaseException as error:
+            # 每条退出路径都要告知熔断器，否则半开状态的探测名额会一直被占用。
+            if call is None:
+                # 请求没有发出（等待名额时被取消或已超出预算），不计入上游统计。
+                self._breaker.release_probe()
+            elif not isinstance(error, asyncio.CancelledError) or loop.time() >= deadline:
+                # 超出预算被取消的请求计为失败；输给对冲请求而被取消的不计入统计。
+                self._breaker.record_failure((loop.time() - start) / weight)
+            raise
+        self._breaker.record_success((loop.time() - start) / weight)
+        return result
+
+    def _release_slot(self, loop):
+        try:
+            loop.call_soon_threadsafe(self._semaphore.release)
+        except RuntimeError:
+            # 事件循环已关闭（客户端正在关闭），名额不再需要归还。
+            pass
+
+    def _request(self, optimization_prompt, api_key, api_url, read_timeout):
+        timeout = (min(self._connect_timeout, read_timeout), read_timeout)
+        return request_optimized_prompt(
+            optimization_prompt, api_key, api_url, session=self._session, timeout=timeout
+        )
+
+    def _request_pack(self, optimization_prompts, api_key, api_url, read_timeout):
+        timeout = (min(self._connect_timeout, read_timeout), read_timeout)
+        return request_packed_prompts(
+            optimization_prompts, api_key, api_url, session=self._session, timeout=timeout
+        )
+
+    async def optimize_many(self, specs: Sequence[Dict[str, str]]) -> List[Tuple[str, str]]:
+        """
+        并发优化一批提示词，结果顺序与输入一致
+
+        Args:
+            specs: 每项为包含 prompt 及可选字段的字典
+        """
+        return await asyncio.gather(*(
+            self.optimize(spec.get("prompt", ""), **{name: spec.get(name, "") for name in PROMPT_FIELD_NAMES})
+            for spec in specs
+        ))
+
+    async def optimize_packed(self, specs: Sequence[Dict[str, str]], pack_size: int = 8) -> List[Tuple[str, str]]:
+        """
+        打包优化一批提示词：每 pack_size 条未命中缓存的提示词合并为一次请求
+
+        返回内容中格式不正确的条目单独重新请求；整包请求失败时这些条目直接使用本地组合。
+        结果顺序与输入一致，与 optimize_many 相同。
+        """
+        loop = self._ensure_loop()
+        if asyncio.get_running_loop() is not loop:
+            return await asyncio.wrap_future(
+                asyncio.run_coroutine_threadsafe(self.optimize_packed(specs, pack_size), loop)
+            )
+
+        items = [
+            (spec.get("prompt", "") or "", [spec.get(name, "") or "" for name in PROMPT_FIELD_NAMES])
+            for spec in specs
+        ]
+        self._stats["requests"] += len(items)
+
+        api_key, api_url = get_api_settings()
+        if not api_key:
+            self._stats["fallbacks"] += len(items)
+            return [(_simple_combine(prompt, *values), "fallback") for prompt, values in items]
+
+        results = [None] * len(items)
+        waiting = {}
+        pending = {}
+        cache_keys = [optimization_cache_key(prompt, *values) for prompt, values in items]
+        cached_prompts = await self._cache_get(cache_keys)
+        for index, (cache_key, cached_prompt) in enumerate(zip(cache_keys, cached_prompts)):
+            if cached_prompt:
+                self._stats["cache_hits"] += 1
+                results[index] = (cached_prompt, "cache")
+                continue
+            # 批内重复项与其他调用方正在进行的相同请求都只等待同一个结果。
+            future = self._in_flight.get(cache_key)
+            if future is None:
+                future = loop.create_future()
+                self._in_flight[cache_key] = future
+                pending[cache_key] = (future, _build_optimization_prompt(items[index][0], *items[index][1]))
+            elif cache_key not in pending:
+                self._stats["coalesced"] += 1
+            waiting[index] = future
+
+        entries = [(cache_key, future, text) for cache_key, (future, text) in pending.items()]
+        size = max(1, pack_size)
+        await asyncio.gather(*(
+            self._fetch_pack(entries[start:start + size], api_key, api_url)
+            for start in range(0, len(entries), size)
+        ))
+
+        for index, future in waiting.items():
+            optimized_prompt = await asyncio.shield(future)
+            if optimized_prompt is None:
+                self._stats["fallbacks"] += 1
+                results[index] = (_simple_combine(items[index][0], *items[index][1]), "fallback")
+            else:
+                results[index] = (optimized_prompt, "api")
+        return results
+
+    async def _fetch_pack(self, entries, api_key, api_url):
+        if len(entries) == 1:
+            await self._fetch(*entries[0], api_key, api_url)
+            return
+
+        answers = [None] * len(entries)
+        repair = False
+        try:
+            if not self._breaker.allow_request():
+                self._stats["short_circuited"] += 1
+            else:
+                self._stats["packed_calls"] += 1
+                self._stats["packed_items"] += len(entries)
+                # 打包请求耗时随条数增长，不参与基于单条 p95 的对冲。
+                answers = await self._call_with_hedging(
+                    functools.partial(self._request_pack, [text for _, _, text in entries], api_key, api_url),
+                    hedge=False, weight=len(entries),
+                )
+                repair = True
+        except asyncio.TimeoutError:
+            self._stats["budget_exceeded"] += 1
+            print("⚠️ 打包优化超出延迟预算,使用简单组合方式")
+        except Exception as error:
+            print(f"⚠️ 打包优化失败,使用简单组合方式: {error}")
+
+        repairs = []
+        for (cache_key, future, text), optimized_prompt in zip(entries, answers):
+            if optimized_prompt is None and repair:
+                repairs.append(self._fetch(cache_key, future, text, api_key, api_url))
+                continue
+            if optimized_prompt is not None:
+                await self._cache_put(cache_key, optimized_prompt)
+            self._in_flight.pop(cache_key, None)
+            if not future.done():
+                future.set_result(optimized_prompt)
+        if repairs:
+            self._stats["pack_repairs"] += len(repairs)
+            await asyncio.gather(*repairs)
+
+    # ---------- 同步接口（供 Flask 请求线程调用） ----------
+
+    def optimize_blocking(self, prompt: str, **fields: str) -> Tuple[str, str]:
+        return self._run_blocking(self.optimize(prompt, **fields))
+
+    def optimize_many_blocking(self, specs: Sequence[Dict[str, str]]) -> List[Tuple[str, str]]:
+        return self._run_blocking(self.optimize_many(specs))
+
+    def optimize_packed_blocking(self, specs: Sequence[Dict[str, str]], pack_size: int = 8) -> List[Tuple[str, str]]:
+        return self._run_blocking(self.optimize_packed(specs, pack_size))
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            **self._stats,
+            "in_flight": len(self._in_flight),
+            "max_concurrency": self._max_concurrency,
+            "latency_budget": self._latency_budget,
+            "hedge": self._hedge,
+            "breaker": self._breaker.snapshot(),
+        }
+
+    def close(self):
+        """停止事件循环并关闭连接池。"""
+        with self._lock:
+            loop, self._loop = self._loop, None
+        if loop is not None:
+            loop.call_soon_threadsafe(loop.stop)
+            if self._loop_thread is not None:
+                self._loop_thread.join(5)
+        self._executor.shutdown(wait=False)
+        self._cache_executor.shutdown(wait=False)
+        self._session.close()
+
+
+_default_client: Optional[AsyncPromptOptimizer] = None
+_default_client_lock = threading.Lock()
+
+
+def get_async_optimizer() -> AsyncPromptOptimizer:
+    """获取进程内共享的异步优化客户端。"""
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            config = prompt_optimizer.config_manager
+            _default_client = AsyncPromptOptimizer(
+                max_concurrency=config.get("deepseek_max_connections", 8),
+                latency_budget=float(config.get("deepseek_latency_budget", 30.0)),
+                hedge=bool(config.get("deepseek_hedge_requests", False)),
+            )
+        return _default_client
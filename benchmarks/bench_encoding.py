@@ -0,0 +1,78 @@
+"""
+编码基准：各编码方式的耗时、文件体积与吞吐，以及缩略图串行/并行编码对比
+
+用法: python benchmarks/bench_encoding.py [--sizes 1024 2048] [--repeat 3] [--workers 2]
+"""
+
+import argparse
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from PIL import Image
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from image_encoding import ENCODING_POLICIES, THUMBNAIL_POLICY, encode_many  # noqa: E402
+
+LADDER = (256, 640, 1280)
+
+
+def make_source(size):
+    # 渐变叠加噪声，编码体积与真实生成结果接近。
+    gradient = Image.linear_gradient("L").resize((size, size))
+    noise = Image.effect_noise((size, size), 40)
+    return Image.merge("RGB", (gradient, noise, gradient.transpose(Image.Transpose.ROTATE_90)))
+
+
+def fastest(repeat, run):
+    elapsed = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        elapsed.append(time.perf_counter() - start)
+    return min(elapsed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1024, 2048], help="图片边长（像素）")
+    parser.add_argument("--repeat", type=int, default=3, help="每个用例重复次数，取最快一次")
+    parser.add_argument("--workers", type=int, default=2, help="并行编码线程数")
+    args = parser.parse_args()
+
+    workdir = Path(tempfile.mkdtemp(prefix="bench_encoding_"))
+    try:
+        for size in args.sizes:
+            image = make_source(size)
+            megapixels = size * size / 1e6
+            print(f"📊 {size}x{size}，每个用例取 {args.repeat} 次中最快的一次")
+            print(f"{'编码方式':<16}{'耗时':>10}{'体积':>10}{'相对 png':>10}{'吞吐':>12}")
+            baseline = None
+            for policy in ENCODING_POLICIES.values():
+                path = workdir / f"original{policy.extension}"
+                elapsed = fastest(args.repeat, lambda: encode_many([(image, path, policy, {})], workers=1))
+                file_size = path.stat().st_size
+                baseline = baseline or file_size
+                print(
+                    f"{policy.name:<16}{elapsed * 1000:>8.0f}ms{file_size / 1024:>8.0f}KB"
+                    f"{file_size / baseline:>9.2f}x{megapixels / elapsed:>8.1f} MP/s"
+                )
+
+            # 缩略图各档尺寸已缩放完成，只比较编码阶段。
+            rungs = [image.resize((rung, rung), Image.Resampling.LANCZOS) for rung in LADDER if rung <= size]
+            jobs = [(rung, workdir / f"thumb_{rung.width}.webp", THUMBNAIL_POLICY, {}) for rung in rungs]
+            serial = fastest(args.repeat, lambda: encode_many(jobs, workers=1))
+            parallel = fastest(args.repeat, lambda: encode_many(jobs, workers=args.workers))
+            print(
+                f"缩略图 {'/'.join(str(rung.width) for rung in rungs)}: 串行 {serial * 1000:.0f}ms，"
+                f"{args.workers} 线程 {parallel * 1000:.0f}ms（{serial / parallel:.1f}x）\n"
+            )
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+画廊搜索基准
+
+在临时目录中构建一个包含大量作品记录的画廊索引，测量全文检索与范围筛选的查询耗时，
+以及不同深度的游标分页（对照 OFFSET 分页）和画廊未变化时重新验证（只读索引版本号）的耗时。
+
+用法: python benchmarks/bench_gallery_search.py [--count 100000]
+"""
+
+import argparse
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from gallery_index import GalleryIndex, GallerySearch, encode_cursor  # noqa: E402
+
+
+SUBJECTS = ["橘猫", "金毛犬", "少女", "机甲战士", "古风庭院", "赛博朋克城市", "雪山", "海边灯塔", "森林精灵", "宇航员"]
+STYLES = ["水彩", "油画", "像素风", "赛璐璐", "写实摄影", "水墨", "low poly", "cinematic lighting", "studio ghibli", "ukiyo-e"]
+SCENES = ["黄昏", "夜景", "晨雾", "暴雨", "樱花", "霓虹灯", "星空", "阳光明媚", "雪夜", "沙漠"]
+SIZES = [(512, 512), (768, 768), (1024, 1024), (1024, 1536), (1536, 1024), (2048, 2048)]
+
+
+def make_records(count, seed=7):
+    rng = random.Random(seed)
+    start = time.time() - count * 60
+    for index in range(count):
+        width, height = rng.choice(SIZES)
+        prompt = f"{rng.choice(SUBJECTS)}，{rng.choice(STYLES)}风格，{rng.choice(SCENES)}，细节丰富 #{index}"
+        yield {
+            "folder": f"item_{index:07d}",
+            "image": f"item_{index:07d}.png",
+            "created": start + index * 60,
+            "width": width,
+            "height": height,
+            "steps": rng.randint(4, 20),
+            "optimization_mode": rng.choice(["basic", "low_vram"]),
+            "gen_time": round(rng.uniform(1, 60), 2),
+            "prompt": prompt,
+            "info": {"提示词": prompt},
+            "mtime_ns": 0,
+        }
+
+
+def measure(index, search, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        items, _older, _newer = index.page(24, search=search)
+        total = index.count(search)
+        timings.append((time.perf_counter() - start) * 1000)
+    return len(items), total, statistics.median(timings)
+
+
+def median_ms(repeat, run):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def measure_paging(index, count, repeat):
+    connection = index._get_connection()
+    print(f"{'重新验证（索引版本号）':<24} 中位耗时 {median_ms(repeat, lambda: index.version):7.3f} ms")
+    for depth in (0.0, 0.5, 0.99):
+        offset = int(count * depth)
+        anchor = connection.execute(
+            "SELECT created, folder FROM gallery_items ORDER BY created DESC, folder DESC LIMIT 1 OFFSET ?",
+            (max(0, offset - 1),),
+        ).fetchone()
+        cursor = encode_cursor(dict(anchor)) if offset else None
+        keyset = median_ms(repeat, lambda: index.page(24, after=cursor))
+        by_offset = median_ms(repeat, lambda: connection.execute(
+            "SELECT * FROM gallery_items ORDER BY created DESC, folder DESC LIMIT 24 OFFSET ?", (offset,),
+        ).fetchall())
+        print(f"{f'第 {offset} 条起的一页':<24} 游标 {keyset:7.2f} ms  OFFSET {by_offset:7.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="画廊搜索基准")
+    parser.add_argument("--count", type=int, default=100000, help="作品记录数量")
+    parser.add_argument("--repeat", type=int, default=20, help="每个查询重复次数")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as gallery:
+        index = GalleryIndex(gallery)
+        # 先完成首次构建（空目录），之后的记录直接写入索引，不再与磁盘对账。
+        index.ensure_built()
+        start = time.perf_counter()
+        batch = []
+        for record in make_records(args.count):
+            batch.append(record)
+            if len(batch) == 5000:
+                index.upsert_many(batch)
+                batch = []
+        index.upsert_many(batch)
+        print(f"📊 写入 {args.count} 条记录耗时 {time.perf_counter() - start:.1f}s")
+
+        queries = {
+            "最新一页": GallerySearch(),
+            "全文: 橘猫": GallerySearch(text="橘猫"),
+            "全文: 水墨 雪夜": GallerySearch(text="水墨 雪夜"),
+            "全文: cinematic": GallerySearch(text="cinematic"),
+            "宽度≥1536 且 步数≤6": GallerySearch(min_width=1536, max_steps=6),
+            "全文 + 范围 + 模式": GallerySearch(text="机甲", min_height=1024, optimization_mode="low_vram",
+                                         max_gen_time=20),
+            "罕见词: #99999": GallerySearch(text="#99999"),
+        }
+        for label, search in queries.items():
+            shown, total, elapsed = measure(index, search, args.repeat)
+            print(f"{label:<24} 命中 {total:>6} 条  首页 {shown:>2} 条  中位耗时 {elapsed:7.2f} ms")
+        measure_paging(index, args.count, args.repeat)
+        index.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+作品元数据读取基准：图片头部 vs 元数据文件 vs 解码整张图片
+
+生成一批内嵌元数据的 PNG，并为每张图另写一份 _meta.json，分别统计三种方式读完全部作品的耗时。
+
+用法: python benchmarks/bench_metadata_read.py [--count 500] [--size 1024]
+"""
+
+import argparse
+import json
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from PIL import Image
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from gallery_metadata import (  # noqa: E402
+    build_metadata, embed_metadata, embedded_save_options, get_metadata_path, read_embedded_metadata,
+    write_metadata,
+)
+
+
+def timed(label, paths, read):
+    start = time.perf_counter()
+    results = [read(path) for path in paths]
+    elapsed = time.perf_counter() - start
+    assert all(results), f"{label} 读取失败"
+    print(f"{label:<12} {elapsed * 1000:8.1f} ms  每张 {elapsed / len(paths) * 1e6:8.1f} µs")
+    return elapsed
+
+
+def decode_full(path):
+    with Image.open(path) as image:
+        image.load()
+        return json.loads(image.info["zimage:metadata"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--count", type=int, default=500, help="作品数")
+    parser.add_argument("--size", type=int, default=1024, help="图片边长（像素）")
+    args = parser.parse_args()
+
+    workdir = Path(tempfile.mkdtemp(prefix="bench_metadata_"))
+    try:
+        source = Image.effect_noise((args.size, args.size), 48).convert("RGB")
+        paths = []
+        for index in range(args.count):
+            path = workdir / f"item{index}.png"
+            metadata = build_metadata(path.name, f"提示词 {index} " * 20, args.size, args.size, 9, "basic",
+                                      gen_time=3.2, seed=index)
+            if index == 0:
+                source.save(path, compress_level=1, **embedded_save_options(path, metadata))
+            else:
+                # 像素数据与第一张相同，只替换元数据，节省准备时间。
+                shutil.copyfile(paths[0], path)
+                embed_metadata(path, metadata)
+            write_metadata(get_metadata_path(path), metadata)
+            paths.append(path)
+
+        print(f"📊 {args.count} 张 {args.size}x{args.size} PNG，单张 {paths[0].stat().st_size / 1024:.0f} KB")
+        header = timed("图片头部", paths, read_embedded_metadata)
+        timed("_meta.json", paths, lambda path: json.loads(get_metadata_path(path).read_text(encoding="utf-8")))
+        decoded = timed("解码整图", paths[:max(1, args.count // 10)], decode_full) * 10
+        print(f"✅ 头部读取比解码整图快约 {decoded / header:.0f} 倍（解码按 1/10 样本外推）")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+生成结果保存基准：PIL 输出 vs numpy 输出共享缓冲区的单次生成峰值内存与耗时
+
+模拟管线解码后的最后一步：VAE 输出的 float32 数组（[0, 1]）。
+"PIL 输出" 按 diffusers 的 numpy_to_pil 换算后保存；"numpy 输出" 原地换算并写入复用的缓冲区后保存。
+两者都经过 save_to_gallery（原图编码、各尺寸缩略图、写入索引）。每个用例在全新的子进程中运行，
+峰值内存取子进程常驻内存（RSS）最高值相对用例开始前的增量。
+
+用法: python benchmarks/bench_pipeline_output.py [--sizes 2048 4096] [--encoding png] [--generations 2]
+"""
+
+import argparse
+import io
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from config_manager import config_manager  # noqa: E402
+from image_buffers import ImageBufferPool, to_shared_image  # noqa: E402
+from image_encoding import ENCODING_POLICIES  # noqa: E402
+from image_processing import save_to_gallery  # noqa: E402
+
+
+def peak_rss_kb():
+    # Linux 上 ru_maxrss 以 KB 为单位，macOS 上以字节为单位。
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+def decoder_output(size, seed):
+    # 相当于 diffusers 以 output_type="np" 返回的 (1, 高, 宽, 3) 数组。
+    rng = np.random.default_rng(seed)
+    return rng.random((1, size, size, 3), dtype=np.float32)
+
+
+def run_case(gallery_dir, size, method, encoding, generations):
+    config_manager.config.gallery_dir = gallery_dir
+    pool = ImageBufferPool()
+    before = peak_rss_kb()
+    elapsed = []
+    for index in range(generations):
+        images = decoder_output(size, index)
+        start = time.perf_counter()
+        buffer = None
+        if method == "pil":
+            image = Image.fromarray((images[0] * 255).round().astype("uint8"))
+        else:
+            image, buffer = to_shared_image(images[0], pool)
+        del images
+        with redirect_stdout(io.StringIO()):
+            save_to_gallery(image, "bench.png", "benchmark", size, size, 9, 0.0, "basic", encoding=encoding)
+        del image
+        pool.release(buffer)
+        elapsed.append(time.perf_counter() - start)
+    return min(elapsed), max(0, peak_rss_kb() - before)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[2048, 4096], help="图片边长（像素）")
+    parser.add_argument("--encoding", default="png", choices=list(ENCODING_POLICIES), help="原图编码方式")
+    parser.add_argument("--generations", type=int, default=2, help="每个用例连续生成次数，取最快一次")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_pipeline_output_")
+    try:
+        print(f"📊 原图编码 {args.encoding}，每个用例连续保存 {args.generations} 张（数组生成不计入耗时）")
+        print(f"{'尺寸':<8}{'PIL 输出':>18}{'numpy 输出':>18}{'内存节省':>10}")
+        for size in args.sizes:
+            results = {}
+            for method in ("pil", "numpy"):
+                # 每个用例使用新进程，峰值内存互不影响。
+                with ProcessPoolExecutor(max_workers=1) as executor:
+                    results[method] = executor.submit(
+                        run_case, workdir, size, method, args.encoding, args.generations,
+                    ).result()
+            (pil_time, pil_rss), (numpy_time, numpy_rss) = results["pil"], results["numpy"]
+            print(
+                f"{size:<8}"
+                f"{pil_time * 1000:>9.0f}ms {pil_rss / 1024:>5.0f}MB"
+                f"{numpy_time * 1000:>9.0f}ms {numpy_rss / 1024:>5.0f}MB"
+                f"{(pil_rss - numpy_rss) / 1024:>8.0f}MB"
+            )
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+批量提示词优化基准：逐条请求 vs 打包请求
+
+在本地启动一个模拟 DeepSeek 的服务，每次请求耗时 = 往返延迟 + 条数 × 单条生成耗时，
+分别用 optimize_many 和 optimize_packed 优化同一批提示词，比较往返次数与总耗时。
+
+用法: python benchmarks/bench_prompt_packing.py [--count 120] [--pack-size 10] [--concurrency 4]
+"""
+
+import argparse
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from unittest.mock import patch
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import async_prompt_optimizer  # noqa: E402
+import prompt_optimizer  # noqa: E402
+from circuit_breaker import CircuitBreaker  # noqa: E402
+from prompt_cache import PromptCache  # noqa: E402
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        user_content = body["messages"][1]["content"]
+        if body["messages"][0]["content"] == prompt_optimizer.PACKED_SYSTEM_PROMPT:
+            entries = json.loads(user_content)
+            content = json.dumps([
+                {"id": entry["id"], "prompt": f"优化: {entry['request'].splitlines()[0]}"} for entry in entries
+            ], ensure_ascii=False)
+            count = len(entries)
+        else:
+            content = f"优化: {user_content.splitlines()[0]}"
+            count = 1
+        with self.server.lock:
+            self.server.calls += 1
+        time.sleep(self.server.round_trip + count * self.server.per_item)
+
+        payload = json.dumps({"choices": [{"message": {"content": content}}]}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *_args):
+        pass
+
+
+def run(server, url, label, specs, concurrency, call):
+    server.calls = 0
+    client = async_prompt_optimizer.AsyncPromptOptimizer(max_concurrency=concurrency, breaker=CircuitBreaker())
+    with patch.object(async_prompt_optimizer, "get_api_settings", return_value=("key", url)), \
+            patch.object(prompt_optimizer, "prompt_cache", PromptCache()):
+        start = time.perf_counter()
+        results = call(client, specs)
+        elapsed = time.perf_counter() - start
+    client.close()
+    sources = {source for _, source in results}
+    print(f"{label:<10} 往返 {server.calls:>4} 次  耗时 {elapsed:6.2f}s  来源 {sorted(sources)}")
+    return server.calls, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--count", type=int, default=120, help="提示词条数")
+    parser.add_argument("--pack-size", type=int, default=10, help="每次请求打包的条数")
+    parser.add_argument("--concurrency", type=int, default=4, help="客户端并发上限")
+    parser.add_argument("--round-trip", type=float, default=0.15, help="模拟的往返延迟（秒）")
+    parser.add_argument("--per-item", type=float, default=0.02, help="模拟的单条生成耗时（秒）")
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.calls = 0
+    server.round_trip = args.round_trip
+    server.per_item = args.per_item
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/v1/chat/completions"
+
+    specs = [{"prompt": f"提示词 {index}", "art_style": "水彩"} for index in range(args.count)]
+    print(f"📊 {args.count} 条提示词，并发 {args.concurrency}，打包 {args.pack_size} 条/请求")
+    single_calls, single_time = run(
+        server, url, "逐条", specs, args.concurrency, lambda client, items: client.optimize_many_blocking(items)
+    )
+    packed_calls, packed_time = run(
+        server, url, "打包", specs, args.concurrency,
+        lambda client, items: client.optimize_packed_blocking(items, pack_size=args.pack_size),
+    )
+    print(f"✅ 往返次数减少 {single_calls / max(1, packed_calls):.1f} 倍，总耗时减少 {single_time / packed_time:.1f} 倍")
+
+    server.shutdown()
+    server.server_close()
+
+
+if __name__ == "__main__":
+    main()
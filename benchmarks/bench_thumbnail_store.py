@@ -0,0 +1,143 @@
+"""
+缩略图存储基准：每张一个文件 vs 打包存储（SQLite）的画廊翻页耗时、文件数与占用空间
+
+按缩略图路由的实际步骤计时："文件" 为查找作品目录、列出文件找到原图、检查并读取缩略图；
+"打包" 为按 (作品目录名, 尺寸) 查表并读取 BLOB。每页读取 24 个作品的一种尺寸，页面随机分布在整个画廊中。
+默认测的是热缓存（文件元数据与内容都在页缓存中）；以 root 运行并加 --drop-caches 可测冷缓存。
+
+用法: python benchmarks/bench_thumbnail_store.py [--items 20000] [--pages 200] [--drop-caches]
+"""
+
+import argparse
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from PIL import Image, ImageFilter
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from gallery_layout import folder_path, resolve_folder  # noqa: E402
+from gallery_metadata import find_gallery_image  # noqa: E402
+from image_processing import create_gallery_thumbnail, get_thumbnail_path  # noqa: E402
+from thumbnail_pack import PACK_FILENAME, ThumbnailPack, migrate_thumbnails  # noqa: E402
+
+SIZES = (256, 640, 1280)
+PAGE_SIZE = 24
+
+
+def make_thumbnails(workdir):
+    """生成一组真实的缩略图字节，之后复制到每个作品，体积与真实画廊接近。"""
+    source = workdir / "source.png"
+    gradient = Image.linear_gradient("L").resize((1536, 1536))
+    fractal = Image.effect_mandelbrot((1536, 1536), (-2, -1.5, 1, 1.5), 100)
+    noise = Image.effect_noise((1536, 1536), 12).filter(ImageFilter.GaussianBlur(2))
+    Image.merge("RGB", (gradient, fractal, noise)).save(source)
+    create_gallery_thumbnail(source, source, sizes=list(SIZES))
+    return {size: get_thumbnail_path(source, size).read_bytes() for size in SIZES}
+
+
+def build_gallery(gallery, items, thumbnails):
+    for number in range(items):
+        name = f"item{number:06d}"
+        folder = folder_path(gallery, name, "sharded")
+        folder.mkdir(parents=True)
+        (folder / f"{name}.png").write_bytes(b"png")
+        for size, data in thumbnails.items():
+            get_thumbnail_path(folder / f"{name}.png", size).write_bytes(data)
+
+
+def disk_usage(paths):
+    files = blocks = 0
+    for path in paths:
+        for root, _, names in os.walk(path) if path.is_dir() else [(str(path.parent), [], [path.name])]:
+            for name in names:
+                files += 1
+                blocks += os.stat(os.path.join(root, name)).st_blocks
+    return files, blocks * 512
+
+
+def read_page_files(gallery, names, size):
+    for name in names:
+        folder = resolve_folder(gallery, name)
+        image_name = find_gallery_image(entry.name for entry in os.scandir(folder) if entry.is_file())
+        thumbnail_path = get_thumbnail_path(folder / image_name, size)
+        if thumbnail_path.exists():
+            thumbnail_path.read_bytes()
+
+
+def read_page_pack(pack, names, size):
+    for name in names:
+        entry = pack.lookup(name, size)
+        if entry is not None:
+            pack.read(entry)
+
+
+def drop_caches():
+    os.sync()
+    with open("/proc/sys/vm/drop_caches", "w") as handle:
+        handle.write("3\n")
+
+
+def measure(read_page, pages, cold):
+    elapsed = []
+    for names, size in pages:
+        if cold:
+            drop_caches()
+        start = time.perf_counter()
+        read_page(names, size)
+        elapsed.append(time.perf_counter() - start)
+    elapsed.sort()
+    return statistics.median(elapsed), elapsed[int(len(elapsed) * 0.95) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--items", type=int, default=20000, help="画廊作品数")
+    parser.add_argument("--pages", type=int, default=200, help="测量的翻页次数")
+    parser.add_argument("--drop-caches", action="store_true", help="每页前清空页缓存（需要 root）")
+    parser.add_argument("--workdir", default=None, help="测试目录所在位置，默认系统临时目录")
+    args = parser.parse_args()
+
+    workdir = Path(tempfile.mkdtemp(prefix="bench_thumbnail_store_", dir=args.workdir))
+    try:
+        gallery = workdir / "gallery"
+        start = time.perf_counter()
+        build_gallery(gallery, args.items, make_thumbnails(workdir))
+        print(f"📊 {args.items} 个作品 x {len(SIZES)} 种尺寸，构建耗时 {time.perf_counter() - start:.1f}s")
+
+        rng = random.Random(7)
+        pages = []
+        for _ in range(args.pages):
+            first = rng.randrange(0, max(1, args.items - PAGE_SIZE))
+            names = [f"item{number:06d}" for number in range(first, min(args.items, first + PAGE_SIZE))]
+            pages.append((names, rng.choice(SIZES)))
+
+        files, used = disk_usage([gallery])
+        file_median, file_p95 = measure(lambda names, size: read_page_files(gallery, names, size), pages, args.drop_caches)
+
+        pack = ThumbnailPack(gallery / PACK_FILENAME)
+        start = time.perf_counter()
+        migrate_thumbnails(gallery, pack, batch_size=500)
+        migrate_seconds = time.perf_counter() - start
+        pack_median, pack_p95 = measure(lambda names, size: read_page_pack(pack, names, size), pages, args.drop_caches)
+        packed_files, packed_used = disk_usage([gallery])
+        pack.close()
+
+        cache = "冷缓存" if args.drop_caches else "热缓存"
+        print(f"迁移到打包存储耗时 {migrate_seconds:.1f}s")
+        print(f"{'存储方式':<10}{'每页中位数':>12}{'每页 p95':>12}{'文件数':>10}{'占用空间':>12}")
+        print(f"{'文件':<10}{file_median * 1000:>10.2f}ms{file_p95 * 1000:>10.2f}ms{files:>10}{used / 1048576:>10.1f}MB")
+        print(f"{'打包':<10}{pack_median * 1000:>10.2f}ms{pack_p95 * 1000:>10.2f}ms{packed_files:>10}{packed_used / 1048576:>10.1f}MB")
+        print(f"（{cache}，每页 {PAGE_SIZE} 个作品；打包后的文件数含原图与索引文件）")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+缩略图生成基准：不同尺寸与格式下的单张耗时与峰值内存
+
+每个用例在全新的子进程中运行，峰值内存取子进程常驻内存（RSS）最高值相对用例开始前的增量。
+"旧实现" 为完整解码 + exif_transpose 整图复制 + 原地 thumbnail 的做法，用于对比。
+
+用法: python benchmarks/bench_thumbnails.py [--sizes 1024 2048 4096] [--formats png jpeg] [--repeat 3]
+"""
+
+import argparse
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from PIL import Image, ImageOps
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from image_processing import create_gallery_thumbnail, get_thumbnail_path  # noqa: E402
+
+LADDER = (256, 640, 1280)
+
+
+def legacy_thumbnail(image_source, image_path, sizes=LADDER):
+    opened_image = Image.open(image_source) if isinstance(image_source, (str, Path)) else None
+    try:
+        current = ImageOps.exif_transpose(opened_image or image_source).copy()
+        if current.mode not in {"RGB", "RGBA"}:
+            current = current.convert("RGB")
+        for size in sorted(sizes, reverse=True):
+            current.thumbnail((size, size), Image.Resampling.LANCZOS, reducing_gap=3.0)
+            current.save(get_thumbnail_path(image_path, size), format="WEBP", quality=82, method=4)
+    finally:
+        if opened_image is not None:
+            opened_image.close()
+
+
+def peak_rss_kb():
+    # Linux 上 ru_maxrss 以 KB 为单位，macOS 上以字节为单位。
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+def run_case(image_path, method, in_memory, repeat):
+    image_path = Path(image_path)
+    source = None
+    if in_memory:
+        source = Image.open(image_path)
+        source.load()
+    before = peak_rss_kb()
+    elapsed = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        if method == "legacy":
+            legacy_thumbnail(source or image_path, image_path)
+        else:
+            create_gallery_thumbnail(source or image_path, image_path, force=True, sizes=LADDER)
+        elapsed.append(time.perf_counter() - start)
+    return min(elapsed), max(0, peak_rss_kb() - before)
+
+
+def make_source(workdir, size, image_format):
+    # 渐变叠加噪声，编码体积与真实生成结果接近。
+    gradient = Image.linear_gradient("L").resize((size, size))
+    noise = Image.effect_noise((size, size), 40)
+    image = Image.merge("RGB", (gradient, noise, gradient.transpose(Image.Transpose.ROTATE_90)))
+    path = Path(workdir) / f"source_{size}.{image_format}"
+    image.save(path, quality=92) if image_format == "jpeg" else image.save(path, compress_level=6)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1024, 2048, 4096], help="原图边长（像素）")
+    parser.add_argument("--formats", nargs="+", default=["png", "jpeg"], choices=["png", "jpeg"], help="原图格式")
+    parser.add_argument("--repeat", type=int, default=3, help="每个用例重复次数，取最快一次")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_thumbnails_")
+    try:
+        print(f"📊 缩略图尺寸 {'/'.join(map(str, LADDER))}，每个用例取 {args.repeat} 次中最快的一次")
+        print(f"{'原图':<14}{'来源':<6}{'旧实现':>18}{'新实现':>18}{'加速':>8}{'内存节省':>10}")
+        for image_format in args.formats:
+            for size in args.sizes:
+                path = make_source(workdir, size, image_format)
+                for in_memory in (False, True):
+                    results = {}
+                    for method in ("legacy", "fast"):
+                        # 每个用例使用新进程，峰值内存互不影响。
+                        with ProcessPoolExecutor(max_workers=1) as executor:
+                            results[method] = executor.submit(run_case, path, method, in_memory, args.repeat).result()
+                    (legacy_time, legacy_rss), (fast_time, fast_rss) = results["legacy"], results["fast"]
+                    label = f"{image_format.upper()} {size}"
+                    print(
+                        f"{label:<14}{'内存' if in_memory else '文件':<6}"
+                        f"{legacy_time * 1000:>9.0f}ms {legacy_rss / 1024:>5.0f}MB"
+                        f"{fast_time * 1000:>9.0f}ms {fast_rss / 1024:>5.0f}MB"
+                        f"{legacy_time / fast_time:>7.1f}x"
+                        f"{(legacy_rss - fast_rss) / 1024:>8.0f}MB"
+                    )
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+有界后台执行器模块
+在线程池前加一道信号量：排队任务超过上限时提交方阻塞，形成背压
+"""
+
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Optional
+
+
+class BoundedExecutor:
+    """同时运行 max_workers 个、额外排队 max_pending 个任务的线程池。"""
+
+    def __init__(self, max_workers: int, max_pending: int, name: str = "bounded"):
+        """
+        初始化执行器
+
+        Args:
+            max_workers: 工作线程数量
+            max_pending: 运行中任务之外允许排队的任务数量
+            name: 线程名前缀
+        """
+        if max_workers < 1 or max_pending < 0:
+            raise ValueError("工作线程数量必须大于0，排队上限不能为负数")
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._slots = threading.BoundedSemaphore(max_workers + max_pending)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+
+    def submit(self, fn: Callable, *args, timeout: Optional[float] = None, **kwargs) -> Future:
+        """
+        提交任务；名额用尽时阻塞等待
+
+        Raises:
+            TimeoutError: 超过 timeout 仍无可用名额
+            RuntimeError: 执行器已关闭
+        """
+        if not self._slots.acquire(timeout=timeout):
+            raise TimeoutError("后台执行器队列已满")
+        with self._lock:
+            self._in_flight += 1
+        try:
+            future = self._executor.submit(fn, *args, **kwargs)
+        except Exception:
+            self._release_slot()
+            raise
+        future.add_done_callback(lambda _future: self._release_slot())
+        return future
+
+    def _release_slot(self):
+        with self._lock:
+            self._in_flight -= 1
+        self._slots.release()
+
+    def in_flight(self) -> int:
+        """运行中与排队中的任务总数。"""
+        with self._lock:
+            return self._in_flight
+
+    def shutdown(self, wait: bool = True):
+        """停止接收新任务；wait 为 True 时等待已提交的任务全部完成。"""
+        self._executor.shutdown(wait=wait)
@@ -140,7 +140,8 @@ def check_requirements(status):
         "diffusers": "0.36.0.dev0",
         "transformers": "4.57.3",
         "accelerate": "1.12.0",
-        "requests": "2.32.5"
+        "requests": "2.32.5",
+        "numpy": "1.24"
     }
 
     print_section("🔍 检查依赖包版本", width=60)
@@ -0,0 +1,144 @@
+"""
+熔断器模块
+根据最近请求的错误率和延迟判断上游是否健康，不健康时直接走本地降级
+"""
+
+import math
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, Optional
+
+
+class CircuitBreaker:
+    """
+    滑动窗口熔断器
+
+    closed: 正常放行；窗口内失败率或慢请求比例超过阈值时打开。
+    open: 直接拒绝，open_seconds 后进入 half_open。
+    half_open: 只放行一个探测请求，成功则关闭，失败则重新打开。
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, window_size: int = 20, min_requests: int = 5, failure_rate_threshold: float = 0.5,
+                 slow_call_seconds: float = 10.0, slow_rate_threshold: float = 0.8,
+                 open_seconds: float = 30.0, clock: Callable[[], float] = time.monotonic):
+        """
+        初始化熔断器
+
+        Args:
+            window_size: 统计最近多少次请求
+            min_requests: 窗口内至少多少次请求才会判断是否熔断
+            failure_rate_threshold: 失败率阈值
+            slow_call_seconds: 超过该耗时的成功请求视为慢请求
+            slow_rate_threshold: 慢请求比例阈值
+            open_seconds: 打开状态持续时间
+            clock: 时间函数，便于测试
+        """
+        self._window = deque(maxlen=max(1, window_size))
+        self._min_requests = max(1, min_requests)
+        self._failure_rate_threshold = failure_rate_threshold
+        self._slow_call_seconds = slow_call_seconds
+        self._slow_rate_threshold = slow_rate_threshold
+        self._open_seconds = open_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._stats = {"successes": 0, "failures": 0, "rejected": 0, "opened": 0}
+
+    def allow_request(self) -> bool:
+        """是否允许向上游发送请求；拒绝时调用方应直接降级。"""
+        with self._lock:
+            if self._state == self.OPEN:
+                if self._clock() - self._opened_at < self._open_seconds:
+                    self._stats["rejected"] += 1
+                    return False
+                self._state = self.HALF_OPEN
+                self._probe_in_flight = False
+            if self._state == self.HALF_OPEN:
+                if self._probe_in_flight:
+                    self._stats["rejected"] += 1
+                    return False
+                self._probe_in_flight = True
+            return True
+
+    def record_success(self, latency: float):
+        with self._lock:
+            self._stats["successes"] += 1
+            self._window.append((True, latency))
+            if self._state == self.HALF_OPEN:
+                self._state = self.CLOSED
+                self._probe_in_flight = False
+                self._window.clear()
+                self._window.append((True, latency))
+                return
+            self._evaluate_locked()
+
+    def record_failure(self, latency: Optional[float] = None):
+        with self._lock:
+            self._stats["failures"] += 1
+            self._window.append((False, latency))
+            if self._state == self.HALF_OPEN:
+                self._open_locked()
+                return
+            self._evaluate_locked()
+
+    def release_probe(self):
+        """放行的请求最终没有发出（如排队时超出预算）：不记录结果，只归还半开状态的探测名额。"""
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                self._probe_in_flight = False
+
+    def _evaluate_locked(self):
+        if self._state != self.CLOSED or len(self._window) < self._min_requests:
+            return
+        total = len(self._window)
+        failures = sum(1 for success, _ in self._window if not success)
+        slow = sum(
+            1 for success, latency in self._window
+            if success and latency is not None and latency >= self._slow_call_seconds
+        )
+        if failures / total >= self._failure_rate_threshold or slow / total >= self._slow_rate_threshold:
+            self._open_locked()
+
+    def _open_locked(self):
+        self._state = self.OPEN
+        self._opened_at = self._clock()
+        self._probe_in_flight = False
+        self._stats["opened"] += 1
+
+    def latency_percentile(self, percentile: float = 0.95) -> Optional[float]:
+        """窗口内成功请求的延迟分位数；样本不足时返回 None。"""
+        with self._lock:
+            latencies = sorted(latency for success, latency in self._window if success and latency is not None)
+        if len(latencies) < self._min_requests:
+            return None
+        index = min(len(latencies) - 1, max(0, math.ceil(percentile * len(latencies)) - 1))
+        return latencies[index]
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == self.OPEN and self._clock() - self._opened_at >= self._open_seconds:
+                return self.HALF_OPEN
+            return self._state
+
+    def snapshot(self) -> Dict[str, object]:
+        """当前状态与统计信息，用于运行指标。"""
+        p95 = self.latency_percentile(0.95)
+        state = self.state
+        with self._lock:
+            total = len(self._window)
+            failures = sum(1 for success, _ in self._window if not success)
+            return {
+                **self._stats,
+                "state": state,
+                "window_requests": total,
+                "window_failure_rate": round(failures / total, 4) if total else 0.0,
+                "p95_latency": round(p95, 4) if p95 is not None else None,
+            }
@@ -6,8 +6,8 @@
 import os
 import json
 from pathlib import Path
-from typing import Any, Dict, Optional
-from dataclasses import dataclass, asdict
+from typing import Any, Dict, List, Optional
+from dataclasses import dataclass, asdict, field
 
 
 @dataclass
@@ -22,14 +22,46 @@ class AppConfig:
     default_height: int = 1024
     default_steps: int = 9
     default_filename: str = "generated_image.png"
+    numpy_output: bool = True  # 管线以 numpy 数组输出，原地转为 uint8 后由原图编码与缩略图共享
+
+    # 生成队列配置
+    generation_workers: int = 1  # 常驻生成工作线程数量；推理串行执行，多线程只让保存与下一次推理重叠
+    max_queued_tasks: int = 4  # 排队与执行中的任务总数上限
+    save_workers: int = 2  # 画廊保存（编码、缩略图、参数文件）线程数量
+    max_pending_saves: int = 4  # 保存阶段积压上限，超过后生成线程等待
+    thumbnail_workers: int = 2  # 补生成缩略图的后台进程数量
+    output_encoding: str = "auto"  # 原图编码：auto（按扩展名）、png、png-fast、webp-lossless、webp、jpeg
+    encoding_workers: int = 2  # 同一张图多份输出（如各尺寸缩略图）的并行编码线程数
+    prompt_optimization_concurrency: int = 2  # 生成任务中同时调用 DeepSeek 的数量
 
     # API配置
     deepseek_api_key: str = ""
     deepseek_base_url: str = "https://api.deepseek.com/v1/chat/completions"
+    deepseek_max_connections: int = 8  # 异步优化客户端的并发上限与连接池大小
+    deepseek_latency_budget: float = 30.0  # 单次优化的总耗时预算（秒），超出后使用本地组合
+    deepseek_hedge_requests: bool = False  # 超过近期 p95 延迟时发送对冲请求
+    deepseek_slow_call_seconds: float = 10.0  # 熔断统计中的慢请求阈值（秒）
+    deepseek_breaker_open_seconds: float = 30.0  # 熔断后多久重新探测上游
+    prompt_pack_size: int = 8  # 批量优化时每次请求合并的提示词条数，1 表示逐条请求
+
+    # 提示词优化缓存配置（留空 prompt_cache_path 表示仅使用内存缓存）
+    prompt_cache_path: str = "cache/prompt_cache.sqlite3"
+    prompt_cache_memory_entries: int = 512
+    prompt_cache_disk_entries: int = 20000
+    prompt_cache_ttl_seconds: int = 604800
 
     # 文件路径配置
     gallery_dir: str = "gallery"
+    gallery_layout: str = "sharded"  # 新作品的目录布局：sharded（_shards/<分片>/<作品>）或 flat
     gallery_page_size: int = 24
+    gallery_watcher: str = "auto"  # 画廊目录监听：auto / inotify / polling / off
+    gallery_watch_debounce: float = 0.5  # 合并连续改动的静默时间（秒）
+    gallery_bundles: bool = False  # 画廊每页缩略图合并为一个文件，一次请求取回
+    thumbnail_store: str = "files"  # 缩略图存储：files（每张一个文件）或 pack（画廊目录中的 .thumbnails.sqlite3）
+    thumbnail_sizes: List[int] = field(default_factory=lambda: [256, 640, 1280])  # 缩略图最长边（像素），640 总会生成
+    # 原图按 Accept 协商提供的转码格式及质量，顺序即优先级，{} 关闭；变体缓存在画廊目录的 .variants/
+    image_variants: Dict[str, int] = field(default_factory=lambda: {"avif": 60, "webp": 80})
+    image_variant_cache_mb: int = 1024
     offload_folder: str = "offload"
 
     # Flask配置
@@ -3,18 +3,42 @@ Flask Web 应用
 Z-Image-Turbo 图片生成器的 Web 界面
 """
 
-from flask import Flask, render_template, jsonify, request, send_file
+from flask import Flask, Response, render_template, jsonify, request, send_file, stream_with_context
+from werkzeug.datastructures import ContentRange
 from pathlib import Path
+import atexit
+import hashlib
+import json
+import os
+import random
+from contextlib import nullcontext
 import time
 import threading
 import shutil
 import math
+import datetime
+from functools import partial
 from urllib.parse import quote
 
 from model_manager import model_manager, load_model, is_model_loaded, unload_model
-from image_processing import create_gallery_thumbnail, get_thumbnail_path, save_to_gallery
-from prompt_optimizer import optimize_with_custom_input
+from image_processing import (
+    PRIMARY_THUMBNAIL_SIZE, get_thumbnail_path, get_thumbnail_sizes, get_thumbnail_widths, save_to_gallery,
+)
+from prompt_optimizer import prewarm_cache_from_gallery, prompt_cache, stream_optimized_prompt
+from async_prompt_optimizer import get_async_optimizer
 from config_manager import config_manager
+from bounded_executor import BoundedExecutor
+from gallery_bundles import bundle_size_for, bundles_enabled, get_bundle_cache
+from gallery_index import GallerySearch, get_gallery_index, list_from_disk
+from gallery_layout import resolve_folder
+from thumbnail_service import get_thumbnail_service
+from thumbnail_pack import PackedThumbnail, forget_thumbnails, get_thumbnail_pack, get_thumbnail_store
+from gallery_metadata import find_gallery_image
+from gallery_watcher import start_gallery_watcher
+from image_buffers import ImageBufferPool, to_shared_image
+from image_encoding import ENCODING_POLICIES, get_encoding_names
+from image_variants import TRANSCODABLE_SUFFIXES, get_variant_cache, get_variant_formats, negotiate_format
+from generation_worker import GenerationWorker
 from task_manager import GenerationCancelled, TaskManager
 from utils import validate_file_extension, validate_integer
 
@@ -25,36 +49,12 @@ app.json.ensure_ascii = False  # Flask 3.x 中文 JSON
 # 加载环境变量
 config_manager.load_from_env()
 
-# 仅允许一个真实工作线程使用本地 GPU；终态任务保留一小时，最多保留 100 条。
-task_manager = TaskManager(retention_seconds=3600, max_completed_tasks=100)
-gallery_index_lock = threading.RLock()
-thumbnail_lock = threading.Lock()
-gallery_index_cache = {'signature': None, 'folders': []}
-
-
-def invalidate_gallery_cache():
-    with gallery_index_lock:
-        gallery_index_cache['signature'] = None
-        gallery_index_cache['folders'] = []
-
-
-def get_gallery_folders(gallery_dir):
-    """按目录修改时间缓存作品目录；新增或删除作品时自动失效。"""
-    gallery_dir = Path(gallery_dir)
-    if not gallery_dir.exists():
-        return []
-    signature = gallery_dir.stat().st_mtime_ns
-    with gallery_index_lock:
-        if gallery_index_cache['signature'] == signature:
-            return list(gallery_index_cache['folders'])
-        folders = sorted(
-            (path for path in gallery_dir.iterdir() if path.is_dir()),
-            key=lambda path: path.name,
-            reverse=True,
-        )
-        gallery_index_cache['signature'] = signature
-        gallery_index_cache['folders'] = folders
-        return list(folders)
+# 任务在常驻工作线程前排队，名额由 max_queued_tasks 限制；终态任务保留一小时，最多保留 100 条。
+task_manager = TaskManager(
+    retention_seconds=3600,
+    max_completed_tasks=100,
+    max_active_tasks=validate_integer('生成队列长度', config_manager.get('max_queued_tasks', 4), 1, 64),
+)
 
 
 def get_json_object():
@@ -84,6 +84,88 @@ def normalize_optimization_mode(value):
     return value
 
 
+GALLERY_SEARCH_RANGES = (
+    ('min_width', '最小宽度', int, 0, 16384), ('max_width', '最大宽度', int, 0, 16384),
+    ('min_height', '最小高度', int, 0, 16384), ('max_height', '最大高度', int, 0, 16384),
+    ('min_steps', '最小步数', int, 0, 1000), ('max_steps', '最大步数', int, 0, 1000),
+    ('min_gen_time', '最短生成时间', float, 0, 86400), ('max_gen_time', '最长生成时间', float, 0, 86400),
+)
+GALLERY_SEARCH_KEYS = ('q', 'mode', 'created_from', 'created_to') + tuple(key for key, *_ in GALLERY_SEARCH_RANGES)
+GALLERY_INDEX_BUILDING_MESSAGE = '画廊索引正在构建，暂时只能按时间浏览，请稍后再搜索'
+# 索引构建期间搜索请求返回 503，建议客户端等待的秒数。
+GALLERY_INDEX_RETRY_SECONDS = 5
+
+
+def get_gallery_search(args):
+    """从查询参数构建画廊搜索条件，空参数忽略；created_from/created_to 为 YYYY-MM-DD，包含当天。"""
+    search = GallerySearch(text=get_text_field(args, 'q', '搜索词', 200))
+    for key, label, cast, minimum, maximum in GALLERY_SEARCH_RANGES:
+        value = args.get(key, '').strip()
+        if not value:
+            continue
+        if cast is int:
+            setattr(search, key, validate_integer(label, value, minimum, maximum))
+            continue
+        try:
+            number = float(value)
+        except ValueError:
+            raise ValueError(f"{label}必须是数字") from None
+        if not minimum <= number <= maximum:
+            raise ValueError(f"{label}必须在{minimum}到{maximum}之间")
+        setattr(search, key, number)
+
+    if args.get('mode', '').strip():
+        search.optimization_mode = normalize_optimization_mode(args['mode'].strip())
+    for key, label, offset in (('created_from', '开始日期', 0), ('created_to', '结束日期', 1)):
+        value = args.get(key, '').strip()
+        if not value:
+            continue
+        try:
+            day = datetime.datetime.strptime(value, '%Y-%m-%d')
+        except ValueError:
+            raise ValueError(f"{label}格式必须是 YYYY-MM-DD") from None
+        setattr(search, key, (day + datetime.timedelta(days=offset)).timestamp())
+    return search
+
+
+def serialize_gallery_item(item):
+    """
+    画廊索引记录转换为页面与 API 使用的作品数据
+
+    srcset 列出各尺寸缩略图及其实际宽度，preview 为最大尺寸缩略图，供详情大图使用；
+    path 按浏览器支持的格式协商，download 总是原始文件；placeholder 为缩略图到达前显示的 BlurHash 与主色。
+    """
+    thumbnail = f"/gallery/thumbnail/{quote(item['folder'], safe='')}"
+    path = f"/gallery/{quote(item['folder'] + '/' + item['image'], safe='/')}"
+    widths = get_thumbnail_widths(item.get('width'), item.get('height'))
+    return {
+        'name': item['image'],
+        'folder': item['folder'],
+        'path': path,
+        'download': f"{path}?original=1",
+        'thumbnail': thumbnail,
+        'srcset': ', '.join(f"{thumbnail}?size={size} {width}w" for size, width in widths),
+        'preview': f"{thumbnail}?size={widths[-1][0]}" if widths else thumbnail,
+        'info': item['info'],
+        'placeholder': item.get('placeholder'),
+    }
+
+
+def attach_page_bundle(index, items, serialized, size):
+    """
+    为一页作品生成或复用缩略图合并包，并在每个作品数据中写入其在包内的字节范围
+
+    Returns:
+        合并包；有作品缺少该尺寸缩略图时返回 None，页面照常逐张加载
+    """
+    bundle = get_bundle_cache().bundle_for(items, index.item_versions(item['folder'] for item in items), size)
+    if bundle is not None:
+        for data in serialized:
+            offset, length = bundle.ranges[data['folder']]
+            data['bundle'] = {'url': bundle.url, 'offset': offset, 'length': length}
+    return bundle
+
+
 def get_prompt_fields(data):
     return {
         'art_style': get_text_field(data, 'art_style', '画风', 1000),
@@ -97,27 +179,73 @@ def get_prompt_fields(data):
     }
 
 
-def generate_image_task(task_id, prompt, width, height, steps, filename, optimize_prompt,
-                       art_style, character_description, pose_description, background_description,
-                       clothing_description, lighting_description, composition_description,
-                       additional_details, optimization_mode):
+def get_optimizer_inputs(prompt, fields):
+    """把 get_prompt_fields 的字段名转换为提示词优化函数的参数名。"""
+    return {
+        'prompt': prompt,
+        'art_style': fields['art_style'],
+        'character': fields['character_description'],
+        'pose': fields['pose_description'],
+        'background': fields['background_description'],
+        'clothing': fields['clothing_description'],
+        'lighting': fields['lighting_description'],
+        'composition': fields['composition_description'],
+        'details': fields['additional_details'],
+    }
+
+
+def optimize_prompt_stage(task_id, prompt, fields, generation_args):
     """
-    后台图片生成任务
+    提示词优化前置阶段：在独立线程池中等待 DeepSeek，完成后才把任务交给生成工作线程
     """
-    pipe_acquired = False
-    saved_image_path = None
+    handed_off = False
 
     def update_task(**changes):
         if not task_manager.update(task_id, **changes):
             raise GenerationCancelled()
 
-    def cleanup_cancelled_output():
-        if not saved_image_path:
-            return
-        gallery_dir = Path(config_manager.get("gallery_dir", "gallery")).resolve()
-        folder = Path(saved_image_path).resolve().parent
-        if folder != gallery_dir and folder.is_relative_to(gallery_dir) and folder.exists():
-            shutil.rmtree(folder)
+    try:
+        task_manager.raise_if_cancelled(task_id)
+        update_task(status='optimizing', progress=5, stage='正在优化提示词...')
+
+        inputs = get_optimizer_inputs(prompt, fields)
+        optimize_start = time.time()
+        prompt, source = get_async_optimizer().optimize_blocking(**inputs)
+        timings = {'prompt_optimization_seconds': round(time.time() - optimize_start, 3)}
+        task_manager.raise_if_cancelled(task_id)
+        update_task(status='pending', progress=10, stage='提示词优化完成，准备生成...')
+
+        optimization_record = None
+        if source != 'fallback':
+            optimization_record = {'inputs': inputs, 'result': prompt, 'source': source}
+        generation_worker.submit(
+            task_id, prompt, *generation_args, optimization_record=optimization_record, timings=timings,
+        )
+        handed_off = True
+    except GenerationCancelled:
+        print(f"🚫 [任务 {task_id}] 任务已在提示词优化阶段取消")
+    except Exception as e:
+        if not task_manager.is_cancelled(task_id):
+            report_task_failure(task_id, e)
+    finally:
+        if not handed_off:
+            task_manager.finish_worker(task_id)
+
+
+def generate_image_task(task_id, prompt, width, height, steps, filename, optimization_mode, encoding=None,
+                        worker_state=None, optimization_record=None, timings=None):
+    """
+    后台图片生成任务，由常驻生成工作线程调用；推理完成后把保存阶段交给 I/O 执行器
+
+    提示词此时已是最终版本，GPU 推理锁只覆盖真正的推理过程。
+    """
+    pipe_acquired = False
+    handed_off = False
+    release_output = None
+
+    def update_task(**changes):
+        if not task_manager.update(task_id, **changes):
+            raise GenerationCancelled()
 
     try:
         task_manager.raise_if_cancelled(task_id)
@@ -129,24 +257,6 @@ def generate_image_task(task_id, prompt, width, height, steps, filename, optimiz
 
         task_manager.raise_if_cancelled(task_id)
 
-        # 如果启用提示词优化
-        if optimize_prompt:
-            update_task(status='optimizing', progress=5, stage='正在优化提示词...')
-
-            prompt = optimize_with_custom_input(
-                prompt,
-                art_style=art_style,
-                character=character_description,
-                pose=pose_description,
-                background=background_description,
-                clothing=clothing_description,
-                lighting=lighting_description,
-                composition=composition_description,
-                details=additional_details
-            )
-            task_manager.raise_if_cancelled(task_id)
-            update_task(status='pending', progress=10, stage='提示词优化完成，准备生成...')
-
         filename = validate_file_extension(filename)
 
         print(f"🔄 [任务 {task_id}] 开始生成图片: {prompt}")
@@ -174,21 +284,39 @@ def generate_image_task(task_id, prompt, width, height, steps, filename, optimiz
             "guidance_scale": 0.0,
         }
 
+        # 复用工作线程常驻的随机数生成器，每个任务只重新设置种子。生成器与 CUDA 流必须位于管线实际执行的设备上，
+        # 否则多卡加载（device_map）时初始噪声会因设备不一致而创建失败。
+        if worker_state is not None:
+            worker_state.bind_device(getattr(pipe, '_execution_device', None))
+        seed = random.randrange(2**63)
+        if worker_state is not None and worker_state.generator is not None:
+            worker_state.generator.manual_seed(seed)
+            generation_params["generator"] = worker_state.generator
+        else:
+            # 没有可复用的生成器时管线自行取随机数，种子无法复现，不写入元数据。
+            seed = None
+
+        # numpy 输出原地转换为 uint8，写入工作线程复用的缓冲区，省去 PIL 输出路径上的几份整图副本。
+        if config_manager.get('numpy_output', True):
+            generation_params["output_type"] = "np"
+
         # 确保所有参数都不为 None
         for key, value in generation_params.items():
             if value is None:
                 raise ValueError(f"参数 {key} 不能为 None")
 
-        print(f"📝 生成参数: prompt={prompt[:50]}..., size={width}x{height}, steps={steps}")
+        print(f"📝 生成参数: prompt={prompt[:50]}..., size={width}x{height}, steps={steps}, seed={seed}")
         print(f"🎨 [任务 {task_id}] 开始图片生成...")
 
         update_task(status='preparing', progress=15, stage='准备生成...')
         task_manager.raise_if_cancelled(task_id)
 
-        image = pipe(
-            **generation_params,
-            callback_on_step_end=progress_callback,
-        ).images[0]
+        stream_context = worker_state.stream_context() if worker_state is not None else nullcontext()
+        with stream_context:
+            images = pipe(
+                **generation_params,
+                callback_on_step_end=progress_callback,
+            ).images
         task_manager.raise_if_cancelled(task_id)
         print(f"✅ [任务 {task_id}] 图片生成完成")
 
@@ -196,22 +324,82 @@ def generate_image_task(task_id, prompt, width, height, steps, filename, optimiz
         model_manager.release_pipe_after_inference()
         pipe_acquired = False
 
+        # 缓冲区在保存阶段结束后才归还，期间下一次生成会使用另一块。
+        buffer_pool = worker_state.buffers.setdefault('output', ImageBufferPool()) if worker_state else None
+        image, output_buffer = to_shared_image(images[0], buffer_pool)
+        del images
+        if buffer_pool is not None and output_buffer is not None:
+            release_output = partial(buffer_pool.release, output_buffer)
+
         gen_time = time.time() - start_time
         print(f"⏱️ [任务 {task_id}] 生成耗时: {gen_time:.2f}秒")
 
+        # 编码与写盘交给 I/O 执行器，工作线程立即处理下一个任务；保存阶段积压时这里会阻塞。
+        update_task(status='saving', progress=95, stage='正在保存图片...')
+        save_executor.submit(
+            save_generation_output, task_id, image, filename, prompt, width, height, steps,
+            gen_time, optimization_mode, optimization_record,
+            seed=seed, model=Path(model_manager.model_path or '').name or None, timings=timings,
+            encoding=encoding, release_output=release_output,
+        )
+        handed_off = True
+
+    except GenerationCancelled:
+        print(f"🚫 [任务 {task_id}] 任务已取消，工作线程已退出")
+    except Exception as e:
+        if not task_manager.is_cancelled(task_id):
+            report_task_failure(task_id, e)
+    finally:
+        if pipe_acquired:
+            model_manager.release_pipe_after_inference()
+        if not handed_off:
+            if release_output is not None:
+                release_output()
+            task_manager.finish_worker(task_id)
+
+
+def save_generation_output(task_id, image, filename, prompt, width, height, steps, gen_time,
+                           optimization_mode, optimization_record=None, seed=None, model=None, timings=None,
+                           encoding=None, release_output=None):
+    """
+    后台保存阶段：编码原图、生成缩略图、写入元数据，在 I/O 执行器中运行
+
+    release_output 在保存结束（含失败与取消）后调用，归还图像共享的像素缓冲区。
+    """
+    saved_image_path = None
+
+    def update_task(**changes):
+        if not task_manager.update(task_id, **changes):
+            raise GenerationCancelled()
+
+    def cleanup_cancelled_output():
+        if not saved_image_path:
+            return
+        gallery_dir = Path(config_manager.get("gallery_dir", "gallery")).resolve()
+        folder = Path(saved_image_path).resolve().parent
+        if folder == resolve_folder(gallery_dir, folder.name):
+            shutil.rmtree(folder)
+            get_gallery_index().remove(folder.name)
+            forget_thumbnails(folder.name)
+
+    try:
+        task_manager.raise_if_cancelled(task_id)
+
         # 保存图片到画廊
         try:
             save_start = time.time()
             print(f"💾 [任务 {task_id}] 调用 save_to_gallery...")
 
-            update_task(status='saving', progress=95, stage='正在保存图片...')
-
             saved_image_path = save_to_gallery(
                 image, filename, prompt, width, height, steps,
                 gen_time, optimization_mode,
                 cancellation_check=lambda: task_manager.raise_if_cancelled(task_id),
+                optimization_record=optimization_record,
+                seed=seed,
+                model=model,
+                timings=timings,
+                encoding=encoding,
             )
-            invalidate_gallery_cache()
             task_manager.raise_if_cancelled(task_id)
             save_duration = time.time() - save_start
             print(f"💾 [任务 {task_id}] 图片保存完成，耗时: {save_duration:.2f}秒")
@@ -226,9 +414,8 @@ def generate_image_task(task_id, prompt, width, height, steps, filename, optimiz
         # 构建文件路径和URL
         print(f"🔗 [任务 {task_id}] 构建文件路径...")
         file_path = Path(saved_image_path)
-        gallery_dir = Path(config_manager.get("gallery_dir", "gallery"))
-        relative_path = file_path.resolve().relative_to(gallery_dir.resolve())
-        image_url = f"/gallery/{quote(relative_path.as_posix(), safe='/')}"
+        # URL 只包含作品目录名，与目录布局（分片或平铺）无关。
+        image_url = f"/gallery/{quote(file_path.parent.name + '/' + file_path.name, safe='/')}"
 
         # 任务完成
         print(f"🎉 [任务 {task_id}] 全部完成！")
@@ -247,27 +434,57 @@ def generate_image_task(task_id, prompt, width, height, steps, filename, optimiz
 
     except GenerationCancelled:
         cleanup_cancelled_output()
-        print(f"🚫 [任务 {task_id}] 任务已取消，工作线程已退出")
+        print(f"🚫 [任务 {task_id}] 任务已取消，保存阶段已退出")
     except Exception as e:
         if task_manager.is_cancelled(task_id):
             cleanup_cancelled_output()
             return
+        report_task_failure(task_id, e)
+    finally:
+        if release_output is not None:
+            release_output()
+        task_manager.finish_worker(task_id)
 
-        import traceback
-        error_msg = f"❌ 生成失败: {str(e)}"
-        if "out of memory" in str(e).lower():
-            error_msg += "\n💡 检测到显存不足,请尝试使用低显存优化模式"
 
-        # 打印完整的错误堆栈以便调试
-        print(f"❌ [任务 {task_id}] 生成失败: {e}")
-        print("完整错误堆栈:")
-        traceback.print_exc()
+def report_task_failure(task_id, error):
+    import traceback
+    error_msg = f"❌ 生成失败: {str(error)}"
+    if "out of memory" in str(error).lower():
+        error_msg += "\n💡 检测到显存不足,请尝试使用低显存优化模式"
 
-        task_manager.fail(task_id, error_msg)
-    finally:
-        if pipe_acquired:
-            model_manager.release_pipe_after_inference()
-        task_manager.finish_worker(task_id)
+    # 打印完整的错误堆栈以便调试
+    print(f"❌ [任务 {task_id}] 生成失败: {error}")
+    print("完整错误堆栈:")
+    traceback.print_exc()
+
+    task_manager.fail(task_id, error_msg)
+
+
+def run_generation_job(job, worker_state):
+    generate_image_task(job.task_id, *job.args, worker_state=worker_state, **job.kwargs)
+
+
+# 提示词优化只占用网络等待，单独限流，不持有 GPU 推理锁。
+prompt_executor = BoundedExecutor(
+    max_workers=validate_integer(
+        '提示词优化并发数', config_manager.get('prompt_optimization_concurrency', 2), 1, 16
+    ),
+    max_pending=64,
+    name='prompt-optimize',
+)
+save_executor = BoundedExecutor(
+    max_workers=validate_integer('保存线程数量', config_manager.get('save_workers', 2), 1, 16),
+    max_pending=validate_integer('保存队列长度', config_manager.get('max_pending_saves', 4), 0, 64),
+    name='gallery-save',
+)
+generation_worker = GenerationWorker(
+    run_generation_job,
+    num_workers=validate_integer('生成工作线程数量', config_manager.get('generation_workers', 1), 1, 8),
+)
+# atexit 后注册先执行：按提示词、生成、保存的顺序逐级排空。
+atexit.register(save_executor.shutdown)
+atexit.register(generation_worker.shutdown)
+atexit.register(prompt_executor.shutdown)
 
 
 # ==================== 页面路由 ====================
@@ -280,56 +497,63 @@ def index():
 
 @app.route('/gallery')
 def gallery():
-    """画廊页面"""
-    gallery_dir = Path(config_manager.get("gallery_dir", "gallery"))
-    try:
-        requested_page = int(request.args.get('page', 1))
-    except (TypeError, ValueError):
-        requested_page = 1
-    page = max(1, requested_page)
+    """画廊页面：从画廊索引按游标分页，after 翻到更旧的一页，before 翻回更新的一页；支持与搜索 API 相同的筛选参数"""
     page_size = validate_integer(
         '画廊分页大小', config_manager.get('gallery_page_size', 24), 6, 60
     )
-
-    folders = get_gallery_folders(gallery_dir)
-    total_images = len(folders)
+    index = get_gallery_index()
+    search_args = {key: request.args[key] for key in GALLERY_SEARCH_KEYS if request.args.get(key, '').strip()}
+    search_error = None
+    try:
+        search = get_gallery_search(request.args)
+    except ValueError as e:
+        search, search_error = GallerySearch(), str(e)
+    page_cursor = request.args.get('after')
+    bundle = None
+    if not index.ready:
+        # 索引还在后台构建，先直接列出磁盘上的作品；此时不支持搜索。
+        index.start_build()
+        if not search.is_empty():
+            search, search_error = GallerySearch(), GALLERY_INDEX_BUILDING_MESSAGE
+        try:
+            listing = list_from_disk(index.gallery_dir, page_size, after=page_cursor, before=request.args.get('before'))
+        except ValueError:
+            page_cursor = None
+            listing = list_from_disk(index.gallery_dir, page_size)
+        items, older_cursor, newer_cursor = listing.items, listing.older_cursor, listing.newer_cursor
+        total_images, first_index = listing.total, listing.offset
+        images = [serialize_gallery_item(item) for item in items]
+    else:
+        try:
+            items, older_cursor, newer_cursor = index.page(
+                page_size, after=page_cursor, before=request.args.get('before'), search=search
+            )
+        except ValueError:
+            page_cursor = None
+            items, older_cursor, newer_cursor = index.page(page_size, search=search)
+        total_images = index.count(search)
+        first_index = index.position(items[0], search) if items else 0
+        images = [serialize_gallery_item(item) for item in items]
+        # 首屏不知道屏幕像素密度，合并包使用默认缩略图尺寸；之后的分块由前端按卡片宽度选择。
+        if bundles_enabled():
+            bundle = attach_page_bundle(index, items, images, PRIMARY_THUMBNAIL_SIZE)
     total_pages = max(1, math.ceil(total_images / page_size))
-    page = min(page, total_pages)
-    start = (page - 1) * page_size
-    visible_folders = folders[start:start + page_size]
-    images = []
-    for image_folder in visible_folders:
-        image_files = (
-            list(image_folder.glob('*.png'))
-            + list(image_folder.glob('*.jpg'))
-            + list(image_folder.glob('*.jpeg'))
-        )
-        if not image_files:
-            continue
-        image_file = image_files[0]
-        info_file = image_folder / f"{image_file.stem}_info.txt"
-        info = {}
-        if info_file.exists():
-            with open(info_file, 'r', encoding='utf-8') as file:
-                for line in file:
-                    if ':' in line:
-                        key, value = line.strip().split(':', 1)
-                        info[key] = value
-
-        relative_path = image_file.relative_to(gallery_dir)
-        images.append({
-            'name': image_file.name,
-            'folder': image_folder.name,
-            'path': f"/gallery/{quote(relative_path.as_posix(), safe='/')}",
-            'info': info,
-        })
 
     return render_template(
         'gallery.html',
         images=images,
+        bundle=bundle,
         total_images=total_images,
-        page=page,
+        page=first_index // page_size + 1,
         total_pages=total_pages,
+        first_index=first_index,
+        older_cursor=older_cursor,
+        newer_cursor=newer_cursor,
+        page_cursor=page_cursor,
+        page_size=page_size,
+        searching=not search.is_empty(),
+        search_args=search_args,
+        search_error=search_error,
     )
 
 
@@ -343,6 +567,21 @@ def api_status():
     })
 
 
+@app.route('/api/metrics')
+def api_metrics():
+    """获取生成流水线、提示词缓存与 DeepSeek 熔断器的运行指标"""
+    return jsonify({
+        'generation': {
+            'active_tasks': task_manager.active_count(),
+            'queued_jobs': generation_worker.pending_count(),
+            'busy_workers': generation_worker.busy_count(),
+            'pending_saves': save_executor.in_flight(),
+        },
+        'prompt_cache': prompt_cache.stats(),
+        'prompt_client': get_async_optimizer().stats(),
+    })
+
+
 @app.route('/api/config')
 def api_config():
     """获取配置"""
@@ -351,7 +590,12 @@ def api_config():
         'default_height': config_manager.get("default_height"),
         'default_steps': config_manager.get("default_steps"),
         'default_filename': config_manager.get("default_filename"),
-        'default_optimization_mode': config_manager.get("default_optimization_mode", "basic")
+        'default_optimization_mode': config_manager.get("default_optimization_mode", "basic"),
+        'output_encoding': config_manager.get("output_encoding", "auto"),
+        'encodings': [
+            {'name': name, 'label': '按文件扩展名' if name == 'auto' else ENCODING_POLICIES[name].label}
+            for name in get_encoding_names()
+        ],
     })
 
 
@@ -409,16 +653,8 @@ def api_optimize_prompt():
         fields = get_prompt_fields(data)
 
         # 调用优化函数
-        optimized_prompt = optimize_with_custom_input(
-            prompt,
-            art_style=fields['art_style'],
-            character=fields['character_description'],
-            pose=fields['pose_description'],
-            background=fields['background_description'],
-            clothing=fields['clothing_description'],
-            lighting=fields['lighting_description'],
-            composition=fields['composition_description'],
-            details=fields['additional_details']
+        optimized_prompt, _source = get_async_optimizer().optimize_blocking(
+            **get_optimizer_inputs(prompt, fields)
         )
 
         return jsonify({
@@ -436,6 +672,77 @@ def api_optimize_prompt():
         }), 500
 
 
+@app.route('/api/optimize-prompt/stream', methods=['POST'])
+def api_optimize_prompt_stream():
+    """
+    流式优化提示词 API
+    以 NDJSON 逐行返回 {"type": "delta", "text"}，最后一行为 {"type": "done", "optimized_prompt", "source"}
+    """
+    try:
+        data = get_json_object()
+        prompt = get_text_field(data, 'prompt', '提示词', 4000, required=True)
+        fields = get_prompt_fields(data)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+
+    def generate():
+        for event in stream_optimized_prompt(**get_optimizer_inputs(prompt, fields)):
+            yield json.dumps(event, ensure_ascii=False) + '\n'
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='application/x-ndjson',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+
+
+@app.route('/api/optimize-prompt/batch', methods=['POST'])
+def api_optimize_prompt_batch():
+    """
+    批量优化提示词 API
+    请求体为 {"items": [{prompt, art_style, ...}, ...], "pack_size": 可选}，结果顺序与输入一致
+    """
+    try:
+        data = get_json_object()
+        items = data.get('items')
+        if not isinstance(items, list) or not items:
+            raise ValueError('items必须是非空数组')
+        if len(items) > 200:
+            raise ValueError('单次最多优化200条提示词')
+        pack_size = validate_integer(
+            '打包条数', data.get('pack_size', config_manager.get('prompt_pack_size', 8)), 1, 20
+        )
+
+        specs = []
+        for item in items:
+            if not isinstance(item, dict):
+                raise ValueError('items中的每一项都必须是JSON对象')
+            prompt = get_text_field(item, 'prompt', '提示词', 4000, required=True)
+            specs.append(get_optimizer_inputs(prompt, get_prompt_fields(item)))
+
+        optimizer = get_async_optimizer()
+        if pack_size > 1:
+            results = optimizer.optimize_packed_blocking(specs, pack_size=pack_size)
+        else:
+            results = optimizer.optimize_many_blocking(specs)
+        return jsonify({
+            'success': True,
+            'results': [
+                {'optimized_prompt': text, 'source': source}
+                for text, source in results
+            ],
+            'message': f'已优化 {len(results)} 条提示词'
+        })
+
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'批量优化失败: {str(e)}'
+        }), 500
+
+
 @app.route('/api/generate', methods=['POST'])
 def api_generate():
     """
@@ -456,6 +763,9 @@ def api_generate():
         height = validate_integer('高度', data.get('height', 1024), 256, 4096, multiple_of=64)
         steps = validate_integer('生成步数', data.get('steps', 9), 4, 20)
         filename = validate_file_extension(data.get('filename', 'generated_image.png'))
+        encoding = data.get('encoding') or None
+        if encoding is not None and encoding not in get_encoding_names():
+            raise ValueError(f"编码方式必须是: {', '.join(get_encoding_names())}")
         optimize_prompt = data.get('optimize_prompt', False)
         if not isinstance(optimize_prompt, bool):
             raise ValueError('是否优化提示词必须是布尔值')
@@ -472,24 +782,31 @@ def api_generate():
         if task_id is None:
             return jsonify({
                 'success': False,
-                'message': '已有生成任务正在运行，请等待完成或先取消该任务',
+                'message': '生成队列已满，请等待当前任务完成或先取消任务',
                 'task_id': active_task_id,
             }), 409
 
-        # 启动后台线程生成图片
-        thread = threading.Thread(
-            target=generate_image_task,
-            args=(task_id, prompt, width, height, steps, filename, optimize_prompt,
-                  fields['art_style'], fields['character_description'], fields['pose_description'],
-                  fields['background_description'], fields['clothing_description'],
-                  fields['lighting_description'], fields['composition_description'],
-                  fields['additional_details'], optimization_mode)
-        )
-        thread.daemon = True
+        # 需要优化时先进入提示词阶段，否则直接交给常驻工作线程排队执行
+        generation_args = (width, height, steps, filename, optimization_mode, encoding)
         try:
-            thread.start()
+            if optimize_prompt:
+                try:
+                    prompt_executor.submit(
+                        optimize_prompt_stage, task_id, prompt, fields, generation_args, timeout=0,
+                    )
+                except TimeoutError:
+                    # 提示词优化队列已满：任务尚未开始，撤销后让客户端稍后重试。
+                    task_manager.discard(task_id)
+                    response = jsonify({
+                        'success': False,
+                        'message': '提示词优化队列已满，请稍后重试',
+                    })
+                    response.headers['Retry-After'] = '5'
+                    return response, 503
+            else:
+                generation_worker.submit(task_id, prompt, *generation_args)
         except Exception:
-            task_manager.fail(task_id, '无法启动生成工作线程')
+            task_manager.fail(task_id, '无法提交到生成工作线程')
             task_manager.finish_worker(task_id)
             raise
 
@@ -562,6 +879,148 @@ def api_generate_cancel():
 
 # ==================== 删除图片 API ====================
 
+@app.route('/api/gallery/search')
+def api_gallery_search():
+    """
+    搜索画廊作品
+    q 为提示词全文检索，其余为范围筛选；结果按创建时间从新到旧，用 after 游标翻页
+    """
+    try:
+        search = get_gallery_search(request.args)
+        limit = validate_integer('每页数量', request.args.get('limit', 24), 1, 200)
+        index = get_gallery_index()
+        start = time.perf_counter()
+        if not index.ready:
+            index.start_build()
+            if not search.is_empty():
+                return gallery_index_building_response()
+            listing = list_from_disk(index.gallery_dir, limit, after=request.args.get('after') or None)
+            items, next_cursor, total = listing.items, listing.older_cursor, listing.total
+        else:
+            items, next_cursor, _newer = index.page(limit, after=request.args.get('after') or None, search=search)
+            total = index.count(search)
+        return jsonify({
+            'success': True,
+            'items': [
+                {**serialize_gallery_item(item), 'created': item['created'], 'width': item['width'],
+                 'height': item['height'], 'steps': item['steps'], 'optimization_mode': item['optimization_mode'],
+                 'gen_time': item['gen_time'], 'prompt': item['prompt']}
+                for item in items
+            ],
+            'total': total,
+            'next_cursor': next_cursor,
+            'elapsed_ms': round((time.perf_counter() - start) * 1000, 2),
+        })
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'搜索失败: {str(e)}'
+        }), 500
+
+
+def gallery_etag(version, args):
+    """画廊 API 的弱 ETag：索引版本号加查询参数与缩略图尺寸的摘要，索引不变时同一请求的 ETag 不变。"""
+    query = json.dumps(
+        [sorted(args.items(multi=True)), get_thumbnail_sizes(), bundles_enabled()],
+        ensure_ascii=False, separators=(',', ':'),
+    )
+    return f"{version}-{hashlib.blake2b(query.encode('utf-8'), digest_size=8).hexdigest()}"
+
+
+def gallery_index_building_response():
+    """索引构建期间无法搜索：返回 503 并提示稍后重试。"""
+    response = jsonify({'success': False, 'message': GALLERY_INDEX_BUILDING_MESSAGE})
+    response.status_code = 503
+    response.headers['Retry-After'] = str(GALLERY_INDEX_RETRY_SECONDS)
+    return response
+
+
+@app.route('/api/gallery')
+def api_gallery():
+    """
+    画廊作品分页 JSON：按创建时间从新到旧，after/before 为不透明游标，支持与搜索 API 相同的筛选参数
+
+    响应带弱 ETag（由索引版本号派生），客户端带 If-None-Match 重新请求且画廊未变化时返回 304，
+    不查询作品数据。游标按 (创建时间, 目录名) 键集定位，任意深度的分页代价与第一页相同。
+
+    启用 gallery_bundles 时，bundle 参数为卡片需要的像素宽度：响应中附带整页缩略图合并包的地址，
+    每个作品的 bundle 字段给出其在包内的字节范围。
+    """
+    try:
+        search = get_gallery_search(request.args)
+        limit = validate_integer(
+            '每页数量', request.args.get('limit', config_manager.get('gallery_page_size', 24)), 1, 200
+        )
+        bundle_width = request.args.get('bundle')
+        if bundle_width is not None:
+            bundle_width = validate_integer('合并包宽度', bundle_width, 1, 8192)
+        index = get_gallery_index()
+        if not index.ready:
+            index.start_build()
+            if not search.is_empty():
+                return gallery_index_building_response()
+            # 磁盘列表没有版本号，不带 ETag；索引就绪后的响应才可以条件请求。
+            listing = list_from_disk(
+                index.gallery_dir, limit, after=request.args.get('after') or None,
+                before=request.args.get('before') or None,
+            )
+            response = jsonify({
+                'success': True,
+                'items': [
+                    {**serialize_gallery_item(item), 'created': item['created'],
+                     'width': item['width'], 'height': item['height']}
+                    for item in listing.items
+                ],
+                'total': listing.total,
+                'next_cursor': listing.older_cursor,
+                'prev_cursor': listing.newer_cursor,
+                'bundle': None,
+            })
+            response.headers['Cache-Control'] = 'no-store'
+            return response
+        etag = gallery_etag(index.version, request.args)
+        bundle_missing = False
+        if request.if_none_match.contains_weak(etag):
+            response = Response(status=304)
+        else:
+            items, older_cursor, newer_cursor = index.page(
+                limit, after=request.args.get('after') or None, before=request.args.get('before') or None,
+                search=search,
+            )
+            serialized = [
+                {**serialize_gallery_item(item), 'created': item['created'],
+                 'width': item['width'], 'height': item['height']}
+                for item in items
+            ]
+            bundle = None
+            if items and bundle_width is not None and bundles_enabled():
+                bundle = attach_page_bundle(index, items, serialized, bundle_size_for(bundle_width))
+                bundle_missing = bundle is None
+            response = jsonify({
+                'success': True,
+                'items': serialized,
+                'total': index.count(search),
+                'next_cursor': older_cursor,
+                'prev_cursor': newer_cursor,
+                'bundle': {'url': bundle.url, 'size': bundle.size, 'length': bundle.length} if bundle else None,
+            })
+        # 请求了合并包但缩略图尚未齐全时不带 ETag，缩略图补齐后下次请求即可拿到合并包。
+        if not bundle_missing:
+            response.set_etag(etag, weak=True)
+        # 允许缓存但每次都需向服务器确认。
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'获取画廊失败: {str(e)}'
+        }), 500
+
+
 @app.route('/api/gallery/delete', methods=['POST'])
 def api_delete_gallery_item():
     """
@@ -574,9 +1033,9 @@ def api_delete_gallery_item():
             raise ValueError('文件夹名称无效')
 
         gallery_dir = Path(config_manager.get("gallery_dir", "gallery"))
-        folder_path = gallery_dir / folder_name
+        folder_path = resolve_folder(gallery_dir, folder_name)
 
-        if not folder_path.exists():
+        if folder_path is None:
             return jsonify({
                 'success': False,
                 'message': '图片文件夹不存在'
@@ -593,9 +1052,9 @@ def api_delete_gallery_item():
             }), 400
 
         # 删除整个文件夹
-        import shutil
         shutil.rmtree(folder_path)
-        invalidate_gallery_cache()
+        get_gallery_index().remove(folder_name)
+        forget_thumbnails(folder_name)
 
         return jsonify({
             'success': True,
@@ -611,64 +1070,191 @@ def api_delete_gallery_item():
         }), 500
 
 
+@app.route('/api/gallery/thumbnails', methods=['GET', 'POST'])
+def api_gallery_thumbnails():
+    """
+    POST 在后台为所有缺少缩略图的作品生成缩略图，GET 查询进度
+    """
+    service = get_thumbnail_service()
+    if request.method == 'GET':
+        return jsonify({'success': True, 'progress': service.progress, 'pending': service.pending_count})
+
+    gallery_dir = Path(config_manager.get("gallery_dir", "gallery")).resolve()
+    started = service.start_pregeneration(gallery_dir)
+    return jsonify({
+        'success': True,
+        'started': started,
+        'message': '缩略图预生成已开始' if started else '缩略图预生成正在进行',
+        'progress': service.progress,
+    }), 202
+
+
 # ==================== 静态文件服务 ====================
 
+THUMBNAIL_MAX_AGE = 31536000
+
+
+def send_packed_thumbnail(entry: PackedThumbnail):
+    """
+    从打包存储返回缩略图，缓存头与 send_file 一致（ETag、Last-Modified、一年的 public 缓存）
+
+    条件请求在读取内容前判断；Range 请求只读取请求的字节。
+    """
+    response = Response(mimetype='image/webp')
+    response.set_etag(entry.etag)
+    response.last_modified = entry.last_modified
+    response.cache_control.public = True
+    response.cache_control.max_age = THUMBNAIL_MAX_AGE
+    response.expires = int(time.time() + THUMBNAIL_MAX_AGE)
+    response.accept_ranges = 'bytes'
+    if request.if_none_match.contains(entry.etag) or (
+            not request.if_none_match and request.if_modified_since
+            and entry.last_modified <= request.if_modified_since):
+        response.status_code = 304
+        return response
+
+    if_range = request.if_range
+    range_applies = (
+        (if_range.etag is None and if_range.date is None)
+        or if_range.etag == entry.etag
+        or (if_range.date is not None and entry.last_modified <= if_range.date)
+    )
+    if request.range and range_applies:
+        byte_range = request.range.range_for_length(entry.length)
+        if byte_range is None:
+            response.status_code = 416
+            response.content_range = ContentRange('bytes', None, None, entry.length)
+            return response
+        start, stop = byte_range
+        response.set_data(get_thumbnail_pack().read(entry, start, stop))
+        response.status_code = 206
+        response.content_range = ContentRange('bytes', start, stop, entry.length)
+        return response
+    response.set_data(get_thumbnail_pack().read(entry))
+    return response
+
+
+@app.route('/gallery/bundle/<key>')
+def serve_gallery_bundle(key):
+    """提供画廊缩略图合并包；地址由页面内容决定，内容不会改变，可永久缓存。"""
+    path = get_bundle_cache().path(key)
+    if path is None:
+        return jsonify({'error': 'Bundle not found'}), 404
+    response = send_file(
+        str(path), mimetype='application/octet-stream', conditional=True, max_age=THUMBNAIL_MAX_AGE,
+    )
+    response.cache_control.immutable = True
+    return response
+
+
 @app.route('/gallery/thumbnail/<path:folder_name>')
 def serve_gallery_thumbnail(folder_name):
-    """按需生成并长期缓存画廊缩略图，兼容已有作品。"""
+    """提供长期缓存的画廊缩略图；缺少缩略图时排队生成，兼容已有作品。"""
+    size = request.args.get('size', PRIMARY_THUMBNAIL_SIZE, type=int)
+    if size not in get_thumbnail_sizes():
+        return jsonify({'error': 'Invalid thumbnail size'}), 404
+    # 打包存储命中时只查一次表，不访问作品目录；未命中（尚未迁移或尚未生成）时按文件处理。
+    if get_thumbnail_store() == 'pack':
+        entry = get_thumbnail_pack().lookup(folder_name, size)
+        if entry is not None:
+            return send_packed_thumbnail(entry)
+
     gallery_dir = Path(config_manager.get("gallery_dir", "gallery")).resolve()
-    folder = (gallery_dir / folder_name).resolve()
-    if folder.parent != gallery_dir or not folder.is_dir():
+    folder = resolve_folder(gallery_dir, folder_name)
+    if folder is None:
         return jsonify({'error': 'Invalid gallery item'}), 404
 
-    image_files = list(folder.glob('*.png')) + list(folder.glob('*.jpg')) + list(folder.glob('*.jpeg'))
-    if not image_files:
+    with os.scandir(folder) as entries:
+        image_name = find_gallery_image(entry.name for entry in entries if entry.is_file())
+    if not image_name:
         return jsonify({'error': 'Image not found'}), 404
-    image_path = image_files[0]
-    thumbnail_path = get_thumbnail_path(image_path)
+    image_path = folder / image_name
+    thumbnail_path = get_thumbnail_path(image_path, size)
     if not thumbnail_path.exists():
-        with thumbnail_lock:
-            if not thumbnail_path.exists():
-                try:
-                    create_gallery_thumbnail(image_path, image_path)
-                except Exception as error:
-                    print(f"⚠️ 无法生成缩略图 {image_path}: {error}")
-                    return send_file(str(image_path), conditional=True, max_age=3600)
+        # 缩略图交给后台进程池生成，本次先返回默认缩略图或原图且不缓存，下次请求即可拿到对应尺寸。
+        get_thumbnail_service().submit(image_path)
+        fallback_entry = None
+        if get_thumbnail_store() == 'pack':
+            fallback_entry = get_thumbnail_pack().lookup(folder_name, PRIMARY_THUMBNAIL_SIZE)
+        if fallback_entry is not None:
+            response = send_packed_thumbnail(fallback_entry)
+            response.expires = None
+        else:
+            fallback_path = get_thumbnail_path(image_path)
+            if not fallback_path.exists():
+                fallback_path = image_path
+            response = send_file(str(fallback_path), conditional=True, max_age=0)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
 
     return send_file(
         str(thumbnail_path),
         mimetype='image/webp',
         conditional=True,
-        max_age=31536000,
+        max_age=THUMBNAIL_MAX_AGE,
     )
 
 @app.route('/gallery/<path:filename>')
 def serve_gallery(filename):
     """
     提供画廊图片文件
-    支持子目录路径,例如: gallery/folder_name/image.png
+    路径为 <作品目录名>/<文件名>,例如: gallery/folder_name/image.png；作品目录的实际位置由目录布局决定
+
+    PNG/JPEG 原图按 Accept 协商：客户端明确接受 AVIF 或 WebP 时提供缓存的转码版本（响应带 Vary: Accept），
+    加 ?original=1 时总是提供原始文件（下载使用）。
     """
     gallery_dir = Path(config_manager.get("gallery_dir", "gallery")).resolve()
-    # 安全检查:确保请求的路径在gallery目录内
-    requested_path = (gallery_dir / filename).resolve()
+    folder_name, _, name = filename.partition('/')
+    folder = resolve_folder(gallery_dir, folder_name)
+    if folder is None or not name:
+        return jsonify({'error': 'File not found'}), 404
+    # 安全检查:确保请求的路径在作品目录内
+    folder = folder.resolve()
+    requested_path = (folder / name).resolve()
 
-    if not requested_path.is_relative_to(gallery_dir):
+    if not requested_path.is_relative_to(folder):
         return jsonify({'error': 'Invalid path'}), 403
+    # 隐藏文件不对外提供
+    if any(part.startswith('.') for part in requested_path.relative_to(folder).parts):
+        return jsonify({'error': 'File not found'}), 404
 
     if requested_path.exists() and requested_path.is_file():
+        negotiable = (
+            requested_path.suffix.lower() in TRANSCODABLE_SUFFIXES and 'original' not in request.args
+            and bool(get_variant_formats())
+        )
+        if negotiable:
+            variant = negotiate_format(value for value, quality in request.accept_mimetypes if quality > 0)
+            variant_path = get_variant_cache().get(requested_path, variant) if variant else None
+            if variant_path is not None:
+                try:
+                    response = send_file(
+                        str(variant_path), mimetype=variant.mimetype, conditional=True, max_age=31536000,
+                    )
+                    response.vary.add('Accept')
+                    return response
+                except FileNotFoundError:
+                    # 变体恰好被淘汰，本次提供原图。
+                    pass
+
         # 根据文件扩展名设置 MIME 类型
         mimetype = None
         if requested_path.suffix.lower() == '.png':
             mimetype = 'image/png'
         elif requested_path.suffix.lower() in ['.jpg', '.jpeg']:
             mimetype = 'image/jpeg'
+        elif requested_path.suffix.lower() == '.webp':
+            mimetype = 'image/webp'
 
-        return send_file(
+        response = send_file(
             str(requested_path),
             mimetype=mimetype,
             conditional=True,
             max_age=31536000,
         )
+        if negotiable:
+            response.vary.add('Accept')
+        return response
     else:
         return jsonify({'error': 'File not found'}), 404
 
@@ -704,6 +1290,23 @@ def main():
     print(f"🎨 画廊地址: http://localhost:{port}/gallery")
     print("=" * 50)
 
+    # 尽早创建缩略图工作进程，避免在索引修复等后台线程运行时 fork。
+    get_thumbnail_service().start()
+    atexit.register(get_thumbnail_service().close)
+
+    # 后台构建或修复画廊索引（补上服务未运行时在磁盘上发生的改动），完成前画廊直接列出磁盘；
+    # 同时用历史优化记录预热提示词缓存，都不阻塞启动。
+    gallery_dir = config_manager.get("gallery_dir", "gallery")
+    get_gallery_index().start_build()
+    watcher = start_gallery_watcher()
+    if watcher is not None:
+        atexit.register(watcher.stop)
+    threading.Thread(
+        target=lambda: print(f"✅ 提示词缓存预热完成: {prewarm_cache_from_gallery(gallery_dir)} 条"),
+        name='prompt-cache-prewarm',
+        daemon=True,
+    ).start()
+
     app.run(host=host, port=port, debug=debug)
 
 
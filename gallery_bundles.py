@@ -0,0 +1,215 @@
+"""
+画廊缩略图合并包模块
+把一页作品的缩略图按顺序拼接为一个文件，页面 JSON 中给出每张的字节范围，浏览器一次请求即可取回整页缩略图；
+合并包按页面内容（作品目录名、作品修改时间、尺寸）寻址，页面上任一作品变化时地址随之改变，旧包不会被误用
+"""
+
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+
+from config_manager import config_manager
+from gallery_layout import resolve_folder
+from image_processing import get_thumbnail_sizes
+from thumbnail_pack import load_thumbnail
+
+
+BUNDLES_DIRNAME = ".bundles"
+# 磁盘上保留的合并包数量上限，超出后删除最久未使用的。
+MAX_BUNDLES = 512
+MEMORY_ENTRIES = 128
+
+
+def bundles_enabled() -> bool:
+    return config_manager.get("gallery_bundles", False) is True
+
+
+def bundle_size_for(width: int, sizes: Optional[Iterable[int]] = None) -> int:
+    """按卡片需要的像素宽度选择缩略图尺寸：不小于该宽度的最小尺寸，都不够时用最大的一档。"""
+    sizes = sorted(sizes or get_thumbnail_sizes())
+    return next((size for size in sizes if size >= width), sizes[-1])
+
+
+def bundle_key(versions: Iterable[Tuple[str, int]], size: int) -> str:
+    """由页面上各作品的 (目录名, 修改时间) 与尺寸计算合并包地址；作品增删、改动或顺序变化都会得到新地址。"""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(str(size).encode("ascii"))
+    for folder_name, mtime_ns in versions:
+        digest.update(b"\0" + folder_name.encode("utf-8", "surrogateescape") + b"\0" + str(mtime_ns).encode("ascii"))
+    return digest.hexdigest()
+
+
+@dataclass(frozen=True)
+class PageBundle:
+    """一个合并包：ranges 为各作品缩略图在包内的 (偏移, 长度)。"""
+    key: str
+    size: int
+    length: int
+    ranges: Dict[str, Tuple[int, int]]
+
+    @property
+    def url(self) -> str:
+        return f"/gallery/bundle/{self.key}"
+
+
+class BundleCache:
+    """合并包缓存：第一次请求某页时生成并写入画廊目录下的 .bundles/，之后直接复用。"""
+
+    def __init__(self, gallery_dir: Union[str, Path], max_bundles: int = MAX_BUNDLES):
+        self.gallery_dir = Path(gallery_dir)
+        self.cache_dir = self.gallery_dir / BUNDLES_DIRNAME
+        self.max_bundles = max(1, max_bundles)
+        self._lock = threading.Lock()
+        self._pending: Dict[str, Future] = {}
+        self._memory: "OrderedDict[str, PageBundle]" = OrderedDict()
+        self.stats = {"hits": 0, "builds": 0, "incomplete": 0}
+
+    def path(self, key: str) -> Optional[Path]:
+        """合并包文件路径；地址格式无效或文件不存在时返回 None。"""
+        if len(key) != 32 or any(char not in "0123456789abcdef" for char in key):
+            return None
+        path = self.cache_dir / f"{key}.bin"
+        return path if path.is_file() else None
+
+    def bundle_for(self, items: List[Dict[str, Any]], versions: Dict[str, int], size: int) -> Optional[PageBundle]:
+        """
+        获取一页作品的合并包，不存在时生成
+
+        Args:
+            items: 画廊索引返回的一页作品（需要 folder 与 image）
+            versions: 作品目录名到修改时间的映射（GalleryIndex.item_versions）
+            size: 缩略图尺寸
+
+        Returns:
+            合并包；页面为空，或有作品尚未生成该尺寸缩略图时返回 None（不缓存，缩略图补齐后下次请求再生成）
+        """
+        if not items:
+            return None
+        key = bundle_key(((item["folder"], versions.get(item["folder"], 0)) for item in items), size)
+        bundle = self._lookup(key)
+        if bundle is not None:
+            return bundle
+        # 同一页的并发请求只生成一次，其余请求等待其结果；不同页的生成互不阻塞。
+        with self._lock:
+            future = self._pending.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._pending[key] = future
+        if not owner:
+            return future.result()
+
+        try:
+            bundle = self._lookup(key)
+            if bundle is None:
+                bundle = self._build(key, items, size)
+        except BaseException as error:
+            future.set_exception(error)
+            raise
+        else:
+            future.set_result(bundle)
+        finally:
+            with self._lock:
+                del self._pending[key]
+        return bundle
+
+    def _lookup(self, key: str) -> Optional[PageBundle]:
+        with self._lock:
+            bundle = self._memory.get(key)
+            if bundle is not None:
+                self._memory.move_to_end(key)
+                self.stats["hits"] += 1
+                return bundle
+        manifest_path = self.cache_dir / f"{key}.json"
+        try:
+            data = json.loads(manifest_path.read_text(encoding="utf-8"))
+            bundle = PageBundle(
+                key=key, size=data["size"], length=data["length"],
+                ranges={folder: tuple(span) for folder, span in data["ranges"].items()},
+            )
+            # 用修改时间记录最近使用，清理时按它淘汰。
+            os.utime(manifest_path)
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+        if self.path(key) is None:
+            return None
+        self._remember(bundle)
+        with self._lock:
+            self.stats["hits"] += 1
+        return bundle
+
+    def _remember(self, bundle: PageBundle):
+        with self._lock:
+            self._memory[bundle.key] = bundle
+            self._memory.move_to_end(bundle.key)
+            while len(self._memory) > MEMORY_ENTRIES:
+                self._memory.popitem(last=False)
+
+    def _build(self, key: str, items: List[Dict[str, Any]], size: int) -> Optional[PageBundle]:
+        parts, ranges, offset = [], {}, 0
+        for item in items:
+            folder = resolve_folder(self.gallery_dir, item["folder"])
+            data = load_thumbnail(folder / item["image"], size) if folder is not None else None
+            if data is None:
+                with self._lock:
+                    self.stats["incomplete"] += 1
+                return None
+            parts.append(data)
+            ranges[item["folder"]] = (offset, len(data))
+            offset += len(data)
+
+        bundle = PageBundle(key=key, size=size, length=offset, ranges=ranges)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        bin_path = self.cache_dir / f"{key}.bin"
+        temp_path = self.cache_dir / f".{key}.bin.tmp"
+        with open(temp_path, "wb") as handle:
+            handle.writelines(parts)
+        os.replace(temp_path, bin_path)
+        # 清单最后写入：清单存在即表示合并包完整。
+        manifest = asdict(bundle)
+        del manifest["key"]
+        temp_path = self.cache_dir / f".{key}.json.tmp"
+        temp_path.write_text(json.dumps(manifest, ensure_ascii=False), encoding="utf-8")
+        os.replace(temp_path, self.cache_dir / f"{key}.json")
+
+        self._remember(bundle)
+        with self._lock:
+            self.stats["builds"] += 1
+        self._prune()
+        return bundle
+
+    def _prune(self):
+        """删除超出数量上限、最久未使用的合并包。"""
+        try:
+            manifests = [entry for entry in os.scandir(self.cache_dir) if entry.name.endswith(".json")]
+        except OSError:
+            return
+        if len(manifests) <= self.max_bundles:
+            return
+        manifests.sort(key=lambda entry: entry.stat().st_mtime_ns)
+        for entry in manifests[:len(manifests) - self.max_bundles]:
+            key = entry.name[:-len(".json")]
+            with self._lock:
+                self._memory.pop(key, None)
+            for path in (Path(entry.path), self.cache_dir / f"{key}.bin"):
+                path.unlink(missing_ok=True)
+
+
+_default_cache: Optional[BundleCache] = None
+_default_cache_lock = threading.Lock()
+
+
+def get_bundle_cache() -> BundleCache:
+    """获取当前画廊目录对应的共享合并包缓存；画廊目录配置变化时重新创建。"""
+    global _default_cache
+    gallery_dir = Path(config_manager.get("gallery_dir", "gallery")).resolve()
+    with _default_cache_lock:
+        if _default_cache is None or _default_cache.gallery_dir != gallery_dir:
+            _default_cache = BundleCache(gallery_dir)
+        return _default_cache
@@ -0,0 +1,664 @@
+"""
+画廊索引模块
+用 SQLite 持久化每个作品的元数据，画廊分页按 (创建时间, 目录名) 键集查询，无需扫描目录；
+提示词全文检索使用 FTS5 倒排索引
+"""
+
+import argparse
+import base64
+import json
+import re
+import sqlite3
+import threading
+import unicodedata
+from dataclasses import dataclass, fields
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+
+from config_manager import config_manager
+from gallery_layout import iter_item_folders, resolve_folder
+from gallery_metadata import created_timestamp, describe_metadata, load_metadata_bulk, read_folder_metadata
+from gallery_placeholders import normalize_placeholder
+
+
+INDEX_FILENAME = ".gallery_index.sqlite3"
+SCHEMA_VERSION = 3
+# 全文检索命中超过该数量时改为沿时间索引扫描，避免对大量命中结果排序。
+ORDERED_SCAN_MIN_MATCHES = 500
+# 中日韩文字之间没有空格，逐字切分后由 FTS5 短语查询匹配连续的字。
+CJK_PATTERN = re.compile(r"([\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uac00-\ud7af])")
+
+
+def encode_cursor(item: Dict[str, Any]) -> str:
+    """把作品的排序键编码为 URL 安全的不透明游标。"""
+    raw = json.dumps([item["created"], item["folder"]], ensure_ascii=False).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[float, str]:
+    """解析游标；格式不正确时抛出 ValueError。"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created, folder = json.loads(raw.decode("utf-8"))
+    except (ValueError, TypeError, UnicodeDecodeError):
+        raise ValueError("分页游标无效") from None
+    if not isinstance(created, (int, float)) or isinstance(created, bool) or not isinstance(folder, str):
+        raise ValueError("分页游标无效")
+    return float(created), folder
+
+
+def search_tokens(text: str) -> str:
+    """把文本转换为写入全文索引的形式：统一全半角与大小写，中日韩文字逐字分开。"""
+    return CJK_PATTERN.sub(r" \1 ", unicodedata.normalize("NFKC", text or "").lower())
+
+
+def build_match_query(text: str) -> str:
+    """
+    把用户输入的搜索词转换为 FTS5 查询
+
+    空格分隔的每个词都必须出现（AND）；词内的字按顺序连续匹配，末尾支持前缀匹配。
+    """
+    terms = []
+    for term in unicodedata.normalize("NFKC", text or "").split():
+        if not any(character.isalnum() for character in term):
+            continue
+        phrase = " ".join(search_tokens(term).split()).replace('"', '""')
+        terms.append(f'"{phrase}"*')
+    return " AND ".join(terms)
+
+
+@dataclass
+class GallerySearch:
+    """画廊搜索条件；所有字段为空时等同于浏览全部作品。created_from/created_to 为时间戳，区间左闭右开。"""
+    text: str = ""
+    min_width: Optional[int] = None
+    max_width: Optional[int] = None
+    min_height: Optional[int] = None
+    max_height: Optional[int] = None
+    min_steps: Optional[int] = None
+    max_steps: Optional[int] = None
+    optimization_mode: Optional[str] = None
+    min_gen_time: Optional[float] = None
+    max_gen_time: Optional[float] = None
+    created_from: Optional[float] = None
+    created_to: Optional[float] = None
+
+    def is_empty(self) -> bool:
+        return not build_match_query(self.text) and all(
+            getattr(self, field.name) is None for field in fields(self) if field.name != "text"
+        )
+
+    def to_sql(self) -> Tuple[List[str], List[Any]]:
+        """生成 WHERE 条件与参数。"""
+        clauses, params = [], []
+        match_query = build_match_query(self.text)
+        if match_query:
+            clauses.append("id IN (SELECT rowid FROM gallery_search WHERE gallery_search MATCH ?)")
+            params.append(match_query)
+        for column, operator, value in (
+            ("width", ">=", self.min_width), ("width", "<=", self.max_width),
+            ("height", ">=", self.min_height), ("height", "<=", self.max_height),
+            ("steps", ">=", self.min_steps), ("steps", "<=", self.max_steps),
+            ("optimization_mode", "=", self.optimization_mode),
+            ("gen_time", ">=", self.min_gen_time), ("gen_time", "<=", self.max_gen_time),
+            ("created", ">=", self.created_from), ("created", "<", self.created_to),
+        ):
+            if value is not None:
+                clauses.append(f"{column} {operator} ?")
+                params.append(value)
+        return clauses, params
+
+
+def record_from_metadata(folder_name: str, metadata: Optional[Dict[str, Any]], mtime_ns: int) -> Optional[Dict[str, Any]]:
+    """把作品元数据转换为索引记录；没有原图时返回 None。"""
+    if metadata is None or not metadata.get("image"):
+        return None
+    timings = metadata.get("timings") or {}
+    return {
+        "folder": folder_name,
+        "image": metadata["image"],
+        "created": created_timestamp(metadata) or 0.0,
+        "width": metadata.get("width"),
+        "height": metadata.get("height"),
+        "steps": metadata.get("steps"),
+        "optimization_mode": metadata.get("optimization_mode"),
+        "gen_time": timings.get("generation_seconds"),
+        "prompt": metadata.get("prompt") or "",
+        "info": describe_metadata(metadata),
+        "placeholder": normalize_placeholder(metadata.get("placeholder")),
+        "mtime_ns": mtime_ns,
+    }
+
+
+def build_record(folder: Path) -> Optional[Dict[str, Any]]:
+    """
+    读取作品目录，生成索引记录
+
+    Returns:
+        索引记录；目录中没有图片时返回 None
+    """
+    try:
+        mtime_ns = folder.stat().st_mtime_ns
+    except OSError:
+        return None
+    return record_from_metadata(folder.name, read_folder_metadata(folder), mtime_ns)
+
+
+@dataclass
+class DiskListing:
+    """索引就绪前直接扫描磁盘得到的一页作品；offset 为本页之前（更新）的作品数量。"""
+    items: List[Dict[str, Any]]
+    older_cursor: Optional[str]
+    newer_cursor: Optional[str]
+    total: int
+    offset: int
+
+
+def list_from_disk(gallery_dir: Union[str, Path], limit: int, after: Optional[str] = None,
+                   before: Optional[str] = None) -> DiskListing:
+    """
+    不经过索引，按作品目录的修改时间从新到旧分页
+
+    只 stat 全部目录，元数据只读取当前页的；游标与 GalleryIndex.page 的格式相同，
+    排序键用目录修改时间近似创建时间。游标格式不正确时抛出 ValueError。
+    """
+    entries = []
+    for entry in iter_item_folders(gallery_dir):
+        try:
+            mtime_ns = entry.stat().st_mtime_ns
+        except OSError:
+            continue
+        entries.append((mtime_ns / 1e9, entry.name, mtime_ns, entry.path))
+    entries.sort(reverse=True)
+
+    if before:
+        key = decode_cursor(before)
+        newer = [entry for entry in entries if entry[:2] > key]
+        offset = max(0, len(newer) - limit)
+        selected, has_newer, has_older = newer[offset:], offset > 0, True
+    else:
+        offset = 0
+        if after:
+            key = decode_cursor(after)
+            offset = sum(1 for entry in entries if entry[:2] >= key)
+        selected = entries[offset:offset + limit]
+        has_newer, has_older = bool(after), len(entries) > offset + limit
+
+    items = []
+    for (created, name, mtime_ns, _path), metadata in zip(
+        selected, load_metadata_bulk(entry[3] for entry in selected)
+    ):
+        record = record_from_metadata(name, metadata, mtime_ns)
+        if record is not None:
+            record.pop("mtime_ns")
+            items.append(record)
+    older = encode_cursor({"created": selected[-1][0], "folder": selected[-1][1]}) if selected and has_older else None
+    newer = encode_cursor({"created": selected[0][0], "folder": selected[0][1]}) if selected and has_newer else None
+    return DiskListing(items, older, newer, len(entries), offset)
+
+
+class GalleryIndex:
+    """画廊元数据索引；由保存与删除操作就地更新，repair() 用于修复外部改动。"""
+
+    COLUMNS = (
+        "folder", "image", "created", "width", "height", "steps", "optimization_mode",
+        "gen_time", "prompt", "info", "placeholder", "mtime_ns",
+    )
+
+    def __init__(self, gallery_dir: Union[str, Path], db_path: Optional[Union[str, Path]] = None):
+        """
+        初始化索引
+
+        Args:
+            gallery_dir: 画廊目录
+            db_path: 索引文件路径，默认放在画廊目录中，随画廊一起迁移
+        """
+        self.gallery_dir = Path(gallery_dir)
+        self.db_path = Path(db_path) if db_path else self.gallery_dir / INDEX_FILENAME
+        self._lock = threading.RLock()
+        self._repair_lock = threading.Lock()
+        self._connection = None
+        self._built = False
+        self._build_lock = threading.Lock()
+        self._build_thread: Optional[threading.Thread] = None
+
+    def _get_connection(self) -> sqlite3.Connection:
+        if self._connection is None:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            connection = sqlite3.connect(str(self.db_path), check_same_thread=False)
+            connection.row_factory = sqlite3.Row
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute("CREATE TABLE IF NOT EXISTS gallery_meta (key TEXT PRIMARY KEY, value TEXT)")
+            row = connection.execute("SELECT value FROM gallery_meta WHERE key = 'schema_version'").fetchone()
+            if row is not None and row["value"] != str(SCHEMA_VERSION):
+                # 旧版本索引直接丢弃，随后由 ensure_built 从磁盘重建。
+                connection.execute("DROP TABLE IF EXISTS gallery_items")
+                connection.execute("DROP TABLE IF EXISTS gallery_search")
+                connection.execute("DELETE FROM gallery_meta WHERE key = 'schema_version'")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS gallery_items ("
+                "id INTEGER PRIMARY KEY, folder TEXT NOT NULL UNIQUE, image TEXT NOT NULL, "
+                "created REAL NOT NULL, width INTEGER, height INTEGER, steps INTEGER, "
+                "optimization_mode TEXT, gen_time REAL, prompt TEXT NOT NULL DEFAULT '', "
+                "info TEXT NOT NULL DEFAULT '{}', placeholder TEXT, mtime_ns INTEGER NOT NULL DEFAULT 0)"
+            )
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS idx_gallery_items_order ON gallery_items(created DESC, folder DESC)"
+            )
+            connection.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS gallery_search USING fts5("
+                "tokens, tokenize = 'unicode61 remove_diacritics 2')"
+            )
+            connection.commit()
+            self._connection = connection
+        return self._connection
+
+    def _schema_current(self) -> bool:
+        with self._lock:
+            row = self._get_connection().execute(
+                "SELECT value FROM gallery_meta WHERE key = 'schema_version'"
+            ).fetchone()
+        return row is not None and row["value"] == str(SCHEMA_VERSION)
+
+    @property
+    def ready(self) -> bool:
+        """本次启动后是否已与磁盘对账，可以直接查询。"""
+        return self._built
+
+    def ensure_built(self):
+        """索引第一次创建时从磁盘完整构建一次，之后只做增量更新。"""
+        if self._built:
+            return
+        with self._build_lock:
+            if not self._built:
+                self.repair()
+                self._built = True
+
+    def start_build(self) -> bool:
+        """
+        在后台线程中构建索引（或与磁盘对账），完成前 ready 为 False
+
+        Returns:
+            索引已就绪或已有构建在运行时返回 False
+        """
+        with self._build_lock:
+            if self._built or (self._build_thread is not None and self._build_thread.is_alive()):
+                return False
+
+            def run():
+                try:
+                    self.ensure_built()
+                    print(f"✅ 画廊索引已与磁盘同步: 共 {self.count()} 个作品")
+                except Exception as error:
+                    print(f"❌ 画廊索引构建失败: {error}")
+
+            self._build_thread = threading.Thread(target=run, name="gallery-index-build", daemon=True)
+            self._build_thread.start()
+            return True
+
+    # ---------- 增量更新 ----------
+
+    def upsert(self, record: Dict[str, Any]):
+        self.upsert_many([record])
+
+    def upsert_many(self, records: List[Dict[str, Any]]):
+        """在一个事务中写入多条记录。"""
+        if not records:
+            return
+        with self._lock:
+            connection = self._get_connection()
+            self._write_locked(connection, records)
+            self._bump_version_locked(connection)
+            connection.commit()
+
+    def _write_locked(self, connection, records):
+        """写入作品记录并同步全文索引；全文索引的 rowid 与作品 id 一致。"""
+        updates = ", ".join(f"{column} = excluded.{column}" for column in self.COLUMNS if column != "folder")
+        sql = (
+            f"INSERT INTO gallery_items ({', '.join(self.COLUMNS)}) "
+            f"VALUES ({', '.join('?' for _ in self.COLUMNS)}) "
+            f"ON CONFLICT(folder) DO UPDATE SET {updates} RETURNING id"
+        )
+        for record in records:
+            row = dict(record)
+            row["info"] = json.dumps(row.get("info") or {}, ensure_ascii=False)
+            row["placeholder"] = json.dumps(row["placeholder"]) if row.get("placeholder") else None
+            item_id = connection.execute(sql, tuple(row.get(column) for column in self.COLUMNS)).fetchone()[0]
+            connection.execute("DELETE FROM gallery_search WHERE rowid = ?", (item_id,))
+            connection.execute(
+                "INSERT INTO gallery_search (rowid, tokens) VALUES (?, ?)",
+                (item_id, search_tokens(f"{row.get('prompt') or ''} {Path(row['image']).stem}")),
+            )
+
+    @staticmethod
+    def _delete_locked(connection, folder_names) -> int:
+        deleted = 0
+        for folder_name in folder_names:
+            connection.execute(
+                "DELETE FROM gallery_search WHERE rowid IN (SELECT id FROM gallery_items WHERE folder = ?)",
+                (folder_name,),
+            )
+            deleted += connection.execute("DELETE FROM gallery_items WHERE folder = ?", (folder_name,)).rowcount
+        return deleted
+
+    @staticmethod
+    def _bump_version_locked(connection):
+        """索引内容每次变化时递增版本号，与改动在同一事务中提交；重建索引时版本号不会回退。"""
+        connection.execute(
+            "INSERT INTO gallery_meta (key, value) VALUES ('version', '1') "
+            "ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + 1"
+        )
+
+    def index_folder(self, folder: Union[str, Path]) -> Optional[Dict[str, Any]]:
+        """重新读取单个作品目录并更新索引；目录已不存在或没有图片时移除。"""
+        folder = Path(folder)
+        record = build_record(folder)
+        if record is None:
+            self.remove(folder.name)
+        else:
+            self.upsert(record)
+        return record
+
+    def remove(self, folder_name: str):
+        with self._lock:
+            connection = self._get_connection()
+            if self._delete_locked(connection, [folder_name]):
+                self._bump_version_locked(connection)
+            connection.commit()
+
+    def repair(self, full: bool = False, workers: int = 8) -> Dict[str, int]:
+        """
+        与磁盘对账：新增或修改过的目录重新读取，已删除的目录移出索引
+
+        Args:
+            full: 忽略目录修改时间，全部重新读取
+            workers: 并发读取目录的线程数
+
+        Returns:
+            {"indexed": 重新读取的目录数, "removed": 移除的条目数, "total": 索引中的作品数}
+        """
+        with self._repair_lock:
+            if not self._schema_current():
+                print("🔧 正在构建画廊索引...")
+                full = True
+            return self._repair_locked(full, workers)
+
+    def _repair_locked(self, full, workers):
+        with self._lock:
+            connection = self._get_connection()
+            known = {
+                row["folder"]: row["mtime_ns"]
+                for row in connection.execute("SELECT folder, mtime_ns FROM gallery_items")
+            }
+
+        on_disk, paths = {}, {}
+        for entry in iter_item_folders(self.gallery_dir):
+            try:
+                on_disk[entry.name] = entry.stat().st_mtime_ns
+            except OSError:
+                continue
+            paths[entry.name] = Path(entry.path)
+
+        changed = [
+            paths[name] for name, mtime_ns in on_disk.items()
+            if full or known.get(name) != mtime_ns
+        ]
+        removed = [name for name in known if name not in on_disk]
+
+        metadata = load_metadata_bulk(changed, workers=workers)
+        records = [
+            record_from_metadata(folder.name, data, on_disk[folder.name])
+            for folder, data in zip(changed, metadata)
+        ]
+
+        with self._lock:
+            connection = self._get_connection()
+            rows = []
+            for folder, record in zip(changed, records):
+                if record is None:
+                    if folder.name in known:
+                        removed.append(folder.name)
+                    continue
+                rows.append(record)
+            self._write_locked(connection, rows)
+            self._delete_locked(connection, removed)
+            if full or rows or removed:
+                self._bump_version_locked(connection)
+            if full:
+                connection.execute(
+                    "INSERT OR REPLACE INTO gallery_meta (key, value) VALUES ('schema_version', ?)",
+                    (str(SCHEMA_VERSION),),
+                )
+            connection.commit()
+            total = connection.execute("SELECT COUNT(*) FROM gallery_items").fetchone()[0]
+        return {"indexed": len(rows), "removed": len(removed), "total": total}
+
+    def refresh(self, folder_names: Iterable[str], workers: int = 8) -> Dict[str, int]:
+        """
+        重新读取指定的作品目录，供目录监听增量更新
+
+        与 repair() 不同，这里不按目录修改时间跳过：就地改写目录中的文件不会改变目录的修改时间。
+        读取后内容与索引一致时只记录新的修改时间，不递增版本号，画廊 API 的 ETag 保持不变。
+
+        Returns:
+            {"indexed": 内容有变化的目录数, "removed": 移除的条目数, "unchanged": 未变化的目录数}
+        """
+        self.ensure_built()
+        names = sorted({name for name in folder_names if name and not name.startswith(".")})
+        with self._repair_lock:
+            return self._refresh_locked(names, workers)
+
+    def _refresh_locked(self, names, workers):
+        known = {}
+        with self._lock:
+            connection = self._get_connection()
+            for start in range(0, len(names), 500):
+                batch = names[start:start + 500]
+                rows = connection.execute(
+                    f"SELECT * FROM gallery_items WHERE folder IN ({', '.join('?' for _ in batch)})", batch
+                ).fetchall()
+                known.update((row["folder"], row) for row in rows)
+
+        on_disk, paths = {}, []
+        for name in names:
+            folder = resolve_folder(self.gallery_dir, name)
+            if folder is not None:
+                try:
+                    on_disk[name] = folder.stat().st_mtime_ns
+                except OSError:
+                    continue
+                paths.append(folder)
+        removed = [name for name in known if name not in on_disk]
+
+        metadata = load_metadata_bulk(paths, workers=workers)
+        updated, touched = [], []
+        for name, data in zip(on_disk, metadata):
+            record = record_from_metadata(name, data, on_disk[name])
+            if record is None:
+                if name in known:
+                    removed.append(name)
+            elif name in known and self._same_content(known[name], record):
+                touched.append((record["mtime_ns"], name))
+            else:
+                updated.append(record)
+
+        with self._lock:
+            connection = self._get_connection()
+            self._write_locked(connection, updated)
+            deleted = self._delete_locked(connection, removed)
+            connection.executemany("UPDATE gallery_items SET mtime_ns = ? WHERE folder = ?", touched)
+            if updated or deleted:
+                self._bump_version_locked(connection)
+            connection.commit()
+        return {"indexed": len(updated), "removed": deleted, "unchanged": len(names) - len(updated) - deleted}
+
+    def _same_content(self, row: sqlite3.Row, record: Dict[str, Any]) -> bool:
+        item = self._to_item(row)
+        return all(item[column] == record[column] for column in self.COLUMNS if column != "mtime_ns")
+
+    # ---------- 查询 ----------
+
+    @property
+    def version(self) -> int:
+        """索引内容的版本号，任何作品的增删改都会使其递增；其他进程（如修复命令）的改动同样可见。"""
+        self.ensure_built()
+        with self._lock:
+            row = self._get_connection().execute(
+                "SELECT value FROM gallery_meta WHERE key = 'version'"
+            ).fetchone()
+        return int(row["value"]) if row is not None else 0
+
+    def count(self, search: Optional[GallerySearch] = None) -> int:
+        self.ensure_built()
+        if search is not None and build_match_query(search.text) and GallerySearch(text=search.text) == search:
+            # 只有全文条件时直接统计倒排索引，无需逐条回表。
+            return self._match_count(search)
+        clauses, params = search.to_sql() if search else ([], [])
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        with self._lock:
+            return self._get_connection().execute(
+                f"SELECT COUNT(*) FROM gallery_items{where}", params
+            ).fetchone()[0]
+
+    def _match_count(self, search: GallerySearch) -> int:
+        with self._lock:
+            return self._get_connection().execute(
+                "SELECT COUNT(*) FROM gallery_search WHERE gallery_search MATCH ?",
+                (build_match_query(search.text),),
+            ).fetchone()[0]
+
+    def get(self, folder_name: str) -> Optional[Dict[str, Any]]:
+        self.ensure_built()
+        with self._lock:
+            row = self._get_connection().execute(
+                "SELECT * FROM gallery_items WHERE folder = ?", (folder_name,)
+            ).fetchone()
+        return self._to_item(row) if row is not None else None
+
+    def item_versions(self, folder_names: Iterable[str]) -> Dict[str, int]:
+        """各作品目录最后一次被索引时的修改时间，作品内容变化时随之改变，用作缓存键。"""
+        names = list(folder_names)
+        versions = {}
+        with self._lock:
+            connection = self._get_connection()
+            for start in range(0, len(names), 500):
+                batch = names[start:start + 500]
+                versions.update(connection.execute(
+                    f"SELECT folder, mtime_ns FROM gallery_items WHERE folder IN ({', '.join('?' for _ in batch)})",
+                    batch,
+                ).fetchall())
+        return versions
+
+    def page(self, limit: int, after: Optional[str] = None, before: Optional[str] = None,
+             search: Optional[GallerySearch] = None) -> Tuple[List[Dict[str, Any]], Optional[str], Optional[str]]:
+        """
+        按创建时间从新到旧分页
+
+        Args:
+            limit: 每页数量
+            after: 上一页最后一项的游标，返回更旧的作品
+            before: 下一页第一项的游标，返回更新的作品
+            search: 搜索条件，None 表示全部作品
+
+        Returns:
+            (作品列表, 更旧一页的游标, 更新一页的游标)，没有对应页时游标为 None
+        """
+        self.ensure_built()
+        clauses, params = search.to_sql() if search else ([], [])
+        if before:
+            clauses.append("(created, folder) > (?, ?)")
+            params.extend(decode_cursor(before))
+            order = "ASC"
+        else:
+            if after:
+                clauses.append("(created, folder) < (?, ?)")
+                params.extend(decode_cursor(after))
+            order = "DESC"
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        # 命中较少时先取全部命中再排序；命中很多时沿时间索引扫描，取满一页即可停止。
+        indexed_by = ""
+        if search is not None and build_match_query(search.text):
+            if self._match_count(search) >= ORDERED_SCAN_MIN_MATCHES:
+                indexed_by = " INDEXED BY idx_gallery_items_order"
+        with self._lock:
+            rows = self._get_connection().execute(
+                f"SELECT * FROM gallery_items{indexed_by}{where} "
+                f"ORDER BY created {order}, folder {order} LIMIT ?",
+                (*params, limit + 1),
+            ).fetchall()
+
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        if before:
+            rows.reverse()
+            has_newer, has_older = has_more, True
+        else:
+            has_newer, has_older = bool(after), has_more
+
+        items = [self._to_item(row) for row in rows]
+        if not items:
+            return items, None, None
+        older = encode_cursor(items[-1]) if has_older else None
+        newer = encode_cursor(items[0]) if has_newer else None
+        return items, older, newer
+
+    def position(self, item: Dict[str, Any], search: Optional[GallerySearch] = None) -> int:
+        """在同一搜索条件下比该作品更新的作品数量，用于显示页码。"""
+        clauses, params = search.to_sql() if search else ([], [])
+        clauses.append("(created, folder) > (?, ?)")
+        params.extend((item["created"], item["folder"]))
+        with self._lock:
+            return self._get_connection().execute(
+                f"SELECT COUNT(*) FROM gallery_items WHERE {' AND '.join(clauses)}", params
+            ).fetchone()[0]
+
+    @staticmethod
+    def _to_item(row: sqlite3.Row) -> Dict[str, Any]:
+        item = dict(row)
+        item["info"] = json.loads(item["info"] or "{}")
+        item["placeholder"] = json.loads(item["placeholder"]) if item.get("placeholder") else None
+        item.pop("id", None)
+        item.pop("mtime_ns", None)
+        return item
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+            self._built = False
+
+
+_default_index: Optional[GalleryIndex] = None
+_default_index_lock = threading.Lock()
+
+
+def get_gallery_index() -> GalleryIndex:
+    """获取当前画廊目录对应的共享索引；画廊目录配置变化时重新打开。"""
+    global _default_index
+    gallery_dir = Path(config_manager.get("gallery_dir", "gallery")).resolve()
+    with _default_index_lock:
+        if _default_index is None or _default_index.gallery_dir != gallery_dir:
+            if _default_index is not None:
+                _default_index.close()
+            _default_index = GalleryIndex(gallery_dir)
+        return _default_index
+
+
+def main():
+    parser = argparse.ArgumentParser(description="重建或修复画廊索引")
+    parser.add_argument("command", choices=["repair", "rebuild"], help="repair 只处理有改动的目录，rebuild 全部重新读取")
+    parser.add_argument("--gallery-dir", default=None, help="画廊目录，默认读取配置")
+    parser.add_argument("--workers", type=int, default=8, help="并发读取目录的线程数")
+    args = parser.parse_args()
+
+    config_manager.load_from_env()
+    index = GalleryIndex(Path(args.gallery_dir or config_manager.get("gallery_dir", "gallery")).resolve())
+    result = index.repair(full=args.command == "rebuild", workers=args.workers)
+    index.close()
+    print(f"✅ 画廊索引已更新: 重新读取 {result['indexed']} 个, 移除 {result['removed']} 个, 共 {result['total']} 个作品")
+
+
+if __name__ == "__main__":
+    main()
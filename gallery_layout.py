@@ -0,0 +1,212 @@
+"""
+画廊目录布局模块
+作品目录按目录名哈希分散到 _shards/<两位十六进制>/ 下，避免单个目录中堆积大量子目录；
+旧版直接放在画廊根目录下的作品照常读取，可在服务运行时分批迁移
+"""
+
+import argparse
+import hashlib
+import os
+import time
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Union
+
+from config_manager import config_manager
+
+
+SHARDS_DIRNAME = "_shards"
+GALLERY_LAYOUTS = ("sharded", "flat")
+
+
+def get_gallery_layout() -> str:
+    """读取新作品使用的目录布局；配置无效时使用 sharded。"""
+    layout = config_manager.get("gallery_layout", "sharded")
+    return layout if layout in GALLERY_LAYOUTS else "sharded"
+
+
+def is_item_name(name: str) -> bool:
+    """作品目录名不能包含路径分隔符，也不能是隐藏目录或分片根目录。"""
+    return (
+        bool(name) and not name.startswith(".") and name != SHARDS_DIRNAME
+        and "/" not in name and "\\" not in name
+    )
+
+
+def shard_for(folder_name: str) -> str:
+    """目录名的分片：哈希的第一个字节，共 256 个分片。"""
+    return hashlib.blake2b(folder_name.encode("utf-8", "surrogateescape"), digest_size=1).hexdigest()
+
+
+def sharded_path(gallery_dir: Union[str, Path], folder_name: str) -> Path:
+    return Path(gallery_dir) / SHARDS_DIRNAME / shard_for(folder_name) / folder_name
+
+
+def folder_path(gallery_dir: Union[str, Path], folder_name: str, layout: Optional[str] = None) -> Path:
+    """按布局计算作品目录应在的位置（不检查是否存在）。"""
+    if (layout or get_gallery_layout()) == "sharded":
+        return sharded_path(gallery_dir, folder_name)
+    return Path(gallery_dir) / folder_name
+
+
+def resolve_folder(gallery_dir: Union[str, Path], folder_name: str) -> Optional[Path]:
+    """
+    查找作品目录的实际位置，两种布局都会查找
+
+    迁移过程中目录可能恰好在两次检查之间被移动，因此分片位置会再检查一次。
+
+    Returns:
+        作品目录路径；目录名无效或不存在时返回 None
+    """
+    if not is_item_name(folder_name):
+        return None
+    sharded = sharded_path(gallery_dir, folder_name)
+    flat = Path(gallery_dir) / folder_name
+    for candidate in (sharded, flat, sharded):
+        if candidate.is_dir():
+            return candidate
+    return None
+
+
+def iter_item_folders(gallery_dir: Union[str, Path]) -> Iterator[os.DirEntry]:
+    """
+    遍历画廊中的全部作品目录（分片与旧版平铺布局）
+
+    同名目录只返回一次，分片中的优先。
+    """
+    gallery_dir = Path(gallery_dir)
+    if not gallery_dir.is_dir():
+        return
+    seen = set()
+    shards_dir = gallery_dir / SHARDS_DIRNAME
+    containers = [Path(entry.path) for entry in list_subdirs(shards_dir) if len(entry.name) == 2]
+    containers.append(gallery_dir)
+    for container in containers:
+        for entry in list_subdirs(container):
+            if is_item_name(entry.name) and entry.name not in seen:
+                seen.add(entry.name)
+                yield entry
+
+
+def list_subdirs(path: Union[str, Path]) -> List[os.DirEntry]:
+    """列出目录下的子目录（不跟随符号链接）；目录不存在时返回空列表。"""
+    try:
+        with os.scandir(path) as entries:
+            return [entry for entry in entries if entry.is_dir(follow_symlinks=False)]
+    except OSError:
+        return []
+
+
+def layout_status(gallery_dir: Union[str, Path]) -> Dict[str, int]:
+    """统计两种布局下的作品数量。"""
+    counts = {"sharded": 0, "flat": 0}
+    for entry in iter_item_folders(gallery_dir):
+        counts["flat" if Path(entry.path).parent == Path(gallery_dir) else "sharded"] += 1
+    return counts
+
+
+def migrate_layout(gallery_dir: Union[str, Path], target: str = "sharded", batch_size: int = 200,
+                   pause: float = 0.05, min_age: float = 60.0, index=None,
+                   progress: Optional[Callable[[Dict[str, int]], None]] = None) -> Dict[str, int]:
+    """
+    把作品目录分批移动到目标布局，服务运行时也可执行，可重复执行
+
+    每个目录用一次 rename 移动（同一文件系统内是原子操作），URL 只包含目录名，移动前后都能访问。
+    最近 min_age 秒内有改动的目录可能仍在保存或生成缩略图，本次跳过。
+
+    Args:
+        gallery_dir: 画廊目录
+        target: 目标布局，sharded 或 flat
+        batch_size: 每批移动的目录数，批次之间暂停 pause 秒，减少对服务的影响
+        min_age: 跳过最近修改过的目录（秒）
+        index: 画廊索引；每批移动后刷新这些目录（只更新修改时间，不改变索引版本号）
+        progress: 每批结束后以当前计数调用
+
+    Returns:
+        {"moved": 移动的目录数, "skipped": 跳过的目录数, "failed": 失败的目录数}
+    """
+    if target not in GALLERY_LAYOUTS:
+        raise ValueError(f"未知的目录布局: {target}")
+    gallery_dir = Path(gallery_dir)
+    batch_size = max(1, batch_size)
+    pending = [
+        entry for entry in iter_item_folders(gallery_dir)
+        if (Path(entry.path).parent == gallery_dir) == (target == "sharded")
+    ]
+    counts = {"moved": 0, "skipped": 0, "failed": 0, "total": len(pending)}
+    for start in range(0, len(pending), batch_size):
+        moved = []
+        now = time.time()
+        for entry in pending[start:start + batch_size]:
+            source = Path(entry.path)
+            destination = folder_path(gallery_dir, entry.name, target)
+            try:
+                if now - source.stat().st_mtime < min_age or destination.exists():
+                    counts["skipped"] += 1
+                    continue
+                destination.parent.mkdir(parents=True, exist_ok=True)
+                os.rename(source, destination)
+            except OSError as e:
+                print(f"⚠️ 无法移动作品目录 {entry.name}: {e}")
+                counts["failed"] += 1
+                continue
+            moved.append(entry.name)
+        counts["moved"] += len(moved)
+        if index is not None and moved:
+            index.refresh(moved)
+        if progress:
+            progress(dict(counts))
+        if pause > 0 and start + batch_size < len(pending):
+            time.sleep(pause)
+
+    if target == "flat":
+        _remove_empty_shards(gallery_dir)
+    return counts
+
+
+def _remove_empty_shards(gallery_dir: Path):
+    shards_dir = gallery_dir / SHARDS_DIRNAME
+    for entry in list_subdirs(shards_dir):
+        try:
+            os.rmdir(entry.path)
+        except OSError:
+            pass
+    try:
+        shards_dir.rmdir()
+    except OSError:
+        pass
+
+
+def main():
+    from gallery_index import GalleryIndex
+
+    parser = argparse.ArgumentParser(description="查看或迁移画廊目录布局")
+    parser.add_argument("command", choices=["status", "migrate"], help="status 统计各布局的作品数，migrate 分批移动作品目录")
+    parser.add_argument("--to", default="sharded", choices=GALLERY_LAYOUTS, help="迁移的目标布局")
+    parser.add_argument("--gallery-dir", default=None, help="画廊目录，默认读取配置")
+    parser.add_argument("--batch-size", type=int, default=200, help="每批移动的目录数")
+    parser.add_argument("--pause", type=float, default=0.05, help="批次之间的暂停时间（秒）")
+    parser.add_argument("--min-age", type=float, default=60.0, help="跳过最近修改过的目录（秒）")
+    args = parser.parse_args()
+
+    config_manager.load_from_env()
+    gallery_dir = Path(args.gallery_dir or config_manager.get("gallery_dir", "gallery")).resolve()
+    if args.command == "status":
+        counts = layout_status(gallery_dir)
+        print(f"📁 {gallery_dir}: 分片 {counts['sharded']} 个, 平铺 {counts['flat']} 个, 新作品使用 {get_gallery_layout()}")
+        return
+
+    index = GalleryIndex(gallery_dir)
+
+    def report(counts):
+        print(f"   {counts['moved'] + counts['skipped'] + counts['failed']}/{counts['total']}", end="\r", flush=True)
+
+    result = migrate_layout(
+        gallery_dir, target=args.to, batch_size=args.batch_size, pause=args.pause,
+        min_age=args.min_age, index=index, progress=report,
+    )
+    index.close()
+    print(f"✅ 迁移完成: 移动 {result['moved']} 个, 跳过 {result['skipped']} 个, 失败 {result['failed']} 个")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,632 @@
+"""
+画廊元数据模块
+作品参数以带版本号的 JSON 写入图片本身（PNG iTXt 块 / JPEG 与 WebP 的 XMP），无法写入时保存为 <图片名>_meta.json；
+兼容读取旧版 "键: 值" 格式的 _info.txt
+"""
+
+import argparse
+import datetime
+import html
+import json
+import os
+import re
+import struct
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Union
+
+
+METADATA_VERSION = 1
+METADATA_SUFFIX = "_meta.json"
+LEGACY_INFO_SUFFIX = "_info.txt"
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp")
+# 画廊缩略图也是 .webp，挑选原图时需要排除。
+THUMBNAIL_NAME_PATTERN = re.compile(r"_thumb(_\d+)?\.webp$")
+# 旧版参数信息文件中记录提示词优化输入与结果的字段。
+OPTIMIZATION_RECORD_KEY = "优化记录"
+
+# 图片内嵌元数据：PNG 使用该关键字的 iTXt 块，JPEG 与 WebP 使用 XMP 包中同名元素。
+EMBEDDED_METADATA_KEY = "zimage:metadata"
+EMBEDDED_NAMESPACE = "urn:z-image-turbo:metadata"
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+XMP_HEADER = b"http://ns.adobe.com/xap/1.0/\x00"
+XMP_METADATA_PATTERN = re.compile(rb"<zimage:metadata>(.*?)</zimage:metadata>", re.S)
+# JPEG 单个 APP1 段的长度上限（含 2 字节长度字段）。
+JPEG_SEGMENT_LIMIT = 65535
+# 超过该长度的 iTXt 文本压缩保存。
+PNG_COMPRESS_THRESHOLD = 1024
+# 头部中单个元数据块的长度上限，防止损坏的文件让读取方分配巨大的缓冲区。
+MAX_EMBEDDED_BYTES = 4 * 1024 * 1024
+# 解析截断或损坏的图片头部时可能抛出的异常。
+EMBEDDED_PARSE_ERRORS = (OSError, ValueError, TypeError, AttributeError, IndexError, zlib.error, struct.error)
+
+
+def read_gallery_info(info_file):
+    """解析旧版作品参数信息文件的 "键: 值" 行。"""
+    info = {}
+    with open(info_file, 'r', encoding='utf-8') as file:
+        for line in file:
+            if ':' in line:
+                key, value = line.strip().split(':', 1)
+                info[key] = value
+    return info
+
+
+def build_metadata(image_name: str, prompt: str, width: int, height: int, steps: int,
+                   optimization_mode: str, gen_time: Optional[float] = None, seed: Optional[int] = None,
+                   model: Optional[str] = None, timings: Optional[Dict[str, float]] = None,
+                   optimization_record: Optional[Dict[str, Any]] = None,
+                   created_at: Optional[datetime.datetime] = None,
+                   placeholder: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    """
+    构建一份作品元数据
+
+    Args:
+        image_name: 图片文件名
+        prompt: 实际用于生成的提示词
+        width, height, steps: 生成参数
+        optimization_mode: 显存优化模式
+        gen_time: 推理耗时（秒），写入 timings.generation_seconds
+        seed: 随机种子；未使用固定种子时为 None
+        model: 模型名称
+        timings: 其他阶段耗时（秒）
+        optimization_record: 提示词优化的输入、结果与来源
+        created_at: 创建时间，默认当前时间
+        placeholder: 画廊占位图 {"blurhash", "color"}（见 gallery_placeholders）
+    """
+    timings = dict(timings or {})
+    if gen_time is not None:
+        timings["generation_seconds"] = round(gen_time, 3)
+    return {
+        "version": METADATA_VERSION,
+        "image": image_name,
+        "created_at": (created_at or datetime.datetime.now()).isoformat(timespec="microseconds"),
+        "prompt": prompt,
+        "width": width,
+        "height": height,
+        "steps": steps,
+        "seed": seed,
+        "optimization_mode": optimization_mode,
+        "model": model,
+        "timings": timings,
+        "optimization": optimization_record,
+        "placeholder": placeholder,
+    }
+
+
+def write_metadata(path: Union[str, Path], metadata: Dict[str, Any]):
+    """原子写入元数据文件，读取方不会看到半个 JSON。"""
+    path = Path(path)
+    temporary_path = path.with_name(f".{path.name}.tmp")
+    try:
+        temporary_path.write_text(json.dumps(metadata, ensure_ascii=False, indent=2), encoding="utf-8")
+        temporary_path.replace(path)
+    finally:
+        temporary_path.unlink(missing_ok=True)
+
+
+def get_metadata_path(image_path: Union[str, Path]) -> Path:
+    image_path = Path(image_path)
+    return image_path.with_name(f"{image_path.stem}{METADATA_SUFFIX}")
+
+
+def _encode_embedded(metadata: Dict[str, Any]) -> str:
+    return json.dumps(metadata, ensure_ascii=False, separators=(",", ":"))
+
+
+def build_xmp_packet(metadata: Dict[str, Any]) -> bytes:
+    text = html.escape(_encode_embedded(metadata), quote=False)
+    return (
+        '<?xpacket begin="\ufeff" id="W5M0MpCehiHzreSzNTczkc9d"?>'
+        '<x:xmpmeta xmlns:x="adobe:ns:meta/">'
+        '<rdf:RDF xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#">'
+        f'<rdf:Description rdf:about="" xmlns:zimage="{EMBEDDED_NAMESPACE}">'
+        f'<zimage:metadata>{text}</zimage:metadata>'
+        '</rdf:Description></rdf:RDF></x:xmpmeta>'
+        '<?xpacket end="w"?>'
+    ).encode("utf-8")
+
+
+def embedded_save_options(image_path: Union[str, Path], metadata: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    返回把元数据写入图片所需的 Image.save 参数
+
+    格式不支持或元数据超出 JPEG 段长度时返回空字典，调用方应改为写入 _meta.json。
+    """
+    suffix = Path(image_path).suffix.lower()
+    if suffix == ".png":
+        from PIL.PngImagePlugin import PngInfo
+
+        text = _encode_embedded(metadata)
+        pnginfo = PngInfo()
+        pnginfo.add_itxt(EMBEDDED_METADATA_KEY, text, zip=len(text) > PNG_COMPRESS_THRESHOLD)
+        return {"pnginfo": pnginfo}
+    if suffix in (".jpg", ".jpeg"):
+        packet = build_xmp_packet(metadata)
+        if 2 + len(XMP_HEADER) + len(packet) <= JPEG_SEGMENT_LIMIT:
+            return {"xmp": packet}
+    if suffix == ".webp":
+        return {"xmp": build_xmp_packet(metadata)}
+    return {}
+
+
+def _png_chunk(chunk_type: bytes, data: bytes) -> bytes:
+    return struct.pack(">I", len(data)) + chunk_type + data + struct.pack(">I", zlib.crc32(chunk_type + data))
+
+
+def _webp_chunk(chunk_type: bytes, data: bytes) -> bytes:
+    return struct.pack("<4sI", chunk_type, len(data)) + data + b"\x00" * (len(data) & 1)
+
+
+def _webp_canvas(chunk_type: bytes, data: bytes):
+    """从简单格式 WebP 的图像块读取 (宽, 高, 是否含透明度)；无法识别时返回 None。"""
+    if chunk_type == b"VP8L" and len(data) >= 5 and data[0] == 0x2F:
+        bits = int.from_bytes(data[1:5], "little")
+        return (bits & 0x3FFF) + 1, (bits >> 14 & 0x3FFF) + 1, bool(bits >> 28 & 1)
+    if chunk_type == b"VP8 " and len(data) >= 10 and data[3:6] == b"\x9d\x01\x2a":
+        width, height = struct.unpack("<HH", data[6:10])
+        return width & 0x3FFF, height & 0x3FFF, False
+    return None
+
+
+def _parse_png_text(chunk_type: bytes, data: bytes) -> Optional[str]:
+    keyword, _, rest = data.partition(b"\x00")
+    if keyword != EMBEDDED_METADATA_KEY.encode("latin-1"):
+        return None
+    if chunk_type == b"tEXt":
+        return rest.decode("latin-1")
+    if chunk_type == b"zTXt":
+        return zlib.decompress(rest[1:]).decode("latin-1")
+    compressed, rest = rest[0], rest[2:]
+    _language, _, rest = rest.partition(b"\x00")
+    _translated, _, text = rest.partition(b"\x00")
+    return (zlib.decompress(text) if compressed else text).decode("utf-8")
+
+
+def _iter_png_chunks(file):
+    """逐个返回 PNG 头部块 (类型, 数据)；遇到图像数据即停止，像素数据不会被读取。"""
+    if file.read(8) != PNG_SIGNATURE:
+        return
+    while True:
+        header = file.read(8)
+        if len(header) < 8:
+            return
+        length, chunk_type = struct.unpack(">I4s", header)
+        if chunk_type in (b"IDAT", b"IEND"):
+            return
+        if chunk_type in (b"iTXt", b"tEXt", b"zTXt") and length <= MAX_EMBEDDED_BYTES:
+            yield chunk_type, file.read(length)
+            file.seek(4, os.SEEK_CUR)
+        else:
+            yield chunk_type, None
+            file.seek(length + 4, os.SEEK_CUR)
+
+
+def _iter_jpeg_segments(file):
+    """逐个返回 JPEG 扫描数据之前的段 (标记, 数据)；只读取 APP1 段的内容。"""
+    if file.read(2) != b"\xff\xd8":
+        return
+    while True:
+        byte = file.read(1)
+        if byte != b"\xff":
+            return
+        marker = file.read(1)
+        while marker == b"\xff":
+            marker = file.read(1)
+        if not marker or marker in (b"\xda", b"\xd9"):
+            return
+        if marker == b"\x01" or b"\xd0" <= marker <= b"\xd7":
+            continue
+        length_bytes = file.read(2)
+        if len(length_bytes) < 2:
+            return
+        length = struct.unpack(">H", length_bytes)[0] - 2
+        if marker == b"\xe1":
+            yield marker, file.read(length)
+        else:
+            yield marker, None
+            file.seek(length, os.SEEK_CUR)
+
+
+def _iter_webp_chunks(file):
+    """逐个返回 WebP 的 RIFF 块 (类型, 数据)；只读取 XMP 块的内容，图像数据直接跳过。"""
+    header = file.read(12)
+    if len(header) < 12 or header[:4] != b"RIFF" or header[8:] != b"WEBP":
+        return
+    while True:
+        chunk_header = file.read(8)
+        if len(chunk_header) < 8:
+            return
+        chunk_type, length = struct.unpack("<4sI", chunk_header)
+        padded = length + (length & 1)
+        if chunk_type == b"XMP " and length <= MAX_EMBEDDED_BYTES:
+            yield chunk_type, file.read(length)
+            file.seek(padded - length, os.SEEK_CUR)
+        else:
+            yield chunk_type, None
+            file.seek(padded, os.SEEK_CUR)
+
+
+def read_embedded_metadata(image_path: Union[str, Path]) -> Optional[Dict[str, Any]]:
+    """
+    只解析图片头部读取内嵌元数据，不解码像素
+
+    Returns:
+        升级到当前版本的元数据；图片没有内嵌元数据或无法解析时返回 None
+    """
+    try:
+        with open(image_path, "rb") as file:
+            magic = file.read(2)
+            file.seek(0)
+            text = None
+            if magic == PNG_SIGNATURE[:2]:
+                for chunk_type, data in _iter_png_chunks(file):
+                    if data is not None:
+                        text = _parse_png_text(chunk_type, data)
+                        if text is not None:
+                            break
+            elif magic == b"\xff\xd8":
+                for _marker, data in _iter_jpeg_segments(file):
+                    if data and data.startswith(XMP_HEADER):
+                        match = XMP_METADATA_PATTERN.search(data)
+                        if match:
+                            text = html.unescape(match.group(1).decode("utf-8"))
+                            break
+            elif magic == b"RI":
+                for _chunk_type, data in _iter_webp_chunks(file):
+                    match = XMP_METADATA_PATTERN.search(data) if data else None
+                    if match:
+                        text = html.unescape(match.group(1).decode("utf-8"))
+                        break
+        if text is None:
+            return None
+        return upgrade_metadata(json.loads(text))
+    except EMBEDDED_PARSE_ERRORS:
+        return None
+
+
+def embed_metadata(image_path: Union[str, Path], metadata: Dict[str, Any]) -> bool:
+    """
+    把元数据写入已有图片的头部，只插入元数据块，不重新编码像素
+
+    旧的内嵌元数据会被替换。不支持的格式或元数据过大时返回 False，文件保持不变。
+    """
+    image_path = Path(image_path)
+    content = image_path.read_bytes()
+    if content.startswith(PNG_SIGNATURE):
+        text = _encode_embedded(metadata).encode("utf-8")
+        compressed = len(text) > PNG_COMPRESS_THRESHOLD
+        chunk = _png_chunk(
+            b"iTXt",
+            EMBEDDED_METADATA_KEY.encode("latin-1") + b"\x00" + bytes([int(compressed), 0]) + b"\x00\x00"
+            + (zlib.compress(text) if compressed else text),
+        )
+        # 新块紧跟 IHDR，原有的同名文本块全部移除。
+        parts, position = [content[:8]], 8
+        while position + 8 <= len(content):
+            length, chunk_type = struct.unpack(">I4s", content[position:position + 8])
+            end = position + 12 + length
+            if chunk_type in (b"iTXt", b"tEXt", b"zTXt") and \
+                    _parse_png_text(chunk_type, content[position + 8:end - 4]) is not None:
+                pass
+            else:
+                parts.append(content[position:end])
+                if chunk_type == b"IHDR":
+                    parts.append(chunk)
+            position = end
+            if chunk_type == b"IEND":
+                break
+        updated = b"".join(parts)
+    elif content.startswith(b"\xff\xd8"):
+        packet = XMP_HEADER + build_xmp_packet(metadata)
+        if len(packet) + 2 > JPEG_SEGMENT_LIMIT:
+            return False
+        segment = b"\xff\xe1" + struct.pack(">H", len(packet) + 2) + packet
+        # XMP 段放在 JFIF/EXIF 等 APP 段之后，旧的 XMP 段移除。
+        parts, position, inserted = [content[:2]], 2, False
+        while position + 4 <= len(content) and content[position] == 0xFF:
+            marker = content[position + 1]
+            if marker == 0xDA or not (0xE0 <= marker <= 0xEF or marker == 0xFE or 0xC0 <= marker <= 0xDF):
+                break
+            length = struct.unpack(">H", content[position + 2:position + 4])[0]
+            end = position + 2 + length
+            if not 0xE0 <= marker <= 0xEF and not inserted:
+                parts.append(segment)
+                inserted = True
+            if not (marker == 0xE1 and content[position + 4:end].startswith(XMP_HEADER)):
+                parts.append(content[position:end])
+            position = end
+        if not inserted:
+            parts.append(segment)
+        parts.append(content[position:])
+        updated = b"".join(parts)
+    elif content[:4] == b"RIFF" and content[8:12] == b"WEBP":
+        packet = build_xmp_packet(metadata)
+        if len(packet) > MAX_EMBEDDED_BYTES:
+            return False
+        chunks, position = [], 12
+        while position + 8 <= len(content):
+            chunk_type, length = struct.unpack("<4sI", content[position:position + 8])
+            chunks.append((chunk_type, content[position + 8:position + 8 + length]))
+            position += 8 + length + (length & 1)
+        if not chunks:
+            return False
+        # XMP 只能出现在扩展格式中：简单格式先补一个 VP8X 头，再设置 XMP 标志位。
+        if chunks[0][0] == b"VP8X":
+            header = bytearray(chunks[0][1])
+        else:
+            canvas = _webp_canvas(*chunks[0])
+            if canvas is None:
+                return False
+            width, height, has_alpha = canvas
+            header = bytearray(b"\x10" if has_alpha else b"\x00") + b"\x00" * 3 \
+                + (width - 1).to_bytes(3, "little") + (height - 1).to_bytes(3, "little")
+            chunks.insert(0, (b"VP8X", b""))
+        header[0] |= 0x04
+        chunks[0] = (b"VP8X", bytes(header))
+        # 旧的 XMP 块移除，新块按规范放在图像数据之后。
+        body = b"WEBP" + b"".join(
+            _webp_chunk(chunk_type, data) for chunk_type, data in chunks if chunk_type != b"XMP "
+        ) + _webp_chunk(b"XMP ", packet)
+        updated = b"RIFF" + struct.pack("<I", len(body)) + body
+    else:
+        return False
+
+    temporary_path = image_path.with_name(f".{image_path.name}.tmp")
+    try:
+        temporary_path.write_bytes(updated)
+        temporary_path.replace(image_path)
+    finally:
+        temporary_path.unlink(missing_ok=True)
+    return True
+
+
+def _parse_number(value, cast, suffix=""):
+    try:
+        return cast(str(value).strip().removesuffix(suffix))
+    except (TypeError, ValueError):
+        return None
+
+
+def metadata_from_legacy_info(info: Dict[str, str], image_name: Optional[str] = None) -> Dict[str, Any]:
+    """把旧版 _info.txt 的内容转换为当前版本的元数据。"""
+    info = {key: value.strip() for key, value in info.items()}
+    width = height = None
+    if "x" in info.get("图片尺寸", ""):
+        width_text, height_text = info["图片尺寸"].split("x", 1)
+        width, height = _parse_number(width_text, int), _parse_number(height_text, int)
+
+    created_at = None
+    if info.get("创建时间"):
+        try:
+            created_at = datetime.datetime.strptime(info["创建时间"], "%Y-%m-%d %H:%M:%S")
+        except ValueError:
+            created_at = None
+
+    optimization_record = None
+    if info.get(OPTIMIZATION_RECORD_KEY):
+        try:
+            optimization_record = json.loads(info[OPTIMIZATION_RECORD_KEY])
+        except ValueError:
+            optimization_record = None
+
+    metadata = build_metadata(
+        image_name or info.get("图片名称") or "",
+        info.get("提示词", ""),
+        width,
+        height,
+        _parse_number(info.get("推理步数"), int),
+        info.get("优化模式"),
+        gen_time=_parse_number(info.get("生成时间"), float, "秒"),
+        optimization_record=optimization_record if isinstance(optimization_record, dict) else None,
+        created_at=created_at,
+    )
+    if created_at is None:
+        metadata["created_at"] = None
+    return metadata
+
+
+def upgrade_metadata(metadata: Dict[str, Any]) -> Dict[str, Any]:
+    """把读到的元数据补齐为当前版本的字段；更高版本的文件保留未知字段原样返回。"""
+    version = metadata.get("version")
+    if not isinstance(version, int) or version < 1:
+        raise ValueError(f"未知的元数据版本: {version!r}")
+    template = build_metadata("", "", None, None, None, None)
+    template["created_at"] = None
+    return {**template, **metadata}
+
+
+def find_gallery_image(names: Iterable[str]) -> Optional[str]:
+    """按 png、jpg、jpeg、webp 的顺序挑选作品目录中的原图，缩略图不计入。"""
+    names = sorted(name for name in names if not THUMBNAIL_NAME_PATTERN.search(name))
+    for extension in IMAGE_EXTENSIONS:
+        image_name = next((name for name in names if name.endswith(extension)), None)
+        if image_name:
+            return image_name
+    return None
+
+
+def read_folder_metadata(folder: Union[str, Path]) -> Optional[Dict[str, Any]]:
+    """
+    读取作品目录的元数据
+
+    优先读取 _meta.json，其次读取图片头部的内嵌元数据，再次转换旧版 _info.txt；
+    都没有时只根据图片生成最少的字段。
+    返回值中的 "image" 为目录中实际存在的原图（没有原图时为 None）。
+    目录不存在或既没有图片也没有参数文件时返回 None。
+    """
+    folder = Path(folder)
+    try:
+        names = {entry.name for entry in os.scandir(folder) if entry.is_file()}
+    except OSError:
+        return None
+
+    image_name = find_gallery_image(names)
+    stems = [Path(image_name).stem] if image_name else []
+    stems += sorted(name[:-len(METADATA_SUFFIX)] for name in names if name.endswith(METADATA_SUFFIX))
+    stems += sorted(name[:-len(LEGACY_INFO_SUFFIX)] for name in names if name.endswith(LEGACY_INFO_SUFFIX))
+
+    metadata = None
+    if image_name and f"{Path(image_name).stem}{METADATA_SUFFIX}" not in names:
+        metadata = read_embedded_metadata(folder / image_name)
+    for stem in dict.fromkeys(stems) if metadata is None else ():
+        try:
+            if f"{stem}{METADATA_SUFFIX}" in names:
+                data = json.loads((folder / f"{stem}{METADATA_SUFFIX}").read_text(encoding="utf-8"))
+                metadata = upgrade_metadata(data)
+                break
+            if f"{stem}{LEGACY_INFO_SUFFIX}" in names:
+                metadata = metadata_from_legacy_info(read_gallery_info(folder / f"{stem}{LEGACY_INFO_SUFFIX}"))
+                break
+        except (OSError, ValueError, TypeError, AttributeError) as error:
+            print(f"⚠️ 无法读取作品参数 {folder / stem}: {error}")
+
+    if metadata is None:
+        if image_name is None:
+            return None
+        metadata = build_metadata(image_name, "", None, None, None, None)
+        metadata["created_at"] = None
+
+    metadata["image"] = image_name
+    if metadata.get("created_at") is None and image_name:
+        try:
+            mtime = (folder / image_name).stat().st_mtime
+            metadata["created_at"] = datetime.datetime.fromtimestamp(mtime).isoformat(timespec="microseconds")
+        except OSError:
+            pass
+    return metadata
+
+
+def load_metadata_bulk(folders: Iterable[Union[str, Path]], workers: int = 16) -> List[Optional[Dict[str, Any]]]:
+    """并发读取多个作品目录的元数据，结果顺序与输入一致。"""
+    folders = list(folders)
+    if len(folders) <= 1 or workers <= 1:
+        return [read_folder_metadata(folder) for folder in folders]
+    with ThreadPoolExecutor(max_workers=min(workers, len(folders)), thread_name_prefix="metadata") as executor:
+        return list(executor.map(read_folder_metadata, folders, chunksize=32))
+
+
+def created_timestamp(metadata: Dict[str, Any]) -> Optional[float]:
+    try:
+        return datetime.datetime.fromisoformat(metadata["created_at"]).timestamp()
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def describe_metadata(metadata: Dict[str, Any]) -> Dict[str, str]:
+    """生成画廊详情面板展示用的 "名称: 值" 字典。"""
+    timings = metadata.get("timings") or {}
+    created = created_timestamp(metadata)
+    rows = (
+        ("图片名称", metadata.get("image")),
+        ("提示词", metadata.get("prompt")),
+        ("图片尺寸", f"{metadata['width']}x{metadata['height']}" if metadata.get("width") and metadata.get("height") else None),
+        ("推理步数", metadata.get("steps")),
+        ("随机种子", metadata.get("seed")),
+        ("优化模式", metadata.get("optimization_mode")),
+        ("模型", metadata.get("model")),
+        ("生成时间", f"{timings['generation_seconds']:.2f}秒" if timings.get("generation_seconds") is not None else None),
+        ("创建时间", datetime.datetime.fromtimestamp(created).strftime("%Y-%m-%d %H:%M:%S") if created else None),
+    )
+    return {label: str(value) for label, value in rows if value not in (None, "")}
+
+
+def _migrate_folder(folder: Path, remove_legacy: bool, embed: bool = False) -> str:
+    try:
+        names = {entry.name for entry in os.scandir(folder) if entry.is_file()}
+    except OSError:
+        return "skipped"
+    legacy = sorted(name for name in names if name.endswith(LEGACY_INFO_SUFFIX))
+    image_name = find_gallery_image(names)
+
+    if embed:
+        sidecars = sorted(name for name in names if name.endswith(METADATA_SUFFIX))
+        if image_name is None or not (legacy or sidecars):
+            return "skipped"
+        metadata = read_folder_metadata(folder)
+        if metadata is None:
+            return "skipped"
+        # 图片损坏时只记为失败，参数文件保留，不中断整个迁移。
+        try:
+            if not embed_metadata(folder / image_name, metadata):
+                return "failed"
+            for name in legacy + sidecars:
+                (folder / name).unlink(missing_ok=True)
+        except EMBEDDED_PARSE_ERRORS as error:
+            print(f"⚠️ 写入图片元数据失败 {folder / image_name}: {error}")
+            return "failed"
+        return "migrated"
+
+    if not legacy:
+        return "skipped"
+    migrated = False
+    for name in legacy:
+        stem = name[:-len(LEGACY_INFO_SUFFIX)]
+        target = folder / f"{stem}{METADATA_SUFFIX}"
+        # 单个目录的文件系统错误（如图片在迁移过程中被删除）只记为失败，不中断整个迁移。
+        try:
+            if target.name not in names:
+                metadata = metadata_from_legacy_info(read_gallery_info(folder / name))
+                if image_name and Path(image_name).stem == stem:
+                    metadata["image"] = image_name
+                if metadata["created_at"] is None and image_name:
+                    mtime = (folder / image_name).stat().st_mtime
+                    metadata["created_at"] = datetime.datetime.fromtimestamp(mtime).isoformat(timespec="microseconds")
+                write_metadata(target, metadata)
+                migrated = True
+            if remove_legacy:
+                (folder / name).unlink(missing_ok=True)
+        except (OSError, ValueError) as error:
+            print(f"⚠️ 迁移失败 {folder / name}: {error}")
+            return "failed"
+    return "migrated" if migrated else "skipped"
+
+
+def migrate_gallery(gallery_dir: Union[str, Path], workers: int = 8, remove_legacy: bool = False,
+                    embed: bool = False) -> Dict[str, int]:
+    """
+    并行把画廊中旧版 _info.txt 转换为 _meta.json；已转换的目录会跳过，可重复执行
+
+    Args:
+        gallery_dir: 画廊目录
+        workers: 并发线程数
+        remove_legacy: 转换成功后删除旧文件
+        embed: 改为把元数据写入图片头部，成功后删除 _meta.json 与 _info.txt
+
+    Returns:
+        {"migrated": 转换的目录数, "skipped": 无需转换的目录数, "failed": 失败的目录数}
+    """
+    from gallery_layout import iter_item_folders
+
+    folders = [Path(entry.path) for entry in iter_item_folders(gallery_dir)]
+    counts = {"migrated": 0, "skipped": 0, "failed": 0}
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="metadata-migrate") as executor:
+        for outcome in executor.map(lambda folder: _migrate_folder(folder, remove_legacy, embed), folders, chunksize=32):
+            counts[outcome] += 1
+    return counts
+
+
+def main():
+    from config_manager import config_manager
+    from gallery_index import GalleryIndex
+
+    parser = argparse.ArgumentParser(description="把旧版 _info.txt 作品参数迁移为 JSON 元数据或写入图片")
+    parser.add_argument("--gallery-dir", default=None, help="画廊目录，默认读取配置")
+    parser.add_argument("--workers", type=int, default=8, help="并发线程数")
+    parser.add_argument("--remove-legacy", action="store_true", help="转换成功后删除 _info.txt")
+    parser.add_argument("--embed", action="store_true", help="把元数据写入图片头部并删除参数文件")
+    args = parser.parse_args()
+
+    config_manager.load_from_env()
+    gallery_dir = Path(args.gallery_dir or config_manager.get("gallery_dir", "gallery")).resolve()
+    result = migrate_gallery(gallery_dir, workers=args.workers, remove_legacy=args.remove_legacy, embed=args.embed)
+    print(f"✅ 迁移完成: 转换 {result['migrated']} 个, 跳过 {result['skipped']} 个, 失败 {result['failed']} 个")
+
+    index = GalleryIndex(gallery_dir)
+    print(f"✅ 画廊索引已更新: {index.repair()}")
+    index.close()
+
+
+if __name__ == "__main__":
+    main()
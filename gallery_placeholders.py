@@ -0,0 +1,273 @@
+"""
+画廊占位图模块
+保存作品时用 NumPy 从缩小的图像计算 BlurHash 与主色，写入作品元数据；画廊页面在缩略图到达之前
+先显示主色背景与解码后的模糊预览。已有作品可用本模块的命令行并行补齐
+"""
+
+import argparse
+import io
+import math
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Optional, Union
+
+import numpy as np
+from PIL import Image
+
+from gallery_metadata import (
+    METADATA_SUFFIX,
+    embed_metadata,
+    find_gallery_image,
+    read_folder_metadata,
+    write_metadata,
+)
+
+
+# 计算前先缩小到最长边不超过该尺寸；BlurHash 只保留最低频的几个分量，更大的输入没有意义。
+SAMPLE_SIZE = 32
+# 长边方向 4 个分量、短边方向 3 个分量，哈希 28 个字符。
+MAX_COMPONENTS = 4
+MIN_COMPONENTS = 3
+# 主色统计时每个通道保留的高位数（3 位即 512 个颜色桶）。
+COLOR_BITS = 3
+BASE83_CHARS = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz#$%*+,-.:;=?@[]^_{|}~"
+BASE83_VALUES = {char: value for value, char in enumerate(BASE83_CHARS)}
+COLOR_PATTERN = re.compile(r"^#[0-9a-f]{6}$")
+
+
+def _encode83(value: int, length: int) -> str:
+    return "".join(BASE83_CHARS[value // 83 ** (length - 1 - digit) % 83] for digit in range(length))
+
+
+def _decode83(text: str) -> int:
+    value = 0
+    for char in text:
+        value = value * 83 + BASE83_VALUES[char]
+    return value
+
+
+def srgb_to_linear(values: np.ndarray) -> np.ndarray:
+    """0–255 的 sRGB 值转换为 0–1 的线性亮度。"""
+    values = np.asarray(values, dtype=np.float64) / 255
+    return np.where(values <= 0.04045, values / 12.92, ((values + 0.055) / 1.055) ** 2.4)
+
+
+def linear_to_srgb(values: np.ndarray) -> np.ndarray:
+    """0–1 的线性亮度转换为 0–255 的 sRGB 整数值。"""
+    values = np.clip(values, 0, 1)
+    srgb = np.where(values <= 0.0031308, values * 12.92, 1.055 * np.power(values, 1 / 2.4) - 0.055)
+    return np.floor(srgb * 255 + 0.5).astype(np.int64)
+
+
+def _cosine_basis(count: int, length: int) -> np.ndarray:
+    """第 i 行为 cos(π·i·x / length)，x 取 0..length-1。"""
+    return np.cos(np.pi * np.arange(count)[:, None] * np.arange(length)[None, :] / length)
+
+
+def components_for(width: int, height: int):
+    """按宽高比选择 (横向, 纵向) 分量数，长边方向多一个分量。"""
+    return (MAX_COMPONENTS, MIN_COMPONENTS) if width >= height else (MIN_COMPONENTS, MAX_COMPONENTS)
+
+
+def encode_blurhash(pixels: np.ndarray, components_x: int, components_y: int) -> str:
+    """
+    把 (高, 宽, 3) 的 uint8 RGB 数组编码为 BlurHash
+
+    所有分量由两组余弦基与线性亮度一次张量收缩得到，不逐像素循环。
+    """
+    if not (1 <= components_x <= 9 and 1 <= components_y <= 9):
+        raise ValueError("BlurHash 分量数必须在 1 到 9 之间")
+    height, width = pixels.shape[:2]
+    linear = srgb_to_linear(pixels[..., :3])
+    factors = np.einsum(
+        "jy,ix,yxc->jic", _cosine_basis(components_y, height), _cosine_basis(components_x, width), linear,
+    ) / (width * height)
+    factors[1:, :] *= 2
+    factors[0, 1:] *= 2
+    factors = factors.reshape(-1, 3)
+    dc, ac = factors[0], factors[1:]
+
+    result = _encode83(components_x - 1 + (components_y - 1) * 9, 1)
+    if len(ac):
+        quantised_max = int(max(0, min(82, math.floor(float(np.abs(ac).max()) * 166 - 0.5))))
+        max_value = (quantised_max + 1) / 166
+    else:
+        quantised_max, max_value = 0, 1.0
+    result += _encode83(quantised_max, 1)
+    red, green, blue = linear_to_srgb(dc)
+    result += _encode83(int(red) << 16 | int(green) << 8 | int(blue), 4)
+    if len(ac):
+        scaled = np.sign(ac) * np.sqrt(np.abs(ac / max_value))
+        quantised = np.clip(np.floor(scaled * 9 + 9.5), 0, 18).astype(np.int64)
+        for value in quantised[:, 0] * 19 * 19 + quantised[:, 1] * 19 + quantised[:, 2]:
+            result += _encode83(int(value), 2)
+    return result
+
+
+def decode_blurhash(blurhash: str, width: int, height: int) -> np.ndarray:
+    """
+    把 BlurHash 解码为 (高, 宽, 3) 的 uint8 RGB 数组，与画廊页面脚本中的解码一致
+
+    哈希格式不正确时抛出 ValueError。
+    """
+    if len(blurhash) < 6 or any(char not in BASE83_VALUES for char in blurhash):
+        raise ValueError("BlurHash 格式无效")
+    size_flag = _decode83(blurhash[0])
+    components_x, components_y = size_flag % 9 + 1, size_flag // 9 + 1
+    if len(blurhash) != 4 + 2 * components_x * components_y:
+        raise ValueError("BlurHash 长度与分量数不符")
+    max_value = (_decode83(blurhash[1]) + 1) / 166
+
+    dc = _decode83(blurhash[2:6])
+    colors = [srgb_to_linear([dc >> 16, dc >> 8 & 255, dc & 255])]
+    for start in range(6, len(blurhash), 2):
+        value = _decode83(blurhash[start:start + 2])
+        quantised = np.array([value // (19 * 19), value // 19 % 19, value % 19], dtype=np.float64)
+        normalised = (quantised - 9) / 9
+        colors.append(np.sign(normalised) * normalised ** 2 * max_value)
+    colors = np.array(colors).reshape(components_y, components_x, 3)
+
+    linear = np.einsum(
+        "jy,ix,jic->yxc", _cosine_basis(components_y, height), _cosine_basis(components_x, width), colors,
+    )
+    return linear_to_srgb(linear).astype(np.uint8)
+
+
+def dominant_color(pixels: np.ndarray) -> str:
+    """
+    统计主色：每个通道只保留高 COLOR_BITS 位分桶，取像素最多的桶内像素的平均色
+
+    Returns:
+        "#rrggbb" 形式的颜色
+    """
+    pixels = pixels[..., :3].reshape(-1, 3)
+    shift = 8 - COLOR_BITS
+    quantised = (pixels >> shift).astype(np.int64)
+    buckets = quantised[:, 0] << (2 * COLOR_BITS) | quantised[:, 1] << COLOR_BITS | quantised[:, 2]
+    counts = np.bincount(buckets, minlength=1 << (3 * COLOR_BITS))
+    color = np.rint(pixels[buckets == counts.argmax()].mean(axis=0)).astype(int)
+    return "#" + "".join(f"{int(channel):02x}" for channel in color)
+
+
+def compute_placeholder(image: Image.Image) -> Dict[str, str]:
+    """
+    计算图像的占位数据，不修改输入
+
+    Returns:
+        {"blurhash": BlurHash 字符串, "color": "#rrggbb" 主色}
+    """
+    width, height = image.size
+    scale = min(1.0, SAMPLE_SIZE / max(width, height))
+    sample = image.resize(
+        (max(1, round(width * scale)), max(1, round(height * scale))), Image.Resampling.BOX, reducing_gap=2.0,
+    )
+    if sample.mode != "RGB":
+        sample = sample.convert("RGB")
+    pixels = np.asarray(sample, dtype=np.uint8)
+    return {
+        "blurhash": encode_blurhash(pixels, *components_for(width, height)),
+        "color": dominant_color(pixels),
+    }
+
+
+def normalize_placeholder(value: Any) -> Optional[Dict[str, str]]:
+    """校验元数据中的占位数据；格式不正确时返回 None，页面不会把它写进样式。"""
+    if not isinstance(value, dict):
+        return None
+    blurhash, color = value.get("blurhash"), value.get("color")
+    if not isinstance(blurhash, str) or not isinstance(color, str) or not COLOR_PATTERN.match(color):
+        return None
+    try:
+        decode_blurhash(blurhash, 1, 1)
+    except ValueError:
+        return None
+    return {"blurhash": blurhash, "color": color}
+
+
+def placeholder_from_file(image_path: Union[str, Path]) -> Dict[str, str]:
+    """优先从最小尺寸缩略图计算占位数据，缩略图不存在时解码原图（JPEG 以草稿模式缩小解码）。"""
+    from image_processing import get_thumbnail_sizes
+    from thumbnail_pack import load_thumbnail
+
+    data = load_thumbnail(image_path, min(get_thumbnail_sizes()))
+    with Image.open(io.BytesIO(data) if data is not None else image_path) as image:
+        if image.format == "JPEG":
+            image.draft("RGB", (SAMPLE_SIZE * 4, SAMPLE_SIZE * 4))
+        return compute_placeholder(image)
+
+
+def _backfill_folder(folder: Path, force: bool) -> str:
+    try:
+        names = {entry.name for entry in os.scandir(folder) if entry.is_file()}
+    except OSError:
+        return "skipped"
+    image_name = find_gallery_image(names)
+    metadata = read_folder_metadata(folder) if image_name else None
+    if metadata is None or (not force and normalize_placeholder(metadata.get("placeholder"))):
+        return "skipped"
+
+    image_path = folder / image_name
+    try:
+        metadata["placeholder"] = placeholder_from_file(image_path)
+        sidecar = folder / f"{image_path.stem}{METADATA_SUFFIX}"
+        if sidecar.name in names:
+            write_metadata(sidecar, metadata)
+            return "updated"
+        # 只改写图片头部，原图的修改时间保持不变。
+        stat = image_path.stat()
+        if embed_metadata(image_path, metadata):
+            os.utime(image_path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        else:
+            write_metadata(sidecar, metadata)
+    except (OSError, ValueError) as error:
+        print(f"⚠️ 占位图计算失败 {image_path}: {error}")
+        return "failed"
+    return "updated"
+
+
+def backfill_placeholders(gallery_dir: Union[str, Path], workers: int = 8, force: bool = False) -> Dict[str, int]:
+    """
+    并行为画廊中缺少占位数据的作品计算并写入元数据；已有占位数据的作品会跳过，可重复执行
+
+    Args:
+        gallery_dir: 画廊目录
+        workers: 并发线程数（解码与 NumPy 运算都会释放 GIL）
+        force: 重新计算所有作品
+
+    Returns:
+        {"updated": 写入的作品数, "skipped": 跳过的目录数, "failed": 失败的作品数}
+    """
+    from gallery_layout import iter_item_folders
+
+    folders = [Path(entry.path) for entry in iter_item_folders(gallery_dir)]
+    counts = {"updated": 0, "skipped": 0, "failed": 0}
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="placeholder") as executor:
+        for outcome in executor.map(lambda folder: _backfill_folder(folder, force), folders, chunksize=32):
+            counts[outcome] += 1
+    return counts
+
+
+def main():
+    from config_manager import config_manager
+    from gallery_index import GalleryIndex
+
+    parser = argparse.ArgumentParser(description="为画廊中已有的作品补齐占位图（BlurHash 与主色）")
+    parser.add_argument("--gallery-dir", default=None, help="画廊目录，默认读取配置")
+    parser.add_argument("--workers", type=int, default=8, help="并发线程数")
+    parser.add_argument("--force", action="store_true", help="重新计算已有占位图的作品")
+    args = parser.parse_args()
+
+    config_manager.load_from_env()
+    gallery_dir = Path(args.gallery_dir or config_manager.get("gallery_dir", "gallery")).resolve()
+    result = backfill_placeholders(gallery_dir, workers=args.workers, force=args.force)
+    print(f"✅ 占位图补齐完成: 写入 {result['updated']} 个, 跳过 {result['skipped']} 个, 失败 {result['failed']} 个")
+
+    index = GalleryIndex(gallery_dir)
+    print(f"✅ 画廊索引已更新: {index.repair()}")
+    index.close()
+
+
+if __name__ == "__main__":
+    main()
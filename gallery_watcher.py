@@ -0,0 +1,458 @@
+"""
+画廊目录监听模块
+监听画廊目录的新增、修改与删除，合并短时间内的连续改动后增量更新画廊索引；
+Linux 上使用 inotify，不可用时退回定时轮询目录与文件的修改时间
+"""
+
+import argparse
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+from config_manager import config_manager
+from gallery_index import GalleryIndex, get_gallery_index
+from gallery_layout import SHARDS_DIRNAME, is_item_name, list_subdirs
+from gallery_metadata import THUMBNAIL_NAME_PATTERN
+
+
+WATCHER_BACKENDS = ("auto", "inotify", "polling", "off")
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+
+CONTAINER_MASK = IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO | IN_ONLYDIR
+# 作品目录内只关心写完的文件；缩略图与临时文件在回调里过滤。
+FOLDER_MASK = IN_CLOSE_WRITE | IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO | IN_ONLYDIR
+EVENT_HEADER = struct.Struct("iIII")
+
+
+def is_relevant_name(name: str) -> bool:
+    """索引文件、临时文件与缩略图的改动不影响作品元数据。"""
+    return bool(name) and not name.startswith(".") and not THUMBNAIL_NAME_PATTERN.search(name)
+
+
+class InotifySource:
+    """基于 inotify 的事件源；每个作品目录一个监听，事件队列溢出时要求完整对账。"""
+
+    name = "inotify"
+
+    def __init__(self, gallery_dir: Path):
+        """
+        Raises:
+            OSError: 系统不支持 inotify，或监听数量超过 fs.inotify.max_user_watches
+        """
+        self.gallery_dir = gallery_dir
+        path = ctypes.util.find_library("c")
+        if path is None:
+            raise OSError(errno.ENOSYS, "找不到 libc")
+        self._libc = ctypes.CDLL(path, use_errno=True)
+        if not hasattr(self._libc, "inotify_init1"):
+            raise OSError(errno.ENOSYS, "系统不支持 inotify")
+        self._fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 失败")
+        # 监听描述符 -> (类型, 路径)：container 为画廊根目录或某个分片，shards 为分片根目录，item 为作品目录。
+        self._watches: Dict[int, Tuple[str, Path]] = {}
+        try:
+            self._watch_container(gallery_dir)
+            shards_dir = gallery_dir / SHARDS_DIRNAME
+            if shards_dir.is_dir():
+                self._watch_shards(shards_dir)
+        except OSError:
+            self.close()
+            raise
+
+    def _add_watch(self, path: Path, kind: str, mask: int):
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(path), mask)
+        if wd < 0:
+            code = ctypes.get_errno()
+            # 目录在监听前已被删除时忽略；其它错误（如 ENOSPC）交给调用方退回轮询。
+            if code == errno.ENOENT and path != self.gallery_dir:
+                return
+            raise OSError(code, f"无法监听 {path}: {os.strerror(code)}")
+        self._watches[wd] = (kind, path)
+
+    def _watch_container(self, path: Path, changed: Optional[Set[str]] = None):
+        """监听存放作品目录的目录及其中的作品；changed 不为空时把已有的作品记为改动（目录刚出现时）。"""
+        self._add_watch(path, "container", CONTAINER_MASK)
+        for entry in list_subdirs(path):
+            if is_item_name(entry.name):
+                self._add_watch(Path(entry.path), "item", FOLDER_MASK)
+                if changed is not None:
+                    changed.add(entry.name)
+
+    def _watch_shards(self, path: Path, changed: Optional[Set[str]] = None):
+        self._add_watch(path, "shards", CONTAINER_MASK)
+        for entry in list_subdirs(path):
+            self._watch_container(Path(entry.path), changed)
+
+    def poll(self, timeout: float) -> Tuple[Set[str], bool]:
+        """
+        等待并读取事件
+
+        Returns:
+            (有改动的作品目录名, 是否需要完整对账)
+        """
+        if self._fd < 0:
+            return set(), False
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return set(), False
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return set(), False
+
+        changed, rescan = set(), False
+        offset = 0
+        while offset + EVENT_HEADER.size <= len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset:offset + length].split(b"\0", 1)[0].decode("utf-8", "surrogateescape")
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                rescan = True
+                continue
+            if mask & IN_IGNORED:
+                self._watches.pop(wd, None)
+                continue
+            watch = self._watches.get(wd)
+            if watch is None:
+                continue
+            kind, path = watch
+            if kind == "item":
+                if is_relevant_name(name):
+                    changed.add(path.name)
+                continue
+            # 目录层级：作品目录或分片本身被创建、删除或移动。
+            if not (mask & IN_ISDIR):
+                continue
+            child = path / name
+            try:
+                if mask & (IN_MOVED_FROM | IN_DELETE):
+                    self._remove_watch(child)
+                    if kind == "container" and is_item_name(name):
+                        changed.add(name)
+                elif kind == "shards":
+                    self._watch_container(child, changed)
+                elif name == SHARDS_DIRNAME and path == self.gallery_dir:
+                    self._watch_shards(child, changed)
+                elif kind == "container" and is_item_name(name):
+                    self._add_watch(child, "item", FOLDER_MASK)
+                    changed.add(name)
+            except OSError as e:
+                print(f"⚠️ 无法监听目录 {child}: {e}")
+                rescan = True
+        return changed, rescan
+
+    def _remove_watch(self, path: Path):
+        for wd, (_, watched) in list(self._watches.items()):
+            if watched == path:
+                self._libc.inotify_rm_watch(self._fd, wd)
+                self._watches.pop(wd, None)
+
+    @property
+    def watch_count(self) -> int:
+        return len(self._watches)
+
+    def close(self):
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+        self._watches.clear()
+
+
+def _mtime_ns(path: Path) -> Optional[int]:
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def folder_signature(path: Path) -> Optional[Tuple[int, int, int, int]]:
+    """
+    作品目录的内容签名：目录修改时间，以及相关文件的数量、总大小与最新修改时间
+
+    原地改写文件不会改变目录的修改时间，因此也比较文件本身；目录不存在时返回 None。
+    """
+    try:
+        count = total_size = newest = 0
+        folder_mtime = os.stat(path).st_mtime_ns
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if is_relevant_name(entry.name) and entry.is_file(follow_symlinks=False):
+                    stat = entry.stat(follow_symlinks=False)
+                    count += 1
+                    total_size += stat.st_size
+                    newest = max(newest, stat.st_mtime_ns)
+    except OSError:
+        return None
+    return folder_mtime, count, total_size, newest
+
+
+class PollingSource:
+    """
+    定时轮询的事件源，用于不支持 inotify 的系统或网络文件系统
+
+    每次只比较画廊根目录、分片根目录与各分片的修改时间，只重新列出有变化的目录来发现新增与删除的作品；
+    作品目录内的改动（包括原地改写的文件）按轮转方式每次检查一部分作品，单次开销不随画廊规模增长。
+    """
+
+    name = "polling"
+    # 每次轮询最多检查内容的作品目录数；上一次有改动的作品下一次总会再检查（可能仍在写入）。
+    ITEMS_PER_POLL = 256
+
+    def __init__(self, gallery_dir: Path, interval: float = 5.0):
+        self.gallery_dir = gallery_dir
+        self.interval = max(0.1, interval)
+        self._closed = threading.Event()
+        self._shards_mtime: Optional[int] = None
+        self._shards: List[Path] = []
+        # 容器目录（分片或画廊根目录）-> (修改时间, {作品目录名: 路径})
+        self._containers: Dict[Path, Tuple[Optional[int], Dict[str, Path]]] = {}
+        self._items: Dict[str, Path] = {}
+        self._signatures: Dict[str, Optional[Tuple[int, int, int, int]]] = {}
+        self._sweep: List[str] = []
+        self._hot: Set[str] = set()
+        self._scan_containers()
+        self._signatures = {name: folder_signature(path) for name, path in self._items.items()}
+        self._next_scan = time.monotonic() + self.interval
+
+    def _container_paths(self) -> List[Path]:
+        shards_dir = self.gallery_dir / SHARDS_DIRNAME
+        mtime = _mtime_ns(shards_dir)
+        if mtime is None or mtime != self._shards_mtime:
+            self._shards_mtime = mtime
+            self._shards = [Path(entry.path) for entry in list_subdirs(shards_dir) if len(entry.name) == 2]
+        return self._shards + [self.gallery_dir]
+
+    def _scan_containers(self) -> Set[str]:
+        """重新列出修改时间有变化的容器目录，返回新增或消失的作品目录名。"""
+        changed = set()
+        paths = self._container_paths()
+        for path in set(self._containers) - set(paths):
+            changed.update(self._containers.pop(path)[1])
+        for path in paths:
+            # 先取修改时间再列出目录：两步之间发生的改动会在下一次轮询时再次列出。
+            mtime = _mtime_ns(path)
+            previous = self._containers.get(path)
+            if previous is not None and mtime is not None and previous[0] == mtime:
+                continue
+            members = {entry.name: Path(entry.path) for entry in list_subdirs(path) if is_item_name(entry.name)}
+            changed.update(members.keys() ^ (previous[1].keys() if previous else set()))
+            self._containers[path] = (mtime, members)
+        if changed or not self._items:
+            # 同名目录以分片中的为准，与 iter_item_folders 一致。
+            items = {}
+            for path in paths:
+                for name, item_path in self._containers.get(path, (None, {}))[1].items():
+                    items.setdefault(name, item_path)
+            self._items = items
+        return changed
+
+    def _next_batch(self) -> List[str]:
+        if not self._sweep:
+            self._sweep = list(self._items)
+        batch = self._sweep[-self.ITEMS_PER_POLL:]
+        del self._sweep[-self.ITEMS_PER_POLL:]
+        return batch
+
+    def poll(self, timeout: float) -> Tuple[Set[str], bool]:
+        wait = min(timeout, max(0.0, self._next_scan - time.monotonic()))
+        if self._closed.wait(wait) or time.monotonic() < self._next_scan:
+            return set(), False
+        self._next_scan = time.monotonic() + self.interval
+        changed = self._scan_containers()
+        for name in changed:
+            path = self._items.get(name)
+            if path is None:
+                self._signatures.pop(name, None)
+            else:
+                self._signatures[name] = folder_signature(path)
+        for name in (self._hot | set(self._next_batch())) - changed:
+            path = self._items.get(name)
+            if path is None:
+                continue
+            signature = folder_signature(path)
+            if signature != self._signatures.get(name):
+                self._signatures[name] = signature
+                changed.add(name)
+        self._hot = {name for name in changed if name in self._items}
+        return changed, False
+
+    def close(self):
+        self._closed.set()
+
+
+class GalleryWatcher:
+    """
+    画廊目录监听器
+
+    改动先进入待处理集合，连续 debounce 秒没有新改动时批量刷新索引；持续有改动时最迟 max_delay 秒刷新一次，
+    批量生成或复制大量作品时每批只提交一次事务、递增一次版本号。
+    """
+
+    IDLE_TICK = 0.5
+
+    def __init__(self, index: GalleryIndex, backend: str = "auto", debounce: float = 0.5,
+                 max_delay: Optional[float] = None, poll_interval: float = 5.0):
+        """
+        初始化监听器
+
+        Args:
+            index: 要更新的画廊索引
+            backend: auto 优先使用 inotify，失败时退回 polling；也可指定 inotify 或 polling
+            debounce: 合并改动的静默时间（秒）
+            max_delay: 持续改动时两次刷新的最长间隔（秒），默认为 debounce 的 10 倍
+            poll_interval: polling 后端的扫描间隔（秒）
+        """
+        if backend not in WATCHER_BACKENDS or backend == "off":
+            raise ValueError(f"未知的监听方式: {backend}")
+        self.index = index
+        self.requested_backend = backend
+        self.debounce = max(0.0, debounce)
+        self.max_delay = max(self.debounce, max_delay if max_delay is not None else self.debounce * 10)
+        self.poll_interval = poll_interval
+        self.backend: Optional[str] = None
+        self.stats = {"flushes": 0, "folders": 0, "rescans": 0, "errors": 0}
+        self._source = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _open_source(self):
+        gallery_dir = self.index.gallery_dir
+        gallery_dir.mkdir(parents=True, exist_ok=True)
+        if self.requested_backend in ("auto", "inotify"):
+            try:
+                return InotifySource(gallery_dir)
+            except OSError as e:
+                if self.requested_backend == "inotify":
+                    raise
+                print(f"⚠️ inotify 不可用（{e}），改为每 {self.poll_interval:g} 秒轮询画廊目录")
+        return PollingSource(gallery_dir, self.poll_interval)
+
+    def start(self) -> str:
+        """启动后台监听线程，返回实际使用的监听方式。"""
+        if self._thread is not None:
+            return self.backend
+        self._source = self._open_source()
+        self.backend = self._source.name
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="gallery-watcher", daemon=True)
+        self._thread.start()
+        return self.backend
+
+    def _run(self):
+        pending: Set[str] = set()
+        rescan = False
+        first_change = last_change = 0.0
+        while not self._stop.is_set():
+            timeout = self.IDLE_TICK
+            if pending or rescan:
+                now = time.monotonic()
+                timeout = max(0.0, min(last_change + self.debounce, first_change + self.max_delay) - now)
+            try:
+                changed, overflow = self._source.poll(timeout)
+            except OSError as e:
+                self.stats["errors"] += 1
+                print(f"⚠️ 画廊目录监听出错: {e}")
+                changed, overflow = set(), True
+                self._stop.wait(self.IDLE_TICK)
+            now = time.monotonic()
+            if changed or overflow:
+                if not pending and not rescan:
+                    first_change = now
+                last_change = now
+                pending |= changed
+                rescan = rescan or overflow
+            if (pending or rescan) and (now - last_change >= self.debounce or now - first_change >= self.max_delay):
+                self._flush(pending, rescan)
+                pending, rescan = set(), False
+
+    def _flush(self, names: Set[str], rescan: bool):
+        try:
+            if rescan:
+                result = self.index.repair()
+                self.stats["rescans"] += 1
+            else:
+                result = self.index.refresh(names)
+        except Exception as e:
+            self.stats["errors"] += 1
+            print(f"⚠️ 画廊索引增量更新失败: {e}")
+            return
+        self.stats["flushes"] += 1
+        self.stats["folders"] += len(names)
+        if result.get("indexed") or result.get("removed"):
+            print(f"🔄 画廊索引增量更新: {result}")
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        if self._source is not None:
+            self._source.close()
+            self._source = None
+
+
+def start_gallery_watcher(index: Optional[GalleryIndex] = None) -> Optional[GalleryWatcher]:
+    """按配置启动画廊目录监听；配置为 off 时返回 None。"""
+    backend = config_manager.get("gallery_watcher", "auto")
+    if backend == "off":
+        return None
+    if backend not in WATCHER_BACKENDS:
+        print(f"⚠️ 未知的 gallery_watcher 配置 {backend!r}，使用 auto")
+        backend = "auto"
+    try:
+        debounce = float(config_manager.get("gallery_watch_debounce", 0.5))
+    except (TypeError, ValueError):
+        debounce = 0.5
+    watcher = GalleryWatcher(index or get_gallery_index(), backend=backend, debounce=debounce)
+    try:
+        print(f"👀 画廊目录监听已启动（{watcher.start()}）")
+    except OSError as e:
+        print(f"⚠️ 画廊目录监听启动失败: {e}")
+        return None
+    return watcher
+
+
+def main():
+    parser = argparse.ArgumentParser(description="监听画廊目录并增量更新索引")
+    parser.add_argument("--gallery-dir", default=None, help="画廊目录，默认读取配置")
+    parser.add_argument("--backend", default="auto", choices=[b for b in WATCHER_BACKENDS if b != "off"], help="监听方式")
+    parser.add_argument("--debounce", type=float, default=0.5, help="合并改动的静默时间（秒）")
+    args = parser.parse_args()
+
+    config_manager.load_from_env()
+    index = GalleryIndex(Path(args.gallery_dir or config_manager.get("gallery_dir", "gallery")).resolve())
+    print(f"✅ 画廊索引已与磁盘同步: {index.repair()}")
+    watcher = GalleryWatcher(index, backend=args.backend, debounce=args.debounce)
+    print(f"👀 正在监听 {index.gallery_dir}（{watcher.start()}），按 Ctrl+C 退出")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.stop()
+        index.close()
+
+
+if __name__ == "__main__":
+    main()
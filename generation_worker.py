@@ -0,0 +1,167 @@
+"""
+常驻生成工作线程模块
+从队列中取出生成任务执行，并为每个工作线程保留可复用的设备状态
+"""
+
+import queue
+import threading
+from contextlib import nullcontext
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Optional, Tuple
+
+
+@dataclass
+class WorkerState:
+    """单个工作线程的常驻状态：设备、随机数生成器、CUDA 流与预分配缓冲区。"""
+    index: int
+    device: str = "cpu"
+    generator: Any = None
+    stream: Any = None
+    buffers: Dict[str, Any] = field(default_factory=dict)
+
+    def bind_device(self, device: Any = None):
+        """
+        把随机数生成器与 CUDA 流绑定到管线实际执行的设备，设备不变时复用已有对象
+
+        所有工作线程共用同一个管线，设备由模型加载方式（device_map、CPU 卸载）决定，不能按线程编号分配。
+        """
+        device = str(device or "cpu")
+        if self.generator is not None and device == self.device:
+            return
+        try:
+            import torch
+        except ImportError:
+            return
+
+        self.device = device
+        self.stream = None
+        cuda = getattr(torch, "cuda", None)
+        if device.startswith("cuda") and cuda is not None and cuda.is_available():
+            self.stream = cuda.Stream(device=device)
+        if hasattr(torch, "Generator"):
+            self.generator = torch.Generator(device=device)
+
+    def stream_context(self):
+        """在工作线程专属的 CUDA 流上执行；CPU 环境下为空上下文。"""
+        if self.stream is None:
+            return nullcontext()
+        import torch
+        return torch.cuda.stream(self.stream)
+
+
+@dataclass
+class GenerationJob:
+    task_id: str
+    args: Tuple[Any, ...] = ()
+    kwargs: Dict[str, Any] = field(default_factory=dict)
+
+
+def create_worker_state(index: int) -> WorkerState:
+    """创建工作线程状态，先使用 CPU 生成器；任务开始时再用 bind_device 绑定到管线的执行设备。"""
+    state = WorkerState(index=index)
+    state.bind_device("cpu")
+    return state
+
+
+class GenerationWorker:
+    """
+    固定数量的常驻工作线程
+
+    所有任务共用一个管线并在推理锁内串行执行，增加线程只能让保存等收尾工作与下一次推理重叠，不会增加 GPU 并行度。
+    """
+
+    _STOP = object()
+
+    def __init__(self, handler: Callable[[GenerationJob, WorkerState], None], num_workers: int = 1,
+                 state_factory: Callable[[int], WorkerState] = create_worker_state,
+                 name: str = "generation-worker"):
+        """
+        初始化工作线程池
+
+        Args:
+            handler: 任务处理函数，接收 (job, worker_state)，需自行处理任务内异常
+            num_workers: 工作线程数量
+            state_factory: 创建工作线程常驻状态的函数
+            name: 线程名前缀
+        """
+        if num_workers < 1:
+            raise ValueError("工作线程数量必须大于0")
+        self._handler = handler
+        self._num_workers = num_workers
+        self._state_factory = state_factory
+        self._name = name
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._threads = []
+        self._accepting = True
+        self._busy = 0
+
+    def start(self):
+        """启动工作线程；重复调用无副作用。"""
+        with self._lock:
+            if self._accepting:
+                self._start_locked()
+
+    def submit(self, task_id: str, *args, **kwargs):
+        """将任务放入队列；关闭后提交会抛出 RuntimeError。"""
+        with self._lock:
+            if not self._accepting:
+                raise RuntimeError("生成工作线程已关闭")
+            self._start_locked()
+            self._queue.put(GenerationJob(task_id, args, kwargs))
+
+    def _start_locked(self):
+        if self._threads:
+            return
+        for index in range(self._num_workers):
+            thread = threading.Thread(
+                target=self._run, args=(index,), name=f"{self._name}-{index}", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def pending_count(self) -> int:
+        """排队中（尚未被工作线程取走）的任务数量。"""
+        return self._queue.qsize()
+
+    def busy_count(self) -> int:
+        with self._lock:
+            return self._busy
+
+    def shutdown(self, wait: bool = True, timeout: Optional[float] = None):
+        """停止接收新任务；已排队的任务会先执行完，再让工作线程退出。"""
+        with self._lock:
+            if self._accepting:
+                self._accepting = False
+                for _ in self._threads:
+                    self._queue.put(self._STOP)
+            threads = list(self._threads)
+        if wait:
+            for thread in threads:
+                if thread is not threading.current_thread():
+                    thread.join(timeout)
+
+    def _run(self, index: int):
+        try:
+            state = self._state_factory(index)
+        except Exception as error:
+            print(f"⚠️ 工作线程 {index} 初始化设备状态失败，使用默认状态: {error}")
+            state = WorkerState(index=index)
+
+        while True:
+            job = self._queue.get()
+            try:
+                if job is self._STOP:
+                    return
+                with self._lock:
+                    self._busy += 1
+                try:
+                    self._handler(job, state)
+                except Exception as error:
+                    # 处理函数负责任务状态；这里只保证工作线程本身不会退出。
+                    print(f"❌ [任务 {job.task_id}] 工作线程未处理的异常: {error}")
+                finally:
+                    with self._lock:
+                        self._busy -= 1
+            finally:
+                self._queue.task_done()
@@ -0,0 +1,99 @@
+"""
+生成结果缓冲区模块
+管线以 numpy 数组输出时，原地转换为 uint8 后写入可复用的缓冲区，PIL 图像直接共享这块内存，
+原图编码与缩略图缩放都从同一份像素读取
+"""
+
+import threading
+from typing import List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+
+class ImageBufferPool:
+    """
+    按尺寸复用的 RGBX 像素缓冲区
+
+    缓冲区由生成线程取出、保存阶段结束后归还；保存仍在进行时不会被下一次生成复用。
+    RGBX 与 Pillow 内部的 RGB 存储布局一致，图像可以直接映射缓冲区而不复制。
+    """
+
+    def __init__(self, max_free: int = 2):
+        """
+        Args:
+            max_free: 最多保留的空闲缓冲区数量，超出时释放最早归还的
+        """
+        self.max_free = max(0, max_free)
+        self._lock = threading.Lock()
+        self._free: List[np.ndarray] = []
+
+    def acquire(self, height: int, width: int) -> np.ndarray:
+        shape = (height, width, 4)
+        with self._lock:
+            for index, buffer in enumerate(self._free):
+                if buffer.shape == shape:
+                    return self._free.pop(index)
+        return allocate_buffer(height, width)
+
+    def release(self, buffer: Optional[np.ndarray]):
+        if buffer is None:
+            return
+        with self._lock:
+            self._free.append(buffer)
+            if len(self._free) > self.max_free:
+                del self._free[:len(self._free) - self.max_free]
+
+    @property
+    def free_count(self) -> int:
+        with self._lock:
+            return len(self._free)
+
+
+def allocate_buffer(height: int, width: int) -> np.ndarray:
+    buffer = np.empty((height, width, 4), dtype=np.uint8)
+    # 填充字节不参与编码，分配时写一次即可。
+    buffer[..., 3] = 255
+    return buffer
+
+
+def frame_to_uint8(frame: np.ndarray, out: np.ndarray):
+    """
+    把 [0, 1] 范围的浮点帧原地换算为 0-255 并写入 out，结果与 diffusers 的 PIL 输出逐像素一致
+
+    可写的浮点帧会被原地改写，不再分配临时数组；已是 uint8 的帧直接复制。
+    """
+    if frame.dtype != np.uint8:
+        if not frame.flags.writeable or frame.dtype.kind != "f":
+            frame = frame.astype(np.float32)
+        np.multiply(frame, 255, out=frame)
+        np.rint(frame, out=frame)
+        np.clip(frame, 0, 255, out=frame)
+    np.copyto(out, frame, casting="unsafe")
+
+
+def to_shared_image(frame, pool: Optional[ImageBufferPool] = None) -> Tuple[Image.Image, Optional[np.ndarray]]:
+    """
+    把管线输出的一帧转为 PIL 图像
+
+    Args:
+        frame: 形如 (高, 宽, 3) 的 numpy 数组，或已经是 PIL 图像
+        pool: 缓冲区池；为空时临时分配
+
+    Returns:
+        (图像, 缓冲区)。图像与缓冲区共享内存，保存完成后应把缓冲区交还 pool.release；
+        无法共享（已是 PIL 图像或通道数不是 3）时缓冲区为 None
+    """
+    if isinstance(frame, Image.Image):
+        return frame, None
+    frame = np.asarray(frame)
+    if frame.ndim != 3 or frame.shape[2] != 3:
+        pixels = np.empty(frame.shape, dtype=np.uint8)
+        frame_to_uint8(frame, pixels)
+        return Image.fromarray(pixels.squeeze()), None
+
+    height, width = frame.shape[:2]
+    buffer = pool.acquire(height, width) if pool is not None else allocate_buffer(height, width)
+    frame_to_uint8(frame, buffer[..., :3])
+    image = Image.frombuffer("RGB", (width, height), buffer, "raw", "RGBX", 0, 1)
+    return image, buffer
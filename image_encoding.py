@@ -0,0 +1,120 @@
+"""
+图片编码模块
+按格式定义原图与缩略图的编码策略，多份图片可在线程池中并行编码（Pillow 编码时释放 GIL）
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from PIL import Image
+
+from config_manager import config_manager
+
+
+@dataclass(frozen=True)
+class EncodingPolicy:
+    """一种编码方式：Pillow 格式名、文件扩展名与编码参数。"""
+    name: str
+    format: str
+    extension: str
+    label: str
+    options: Dict[str, Any] = field(default_factory=dict)
+
+    def save(self, image: Image.Image, path, **extra):
+        """按策略编码保存；extra 为额外的保存参数（如内嵌元数据）。"""
+        if self.format == "JPEG" and image.mode not in {"RGB", "RGBX", "L", "CMYK"}:
+            image = image.convert("RGB")
+        elif self.format == "PNG" and image.mode == "RGBX":
+            # 生成阶段共享内存的图像为 RGBX，PNG 不支持该模式，编码前转换一次；WebP 与 JPEG 可直接编码。
+            image = image.convert("RGB")
+        image.save(path, format=self.format, **self.options, **extra)
+
+
+AUTO_ENCODING = "auto"
+ENCODING_POLICIES = {
+    policy.name: policy for policy in (
+        EncodingPolicy("png", "PNG", ".png", "PNG（无损）", {"compress_level": 6}),
+        EncodingPolicy("png-fast", "PNG", ".png", "PNG（无损，快速压缩，文件较大）", {"compress_level": 1}),
+        EncodingPolicy("webp-lossless", "WEBP", ".webp", "WebP（无损）", {"lossless": True, "quality": 20, "method": 1}),
+        EncodingPolicy("webp", "WEBP", ".webp", "WebP（高质量）", {"quality": 92, "method": 2}),
+        EncodingPolicy("jpeg", "JPEG", ".jpg", "JPEG（高质量）", {"quality": 95, "subsampling": 0}),
+    )
+}
+# 画廊缩略图的编码方式。
+THUMBNAIL_POLICY = EncodingPolicy("thumbnail", "WEBP", ".webp", "缩略图", {"quality": 82, "method": 4})
+# auto 模式下按文件扩展名选择的策略。
+EXTENSION_POLICIES = {".png": "png", ".jpg": "jpeg", ".jpeg": "jpeg", ".webp": "webp"}
+
+
+def get_encoding_names() -> List[str]:
+    return [AUTO_ENCODING, *ENCODING_POLICIES]
+
+
+def resolve_policy(name: Optional[str], filename: str) -> EncodingPolicy:
+    """
+    确定原图的编码策略
+
+    Args:
+        name: 策略名；为空时读取配置 output_encoding，auto 表示按文件扩展名选择
+        filename: 用户指定的文件名
+
+    Raises:
+        ValueError: 指定了未知的策略名
+    """
+    if not name:
+        name = config_manager.get("output_encoding", AUTO_ENCODING)
+        if name not in ENCODING_POLICIES:
+            # 配置写错时不影响保存，按文件扩展名选择。
+            name = AUTO_ENCODING
+    if name == AUTO_ENCODING:
+        name = EXTENSION_POLICIES.get(Path(filename).suffix.lower(), "png")
+    if name not in ENCODING_POLICIES:
+        raise ValueError(f"未知的编码方式: {name}，可选: {', '.join(get_encoding_names())}")
+    return ENCODING_POLICIES[name]
+
+
+def output_extension(policy: EncodingPolicy, filename: str) -> str:
+    """文件名扩展名与策略格式一致时沿用（如 .jpeg），否则使用策略的扩展名。"""
+    suffix = Path(filename).suffix
+    if EXTENSION_POLICIES.get(suffix.lower()) and \
+            ENCODING_POLICIES[EXTENSION_POLICIES[suffix.lower()]].format == policy.format:
+        return suffix
+    return policy.extension
+
+
+EncodeJob = Tuple[Image.Image, Path, EncodingPolicy, Dict[str, Any]]
+
+
+def _encode(job: EncodeJob) -> Path:
+    image, path, policy, extra = job
+    path = Path(path)
+    temporary_path = path.with_name(f".{path.name}.tmp")
+    try:
+        policy.save(image, temporary_path, **extra)
+        temporary_path.replace(path)
+    finally:
+        temporary_path.unlink(missing_ok=True)
+    return path
+
+
+def encode_many(jobs: Iterable[EncodeJob], workers: Optional[int] = None) -> List[Path]:
+    """
+    编码多份图片，每份先写临时文件再原子替换
+
+    Args:
+        jobs: (图像, 目标路径, 编码策略, 额外保存参数) 列表
+        workers: 并行线程数，默认读取配置 encoding_workers；1 表示依次编码
+
+    Returns:
+        与输入顺序一致的目标路径
+    """
+    jobs = list(jobs)
+    if workers is None:
+        workers = config_manager.get("encoding_workers", 2)
+        workers = workers if isinstance(workers, int) and not isinstance(workers, bool) else 2
+    if workers <= 1 or len(jobs) <= 1:
+        return [_encode(job) for job in jobs]
+    with ThreadPoolExecutor(max_workers=min(workers, len(jobs)), thread_name_prefix="encode") as executor:
+        return list(executor.map(_encode, jobs))
@@ -7,51 +7,146 @@
 import datetime
 import shutil
 from pathlib import Path
-from PIL import Image, ImageOps
+from PIL import ExifTags, Image
 from utils import ensure_directory, validate_file_extension
 from config_manager import config_manager
+from image_encoding import THUMBNAIL_POLICY, encode_many, output_extension, resolve_policy
+from gallery_index import get_gallery_index
+from gallery_layout import folder_path, get_gallery_layout, is_item_name, resolve_folder
+from gallery_placeholders import compute_placeholder
+# read_gallery_info 与 OPTIMIZATION_RECORD_KEY 从此处导入的旧代码仍然可用。
+from gallery_metadata import (
+    METADATA_SUFFIX, OPTIMIZATION_RECORD_KEY, build_metadata, embedded_save_options, read_gallery_info,
+    write_metadata,
+)
 
 
 THUMBNAIL_SIZE = (640, 640)
 THUMBNAIL_SUFFIX = "_thumb.webp"
+# 画廊卡片默认使用的缩略图边长；其余尺寸保存为 <图片名>_thumb_<边长>.webp。
+PRIMARY_THUMBNAIL_SIZE = THUMBNAIL_SIZE[0]
+DEFAULT_THUMBNAIL_SIZES = (256, 640, 1280)
+THUMBNAIL_SIZE_RANGE = (64, 4096)
+THUMBNAIL_REDUCING_GAP = 3.0
+# EXIF 方向值对应的校正操作，与 ImageOps.exif_transpose 一致。
+EXIF_TRANSPOSE_METHODS = {
+    2: Image.Transpose.FLIP_LEFT_RIGHT,
+    3: Image.Transpose.ROTATE_180,
+    4: Image.Transpose.FLIP_TOP_BOTTOM,
+    5: Image.Transpose.TRANSPOSE,
+    6: Image.Transpose.ROTATE_270,
+    7: Image.Transpose.TRANSVERSE,
+    8: Image.Transpose.ROTATE_90,
+}
 
 
-def get_thumbnail_path(image_path):
+def get_thumbnail_sizes():
+    """读取配置的缩略图尺寸（最长边像素），去重排序；默认尺寸总会包含在内。"""
+    sizes = {PRIMARY_THUMBNAIL_SIZE}
+    configured = config_manager.get("thumbnail_sizes", DEFAULT_THUMBNAIL_SIZES)
+    for size in configured if isinstance(configured, (list, tuple)) else DEFAULT_THUMBNAIL_SIZES:
+        if isinstance(size, int) and not isinstance(size, bool) and \
+                THUMBNAIL_SIZE_RANGE[0] <= size <= THUMBNAIL_SIZE_RANGE[1]:
+            sizes.add(size)
+    return tuple(sorted(sizes))
+
+
+def get_thumbnail_path(image_path, size=None):
     image_path = Path(image_path)
-    return image_path.with_name(f"{image_path.stem}{THUMBNAIL_SUFFIX}")
+    if size is None or size == PRIMARY_THUMBNAIL_SIZE:
+        return image_path.with_name(f"{image_path.stem}{THUMBNAIL_SUFFIX}")
+    return image_path.with_name(f"{image_path.stem}_thumb_{size}.webp")
+
+
+def get_thumbnail_widths(width, height, sizes=None):
+    """
+    计算各尺寸缩略图的实际宽度，用于 srcset 的宽度描述符
+
+    缩略图不会放大，超过原图的尺寸与原图同宽，只保留其中最小的一个。
+    原图尺寸未知时返回空列表。
+    """
+    if not width or not height:
+        return []
+    widths = []
+    for size in sizes or get_thumbnail_sizes():
+        scaled = max(1, round(width * min(1.0, size / max(width, height))))
+        if not widths or scaled > widths[-1][1]:
+            widths.append((size, scaled))
+    return widths
+
+
+def _scale_to_fit(image, size):
+    """
+    缩小到最长边不超过 size，返回新图像，不修改输入
+
+    resize 的 reducing_gap 会先用 Image.reduce 按整数倍快速缩小，再做一次 LANCZOS 重采样。
+    """
+    width, height = image.size
+    scale = min(1.0, size / max(width, height))
+    target = (max(1, round(width * scale)), max(1, round(height * scale)))
+    if target == image.size:
+        return image
+    return image.resize(target, Image.Resampling.LANCZOS, reducing_gap=THUMBNAIL_REDUCING_GAP)
+
+
+def create_gallery_thumbnail(image_source, image_path, force=False, sizes=None):
+    """
+    为画廊生成一组不同尺寸的 WebP 缩略图，使用原子替换避免半文件
 
+    image_source 可以是文件路径，也可以是生成阶段仍在内存中的图像（不会被修改）。
+    原图只解码一次：JPEG 以草稿模式按 1/2、1/4、1/8 直接解码到接近最大尺寸；
+    随后从大到小逐级缩小，每一级都以上一级的结果为输入。
+    EXIF 方向在最大一级缩略图上校正，没有方向信息时不会复制整张原图。
 
-def create_gallery_thumbnail(image_source, image_path, force=False):
-    """为画廊生成体积较小的 WebP 缩略图，使用原子替换避免半文件。"""
+    Returns:
+        默认尺寸缩略图的路径
+    """
     image_path = Path(image_path)
-    thumbnail_path = get_thumbnail_path(image_path)
-    if thumbnail_path.exists() and not force:
-        return thumbnail_path
+    sizes = sorted(sizes or get_thumbnail_sizes(), reverse=True)
+    targets = [(size, get_thumbnail_path(image_path, size)) for size in sizes]
+    if not force:
+        targets = [(size, path) for size, path in targets if not path.exists()]
+    if not targets:
+        return get_thumbnail_path(image_path)
 
-    temporary_path = thumbnail_path.with_name(f".{thumbnail_path.name}.tmp")
     opened_image = None
     try:
         if isinstance(image_source, (str, Path)):
             opened_image = Image.open(image_source)
             source = opened_image
+            if source.format == "JPEG":
+                largest = targets[0][0]
+                source.draft("RGB", (largest, largest))
         else:
             source = image_source
 
-        thumbnail = ImageOps.exif_transpose(source).copy()
-        thumbnail.thumbnail(THUMBNAIL_SIZE, Image.Resampling.LANCZOS, reducing_gap=3.0)
-        if thumbnail.mode not in {"RGB", "RGBA"}:
-            thumbnail = thumbnail.convert("RGB")
-        thumbnail.save(temporary_path, format="WEBP", quality=82, method=4)
-        temporary_path.replace(thumbnail_path)
-        return thumbnail_path
+        transpose = EXIF_TRANSPOSE_METHODS.get(source.getexif().get(ExifTags.Base.Orientation, 1))
+        current = source if source.mode in {"RGB", "RGBA", "RGBX"} else source.convert("RGB")
+        jobs = []
+        for index, (size, thumbnail_path) in enumerate(targets):
+            current = _scale_to_fit(current, size)
+            if index == 0 and transpose is not None:
+                current = current.transpose(transpose)
+            jobs.append((current, thumbnail_path, THUMBNAIL_POLICY, {}))
+        # 缩放很快，编码占大头；各尺寸缩放完成后并行编码。
+        encode_many(jobs)
+        return get_thumbnail_path(image_path)
     finally:
         if opened_image is not None:
             opened_image.close()
-        temporary_path.unlink(missing_ok=True)
+
 
 def save_to_gallery(image, filename, prompt, width, height, steps, gen_time, optimization_mode,
-                    cancellation_check=None):
-    """将图片保存到gallery文件夹中的子文件夹"""
+                    cancellation_check=None, optimization_record=None, seed=None, model=None, timings=None,
+                    encoding=None):
+    """
+    将图片保存到gallery文件夹中的子文件夹
+
+    作品参数写入图片头部（无法写入时保存为 <图片名>_meta.json）：seed 为随机种子，model 为模型名称，
+    timings 为各阶段耗时（秒），optimization_record 为提示词优化的输入、结果与来源，供缓存预热使用。
+    encoding 为原图编码方式（见 image_encoding.ENCODING_POLICIES），为空时读取配置 output_encoding，
+    原图扩展名随编码格式调整。
+    """
     import time
 
     print(f"🔧 [save_to_gallery] 开始保存流程")
@@ -59,28 +154,36 @@ def save_to_gallery(image, filename, prompt, width, height, steps, gen_time, opt
     print(f"   - size: {width}x{height}")
 
     filename = validate_file_extension(filename)
+    policy = resolve_policy(encoding, filename)
     gallery_dir = ensure_directory(config_manager.get("gallery_dir", "gallery")).resolve()
     print(f"   - gallery_dir: {gallery_dir}")
     print(f"   - gallery_dir exists: {gallery_dir.exists()}")
 
     # 获取文件名（不含扩展名）作为子文件夹名
     base_name = Path(filename).stem
-    extension = Path(filename).suffix
+    extension = output_extension(policy, filename)
     print(f"   - base_name: {base_name}")
     print(f"   - extension: {extension}")
 
-    # 原子创建唯一目录，避免同名请求在同一秒内互相覆盖。
-    image_folder = gallery_dir / base_name
+    # 原子创建唯一目录，避免同名请求在同一秒内互相覆盖；目录名在两种布局中都不能重复。
+    layout = get_gallery_layout()
+    # 不能直接用作目录名的（如以 "." 开头会变成隐藏目录）加 image_ 前缀，重名后缀也加在前缀之后的名字上。
+    base_folder_name = base_name if is_item_name(base_name) else f"image_{base_name}"
+    folder_name = base_folder_name
     counter = 0
     while True:
+        image_folder = folder_path(gallery_dir, folder_name, layout)
         try:
+            if resolve_folder(gallery_dir, folder_name) is not None:
+                raise FileExistsError(image_folder)
+            image_folder.parent.mkdir(parents=True, exist_ok=True)
             image_folder.mkdir(parents=False, exist_ok=False)
             break
         except FileExistsError:
             counter += 1
             timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S_%f")
             suffix = f"_{counter}" if counter > 1 else ""
-            image_folder = gallery_dir / f"{base_name}_{timestamp}{suffix}"
+            folder_name = f"{base_folder_name}_{timestamp}{suffix}"
 
     print(f"   - 最终文件夹路径: {image_folder}")
 
@@ -99,11 +202,23 @@ def save_to_gallery(image, filename, prompt, width, height, steps, gen_time, opt
     image_path = image_folder / f"{base_name}{extension}"
     print(f"   - 图片保存路径: {image_path}")
     save_start = time.time()
+    # 占位图从内存中的图像计算（先缩小到 32 像素），随元数据一起写入原图，画廊在缩略图到达前即可显示。
+    try:
+        placeholder = compute_placeholder(image)
+    except Exception as placeholder_error:
+        print(f"⚠️ 占位图计算失败，可稍后用 gallery_placeholders 补齐: {placeholder_error}")
+        placeholder = None
+    metadata = build_metadata(
+        image_path.name, prompt, width, height, steps, optimization_mode,
+        gen_time=gen_time, seed=seed, model=model, timings=timings,
+        optimization_record=optimization_record, placeholder=placeholder,
+    )
+    save_options = embedded_save_options(image_path, metadata)
 
     try:
         check_cancelled()
-        print(f"   - 开始调用 image.save()...")
-        image.save(image_path)
+        print(f"   - 开始编码原图: {policy.label}")
+        policy.save(image, image_path, **save_options)
         check_cancelled()
         save_time = time.time() - save_start
         print(f"💾 图片保存完成，耗时: {save_time:.2f}秒")
@@ -116,32 +231,34 @@ def save_to_gallery(image, filename, prompt, width, height, steps, gen_time, opt
 
     # 新作品在保存阶段立即生成缩略图，画廊无需传输原始大图。
     try:
+        from thumbnail_pack import store_thumbnails
+
         check_cancelled()
         create_gallery_thumbnail(image, image_path)
+        store_thumbnails(image_path)
         check_cancelled()
     except Exception as thumbnail_error:
         check_cancelled()
         print(f"⚠️ 缩略图生成失败，将在访问画廊时重试: {thumbnail_error}")
 
-    # 创建参数信息文件
-    info_file = image_folder / f"{base_name}_info.txt"
-    print(f"   - 创建info文件: {info_file}")
-    try:
-        check_cancelled()
-        with open(info_file, 'w', encoding='utf-8') as f:
-            f.write(f"图片名称: {base_name}{extension}\n")
-            f.write(f"提示词: {prompt}\n")
-            f.write(f"图片尺寸: {width}x{height}\n")
-            f.write(f"推理步数: {steps}\n")
-            f.write(f"优化模式: {optimization_mode}\n")
-            f.write(f"生成时间: {gen_time:.2f}秒\n")
-            f.write(f"创建时间: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-        print(f"   - info文件创建完成")
-    except Exception as e:
-        check_cancelled()
-        print(f"❌ info文件创建失败: {e}")
-        # info文件失败不影响主流程
+    # 图片无法内嵌元数据时改为写入元数据文件
+    if not save_options:
+        metadata_file = image_folder / f"{base_name}{METADATA_SUFFIX}"
+        print(f"   - 创建元数据文件: {metadata_file}")
+        try:
+            check_cancelled()
+            write_metadata(metadata_file, metadata)
+            print(f"   - 元数据文件创建完成")
+        except Exception as e:
+            check_cancelled()
+            print(f"❌ 元数据文件创建失败: {e}")
+            # 元数据文件失败不影响主流程
 
     check_cancelled()
+    # 就地更新画廊索引，画廊页面不再需要扫描目录。
+    try:
+        get_gallery_index().index_folder(image_folder)
+    except Exception as index_error:
+        print(f"⚠️ 画廊索引更新失败，将在下次修复索引时补上: {index_error}")
     print(f"✅ [save_to_gallery] 全部完成")
     return image_path
@@ -0,0 +1,265 @@
+"""
+原图转码变体模块
+浏览器在 Accept 中声明支持 AVIF / WebP 时，画廊原图改为提供转码后的版本（2048×2048 的 PNG 通常只剩几十分之一）；
+变体按需生成，同一张图同时只转码一次，保存在画廊目录下的 .variants/，总大小超出上限时淘汰最久未使用的
+"""
+
+import argparse
+import hashlib
+import os
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Union
+
+from PIL import Image, features
+
+from config_manager import config_manager
+from image_encoding import EncodingPolicy
+
+
+VARIANTS_DIRNAME = ".variants"
+# 只转码这些格式的原图；WebP 原图已足够小。
+TRANSCODABLE_SUFFIXES = {".png", ".jpg", ".jpeg"}
+DEFAULT_VARIANTS = {"avif": 60, "webp": 80}
+DEFAULT_CACHE_MB = 1024
+# 超出上限时淘汰到上限的该比例以下，避免每次写入都触发淘汰。
+EVICT_TO = 0.9
+
+
+@dataclass(frozen=True)
+class VariantFormat:
+    """一种变体格式：名称、MIME 类型与编码策略。"""
+    name: str
+    mimetype: str
+    policy: EncodingPolicy
+
+
+def _variant_format(name: str, quality: int) -> Optional[VariantFormat]:
+    if name == "avif" and features.check("avif"):
+        # speed 8 的体积与默认速度相差不到一成，编码快约 5 倍，适合在请求中按需生成。
+        return VariantFormat("avif", "image/avif", EncodingPolicy("avif", "AVIF", ".avif", "AVIF", {"quality": quality, "speed": 8}))
+    if name == "webp":
+        return VariantFormat("webp", "image/webp", EncodingPolicy("webp", "WEBP", ".webp", "WebP", {"quality": quality, "method": 4}))
+    return None
+
+
+def get_variant_formats() -> List[VariantFormat]:
+    """
+    读取配置 image_variants（格式名到质量的映射，顺序即优先级），空映射表示关闭
+
+    当前 Pillow 不支持的格式、未知格式与无效质量会被忽略；配置无效时使用默认值。
+    """
+    configured = config_manager.get("image_variants", DEFAULT_VARIANTS)
+    if not isinstance(configured, dict):
+        configured = DEFAULT_VARIANTS
+    formats = []
+    for name, quality in configured.items():
+        if isinstance(quality, int) and not isinstance(quality, bool) and 1 <= quality <= 100:
+            variant = _variant_format(name, quality)
+            if variant is not None:
+                formats.append(variant)
+    return formats
+
+
+def negotiate_format(accepted: Iterable[str], formats: Optional[List[VariantFormat]] = None) -> Optional[VariantFormat]:
+    """
+    按优先级选择客户端明确接受的变体格式
+
+    Args:
+        accepted: 客户端 Accept 中质量大于 0 的 MIME 类型；只认明确列出的类型，*/* 与 image/* 不算
+        formats: 候选格式，默认读取配置
+
+    Returns:
+        变体格式；客户端不支持任何候选格式时返回 None（提供原图）
+    """
+    accepted = set(accepted)
+    formats = get_variant_formats() if formats is None else formats
+    return next((variant for variant in formats if variant.mimetype in accepted), None)
+
+
+class VariantCache:
+    """有大小上限的变体磁盘缓存；文件访问时间记录最近使用时间（修改时间不变，ETag 与 Last-Modified 保持稳定）。"""
+
+    def __init__(self, cache_dir: Union[str, Path], max_bytes: int = DEFAULT_CACHE_MB * 1024 * 1024):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max(0, max_bytes)
+        self._lock = threading.Lock()
+        self._pending: Dict[str, Future] = {}
+        self._total_bytes: Optional[int] = None
+        self.stats = {"hits": 0, "encoded": 0, "shared": 0, "evicted": 0, "failed": 0}
+
+    def key(self, source: Path, variant: VariantFormat) -> str:
+        """由作品目录名、文件名、原图大小与修改时间以及编码参数计算；原图改动或目录迁移到分片后仍能命中。"""
+        stat = source.stat()
+        parts = (
+            source.parent.name, source.name, str(stat.st_size), str(stat.st_mtime_ns),
+            variant.name, repr(sorted(variant.policy.options.items())),
+        )
+        return hashlib.blake2b("\0".join(parts).encode("utf-8", "surrogateescape"), digest_size=16).hexdigest()
+
+    def get(self, source: Union[str, Path], variant: VariantFormat) -> Optional[Path]:
+        """
+        获取原图的变体，不存在时转码
+
+        同一变体的并发请求共享一次转码，其余请求等待其结果。
+
+        Returns:
+            变体文件路径；变体不比原图小或转码失败时返回 None，此时应提供原图
+        """
+        source = Path(source)
+        try:
+            key = self.key(source, variant)
+        except OSError:
+            return None
+        path = self.cache_dir / f"{key}{variant.policy.extension}"
+        marker = self.cache_dir / f"{key}.orig"
+        for candidate in (path, marker):
+            try:
+                os.utime(candidate, ns=(time.time_ns(), candidate.stat().st_mtime_ns))
+            except OSError:
+                continue
+            with self._lock:
+                self.stats["hits"] += 1
+            return path if candidate == path else None
+
+        with self._lock:
+            future = self._pending.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._pending[key] = future
+            else:
+                self.stats["shared"] += 1
+        if not owner:
+            return future.result()
+
+        result = None
+        try:
+            result = self._encode(source, variant, path, marker)
+        except Exception as e:
+            print(f"⚠️ 原图转码失败 {source.name} -> {variant.name}: {e}")
+            with self._lock:
+                self.stats["failed"] += 1
+        finally:
+            # 转码线程被中断（BaseException）时等待者也要得到结果（提供原图），不能一直阻塞。
+            future.set_result(result)
+            with self._lock:
+                del self._pending[key]
+        return result
+
+    def _encode(self, source: Path, variant: VariantFormat, path: Path, marker: Path) -> Optional[Path]:
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        temporary_path = self.cache_dir / f".{path.name}.tmp"
+        try:
+            with Image.open(source) as image:
+                image.load()
+                if image.mode not in {"RGB", "RGBA"}:
+                    image = image.convert("RGBA" if "A" in image.getbands() or "transparency" in image.info else "RGB")
+                variant.policy.save(image, temporary_path)
+            size = temporary_path.stat().st_size
+            if size >= source.stat().st_size:
+                # 变体不比原图小（如质量很低的 JPEG）：记录下来，之后直接提供原图。
+                marker.touch()
+                return None
+            os.replace(temporary_path, path)
+        finally:
+            temporary_path.unlink(missing_ok=True)
+        with self._lock:
+            self.stats["encoded"] += 1
+        self._add_bytes(size)
+        return path
+
+    def _add_bytes(self, size: int):
+        with self._lock:
+            if self._total_bytes is None:
+                self._total_bytes = sum(entry.stat().st_size for entry in self._entries())
+            else:
+                self._total_bytes += size
+            if self._total_bytes > self.max_bytes:
+                self._evict_locked()
+
+    def _entries(self) -> List[os.DirEntry]:
+        try:
+            with os.scandir(self.cache_dir) as entries:
+                return [entry for entry in entries if entry.is_file() and not entry.name.startswith(".")]
+        except OSError:
+            return []
+
+    def _evict_locked(self):
+        """按最近使用时间从旧到新删除变体，直到总大小降到上限的 EVICT_TO 以下。"""
+        entries = sorted(self._entries(), key=lambda entry: entry.stat().st_atime_ns)
+        total = sum(entry.stat().st_size for entry in entries)
+        target = self.max_bytes * EVICT_TO
+        for entry in entries:
+            if total <= target:
+                break
+            size = entry.stat().st_size
+            try:
+                os.unlink(entry.path)
+            except OSError:
+                continue
+            total -= size
+            self.stats["evicted"] += 1
+        self._total_bytes = total
+
+    def usage(self) -> Dict[str, int]:
+        entries = self._entries()
+        return {"files": len(entries), "bytes": sum(entry.stat().st_size for entry in entries)}
+
+    def clear(self) -> int:
+        with self._lock:
+            removed = 0
+            for entry in self._entries():
+                os.unlink(entry.path)
+                removed += 1
+            self._total_bytes = 0
+        return removed
+
+
+def get_cache_bytes() -> int:
+    """读取配置 image_variant_cache_mb；配置无效时使用默认值。"""
+    size = config_manager.get("image_variant_cache_mb", DEFAULT_CACHE_MB)
+    if not isinstance(size, (int, float)) or isinstance(size, bool) or size < 0:
+        size = DEFAULT_CACHE_MB
+    return int(size * 1024 * 1024)
+
+
+_default_cache: Optional[VariantCache] = None
+_default_cache_lock = threading.Lock()
+
+
+def get_variant_cache() -> VariantCache:
+    """获取当前画廊目录对应的共享变体缓存；画廊目录配置变化时重新创建。"""
+    global _default_cache
+    cache_dir = Path(config_manager.get("gallery_dir", "gallery")).resolve() / VARIANTS_DIRNAME
+    with _default_cache_lock:
+        if _default_cache is None or _default_cache.cache_dir != cache_dir:
+            _default_cache = VariantCache(cache_dir, get_cache_bytes())
+        _default_cache.max_bytes = get_cache_bytes()
+        return _default_cache
+
+
+def main():
+    parser = argparse.ArgumentParser(description="查看或清空原图转码变体缓存")
+    parser.add_argument("command", choices=["status", "clear"], help="status 查看缓存占用，clear 删除全部变体")
+    parser.add_argument("--gallery-dir", default=None, help="画廊目录，默认读取配置")
+    args = parser.parse_args()
+
+    config_manager.load_from_env()
+    gallery_dir = Path(args.gallery_dir or config_manager.get("gallery_dir", "gallery")).resolve()
+    cache = VariantCache(gallery_dir / VARIANTS_DIRNAME, get_cache_bytes())
+    if args.command == "clear":
+        print(f"🧹 已删除 {cache.clear()} 个变体")
+    usage = cache.usage()
+    formats = ", ".join(variant.name for variant in get_variant_formats()) or "已关闭"
+    print(
+        f"📦 {cache.cache_dir}: {usage['files']} 个文件, {usage['bytes'] / 1024 / 1024:.1f} MB"
+        f"（上限 {cache.max_bytes / 1024 / 1024:.0f} MB），格式: {formats}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -35,6 +35,7 @@ class ModelManager:
             self.model_loaded = False
             self.loading_in_progress = False
             self.optimization_mode = None
+            self.model_path = None
             self._initialized = True
 
     def load_model(self, optimization_mode: str = "basic", model_path: Optional[str] = None) -> Tuple[bool, str]:
@@ -104,6 +105,7 @@ class ModelManager:
                 self.pipe = loaded_pipe
                 self.model_loaded = True
                 self.optimization_mode = optimization_mode
+                self.model_path = str(local_model_path)
                 self.loading_in_progress = False
 
             return True, f"✅ 模型加载成功! 耗时: {load_time:.2f}秒"
@@ -0,0 +1,241 @@
+"""
+提示词优化缓存模块
+内存 LRU + SQLite 磁盘两级缓存，带过期时间和容量上限
+"""
+
+import hashlib
+import math
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Optional, Tuple, Union
+
+
+def normalize_text(text: str) -> str:
+    """统一全半角、去掉首尾空白并把连续空白压缩为一个空格。"""
+    return " ".join(unicodedata.normalize("NFKC", text or "").split())
+
+
+def make_cache_key(*parts: str) -> str:
+    normalized = "\x1f".join(normalize_text(part) for part in parts)
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+class PromptCache:
+    """优化结果缓存；磁盘层不可用时自动退化为仅内存缓存。"""
+
+    def __init__(self, db_path: Optional[Union[str, Path]] = None, memory_entries: int = 512,
+                 disk_entries: int = 20000, ttl_seconds: float = 7 * 24 * 3600,
+                 clock: Callable[[], float] = time.time):
+        """
+        初始化缓存
+
+        Args:
+            db_path: SQLite 文件路径，None 表示不使用磁盘层
+            memory_entries: 内存层最多条目数
+            disk_entries: 磁盘层最多条目数
+            ttl_seconds: 条目有效期（秒）
+            clock: 时间函数，便于测试
+        """
+        self._db_path = Path(db_path) if db_path else None
+        self._memory_entries = max(1, memory_entries)
+        self._disk_entries = max(1, disk_entries)
+        self._ttl = ttl_seconds
+        self._clock = clock
+        self._lock = threading.RLock()
+        self._memory = OrderedDict()
+        self._connection = None
+        self._disk_failed = False
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0}
+
+    def _get_connection(self):
+        if self._db_path is None or self._disk_failed:
+            return None
+        if self._connection is None:
+            try:
+                self._db_path.parent.mkdir(parents=True, exist_ok=True)
+                connection = sqlite3.connect(str(self._db_path), check_same_thread=False)
+                connection.execute("PRAGMA journal_mode=WAL")
+                connection.execute(
+                    "CREATE TABLE IF NOT EXISTS prompt_cache ("
+                    "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                    "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+                )
+                connection.execute(
+                    "CREATE INDEX IF NOT EXISTS idx_prompt_cache_accessed ON prompt_cache(accessed_at)"
+                )
+                connection.commit()
+                self._connection = connection
+            except sqlite3.Error as error:
+                print(f"⚠️ 提示词缓存磁盘层不可用，仅使用内存缓存: {error}")
+                self._disk_failed = True
+                return None
+        return self._connection
+
+    def get(self, key: str) -> Optional[str]:
+        """读取缓存；内存未命中时查磁盘并回填内存。"""
+        now = self._clock()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                value, created_at = entry
+                if now - created_at <= self._ttl:
+                    self._memory.move_to_end(key)
+                    self._stats["memory_hits"] += 1
+                    return value
+                del self._memory[key]
+
+            connection = self._get_connection()
+            if connection is not None:
+                try:
+                    row = connection.execute(
+                        "SELECT value, created_at FROM prompt_cache WHERE key = ?", (key,)
+                    ).fetchone()
+                    if row is not None and now - row[1] <= self._ttl:
+                        connection.execute(
+                            "UPDATE prompt_cache SET accessed_at = ? WHERE key = ?", (now, key)
+                        )
+                        connection.commit()
+                        self._remember_locked(key, row[0], row[1])
+                        self._stats["disk_hits"] += 1
+                        return row[0]
+                    if row is not None:
+                        connection.execute("DELETE FROM prompt_cache WHERE key = ?", (key,))
+                        connection.commit()
+                except sqlite3.Error as error:
+                    print(f"⚠️ 读取提示词缓存失败: {error}")
+
+            self._stats["misses"] += 1
+            return None
+
+    def put(self, key: str, value: str, created_at: Optional[float] = None):
+        """写入两级缓存，并按访问时间淘汰超出上限的磁盘条目。"""
+        if not value:
+            return
+        now = self._clock()
+        created_at = now if created_at is None else created_at
+        with self._lock:
+            self._remember_locked(key, value, created_at)
+            self._stats["stores"] += 1
+            connection = self._get_connection()
+            if connection is None:
+                return
+            try:
+                connection.execute(
+                    "INSERT OR REPLACE INTO prompt_cache (key, value, created_at, accessed_at) "
+                    "VALUES (?, ?, ?, ?)",
+                    (key, value, created_at, now),
+                )
+                self._evict_locked(connection, now)
+                connection.commit()
+            except sqlite3.Error as error:
+                print(f"⚠️ 写入提示词缓存失败: {error}")
+
+    def put_many(self, entries: Iterable[Tuple[str, str, Optional[float]]]) -> int:
+        """
+        批量写入 (key, value, created_at)，用于预热
+
+        只写磁盘层，在一个事务中完成，最后统一淘汰一次，不会挤掉内存层中正在使用的条目。
+        已过期的条目与按时间排在容量上限之外的条目直接跳过；磁盘中已有的同键条目保持不变。
+        没有磁盘层时只填充内存层的空余位置。
+
+        Returns:
+            实际写入的条目数
+        """
+        now = self._clock()
+        rows = {}
+        for key, value, created_at in entries:
+            created_at = now if created_at is None else created_at
+            if value and now - created_at <= self._ttl and created_at > rows.get(key, ("", -math.inf))[1]:
+                rows[key] = (value, created_at)
+        # 按创建时间从新到旧，超出磁盘容量的部分写入后也会立即被淘汰，不必写入。
+        newest = sorted(rows.items(), key=lambda item: item[1][1], reverse=True)
+        with self._lock:
+            connection = self._get_connection()
+            if connection is None:
+                written = 0
+                for key, (value, created_at) in newest:
+                    if len(self._memory) >= self._memory_entries:
+                        break
+                    if key not in self._memory:
+                        self._memory[key] = (value, created_at)
+                        self._memory.move_to_end(key, last=False)
+                        written += 1
+                self._stats["stores"] += written
+                return written
+            try:
+                # 磁盘层已满时，比其中最旧条目还旧的预热条目写入后会立即被淘汰，直接跳过。
+                horizon = connection.execute(
+                    "SELECT accessed_at FROM prompt_cache ORDER BY accessed_at DESC LIMIT 1 OFFSET ?",
+                    (self._disk_entries - 1,),
+                ).fetchone()
+                if horizon is not None:
+                    newest = [item for item in newest if item[1][1] > horizon[0]]
+                # 访问时间取创建时间，预热条目不会排在近期真正使用过的条目之前。
+                before = connection.total_changes
+                connection.executemany(
+                    "INSERT OR IGNORE INTO prompt_cache (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                    ((key, value, created_at, created_at) for key, (value, created_at) in newest[:self._disk_entries]),
+                )
+                written = connection.total_changes - before
+                self._evict_locked(connection, now)
+                connection.commit()
+            except sqlite3.Error as error:
+                connection.rollback()
+                print(f"⚠️ 批量写入提示词缓存失败: {error}")
+                return 0
+            self._stats["stores"] += written
+            return written
+
+    def _evict_locked(self, connection, now):
+        """删除过期条目，并按访问时间淘汰超出上限的磁盘条目。"""
+        connection.execute("DELETE FROM prompt_cache WHERE created_at < ?", (now - self._ttl,))
+        connection.execute(
+            "DELETE FROM prompt_cache WHERE key IN ("
+            "SELECT key FROM prompt_cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+            (self._disk_entries,),
+        )
+
+    def _remember_locked(self, key, value, created_at):
+        self._memory[key] = (value, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self._memory_entries:
+            self._memory.popitem(last=False)
+
+    def stats(self) -> Dict[str, Union[int, float]]:
+        """命中率等统计信息。"""
+        with self._lock:
+            hits = self._stats["memory_hits"] + self._stats["disk_hits"]
+            lookups = hits + self._stats["misses"]
+            disk_entries = 0
+            connection = self._get_connection()
+            if connection is not None:
+                try:
+                    disk_entries = connection.execute("SELECT COUNT(*) FROM prompt_cache").fetchone()[0]
+                except sqlite3.Error:
+                    pass
+            return {
+                **self._stats,
+                "hits": hits,
+                "lookups": lookups,
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+                "memory_entries": len(self._memory),
+                "disk_entries": disk_entries,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            connection = self._get_connection()
+            if connection is not None:
+                connection.execute("DELETE FROM prompt_cache")
+                connection.commit()
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
@@ -5,7 +5,23 @@
 
 import requests
 import json
+import time
+from pathlib import Path
+from circuit_breaker import CircuitBreaker
 from config_manager import config_manager
+from prompt_cache import PromptCache, make_cache_key, normalize_text
+
+
+MODEL_NAME = "deepseek-chat"
+SYSTEM_PROMPT = "你是一个专业的AI绘画提示词优化助手。你的任务是根据用户的描述,生成高质量的中文提示词。提示词应该简洁、准确、富有表现力。只返回优化后的提示词,不要包含任何解释或额外文字。"
+PROMPT_FIELD_NAMES = (
+    "art_style", "character", "pose", "background", "clothing", "lighting", "composition", "details",
+)
+PACKED_SYSTEM_PROMPT = SYSTEM_PROMPT + "用户会以 JSON 数组一次给出多条描述,每条包含 id 和 request。请逐条独立优化,只返回一个 JSON 数组,每个元素形如 {\"id\": 编号, \"prompt\": 优化后的提示词},不要包含任何其他文字。"
+PACKED_MAX_TOKENS = 8000
+
+class PromptOptimizationError(Exception):
+    """DeepSeek 请求失败或返回内容不可用。"""
 
 
 # 复用 HTTPS 连接，连续润色提示词时避免重复 TLS 握手。
@@ -13,6 +29,30 @@ http_session = requests.Session()
 http_adapter = requests.adapters.HTTPAdapter(pool_connections=2, pool_maxsize=4, max_retries=0)
 http_session.mount("https://", http_adapter)
 
+# 上游持续失败或变慢时熔断，所有调用路径直接使用本地组合，不再等待超时。
+deepseek_breaker = CircuitBreaker(
+    slow_call_seconds=config_manager.get("deepseek_slow_call_seconds", 10.0),
+    open_seconds=config_manager.get("deepseek_breaker_open_seconds", 30.0),
+)
+
+# 相同的提示词与字段组合会被反复提交，优化结果按规范化后的请求内容缓存。
+prompt_cache = PromptCache(
+    db_path=config_manager.get("prompt_cache_path", "cache/prompt_cache.sqlite3") or None,
+    memory_entries=config_manager.get("prompt_cache_memory_entries", 512),
+    disk_entries=config_manager.get("prompt_cache_disk_entries", 20000),
+    ttl_seconds=config_manager.get("prompt_cache_ttl_seconds", 7 * 24 * 3600),
+)
+
+
+def optimization_cache_key(prompt, art_style="", character="", pose="", background="", clothing="",
+                           lighting="", composition="", details=""):
+    """由 _build_optimization_prompt 的输入生成缓存键；空白和全半角差异不影响命中。"""
+    parts = [normalize_text(value) for value in (
+        prompt, art_style, character, pose, background, clothing, lighting, composition, details
+    )]
+    return make_cache_key(MODEL_NAME, SYSTEM_PROMPT, _build_optimization_prompt(*parts))
+
+
 def optimize_with_custom_input(
     prompt,
     art_style="",
@@ -41,72 +81,313 @@ def optimize_with_custom_input(
     Returns:
         优化后的提示词
     """
+    optimized_prompt, _source = optimize_prompt_detailed(
+        prompt, art_style, character, pose, background, clothing, lighting, composition, details
+    )
+    return optimized_prompt
+
+
+def optimize_prompt_detailed(prompt, art_style="", character="", pose="", background="", clothing="",
+                             lighting="", composition="", details=""):
+    """
+    与 optimize_with_custom_input 相同，但同时返回结果来源
+
+    Returns:
+        (优化后的提示词, 来源)，来源为 "api"、"cache" 或 "fallback"
+    """
+    def fallback():
+        return _simple_combine(
+            prompt, art_style, character, pose, background, clothing, lighting, composition, details
+        ), "fallback"
+
     # 获取API密钥
-    api_key = config_manager.get("deepseek_api_key", "")
-    api_url = config_manager.get("deepseek_base_url", "https://api.deepseek.com/v1/chat/completions")
+    api_key, api_url = get_api_settings()
 
     # 如果没有API密钥,返回简单的组合提示词
     if not api_key:
         print("⚠️ 未设置DeepSeek API密钥,使用简单组合方式")
-        return _simple_combine(prompt, art_style, character, pose, background, clothing, lighting, composition, details)
+        return fallback()
+
+    cache_key = optimization_cache_key(
+        prompt, art_style, character, pose, background, clothing, lighting, composition, details
+    )
+    cached_prompt = prompt_cache.get(cache_key)
+    if cached_prompt:
+        print("✅ 提示词优化命中缓存")
+        return cached_prompt, "cache"
 
     # 构建优化请求的提示词
     optimization_prompt = _build_optimization_prompt(
         prompt, art_style, character, pose, background, clothing, lighting, composition, details
     )
 
+    if not deepseek_breaker.allow_request():
+        print("⚠️ DeepSeek 服务暂不可用（熔断中）,使用简单组合方式")
+        return fallback()
+
+    start_time = time.monotonic()
     try:
-        # 调用 DeepSeek API
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {api_key}"
-        }
+        optimized_prompt = request_optimized_prompt(
+            optimization_prompt, api_key, api_url, timeout=get_request_timeout()
+        )
+    except PromptOptimizationError as e:
+        deepseek_breaker.record_failure(time.monotonic() - start_time)
+        print(f"⚠️ {e},使用简单组合方式")
+        return fallback()
+    except Exception as e:
+        deepseek_breaker.record_failure(time.monotonic() - start_time)
+        print(f"❌ 优化提示词时出错: {e}")
+        return fallback()
+    deepseek_breaker.record_success(time.monotonic() - start_time)
+
+    print(f"✅ 提示词优化成功")
+    prompt_cache.put(cache_key, optimized_prompt)
+    return optimized_prompt, "api"
+
+
+def get_api_settings():
+    """返回 (API 密钥, API 地址)。"""
+    api_key = config_manager.get("deepseek_api_key", "")
+    api_url = config_manager.get("deepseek_base_url", "https://api.deepseek.com/v1/chat/completions")
+    return api_key, api_url
+
+
+def get_request_timeout():
+    """(连接超时, 读取超时)；读取超时不超过单次请求的延迟预算。"""
+    budget = float(config_manager.get("deepseek_latency_budget", 30.0))
+    return min(5.0, budget), budget
+
+
+def request_optimized_prompt(optimization_prompt, api_key, api_url, session=None, timeout=(5, 30),
+                             system_prompt=SYSTEM_PROMPT, max_tokens=500):
+    """
+    调用一次 DeepSeek 对话补全接口
+
+    Args:
+        optimization_prompt: _build_optimization_prompt 生成的请求内容
+        api_key: API 密钥
+        api_url: API 地址
+        session: requests 会话，默认使用模块级连接池
+        timeout: (连接超时, 读取超时)
+        system_prompt: 系统提示词
+        max_tokens: 最大输出长度
+
+    Returns:
+        优化后的提示词
+
+    Raises:
+        PromptOptimizationError: 请求失败或响应内容不可用
+    """
+    # 调用 DeepSeek API
+    headers = {
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {api_key}"
+    }
+
+    payload = {
+        "model": MODEL_NAME,
+        "messages": [
+            {
+                "role": "system",
+                "content": system_prompt
+            },
+            {
+                "role": "user",
+                "content": optimization_prompt
+            }
+        ],
+        "temperature": 0.7,
+        "max_tokens": max_tokens
+    }
+
+    try:
+        response = (session or http_session).post(api_url, headers=headers, json=payload, timeout=timeout)
+    except requests.RequestException as error:
+        raise PromptOptimizationError(f"API请求出错: {error}") from error
+
+    if response.status_code != 200:
+        raise PromptOptimizationError(f"API请求失败: {response.status_code}")
+
+    try:
+        result = response.json()
+    except ValueError:
+        raise PromptOptimizationError("API响应格式异常") from None
 
-        payload = {
-            "model": "deepseek-chat",
-            "messages": [
-                {
-                    "role": "system",
-                    "content": "你是一个专业的AI绘画提示词优化助手。你的任务是根据用户的描述,生成高质量的中文提示词。提示词应该简洁、准确、富有表现力。只返回优化后的提示词,不要包含任何解释或额外文字。"
-                },
-                {
-                    "role": "user",
-                    "content": optimization_prompt
-                }
-            ],
-            "temperature": 0.7,
-            "max_tokens": 500
+    # 安全检查:确保响应结构正确
+    if not (
+        isinstance(result, dict)
+        and result.get("choices")
+        and isinstance(result["choices"][0], dict)
+        and isinstance(result["choices"][0].get("message"), dict)
+        and isinstance(result["choices"][0]["message"].get("content"), str)
+    ):
+        raise PromptOptimizationError("API响应格式异常")
+
+    optimized_prompt = result["choices"][0]["message"]["content"].strip()
+    if not optimized_prompt:  # 确保内容不为空
+        raise PromptOptimizationError("API返回空内容")
+    return optimized_prompt
+
+
+def build_packed_request(optimization_prompts):
+    """把多条 _build_optimization_prompt 结果打包成一条 JSON 数组请求，id 即在包内的序号。"""
+    return json.dumps(
+        [{"id": index, "request": text} for index, text in enumerate(optimization_prompts)],
+        ensure_ascii=False,
+    )
+
+
+def parse_packed_response(text, count):
+    """
+    解析打包请求的返回内容
+
+    Returns:
+        长度为 count 的列表，格式不正确、缺失或为空的条目为 None
+    """
+    results = [None] * count
+    start, end = text.find("["), text.rfind("]")
+    if start < 0 or end <= start:
+        return results
+    try:
+        entries = json.loads(text[start:end + 1])
+    except ValueError:
+        return results
+    if not isinstance(entries, list):
+        return results
+
+    for entry in entries:
+        if not isinstance(entry, dict):
+            continue
+        index, optimized_prompt = entry.get("id"), entry.get("prompt")
+        if (
+            isinstance(index, int) and not isinstance(index, bool) and 0 <= index < count
+            and results[index] is None
+            and isinstance(optimized_prompt, str) and optimized_prompt.strip()
+        ):
+            results[index] = optimized_prompt.strip()
+    return results
+
+
+def request_packed_prompts(optimization_prompts, api_key, api_url, session=None, timeout=(5, 30)):
+    """
+    在一次对话补全中优化多条提示词
+
+    Returns:
+        与输入顺序一致的列表，无法解析的条目为 None，由调用方单独重试或降级
+
+    Raises:
+        PromptOptimizationError: 请求失败
+    """
+    content = request_optimized_prompt(
+        build_packed_request(optimization_prompts), api_key, api_url, session=session, timeout=timeout,
+        system_prompt=PACKED_SYSTEM_PROMPT, max_tokens=min(PACKED_MAX_TOKENS, 500 * len(optimization_prompts)),
+    )
+    return parse_packed_response(content, len(optimization_prompts))
+
+
+def stream_optimized_prompt(prompt, art_style="", character="", pose="", background="", clothing="",
+                            lighting="", composition="", details=""):
+    """
+    以流式方式优化提示词，边接收 DeepSeek 输出边产出增量
+
+    最终文本与非流式路径一样经过非空校验并写入缓存；失败时以本地组合结果结束。
+
+    Yields:
+        {"type": "delta", "text": 增量文本}，最后一项为
+        {"type": "done", "optimized_prompt": 最终提示词, "source": "api"/"cache"/"fallback"}
+    """
+    def fallback():
+        return {
+            "type": "done",
+            "optimized_prompt": _simple_combine(
+                prompt, art_style, character, pose, background, clothing, lighting, composition, details
+            ),
+            "source": "fallback",
         }
 
-        response = http_session.post(api_url, headers=headers, json=payload, timeout=(5, 30))
-
-        if response.status_code == 200:
-            result = response.json()
-            # 安全检查:确保响应结构正确
-            if (
-                result
-                and "choices" in result
-                and len(result["choices"]) > 0
-                and "message" in result["choices"][0]
-                and "content" in result["choices"][0]["message"]
-            ):
-                optimized_prompt = result["choices"][0]["message"]["content"].strip()
-                if optimized_prompt:  # 确保内容不为空
-                    print(f"✅ 提示词优化成功")
-                    return optimized_prompt
-                else:
-                    print(f"⚠️ API返回空内容,使用简单组合方式")
-                    return _simple_combine(prompt, art_style, character, pose, background, clothing, lighting, composition, details)
-            else:
-                print(f"⚠️ API响应格式异常,使用简单组合方式")
-                return _simple_combine(prompt, art_style, character, pose, background, clothing, lighting, composition, details)
-        else:
-            print(f"⚠️ API请求失败: {response.status_code}")
-            return _simple_combine(prompt, art_style, character, pose, background, clothing, lighting, composition, details)
+    api_key, api_url = get_api_settings()
+    if not api_key:
+        print("⚠️ 未设置DeepSeek API密钥,使用简单组合方式")
+        yield fallback()
+        return
+
+    cache_key = optimization_cache_key(
+        prompt, art_style, character, pose, background, clothing, lighting, composition, details
+    )
+    cached_prompt = prompt_cache.get(cache_key)
+    if cached_prompt:
+        yield {"type": "done", "optimized_prompt": cached_prompt, "source": "cache"}
+        return
+
+    if not deepseek_breaker.allow_request():
+        print("⚠️ DeepSeek 服务暂不可用（熔断中）,使用简单组合方式")
+        yield fallback()
+        return
+
+    optimization_prompt = _build_optimization_prompt(
+        prompt, art_style, character, pose, background, clothing, lighting, composition, details
+    )
+    payload = {
+        "model": MODEL_NAME,
+        "messages": [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": optimization_prompt},
+        ],
+        "temperature": 0.7,
+        "max_tokens": 500,
+        "stream": True,
+    }
+    headers = {
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {api_key}",
+        "Accept": "text/event-stream",
+    }
 
+    connect_timeout, budget = get_request_timeout()
+    start_time = time.monotonic()
+    chunks = []
+    try:
+        with http_session.post(api_url, headers=headers, json=payload, stream=True,
+                               timeout=(connect_timeout, budget)) as response:
+            if response.status_code != 200:
+                raise PromptOptimizationError(f"API请求失败: {response.status_code}")
+            response.encoding = "utf-8"
+            for line in response.iter_lines(decode_unicode=True):
+                if time.monotonic() - start_time > budget:
+                    raise PromptOptimizationError("超出延迟预算")
+                if not line or not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                try:
+                    delta = json.loads(data)["choices"][0].get("delta", {}).get("content") or ""
+                except (ValueError, KeyError, IndexError, TypeError, AttributeError):
+                    raise PromptOptimizationError("API响应格式异常") from None
+                if delta:
+                    chunks.append(delta)
+                    yield {"type": "delta", "text": delta}
+    except GeneratorExit:
+        # 浏览器中途断开时没有看到上游完成输出：成功与失败都不记录，只归还半开探测名额，也不写缓存。
+        deepseek_breaker.release_probe()
+        raise
     except Exception as e:
-        print(f"❌ 优化提示词时出错: {e}")
-        return _simple_combine(prompt, art_style, character, pose, background, clothing, lighting, composition, details)
+        deepseek_breaker.record_failure(time.monotonic() - start_time)
+        print(f"⚠️ 流式优化失败,使用简单组合方式: {e}")
+        yield fallback()
+        return
+
+    optimized_prompt = "".join(chunks).strip()
+    if not optimized_prompt:
+        deepseek_breaker.record_failure(time.monotonic() - start_time)
+        print("⚠️ API返回空内容,使用简单组合方式")
+        yield fallback()
+        return
+
+    deepseek_breaker.record_success(time.monotonic() - start_time)
+    print("✅ 提示词流式优化成功")
+    prompt_cache.put(cache_key, optimized_prompt)
+    yield {"type": "done", "optimized_prompt": optimized_prompt, "source": "api"}
 
 
 def _build_optimization_prompt(prompt, art_style, character, pose, background, clothing, lighting, composition, details):
@@ -170,6 +451,36 @@ def _simple_combine(prompt, art_style, character, pose, background, clothing, li
     return combined
 
 
+def prewarm_cache_from_gallery(gallery_dir):
+    """
+    用画廊中已记录的优化输入和结果预热缓存
+
+    Args:
+        gallery_dir: 画廊目录
+
+    Returns:
+        写入缓存的条目数（已过期或磁盘中已有的条目不计）
+    """
+    from gallery_layout import iter_item_folders
+    from gallery_metadata import created_timestamp, load_metadata_bulk
+
+    folders = [Path(entry.path) for entry in iter_item_folders(gallery_dir)]
+    entries = []
+    for metadata in load_metadata_bulk(folders):
+        record = (metadata or {}).get("optimization")
+        if not isinstance(record, dict) or record.get("source") not in {"api", "cache"}:
+            continue
+        inputs = record.get("inputs") or {}
+        result = record.get("result")
+        if not isinstance(inputs, dict) or not isinstance(result, str) or not result.strip():
+            continue
+        fields = {name: str(inputs.get(name, "")) for name in PROMPT_FIELD_NAMES}
+        cache_key = optimization_cache_key(str(inputs.get("prompt", "")), **fields)
+        entries.append((cache_key, result.strip(), created_timestamp(metadata)))
+    # 一次事务批量写入磁盘层，内存层保留正在使用的条目。
+    return prompt_cache.put_many(entries)
+
+
 def optimize_prompt_simple(prompt, art_style=""):
     """
     简化的提示词优化方法
@@ -0,0 +1,648 @@
+// 画廊页面脚本：窗口化无限滚动、详情弹窗与批量管理
+
+const GALLERY_OPTIONS = {
+    renderMargin: '1600px 0px',   // 距视口这个范围内的分块保留卡片，其余只留占位高度
+    loadMargin: '1200px 0px',     // 底部进入这个范围时加载下一块
+    maxCachedChunks: 40,          // 内存中保留的分块数据上限，超出后重新进入视口时再请求
+    maxDecodedImages: 96          // 空闲时预先解码的缩略图上限
+};
+
+// 按最近使用淘汰的有界缓存；onEvict 在条目被淘汰时调用
+class LruCache {
+    constructor(limit, onEvict = null) {
+        this.limit = limit;
+        this.onEvict = onEvict;
+        this.entries = new Map();
+    }
+
+    get(key) {
+        if (!this.entries.has(key)) return undefined;
+        const value = this.entries.get(key);
+        this.entries.delete(key);
+        this.entries.set(key, value);
+        return value;
+    }
+
+    has(key) {
+        return this.entries.has(key);
+    }
+
+    set(key, value) {
+        this.entries.delete(key);
+        this.entries.set(key, value);
+        while (this.entries.size > this.limit) {
+            const [oldest, evicted] = this.entries.entries().next().value;
+            this.entries.delete(oldest);
+            if (this.onEvict) this.onEvict(evicted);
+        }
+    }
+
+    values() {
+        return this.entries.values();
+    }
+}
+
+const whenIdle = window.requestIdleCallback
+    ? task => window.requestIdleCallback(task, { timeout: 2000 })
+    : task => setTimeout(task, 200);
+
+// 与服务端模板一致：每 7 张中第 1、5 张占半行
+const cardSizes = offset => `(max-width: 540px) 100vw, (max-width: 1080px) 50vw, ${offset % 7 === 0 || offset % 7 === 4 ? '50vw' : '33vw'}`;
+
+// 合并包只有一种尺寸，按大多数卡片的显示宽度选择（宽屏上占半行的卡片会略微放大）
+const bundleWidth = () => Math.round(
+    window.innerWidth * (window.innerWidth <= 540 ? 1 : window.innerWidth <= 1080 ? 0.5 : 1 / 3) * (window.devicePixelRatio || 1)
+);
+
+// BlurHash 占位图解码为小图地址，作为卡片背景放大显示（模糊由浏览器缩放完成）；同一哈希只解码一次
+const BLURHASH_CHARS = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz#$%*+,-.:;=?@[]^_{|}~';
+const placeholderUrls = new LruCache(GALLERY_OPTIONS.maxDecodedImages * 2);
+
+const decode83 = text => [...text].reduce((value, char) => value * 83 + BLURHASH_CHARS.indexOf(char), 0);
+const srgbToLinear = value => {
+    const v = value / 255;
+    return v <= 0.04045 ? v / 12.92 : Math.pow((v + 0.055) / 1.055, 2.4);
+};
+const linearToSrgb = value => {
+    const v = Math.max(0, Math.min(1, value));
+    return Math.floor((v <= 0.0031308 ? v * 12.92 : 1.055 * Math.pow(v, 1 / 2.4) - 0.055) * 255 + 0.5);
+};
+
+// 与 gallery_placeholders.decode_blurhash 一致，返回 RGBA 像素
+function decodeBlurhash(hash, width, height) {
+    const sizeFlag = decode83(hash[0]);
+    const componentsX = sizeFlag % 9 + 1;
+    const componentsY = Math.floor(sizeFlag / 9) + 1;
+    if (hash.length !== 4 + 2 * componentsX * componentsY) throw new Error('BlurHash 长度与分量数不符');
+    const maxValue = (decode83(hash[1]) + 1) / 166;
+    const dc = decode83(hash.slice(2, 6));
+    const colors = [[dc >> 16, (dc >> 8) & 255, dc & 255].map(srgbToLinear)];
+    for (let start = 6; start < hash.length; start += 2) {
+        const value = decode83(hash.slice(start, start + 2));
+        colors.push([Math.floor(value / 361), Math.floor(value / 19) % 19, value % 19].map(quantised => {
+            const normalised = (quantised - 9) / 9;
+            return Math.sign(normalised) * normalised * normalised * maxValue;
+        }));
+    }
+    const pixels = new Uint8ClampedArray(width * height * 4);
+    for (let y = 0; y < height; y++) {
+        for (let x = 0; x < width; x++) {
+            const sum = [0, 0, 0];
+            for (let j = 0; j < componentsY; j++) {
+                for (let i = 0; i < componentsX; i++) {
+                    const basis = Math.cos(Math.PI * x * i / width) * Math.cos(Math.PI * y * j / height);
+                    const color = colors[i + j * componentsX];
+                    for (let channel = 0; channel < 3; channel++) sum[channel] += color[channel] * basis;
+                }
+            }
+            const offset = (y * width + x) * 4;
+            sum.forEach((value, channel) => { pixels[offset + channel] = linearToSrgb(value); });
+            pixels[offset + 3] = 255;
+        }
+    }
+    return pixels;
+}
+
+// 按分量数保持大致的宽高比，背景以 cover 方式铺满，与缩略图的裁切一致
+function placeholderUrl(hash) {
+    if (placeholderUrls.has(hash)) return placeholderUrls.get(hash);
+    let url = '';
+    try {
+        const sizeFlag = decode83(hash[0]);
+        const width = (sizeFlag % 9 + 1) * 8;
+        const height = (Math.floor(sizeFlag / 9) + 1) * 8;
+        const canvas = document.createElement('canvas');
+        canvas.width = width;
+        canvas.height = height;
+        canvas.getContext('2d').putImageData(new ImageData(decodeBlurhash(hash, width, height), width, height), 0, 0);
+        url = canvas.toDataURL();
+    } catch (error) {
+        // 无法解码时只显示主色
+    }
+    placeholderUrls.set(hash, url);
+    return url;
+}
+
+function applyPlaceholder(wrapper, placeholder) {
+    const url = placeholder?.blurhash ? placeholderUrl(placeholder.blurhash) : '';
+    wrapper.style.backgroundColor = placeholder?.color || '';
+    wrapper.style.backgroundImage = url ? `url("${url}")` : '';
+}
+
+class GalleryFeed {
+    constructor(root) {
+        this.root = root;
+        this.template = document.getElementById('galleryCardTemplate');
+        this.status = document.getElementById('galleryFeedStatus');
+        this.pageSize = Number(root.dataset.pageSize) || 24;
+        this.total = Number(root.dataset.total) || 0;
+        this.query = new URLSearchParams(location.search);
+        ['after', 'before'].forEach(key => this.query.delete(key));
+
+        this.chunks = [];
+        this.cache = new LruCache(GALLERY_OPTIONS.maxCachedChunks);
+        this.images = new LruCache(GALLERY_OPTIONS.maxDecodedImages);
+        // 合并包切分出的 Blob 地址，随分块数据一起淘汰并释放
+        this.bundles = new LruCache(GALLERY_OPTIONS.maxCachedChunks, urls => urls.forEach(url => URL.revokeObjectURL(url)));
+        this.bundleRequests = new Map();
+        this.failedBundles = new Set();
+        this.bundleWidth = bundleWidth();
+        this.requests = new Map();
+        this.deleted = new Set();
+        this.selected = new Set();
+        this.batchMode = false;
+        this.loading = false;
+        this.sentinelVisible = false;
+
+        this.chunkObserver = new IntersectionObserver(entries => this.onChunkVisibility(entries), {
+            rootMargin: GALLERY_OPTIONS.renderMargin
+        });
+        this.sentinelObserver = new IntersectionObserver(entries => {
+            this.sentinelVisible = entries.at(-1).isIntersecting;
+            if (this.sentinelVisible) this.loadNext();
+        }, { rootMargin: GALLERY_OPTIONS.loadMargin });
+
+        this.adoptFirstChunk();
+        this.sentinelObserver.observe(this.status);
+        this.prefetchNext();
+    }
+
+    // 首屏由服务端渲染，直接接管为第一块，不重复请求
+    adoptFirstChunk() {
+        const element = this.root.querySelector('.gallery-chunk');
+        const items = JSON.parse(document.getElementById('galleryInitialItems').textContent);
+        const chunk = {
+            id: 0,
+            cursor: this.root.dataset.cursor || null,
+            next: this.root.dataset.nextCursor || null,
+            start: Number(this.root.dataset.start) || 0,
+            count: items.length,
+            element,
+            rendered: true,
+            visible: true
+        };
+        element.dataset.chunk = '0';
+        this.chunks.push(chunk);
+        this.cache.set(chunk.id, items);
+        element.querySelectorAll('.gallery-card').forEach(card => {
+            const item = items.find(entry => entry.folder === card.dataset.folder);
+            if (item) applyPlaceholder(card.querySelector('.gallery-image-wrapper'), item.placeholder);
+        });
+        this.applyBundle(chunk, items);
+        this.chunkObserver.observe(element);
+        this.updateStatus();
+    }
+
+    get lastChunk() {
+        return this.chunks.at(-1);
+    }
+
+    // 同一游标同时只发一个请求；浏览器按 ETag 重新验证，画廊未变化时服务器只返回 304
+    request(cursor) {
+        const key = cursor || '';
+        if (!this.requests.has(key)) {
+            const params = new URLSearchParams(this.query);
+            params.set('limit', this.pageSize);
+            params.set('bundle', this.bundleWidth);
+            if (cursor) params.set('after', cursor);
+            const pending = fetch(`/api/gallery?${params}`)
+                .then(async response => {
+                    const data = await response.json();
+                    if (!response.ok || !data.success) throw new Error(data.message || '加载作品失败');
+                    return data;
+                })
+                .finally(() => this.requests.delete(key));
+            this.requests.set(key, pending);
+        }
+        return this.requests.get(key);
+    }
+
+    async loadNext() {
+        const last = this.lastChunk;
+        if (this.loading || !last.next) return;
+        this.loading = true;
+        this.updateStatus();
+        try {
+            const cursor = last.next;
+            const data = this.prefetched?.cursor === cursor ? this.prefetched.data : await this.request(cursor);
+            this.prefetched = null;
+            this.appendChunk(cursor, data);
+        } catch (error) {
+            this.loading = false;
+            this.updateStatus(error.message);
+            return;
+        }
+        this.loading = false;
+        this.updateStatus();
+        this.prefetchNext();
+        // 一块不足以填满视口时继续加载
+        if (this.sentinelVisible) requestAnimationFrame(() => this.loadNext());
+    }
+
+    // 空闲时预取下一块的数据并解码其缩略图，滚动到底部时可直接渲染
+    prefetchNext() {
+        const cursor = this.lastChunk.next;
+        if (!cursor || this.prefetched?.cursor === cursor) return;
+        whenIdle(async () => {
+            if (this.lastChunk.next !== cursor || this.prefetched?.cursor === cursor) return;
+            try {
+                const data = await this.request(cursor);
+                if (this.lastChunk.next !== cursor) return;
+                this.prefetched = { cursor, data };
+                whenIdle(() => this.decodeThumbnails(data.items));
+            } catch (error) {
+                // 预取失败不提示，正式加载时会重试
+            }
+        });
+    }
+
+    async decodeThumbnails(items) {
+        const bundled = items.filter(item => item.bundle);
+        if (bundled.length) await this.loadBundle(bundled[0].bundle.url, bundled).catch(() => {});
+        items.forEach((item, offset) => {
+            if (this.images.has(item.folder)) return;
+            const image = new Image();
+            image.decoding = 'async';
+            this.showThumbnail(image, item, offset);
+            image.decode().catch(() => {});
+            this.images.set(item.folder, image);
+        });
+    }
+
+    // 一次请求取回整页缩略图，按字节范围切成 Blob 地址；同一合并包同时只请求一次
+    loadBundle(url, items) {
+        if (this.bundles.has(url)) return Promise.resolve(this.bundles.get(url));
+        if (!this.bundleRequests.has(url)) {
+            const pending = fetch(url)
+                .then(response => {
+                    if (!response.ok) throw new Error(`合并包加载失败: ${response.status}`);
+                    return response.arrayBuffer();
+                })
+                .then(buffer => {
+                    const urls = new Map();
+                    items.forEach(item => {
+                        const bytes = new Uint8Array(buffer, item.bundle.offset, item.bundle.length);
+                        urls.set(item.folder, URL.createObjectURL(new Blob([bytes], { type: 'image/webp' })));
+                    });
+                    this.bundles.set(url, urls);
+                    return urls;
+                })
+                .catch(error => {
+                    this.failedBundles.add(url);
+                    throw error;
+                })
+                .finally(() => this.bundleRequests.delete(url));
+            this.bundleRequests.set(url, pending);
+        }
+        return this.bundleRequests.get(url);
+    }
+
+    // 合并包已加载时使用其中的图片；加载中先留空，失败或没有合并包时逐张加载
+    showThumbnail(image, item, offset) {
+        const url = item.bundle && this.bundles.get(item.bundle.url)?.get(item.folder);
+        if (url) {
+            image.removeAttribute('srcset');
+            image.src = url;
+            return;
+        }
+        if (item.bundle && !this.failedBundles.has(item.bundle.url)) {
+            image.removeAttribute('src');
+            return;
+        }
+        image.sizes = cardSizes(offset);
+        if (item.srcset) image.srcset = item.srcset;
+        image.src = item.thumbnail;
+    }
+
+    applyBundle(chunk, items) {
+        const bundled = items.filter(item => item.bundle);
+        const url = bundled[0]?.bundle.url;
+        if (!url || this.bundles.has(url) || this.failedBundles.has(url)) return;
+        this.loadBundle(url, bundled).catch(() => {}).then(() => {
+            if (!chunk.rendered) return;
+            chunk.element.querySelectorAll('.gallery-card').forEach((card, offset) => {
+                const item = bundled.find(entry => entry.folder === card.dataset.folder);
+                if (item) this.showThumbnail(card.querySelector('img'), item, offset);
+            });
+        });
+    }
+
+    appendChunk(cursor, data) {
+        const last = this.lastChunk;
+        const element = document.createElement('section');
+        element.className = 'gallery-grid gallery-chunk';
+        element.setAttribute('aria-label', '生成作品');
+        const chunk = {
+            id: this.chunks.length,
+            cursor,
+            next: data.next_cursor,
+            start: last.start + last.count,
+            count: data.items.length,
+            element,
+            rendered: false,
+            visible: true
+        };
+        element.dataset.chunk = String(chunk.id);
+        this.total = data.total;
+        this.chunks.push(chunk);
+        this.cache.set(chunk.id, data.items);
+        this.renderChunk(chunk, data.items);
+        this.root.append(element);
+        this.chunkObserver.observe(element);
+    }
+
+    renderChunk(chunk, items, restored = false) {
+        const fragment = document.createDocumentFragment();
+        items.filter(item => !this.deleted.has(item.folder))
+            .forEach((item, offset) => fragment.append(this.createCard(item, chunk, offset)));
+        chunk.element.replaceChildren(fragment);
+        chunk.element.style.height = '';
+        chunk.element.classList.toggle('is-restored', restored);
+        chunk.rendered = true;
+        this.applyBundle(chunk, items);
+    }
+
+    createCard(item, chunk, offset) {
+        const card = this.template.content.firstElementChild.cloneNode(true);
+        card.dataset.folder = item.folder;
+        card.classList.toggle('selected', this.selected.has(item.folder));
+
+        const checkboxLabel = card.querySelector('.batch-select-checkbox');
+        checkboxLabel.classList.toggle('d-none', !this.batchMode);
+        checkboxLabel.title = `选择 ${item.name}`;
+        const checkbox = card.querySelector('.image-checkbox');
+        checkbox.dataset.folder = item.folder;
+        checkbox.checked = this.selected.has(item.folder);
+        checkbox.setAttribute('aria-label', `选择 ${item.name}`);
+
+        applyPlaceholder(card.querySelector('.gallery-image-wrapper'), item.placeholder);
+        const image = card.querySelector('img');
+        image.alt = item.name;
+        this.showThumbnail(image, item, offset);
+
+        const download = card.querySelector('.download-image');
+        download.href = item.download || item.path;
+        download.title = `下载 ${item.name}`;
+        card.querySelector('.delete-image').title = `删除 ${item.name}`;
+
+        const name = card.querySelector('.gallery-card-meta strong');
+        name.textContent = item.name;
+        name.title = item.name;
+        card.querySelector('.gallery-card-meta span').textContent = `#${String(chunk.start + offset + 1).padStart(2, '0')}`;
+        return card;
+    }
+
+    onChunkVisibility(entries) {
+        entries.forEach(entry => {
+            const chunk = this.chunks[Number(entry.target.dataset.chunk)];
+            chunk.visible = entry.isIntersecting;
+            if (entry.isIntersecting) {
+                this.restoreChunk(chunk);
+            } else {
+                this.parkChunk(chunk);
+            }
+        });
+    }
+
+    // 远离视口的分块只保留高度占位，DOM 中的卡片与图片数量保持有界
+    parkChunk(chunk) {
+        if (!chunk.rendered) return;
+        chunk.element.style.height = `${chunk.element.offsetHeight}px`;
+        chunk.element.replaceChildren();
+        chunk.rendered = false;
+    }
+
+    async restoreChunk(chunk) {
+        if (chunk.rendered) return;
+        let items = this.cache.get(chunk.id);
+        if (!items) {
+            try {
+                items = (await this.request(chunk.cursor)).items;
+            } catch (error) {
+                return;
+            }
+            this.cache.set(chunk.id, items);
+        }
+        if (chunk.visible && !chunk.rendered) this.renderChunk(chunk, items, true);
+    }
+
+    updateStatus(error) {
+        if (!this.status) return;
+        if (error) {
+            const retry = document.createElement('button');
+            retry.className = 'btn btn-outline btn-sm';
+            retry.type = 'button';
+            retry.textContent = '重试';
+            retry.addEventListener('click', () => this.loadNext());
+            const message = document.createElement('span');
+            message.textContent = error;
+            this.status.replaceChildren(message, retry);
+        } else if (this.loading) {
+            this.status.textContent = '正在加载更多作品…';
+        } else if (this.lastChunk.next) {
+            this.status.textContent = '';
+        } else {
+            this.status.textContent = `已显示全部 ${this.total} 幅作品`;
+        }
+    }
+
+    // ---------- 作品操作 ----------
+
+    itemFor(card) {
+        const chunk = this.chunks[Number(card.closest('.gallery-chunk').dataset.chunk)];
+        return (this.cache.get(chunk.id) || []).find(item => item.folder === card.dataset.folder);
+    }
+
+    loadedFolders() {
+        const folders = [];
+        for (const items of this.cache.values()) {
+            items.forEach(item => { if (!this.deleted.has(item.folder)) folders.push(item.folder); });
+        }
+        return folders;
+    }
+
+    cards() {
+        return this.root.querySelectorAll('.gallery-card');
+    }
+
+    removeCard(folder) {
+        this.deleted.add(folder);
+        this.selected.delete(folder);
+        this.total = Math.max(0, this.total - 1);
+        const card = [...this.cards()].find(item => item.dataset.folder === folder);
+        if (!card) return;
+        card.style.opacity = '0';
+        card.style.transform = 'scale(.96)';
+        setTimeout(() => card.remove(), 280);
+    }
+}
+
+(function () {
+    const root = document.getElementById('galleryFeed');
+    const modal = document.getElementById('imageModal');
+    const modalImage = document.getElementById('modalImage');
+    const modalName = document.getElementById('modalImageName');
+    const modalInfo = document.getElementById('modalImageInfo');
+    const modalDownload = document.getElementById('modalDownloadBtn');
+    let currentFolder = null;
+
+    document.getElementById('refreshGallery')?.addEventListener('click', () => location.reload());
+    if (!root) return;
+
+    // 通过“上一页”链接进入的页面保留服务端分页
+    const virtual = !new URLSearchParams(location.search).has('before') && 'IntersectionObserver' in window;
+    const feed = virtual ? new GalleryFeed(root) : null;
+    if (virtual) document.querySelector('.gallery-pagination')?.classList.add('d-none');
+    const initialItems = JSON.parse(document.getElementById('galleryInitialItems').textContent);
+    const selected = feed ? feed.selected : new Set();
+    const cards = () => root.querySelectorAll('.gallery-card');
+    const itemFor = card => feed ? feed.itemFor(card) : initialItems.find(item => item.folder === card.dataset.folder);
+
+    const syncSelection = () => {
+        const count = document.getElementById('selectedCount');
+        if (count) count.textContent = selected.size;
+        cards().forEach(card => {
+            const isSelected = selected.has(card.dataset.folder);
+            card.classList.toggle('selected', isSelected);
+            card.querySelector('.image-checkbox').checked = isSelected;
+        });
+    };
+
+    const setBatchMode = enabled => {
+        if (feed) feed.batchMode = enabled;
+        document.getElementById('batchActions')?.classList.toggle('d-none', !enabled);
+        document.getElementById('batchActions')?.classList.toggle('d-flex', enabled);
+        document.getElementById('normalActions')?.classList.toggle('d-none', enabled);
+        root.querySelectorAll('.batch-select-checkbox').forEach(item => item.classList.toggle('d-none', !enabled));
+        if (!enabled) {
+            selected.clear();
+            syncSelection();
+        }
+    };
+
+    async function deleteFolder(folder) {
+        const response = await fetch('/api/gallery/delete', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ folder_name: folder })
+        });
+        const result = await response.json();
+        if (!response.ok || !result.success) throw new Error(result.message || '删除失败');
+        return result;
+    }
+
+    function removeCard(folder) {
+        if (feed) return feed.removeCard(folder);
+        const card = [...cards()].find(item => item.dataset.folder === folder);
+        if (!card) return;
+        card.style.opacity = '0';
+        card.style.transform = 'scale(.96)';
+        setTimeout(() => card.remove(), 280);
+    }
+
+    function closeModal() {
+        modal?.classList.remove('show');
+        setTimeout(() => { if (modal) modal.style.display = 'none'; }, 250);
+        currentFolder = null;
+    }
+
+    function showDetails(data) {
+        currentFolder = data.folder;
+        // 详情大图使用最大尺寸的 WebP 缩略图，下载仍提供原图。
+        modalImage.src = data.preview || data.path;
+        modalName.textContent = data.name;
+        modalDownload.href = data.download || data.path;
+        modalDownload.download = data.name;
+
+        if (data.info && Object.keys(data.info).length) {
+            const grid = document.createElement('div');
+            grid.className = 'info-grid';
+            Object.entries(data.info).forEach(([key, value]) => {
+                const item = document.createElement('div');
+                item.className = 'info-item';
+                const label = document.createElement('span');
+                label.className = 'info-label';
+                label.textContent = key.toUpperCase();
+                const content = document.createElement('span');
+                content.className = 'info-value';
+                content.textContent = value;
+                item.append(label, content);
+                grid.append(item);
+            });
+            modalInfo.replaceChildren(grid);
+        } else {
+            const empty = document.createElement('p');
+            empty.className = 'info-value';
+            empty.textContent = '暂无作品参数。';
+            modalInfo.replaceChildren(empty);
+        }
+
+        modal.style.display = 'flex';
+        requestAnimationFrame(() => modal.classList.add('show'));
+        document.getElementById('modalCloseBtn').focus();
+    }
+
+    document.getElementById('enableBatchMode')?.addEventListener('click', () => setBatchMode(true));
+    document.getElementById('batchCancel')?.addEventListener('click', () => setBatchMode(false));
+
+    // 卡片随滚动创建与回收，事件统一委托到容器上
+    root.addEventListener('change', event => {
+        const box = event.target.closest('.image-checkbox');
+        if (!box) return;
+        box.checked ? selected.add(box.dataset.folder) : selected.delete(box.dataset.folder);
+        syncSelection();
+    });
+
+    root.addEventListener('click', async event => {
+        const card = event.target.closest('.gallery-card');
+        if (!card) return;
+        if (event.target.closest('.view-details')) {
+            const data = itemFor(card);
+            if (data) showDetails(data);
+        } else if (event.target.closest('.delete-image')) {
+            if (!confirm('确定永久删除这幅作品吗？')) return;
+            try {
+                await deleteFolder(card.dataset.folder);
+                removeCard(card.dataset.folder);
+                showNotification('作品已删除', 'success');
+            } catch (error) {
+                showNotification(error.message, 'error');
+            }
+        }
+    });
+
+    // 全选作用于已加载的作品
+    document.getElementById('batchSelectAll')?.addEventListener('click', () => {
+        const folders = feed ? feed.loadedFolders() : [...cards()].map(card => card.dataset.folder);
+        const selectAll = folders.some(folder => !selected.has(folder));
+        folders.forEach(folder => (selectAll ? selected.add(folder) : selected.delete(folder)));
+        syncSelection();
+    });
+
+    document.getElementById('batchDelete')?.addEventListener('click', async () => {
+        if (!selected.size) return showNotification('请先选择要删除的作品', 'warning');
+        if (!confirm(`确定永久删除选中的 ${selected.size} 幅作品吗？`)) return;
+        const folders = [...selected];
+        const results = await Promise.allSettled(folders.map(deleteFolder));
+        const removed = results.filter(result => result.status === 'fulfilled').length;
+        showNotification(`已删除 ${removed} / ${folders.length} 幅作品`, removed === folders.length ? 'success' : 'warning');
+        setTimeout(() => location.reload(), 650);
+    });
+
+    document.getElementById('modalDeleteBtn')?.addEventListener('click', async () => {
+        if (!currentFolder || !confirm('确定永久删除这幅作品吗？')) return;
+        try {
+            const folder = currentFolder;
+            await deleteFolder(folder);
+            closeModal();
+            removeCard(folder);
+            showNotification('作品已删除', 'success');
+        } catch (error) {
+            showNotification(error.message, 'error');
+        }
+    });
+
+    document.getElementById('modalCloseBtn')?.addEventListener('click', closeModal);
+    modal?.addEventListener('click', event => { if (event.target === modal) closeModal(); });
+    document.addEventListener('keydown', event => { if (event.key === 'Escape' && modal?.classList.contains('show')) closeModal(); });
+})();
@@ -230,6 +230,12 @@ class ZImageApp {
             Object.entries(formDefaults).forEach(([id, value]) => {
                 document.getElementById(id).value = value;
             });
+
+            const encodingSelect = document.getElementById('outputEncoding');
+            if (encodingSelect && Array.isArray(config.encodings)) {
+                encodingSelect.replaceChildren(...config.encodings.map(({ name, label }) => new Option(label, name)));
+                encodingSelect.value = config.output_encoding || 'auto';
+            }
         } catch (error) {
             console.error('加载配置失败:', error);
         }
@@ -352,12 +358,13 @@ class ZImageApp {
         // 收集优化配置
         const params = this.collectOptimizationParams(prompt);
 
+        DOM.optimizePromptBtn.disabled = true;
         try {
-            const data = await this.apiRequest('/api/optimize-prompt', params);
+            const optimizedPrompt = await this.streamOptimizedPrompt(params);
 
-            if (data.success) {
-                this.optimizedPrompt = data.optimized_prompt;
-                this.showEditablePromptPreview(data.optimized_prompt);
+            if (optimizedPrompt) {
+                this.optimizedPrompt = optimizedPrompt;
+                this.showEditablePromptPreview(optimizedPrompt);
                 this.showNotification('✅ 提示词优化成功', 'success');
             } else {
                 this.showNotification('❌ 优化失败', 'error');
@@ -365,7 +372,52 @@ class ZImageApp {
         } catch (error) {
             console.error('优化提示词失败:', error);
             this.showNotification('❌ 网络错误', 'error');
+        } finally {
+            DOM.optimizePromptBtn.disabled = false;
+        }
+    }
+
+    // 流式接收优化结果，逐段渲染到可编辑预览框；浏览器不支持流式读取时退回普通接口
+    async streamOptimizedPrompt(params) {
+        const response = await fetch('/api/optimize-prompt/stream', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify(params)
+        });
+
+        if (!response.ok || !response.body) {
+            const data = await this.apiRequest('/api/optimize-prompt', params);
+            return data.success ? data.optimized_prompt : null;
+        }
+
+        this.showEditablePromptPreview('');
+        const editablePrompt = document.getElementById('editablePrompt');
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let finalPrompt = null;
+
+        const handleLine = line => {
+            if (!line.trim()) return;
+            const event = JSON.parse(line);
+            if (event.type === 'delta') {
+                editablePrompt.value += event.text;
+                editablePrompt.scrollTop = editablePrompt.scrollHeight;
+            } else if (event.type === 'done') {
+                finalPrompt = event.optimized_prompt;
+            }
+        };
+
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+            const lines = buffer.split('\n');
+            buffer = lines.pop();
+            lines.forEach(handleLine);
         }
+        handleLine(buffer + decoder.decode());
+        return finalPrompt;
     }
 
     // 收集优化参数
@@ -809,6 +861,7 @@ class ZImageApp {
             height: document.getElementById('height').value,
             steps: document.getElementById('steps').value,
             filename: document.getElementById('filename').value,
+            outputEncoding: document.getElementById('outputEncoding').value,
             optimizationMode: document.getElementById('optimizationMode').value,
             artStyle: document.getElementById('artStyle').value,
             character: document.getElementById('character').value,
@@ -837,6 +890,7 @@ class ZImageApp {
                     document.getElementById('stepsValue').textContent = formData.steps;
                 }
                 if (formData.filename) document.getElementById('filename').value = formData.filename;
+                if (formData.outputEncoding) document.getElementById('outputEncoding').value = formData.outputEncoding;
                 if (formData.optimizationMode) document.getElementById('optimizationMode').value = formData.optimizationMode;
                 if (formData.artStyle) document.getElementById('artStyle').value = formData.artStyle;
                 if (formData.character) document.getElementById('character').value = formData.character;
@@ -864,6 +918,7 @@ class ZImageApp {
             height: parseInt(document.getElementById('height').value),
             steps: parseInt(document.getElementById('steps').value),
             filename: document.getElementById('filename').value,
+            encoding: document.getElementById('outputEncoding').value,
             optimize_prompt: false,  // 默认不优化，只有用户点击"预览优化效果"并使用后才会优化
             optimization_mode: document.getElementById('optimizationMode').value
         };
@@ -975,8 +1030,11 @@ class ZImageApp {
             const filename = document.getElementById('filename').value;
             console.log('文件名:', filename);
 
+            // 图片地址会按浏览器支持的格式返回 AVIF/WebP，下载时请求原始文件
+            const url = new URL(this.currentImageUrl, window.location.href);
+            url.searchParams.set('original', '1');
             const link = document.createElement('a');
-            link.href = this.currentImageUrl;
+            link.href = url.href;
             link.download = filename;
             document.body.appendChild(link);
             link.click();
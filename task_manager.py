@@ -13,20 +13,22 @@ class GenerationCancelled(Exception):
 
 
 class TaskManager:
-    def __init__(self, retention_seconds=3600, max_completed_tasks=100):
+    def __init__(self, retention_seconds=3600, max_completed_tasks=100, max_active_tasks=1):
         self._lock = threading.RLock()
         self._tasks = {}
         self._cancel_events = {}
-        self._active_task_id = None
+        # 按提交顺序保存尚未退出的任务（排队中或执行中）。
+        self._active_task_ids = []
         self._retention_seconds = retention_seconds
         self._max_completed_tasks = max_completed_tasks
+        self._max_active_tasks = max(1, max_active_tasks)
 
     def create_task(self):
-        """创建唯一活动任务；仍有工作线程时返回 (None, active_id)。"""
+        """创建活动任务；活动任务已满时返回 (None, 最早的 active_id)。"""
         with self._lock:
             self._cleanup_locked()
-            if self._active_task_id is not None:
-                return None, self._active_task_id
+            if len(self._active_task_ids) >= self._max_active_tasks:
+                return None, self._active_task_ids[0]
 
             task_id = str(uuid.uuid4())
             now = time.time()
@@ -38,7 +40,7 @@ class TaskManager:
                 "updated_at": now,
             }
             self._cancel_events[task_id] = threading.Event()
-            self._active_task_id = task_id
+            self._active_task_ids.append(task_id)
             return task_id, None
 
     def update(self, task_id, **changes):
@@ -101,22 +103,34 @@ class TaskManager:
 
     def has_active_worker(self):
         with self._lock:
-            return self._active_task_id is not None
+            return bool(self._active_task_ids)
+
+    def active_count(self):
+        with self._lock:
+            return len(self._active_task_ids)
 
     def finish_worker(self, task_id):
-        """仅在线程真正退出后允许下一个任务开始。"""
+        """仅在任务真正退出工作线程后释放名额，允许新任务进入队列。"""
         with self._lock:
-            if self._active_task_id == task_id:
-                self._active_task_id = None
+            if task_id in self._active_task_ids:
+                self._active_task_ids.remove(task_id)
             self._cancel_events.pop(task_id, None)
             self._cleanup_locked()
 
+    def discard(self, task_id):
+        """撤销一个尚未交给任何工作线程的任务：释放名额并删除记录，客户端可直接重试。"""
+        with self._lock:
+            if task_id in self._active_task_ids:
+                self._active_task_ids.remove(task_id)
+            self._cancel_events.pop(task_id, None)
+            self._tasks.pop(task_id, None)
+
     def _cleanup_locked(self):
         now = time.time()
         removable = [
             task_id
             for task_id, task in self._tasks.items()
-            if task_id != self._active_task_id
+            if task_id not in self._active_task_ids
             and task.get("status") in TERMINAL_STATUSES
             and now - task.get("updated_at", now) > self._retention_seconds
         ]
@@ -128,7 +142,7 @@ class TaskManager:
             (
                 (task.get("updated_at", 0), task_id)
                 for task_id, task in self._tasks.items()
-                if task_id != self._active_task_id
+                if task_id not in self._active_task_ids
                 and task.get("status") in TERMINAL_STATUSES
             ),
             reverse=True,
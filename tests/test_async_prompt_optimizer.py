@@ -0,0 +1,273 @@
+import io
+import json
+import threading
+import time
+import unittest
+from contextlib import redirect_stdout
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+
+import async_prompt_optimizer
+import prompt_optimizer
+from circuit_breaker import CircuitBreaker
+from prompt_cache import PromptCache
+
+
+class StubDeepSeekHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    delay = 0.05
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        with self.server.lock:
+            self.server.calls += 1
+            self.server.connections.add(self.client_address)
+            # 测试可注入故障：("delay", 秒) 或 ("status", 状态码)，按请求顺序消费。
+            behavior = self.server.behaviors.pop(0) if self.server.behaviors else ("delay", self.delay)
+        if behavior[0] == "status":
+            self.send_response(behavior[1])
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        user_content = body["messages"][1]["content"]
+        if body["messages"][0]["content"] == prompt_optimizer.PACKED_SYSTEM_PROMPT:
+            # 打包请求：("drop", {id, ...}) 让对应条目缺失。
+            with self.server.lock:
+                self.server.packed_calls += 1
+            dropped = behavior[1] if behavior[0] == "drop" else set()
+            time.sleep(self.delay)
+            content = json.dumps([
+                {"id": entry["id"], "prompt": f"优化: {entry['request'].splitlines()[0]}"}
+                for entry in json.loads(user_content) if entry["id"] not in dropped
+            ], ensure_ascii=False)
+        else:
+            time.sleep(behavior[1] if behavior[0] == "delay" else self.delay)
+            content = f"优化: {user_content.splitlines()[0]}"
+        payload = json.dumps({"choices": [{"message": {"content": content}}]}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *_args):
+        pass
+
+
+class AsyncPromptOptimizerTests(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), StubDeepSeekHandler)
+        self.server.daemon_threads = True
+        self.server.lock = threading.Lock()
+        self.server.calls = 0
+        self.server.packed_calls = 0
+        self.server.connections = set()
+        self.server.behaviors = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{self.server.server_port}/v1/chat/completions"
+        self.patches = [
+            patch.object(async_prompt_optimizer, "get_api_settings", return_value=("key", url)),
+            patch.object(prompt_optimizer, "prompt_cache", PromptCache()),
+        ]
+        for item in self.patches:
+            item.start()
+        self.client = self.make_client(max_concurrency=50)
+
+    def make_client(self, **kwargs):
+        kwargs.setdefault("breaker", CircuitBreaker())
+        return async_prompt_optimizer.AsyncPromptOptimizer(**kwargs)
+
+    def replace_client(self, **kwargs):
+        self.client.close()
+        self.client = self.make_client(**kwargs)
+
+    def tearDown(self):
+        self.client.close()
+        for item in self.patches:
+            item.stop()
+        self.stop_server()
+
+    def stop_server(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def test_throughput_with_50_concurrent_callers(self):
+        specs = [{"prompt": f"提示词 {index}", "art_style": "水彩"} for index in range(50)]
+        start = time.perf_counter()
+        results = self.client.optimize_many_blocking(specs)
+        elapsed = time.perf_counter() - start
+        throughput = len(specs) / elapsed
+
+        self.assertEqual(results[7], ("优化: 原始描述: 提示词 7", "api"))
+        self.assertEqual(self.server.calls, 50)
+        # 串行需要 50 × 50ms = 2.5 秒；并发客户端应远快于此。
+        self.assertGreater(throughput, 40, f"{throughput:.1f} req/s")
+
+        # 重复提交全部命中缓存；新一批请求复用连接池中的长连接。
+        results = self.client.optimize_many_blocking(specs)
+        self.assertEqual(self.server.calls, 50)
+        self.assertTrue(all(source == "cache" for _, source in results))
+        self.client.optimize_many_blocking([{"prompt": f"新提示词 {index}"} for index in range(50)])
+        self.assertEqual(self.server.calls, 100)
+        self.assertLessEqual(len(self.server.connections), 50)
+
+    def test_identical_concurrent_calls_share_one_upstream_request(self):
+        barrier = threading.Barrier(50)
+        results = []
+
+        def caller():
+            barrier.wait()
+            results.append(self.client.optimize_blocking("同一个提示词", lighting="黄昏"))
+
+        threads = [threading.Thread(target=caller) for _ in range(50)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(10)
+
+        self.assertEqual(len(results), 50)
+        self.assertEqual(len(set(results)), 1)
+        self.assertEqual(self.server.calls, 1)
+        self.assertEqual(self.client.stats()["upstream_calls"], 1)
+
+    def test_upstream_failure_falls_back_to_simple_combine(self):
+        self.stop_server()
+        with redirect_stdout(io.StringIO()):
+            text, source = self.client.optimize_blocking("小猫", art_style="水彩")
+        self.assertEqual(source, "fallback")
+        self.assertEqual(text, "小猫, 水彩 style")
+
+    def test_open_circuit_skips_upstream(self):
+        self.replace_client(breaker=CircuitBreaker(min_requests=3, open_seconds=60))
+        self.server.behaviors = [("status", 500)] * 3
+        with redirect_stdout(io.StringIO()):
+            for index in range(3):
+                self.assertEqual(self.client.optimize_blocking(f"失败 {index}")[1], "fallback")
+            start = time.perf_counter()
+            text, source = self.client.optimize_blocking("熔断中")
+            elapsed = time.perf_counter() - start
+
+        self.assertEqual((text, source), ("熔断中", "fallback"))
+        self.assertEqual(self.server.calls, 3)
+        self.assertLess(elapsed, 0.05)
+        stats = self.client.stats()
+        self.assertEqual(stats["short_circuited"], 1)
+        self.assertEqual(stats["breaker"]["state"], CircuitBreaker.OPEN)
+
+    def test_probe_cancelled_while_waiting_for_a_slot_is_released(self):
+        clock = [0.0]
+        breaker = CircuitBreaker(min_requests=1, open_seconds=10, clock=lambda: clock[0])
+        breaker.record_failure(1.0)
+        clock[0] = 11.0
+        self.replace_client(max_concurrency=1, latency_budget=0.3, breaker=breaker)
+        # 唯一的名额被占住，半开状态的探测请求在排队时超出预算被取消，请求没有发出。
+        self.client._ensure_loop()
+        self.client._run_blocking(self.client._semaphore.acquire())
+        with redirect_stdout(io.StringIO()):
+            self.assertEqual(self.client.optimize_blocking("探测")[1], "fallback")
+
+        self.assertEqual(self.server.calls, 0)
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertTrue(breaker.allow_request())
+
+    def test_hedged_request_beats_slow_primary(self):
+        breaker = CircuitBreaker(min_requests=5)
+        for _ in range(5):
+            breaker.record_success(0.05)
+        self.replace_client(breaker=breaker, hedge=True)
+        self.server.behaviors = [("delay", 1.0)]
+
+        start = time.perf_counter()
+        text, source = self.client.optimize_blocking("对冲")
+        elapsed = time.perf_counter() - start
+
+        self.assertEqual(source, "api")
+        self.assertLess(elapsed, 0.6)
+        self.assertEqual(self.server.calls, 2)
+        self.assertEqual(self.client.stats()["hedged"], 1)
+
+    def test_latency_budget_falls_back_in_time(self):
+        self.replace_client(latency_budget=0.2)
+        self.server.behaviors = [("delay", 1.0)]
+        start = time.perf_counter()
+        with redirect_stdout(io.StringIO()):
+            text, source = self.client.optimize_blocking("预算", art_style="油画")
+        elapsed = time.perf_counter() - start
+
+        self.assertEqual((text, source), ("预算, 油画 style", "fallback"))
+        self.assertLess(elapsed, 0.6)
+        self.assertEqual(self.client.stats()["breaker"]["failures"], 1)
+
+    def test_timed_out_request_keeps_its_slot_until_it_finishes(self):
+        breaker = CircuitBreaker(min_requests=1, failure_rate_threshold=2)
+        self.replace_client(max_concurrency=1, latency_budget=0.4, breaker=breaker)
+        delays = [0.5, 0.05]
+
+        def request(_text, _api_key, _api_url, _read_timeout):
+            # 不受读取超时约束的慢请求：超出预算后线程仍在运行。
+            time.sleep(delays.pop(0))
+            return "优化结果"
+
+        with patch.object(self.client, "_request", request), redirect_stdout(io.StringIO()):
+            self.assertEqual(self.client.optimize_blocking("慢请求")[1], "fallback")
+            self.assertEqual(self.client.optimize_blocking("下一个"), ("优化结果", "api"))
+        # 第二个请求等到第一个请求的线程结束后才发出，等待时间不计入上游延迟。
+        self.assertLess(breaker.latency_percentile(1.0), 0.1)
+
+    def test_cache_io_runs_outside_the_event_loop(self):
+        threads = []
+        cache = prompt_optimizer.prompt_cache
+        original_get, original_put = cache.get, cache.put
+
+        def get(key):
+            threads.append(threading.current_thread().name)
+            return original_get(key)
+
+        def put(key, value):
+            threads.append(threading.current_thread().name)
+            original_put(key, value)
+
+        with patch.object(cache, "get", get), patch.object(cache, "put", put):
+            self.client.optimize_blocking("线程")
+            self.client.optimize_packed_blocking([{"prompt": "线程"}, {"prompt": "打包 1"}, {"prompt": "打包 2"}])
+        self.assertEqual(len(threads), 7)
+        self.assertTrue(all(name.startswith("prompt-cache") for name in threads), threads)
+
+    def test_packed_batch_uses_fewer_round_trips(self):
+        specs = [{"prompt": f"提示词 {index}", "art_style": "水彩"} for index in range(40)]
+        specs.append(dict(specs[0]))
+
+        results = self.client.optimize_packed_blocking(specs, pack_size=10)
+
+        self.assertEqual(len(results), 41)
+        self.assertEqual(results[7], ("优化: 原始描述: 提示词 7", "api"))
+        self.assertEqual(results[40], results[0])
+        self.assertEqual(self.server.calls, 4)
+        self.assertEqual(self.server.packed_calls, 4)
+        # 打包结果与逐条结果共用缓存。
+        self.assertEqual(self.client.optimize_blocking("提示词 3", art_style="水彩"), ("优化: 原始描述: 提示词 3", "cache"))
+
+    def test_malformed_pack_entries_are_retried_individually(self):
+        self.server.behaviors = [("drop", {1, 3})]
+
+        results = self.client.optimize_packed_blocking([{"prompt": f"条目 {index}"} for index in range(5)], pack_size=5)
+
+        self.assertEqual([source for _, source in results], ["api"] * 5)
+        self.assertEqual(results[3][0], "优化: 原始描述: 条目 3")
+        self.assertEqual(self.server.calls, 3)
+        self.assertEqual(self.client.stats()["pack_repairs"], 2)
+
+    def test_failed_pack_falls_back_to_simple_combine(self):
+        self.server.behaviors = [("status", 500)]
+        with redirect_stdout(io.StringIO()):
+            results = self.client.optimize_packed_blocking(
+                [{"prompt": "小猫", "art_style": "水彩"}, {"prompt": "小狗"}], pack_size=2
+            )
+        self.assertEqual(results, [("小猫, 水彩 style", "fallback"), ("小狗", "fallback")])
+        self.assertEqual(self.server.calls, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,26 @@
+import threading
+import unittest
+
+from bounded_executor import BoundedExecutor
+
+
+class BoundedExecutorTests(unittest.TestCase):
+    def test_submit_blocks_when_pending_limit_reached(self):
+        executor = BoundedExecutor(max_workers=1, max_pending=1)
+        release = threading.Event()
+        try:
+            executor.submit(release.wait, 5)
+            executor.submit(release.wait, 5)
+            self.assertEqual(executor.in_flight(), 2)
+            with self.assertRaises(TimeoutError):
+                executor.submit(release.wait, 5, timeout=0.05)
+            release.set()
+            executor.submit(lambda: None, timeout=5).result(5)
+        finally:
+            release.set()
+            executor.shutdown()
+        self.assertEqual(executor.in_flight(), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
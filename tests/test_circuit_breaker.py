@@ -0,0 +1,49 @@
+import unittest
+
+from circuit_breaker import CircuitBreaker
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class CircuitBreakerTests(unittest.TestCase):
+    def test_opens_on_failures_and_recovers_through_half_open_probe(self):
+        clock = FakeClock()
+        breaker = CircuitBreaker(window_size=10, min_requests=4, open_seconds=30, clock=clock)
+        for _ in range(4):
+            self.assertTrue(breaker.allow_request())
+            breaker.record_failure(0.1)
+
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        self.assertFalse(breaker.allow_request())
+
+        clock.now += 31
+        self.assertTrue(breaker.allow_request())
+        self.assertFalse(breaker.allow_request())  # 半开状态只放行一个探测请求
+        breaker.record_success(0.2)
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        self.assertTrue(breaker.allow_request())
+
+    def test_slow_calls_open_the_circuit(self):
+        breaker = CircuitBreaker(min_requests=3, slow_call_seconds=1.0, slow_rate_threshold=0.6)
+        for _ in range(3):
+            breaker.record_success(2.0)
+        self.assertEqual(breaker.snapshot()["state"], CircuitBreaker.OPEN)
+
+    def test_latency_percentile_needs_enough_samples(self):
+        breaker = CircuitBreaker(min_requests=5)
+        for latency in (0.1, 0.2, 0.3, 0.4):
+            breaker.record_success(latency)
+        self.assertIsNone(breaker.latency_percentile(0.95))
+        breaker.record_success(1.0)
+        self.assertEqual(breaker.latency_percentile(0.95), 1.0)
+        self.assertEqual(breaker.latency_percentile(0.5), 0.3)
+
+
+if __name__ == "__main__":
+    unittest.main()
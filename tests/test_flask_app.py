@@ -0,0 +1,228 @@
+import importlib
+import io
+import os
+import random
+import shutil
+import sys
+import tempfile
+import types
+import unittest
+from contextlib import redirect_stdout
+from pathlib import Path
+from unittest.mock import patch
+
+from PIL import Image
+
+from config_manager import config_manager
+from gallery_index import GalleryIndex, get_gallery_index
+from image_processing import PRIMARY_THUMBNAIL_SIZE
+from thumbnail_pack import get_thumbnail_pack
+
+
+def import_flask_app():
+    """导入 flask_app；模型管理依赖 torch，用只提供路由所需接口的假模块代替。"""
+    fake_model_manager = types.ModuleType("model_manager")
+    fake_model_manager.model_manager = types.SimpleNamespace(get_pipe=lambda: None)
+    fake_model_manager.load_model = lambda *args, **kwargs: (False, "测试中不加载模型")
+    fake_model_manager.is_model_loaded = lambda: False
+    fake_model_manager.unload_model = lambda: (True, "")
+    saved = sys.modules.get("model_manager")
+    sys.modules["model_manager"] = fake_model_manager
+    try:
+        with redirect_stdout(io.StringIO()):
+            return importlib.import_module("flask_app")
+    finally:
+        if saved is None:
+            sys.modules.pop("model_manager", None)
+        else:
+            sys.modules["model_manager"] = saved
+
+
+flask_app = import_flask_app()
+
+
+def make_item(gallery, name, created, mtime, prompt="一只猫"):
+    folder = Path(gallery) / name
+    folder.mkdir()
+    Image.new("RGB", (64, 48), "orange").save(folder / f"{name}.png")
+    (folder / f"{name}_info.txt").write_text(
+        f"图片名称: {name}.png\n提示词: {prompt}\n图片尺寸: 64x48\n推理步数: 9\n"
+        f"优化模式: basic\n生成时间: 3.50秒\n创建时间: {created}\n",
+        encoding="utf-8",
+    )
+    os.utime(folder, (mtime, mtime))
+    return folder
+
+
+class FlaskAppTestCase(unittest.TestCase):
+    def setUp(self):
+        self.gallery = tempfile.mkdtemp()
+        patcher = patch.object(config_manager.config, "gallery_dir", self.gallery)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = flask_app.app.test_client()
+        make_item(self.gallery, "cat", "2024-05-01 10:00:00", 1_700_000_000)
+        make_item(self.gallery, "dog", "2024-05-02 10:00:00", 1_700_000_100, prompt="一只狗")
+
+    def tearDown(self):
+        get_gallery_index().close()
+        shutil.rmtree(self.gallery, ignore_errors=True)
+
+    def build_index(self):
+        with redirect_stdout(io.StringIO()):
+            get_gallery_index().ensure_built()
+
+
+class GalleryIndexBuildingTests(FlaskAppTestCase):
+    def test_api_lists_disk_and_builds_in_background_until_ready(self):
+        with patch.object(GalleryIndex, "start_build", return_value=True) as start_build:
+            response = self.client.get("/api/gallery?limit=1")
+            self.assertEqual(response.status_code, 200)
+            self.assertIsNone(response.headers.get("ETag"))
+            data = response.get_json()
+            self.assertEqual(([item["folder"] for item in data["items"]], data["total"]), (["dog"], 2))
+            older = self.client.get(f"/api/gallery?limit=1&after={data['next_cursor']}").get_json()
+            self.assertEqual([item["folder"] for item in older["items"]], ["cat"])
+
+            searching = self.client.get("/api/gallery?q=猫")
+            self.assertEqual((searching.status_code, searching.headers.get("Retry-After")), (503, "5"))
+            self.assertEqual(self.client.get("/api/gallery/search?q=猫").status_code, 503)
+            page = self.client.get("/gallery?q=猫")
+            self.assertEqual(page.status_code, 200)
+            self.assertIn("画廊索引正在构建", page.get_data(as_text=True))
+            self.assertIn("/gallery/thumbnail/dog", page.get_data(as_text=True))
+        self.assertGreaterEqual(start_build.call_count, 4)
+        self.assertFalse(get_gallery_index().ready)
+
+        self.build_index()
+        response = self.client.get("/api/gallery?q=猫")
+        self.assertEqual([item["folder"] for item in response.get_json()["items"]], ["cat"])
+        self.assertIsNotNone(response.headers.get("ETag"))
+
+
+class GalleryApiTests(FlaskAppTestCase):
+    def setUp(self):
+        super().setUp()
+        self.build_index()
+
+    def test_matching_if_none_match_returns_not_modified(self):
+        response = self.client.get("/api/gallery?limit=1")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers["Cache-Control"], "no-cache")
+        etag = response.headers["ETag"]
+        self.assertTrue(etag.startswith('W/"'))
+
+        cached = self.client.get("/api/gallery?limit=1", headers={"If-None-Match": etag})
+        self.assertEqual((cached.status_code, cached.data), (304, b""))
+        self.assertEqual(cached.headers["ETag"], etag)
+        # 查询参数不同的请求使用不同的 ETag。
+        other = self.client.get("/api/gallery?limit=2", headers={"If-None-Match": etag})
+        self.assertEqual(other.status_code, 200)
+
+    def test_invalid_cursor_returns_bad_request(self):
+        for query in ("after=not-a-cursor", "before=%E7%8C%AB", "limit=0"):
+            with self.subTest(query=query):
+                response = self.client.get(f"/api/gallery?{query}")
+                self.assertEqual(response.status_code, 400)
+                self.assertFalse(response.get_json()["success"])
+
+    def test_etag_changes_after_delete(self):
+        etag = self.client.get("/api/gallery").headers["ETag"]
+        deleted = self.client.post("/api/gallery/delete", json={"folder_name": "dog"})
+        self.assertTrue(deleted.get_json()["success"])
+
+        response = self.client.get("/api/gallery", headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers["ETag"], etag)
+        self.assertEqual([item["folder"] for item in response.get_json()["items"]], ["cat"])
+
+
+class PackedThumbnailTests(FlaskAppTestCase):
+    def setUp(self):
+        super().setUp()
+        patcher = patch.object(config_manager.config, "thumbnail_store", "pack")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.data = bytes(range(256)) * 4
+        get_thumbnail_pack().put_many([("cat", PRIMARY_THUMBNAIL_SIZE, self.data)])
+        self.addCleanup(get_thumbnail_pack().close)
+        self.etag = self.client.get("/gallery/thumbnail/cat").headers["ETag"]
+
+    def test_range_returns_partial_content(self):
+        response = self.client.get("/gallery/thumbnail/cat", headers={"Range": "bytes=10-19"})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.headers["Content-Range"], f"bytes 10-19/{len(self.data)}")
+        self.assertEqual(response.data, self.data[10:20])
+        suffix = self.client.get("/gallery/thumbnail/cat", headers={"Range": "bytes=-4", "If-Range": self.etag})
+        self.assertEqual(suffix.status_code, 206)
+        self.assertEqual(suffix.headers["Content-Range"], f"bytes 1020-1023/{len(self.data)}")
+        self.assertEqual(suffix.data, self.data[-4:])
+
+    def test_unsatisfiable_range_returns_416(self):
+        response = self.client.get("/gallery/thumbnail/cat", headers={"Range": f"bytes={len(self.data)}-"})
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response.headers["Content-Range"], f"bytes */{len(self.data)}")
+        self.assertEqual(response.data, b"")
+
+    def test_stale_if_range_returns_full_body(self):
+        response = self.client.get(
+            "/gallery/thumbnail/cat", headers={"Range": "bytes=0-9", "If-Range": '"stale"'}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response.headers.get("Content-Range"))
+        self.assertEqual(response.data, self.data)
+        self.assertEqual(response.headers["ETag"], self.etag)
+
+
+class GalleryImageTests(FlaskAppTestCase):
+    CHROME_ACCEPT = "image/avif,image/webp,image/apng,image/*,*/*;q=0.8"
+
+    def setUp(self):
+        super().setUp()
+        patcher = patch.object(config_manager.config, "image_variants", {"webp": 80})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # 噪点图的 WebP 明显小于 PNG，保证协商时提供变体。
+        folder = Path(self.gallery) / "cat"
+        Image.frombytes("RGB", (64, 48), random.Random(0).randbytes(64 * 48 * 3)).save(folder / "cat.png")
+        self.original = (folder / "cat.png").read_bytes()
+
+    def test_accept_negotiates_webp_and_varies_on_accept(self):
+        response = self.client.get("/gallery/cat/cat.png", headers={"Accept": self.CHROME_ACCEPT})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, "image/webp")
+        self.assertLess(len(response.data), len(self.original))
+        self.assertIn("Accept", response.headers["Vary"])
+
+        # 只有 */* 或 image/* 不算明确接受 WebP，提供原图但同样按 Accept 区分缓存。
+        for accept in ("*/*", "image/*", "image/webp;q=0"):
+            with self.subTest(accept=accept):
+                response = self.client.get("/gallery/cat/cat.png", headers={"Accept": accept})
+                self.assertEqual((response.mimetype, response.data), ("image/png", self.original))
+                self.assertIn("Accept", response.headers["Vary"])
+
+    def test_original_parameter_always_serves_the_original_file(self):
+        response = self.client.get("/gallery/cat/cat.png?original=1", headers={"Accept": self.CHROME_ACCEPT})
+        self.assertEqual((response.status_code, response.mimetype), (200, "image/png"))
+        self.assertEqual(response.data, self.original)
+        self.assertNotIn("Accept", response.headers.get("Vary", ""))
+
+    def test_hidden_files_and_variant_markers_are_not_served(self):
+        self.client.get("/gallery/cat/cat.png", headers={"Accept": self.CHROME_ACCEPT})
+        cache_dir = Path(self.gallery) / ".variants"
+        (cache_dir / "0123456789abcdef.orig").write_bytes(b"")
+        (Path(self.gallery) / "cat" / ".secret").write_text("hidden", encoding="utf-8")
+        variant_name = next(path.name for path in cache_dir.iterdir() if path.suffix == ".webp")
+
+        for path in (
+            "/gallery/.variants/0123456789abcdef.orig",
+            f"/gallery/.variants/{variant_name}",
+            "/gallery/cat/.secret",
+            "/gallery/cat/missing.png",
+        ):
+            with self.subTest(path=path):
+                self.assertEqual(self.client.get(path).status_code, 404)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,126 @@
+import shutil
+import tempfile
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from unittest.mock import patch
+
+from PIL import Image
+
+import thumbnail_pack
+from gallery_bundles import BUNDLES_DIRNAME, BundleCache, bundle_size_for
+from image_processing import create_gallery_thumbnail, get_thumbnail_path
+from thumbnail_pack import PACK_FILENAME, ThumbnailPack, migrate_thumbnails
+
+
+SIZES = (256, 640)
+
+
+def make_item(gallery, name, color="orange"):
+    folder = Path(gallery) / name
+    folder.mkdir()
+    image_path = folder / f"{name}.png"
+    Image.new("RGB", (800, 600), color).save(image_path)
+    create_gallery_thumbnail(image_path, image_path, sizes=list(SIZES))
+    return {"folder": name, "image": image_path.name}
+
+
+class GalleryBundleTests(unittest.TestCase):
+    def setUp(self):
+        self.gallery = Path(tempfile.mkdtemp())
+        self.cache = BundleCache(self.gallery)
+        self.items = [make_item(self.gallery, name, color) for name, color in (("cat", "red"), ("dog", "blue"))]
+        self.versions = {"cat": 1, "dog": 1}
+
+    def tearDown(self):
+        shutil.rmtree(self.gallery, ignore_errors=True)
+
+    def read_part(self, bundle, folder_name):
+        offset, length = bundle.ranges[folder_name]
+        return self.cache.path(bundle.key).read_bytes()[offset:offset + length]
+
+    def test_size_selection(self):
+        self.assertEqual(bundle_size_for(200, SIZES), 256)
+        self.assertEqual(bundle_size_for(300, SIZES), 640)
+        self.assertEqual(bundle_size_for(5000, SIZES), 640)
+
+    def test_bundle_holds_page_thumbnails_and_is_reused(self):
+        bundle = self.cache.bundle_for(self.items, self.versions, 256)
+        self.assertEqual(list(bundle.ranges), ["cat", "dog"])
+        for item in self.items:
+            expected = get_thumbnail_path(self.gallery / item["folder"] / item["image"], 256).read_bytes()
+            self.assertEqual(self.read_part(bundle, item["folder"]), expected)
+        self.assertEqual(bundle.length, self.cache.path(bundle.key).stat().st_size)
+
+        self.assertEqual(self.cache.bundle_for(self.items, self.versions, 256), bundle)
+        # 新的缓存实例从磁盘上的清单恢复，不重新生成。
+        reopened = BundleCache(self.gallery)
+        self.assertEqual(reopened.bundle_for(self.items, self.versions, 256), bundle)
+        self.assertEqual((reopened.stats["hits"], reopened.stats["builds"]), (1, 0))
+
+        # 作品改动、页面成员或尺寸变化都会得到新地址。
+        changed = self.cache.bundle_for(self.items, {"cat": 1, "dog": 2}, 256)
+        self.assertNotEqual(changed.key, bundle.key)
+        self.assertNotEqual(self.cache.bundle_for(self.items[:1], self.versions, 256).key, bundle.key)
+        self.assertNotEqual(self.cache.bundle_for(self.items, self.versions, 640).key, bundle.key)
+
+    def test_concurrent_builds_are_shared_per_page(self):
+        build = self.cache._build
+        release = threading.Event()
+
+        def slow_build(key, items, size):
+            if size == 640:
+                release.wait(10)
+            return build(key, items, size)
+
+        with patch.object(self.cache, "_build", slow_build):
+            with ThreadPoolExecutor(max_workers=3) as executor:
+                slow = [executor.submit(self.cache.bundle_for, self.items, self.versions, 640) for _ in range(2)]
+                # 另一页不必等待正在生成的页面。
+                other = executor.submit(self.cache.bundle_for, self.items, self.versions, 256).result(timeout=5)
+                self.assertFalse(any(future.done() for future in slow))
+                release.set()
+                first, second = (future.result(timeout=10) for future in slow)
+
+        self.assertIs(first, second)
+        self.assertNotEqual(other.key, first.key)
+        self.assertEqual(self.cache.stats["builds"], 2)
+        self.assertEqual(self.cache._pending, {})
+
+    def test_missing_thumbnail_is_not_cached(self):
+        thumbnail = get_thumbnail_path(self.gallery / "dog" / "dog.png", 640)
+        data = thumbnail.read_bytes()
+        thumbnail.unlink()
+        self.assertIsNone(self.cache.bundle_for(self.items, self.versions, 640))
+        self.assertEqual(self.cache.stats["incomplete"], 1)
+
+        thumbnail.write_bytes(data)
+        self.assertIsNotNone(self.cache.bundle_for(self.items, self.versions, 640))
+
+    def test_rejects_bad_keys_and_prunes_old_bundles(self):
+        for key in ("", "../x", "g" * 32, "0" * 32):
+            self.assertIsNone(self.cache.path(key))
+
+        cache = BundleCache(self.gallery, max_bundles=2)
+        keys = [cache.bundle_for(self.items, {"cat": version, "dog": 1}, 256).key for version in range(4)]
+        remaining = sorted(path.name for path in (self.gallery / BUNDLES_DIRNAME).iterdir())
+        self.assertEqual(remaining, sorted(f"{key}.{suffix}" for key in keys[-2:] for suffix in ("bin", "json")))
+        self.assertIsNone(cache.path(keys[0]))
+
+    def test_reads_from_thumbnail_pack(self):
+        pack = ThumbnailPack(self.gallery / PACK_FILENAME)
+        values = {"thumbnail_store": "pack", "thumbnail_sizes": list(SIZES)}
+        try:
+            with patch.object(thumbnail_pack.config_manager, "get", side_effect=lambda key, default=None: values.get(key, default)), \
+                    patch.object(thumbnail_pack, "get_thumbnail_pack", return_value=pack):
+                expected = get_thumbnail_path(self.gallery / "cat" / "cat.png", 640).read_bytes()
+                migrate_thumbnails(self.gallery, pack)
+                bundle = self.cache.bundle_for(self.items, self.versions, 640)
+            self.assertEqual(self.read_part(bundle, "cat"), expected)
+        finally:
+            pack.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,238 @@
+import io
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from contextlib import redirect_stdout
+from pathlib import Path
+from unittest.mock import patch
+
+import gallery_index
+import image_processing
+from gallery_index import GalleryIndex, GallerySearch, build_match_query, decode_cursor, list_from_disk
+
+
+def make_item(gallery, name, created, prompt="一只猫", size="512x768"):
+    folder = Path(gallery) / name
+    folder.mkdir()
+    (folder / f"{name}.png").write_bytes(b"png")
+    (folder / f"{name}_info.txt").write_text(
+        f"图片名称: {name}.png\n提示词: {prompt}\n图片尺寸: {size}\n推理步数: 9\n"
+        f"优化模式: basic\n生成时间: 3.50秒\n创建时间: {created}\n",
+        encoding="utf-8",
+    )
+    return folder
+
+
+class GalleryIndexTests(unittest.TestCase):
+    def setUp(self):
+        self.gallery = tempfile.mkdtemp()
+        self.index = GalleryIndex(self.gallery)
+
+    def tearDown(self):
+        self.index.close()
+        shutil.rmtree(self.gallery, ignore_errors=True)
+
+    def build(self):
+        with redirect_stdout(io.StringIO()):
+            return self.index.repair()
+
+    def test_builds_records_from_existing_gallery(self):
+        make_item(self.gallery, "cat", "2024-05-01 10:00:00", prompt="橘猫: 晒太阳")
+        (Path(self.gallery) / "empty").mkdir()
+
+        self.assertEqual(self.build(), {"indexed": 1, "removed": 0, "total": 1})
+        item = self.index.get("cat")
+        self.assertEqual((item["image"], item["width"], item["height"], item["steps"]), ("cat.png", 512, 768, 9))
+        self.assertEqual(item["gen_time"], 3.5)
+        self.assertEqual(item["prompt"], "橘猫: 晒太阳")
+        self.assertEqual(item["info"]["优化模式"], "basic")
+
+    def test_keyset_pages_newest_first(self):
+        for day in range(1, 8):
+            make_item(self.gallery, f"item{day}", f"2024-05-0{day} 10:00:00")
+        make_item(self.gallery, "item7b", "2024-05-07 10:00:00")
+        self.build()
+
+        first, older, newer = self.index.page(3)
+        self.assertEqual([item["folder"] for item in first], ["item7b", "item7", "item6"])
+        self.assertIsNone(newer)
+        second, older, newer = self.index.page(3, after=older)
+        self.assertEqual([item["folder"] for item in second], ["item5", "item4", "item3"])
+        self.assertEqual(self.index.position(second[0]), 3)
+        last, no_more, newer = self.index.page(3, after=older)
+        self.assertEqual([item["folder"] for item in last], ["item2", "item1"])
+        self.assertIsNone(no_more)
+
+        back, _older, newer = self.index.page(3, before=newer)
+        self.assertEqual(back, second)
+        self.assertEqual(self.index.page(3, before=newer)[0], first)
+        with self.assertRaises(ValueError):
+            decode_cursor("not-a-cursor")
+
+    def test_disk_listing_pages_by_folder_mtime_before_the_index_is_built(self):
+        for day in range(1, 6):
+            folder = make_item(self.gallery, f"item{day}", f"2024-05-0{day} 10:00:00")
+            os.utime(folder, ns=(day * 10**9, day * 10**9))
+        (Path(self.gallery) / "item4" / "item4.png").unlink()
+
+        first = list_from_disk(self.gallery, 2)
+        self.assertEqual([item["folder"] for item in first.items], ["item5"])
+        self.assertEqual((first.total, first.offset, first.newer_cursor), (5, 0, None))
+        self.assertEqual(first.items[0]["info"]["优化模式"], "basic")
+        second = list_from_disk(self.gallery, 2, after=first.older_cursor)
+        self.assertEqual([item["folder"] for item in second.items], ["item3", "item2"])
+        self.assertEqual(second.offset, 2)
+        last = list_from_disk(self.gallery, 2, after=second.older_cursor)
+        self.assertEqual([item["folder"] for item in last.items], ["item1"])
+        self.assertIsNone(last.older_cursor)
+        back = list_from_disk(self.gallery, 2, before=last.newer_cursor)
+        self.assertEqual(back.items, second.items)
+        self.assertEqual((back.offset, back.newer_cursor is not None), (2, True))
+        with self.assertRaises(ValueError):
+            list_from_disk(self.gallery, 2, after="not-a-cursor")
+        self.assertFalse(self.index.ready)
+
+    def test_start_build_runs_in_the_background_once(self):
+        make_item(self.gallery, "cat", "2024-05-01 10:00:00")
+        release = threading.Event()
+        original_repair = self.index.repair
+
+        def slow_repair(*args, **kwargs):
+            release.wait(5)
+            return original_repair(*args, **kwargs)
+
+        with patch.object(self.index, "repair", side_effect=slow_repair) as repair, \
+                redirect_stdout(io.StringIO()):
+            self.assertTrue(self.index.start_build())
+            self.assertFalse(self.index.ready)
+            self.assertFalse(self.index.start_build())
+            release.set()
+            self.index._build_thread.join(5)
+        self.assertTrue(self.index.ready)
+        self.assertEqual(repair.call_count, 1)
+        self.assertFalse(self.index.start_build())
+        self.assertEqual(self.index.count(), 1)
+
+    def test_repair_picks_up_external_changes(self):
+        make_item(self.gallery, "keep", "2024-05-01 10:00:00")
+        make_item(self.gallery, "gone", "2024-05-02 10:00:00")
+        self.build()
+
+        shutil.rmtree(Path(self.gallery) / "gone")
+        make_item(self.gallery, "new", "2024-05-03 10:00:00")
+        self.assertEqual(self.index.repair(), {"indexed": 1, "removed": 1, "total": 2})
+        self.assertEqual(self.index.repair(), {"indexed": 0, "removed": 0, "total": 2})
+        self.assertIsNone(self.index.get("gone"))
+
+    def test_version_changes_only_with_content(self):
+        make_item(self.gallery, "cat", "2024-05-01 10:00:00")
+        self.build()
+        built = self.index.version
+        self.assertGreater(built, 0)
+
+        self.build()
+        self.index.remove("missing")
+        self.index.upsert_many([])
+        self.assertEqual(self.index.version, built)
+
+        make_item(self.gallery, "dog", "2024-05-02 10:00:00")
+        self.index.index_folder(Path(self.gallery) / "dog")
+        self.assertEqual(self.index.version, built + 1)
+        self.index.remove("dog")
+        self.assertEqual(self.index.version, built + 2)
+
+        # 其他连接（如命令行修复）写入的改动同样可见。
+        other = GalleryIndex(self.gallery)
+        shutil.rmtree(Path(self.gallery) / "cat")
+        other.repair()
+        other.close()
+        self.assertEqual(self.index.version, built + 3)
+
+    def test_refresh_reads_only_named_folders(self):
+        cat = make_item(self.gallery, "cat", "2024-05-01 10:00:00")
+        self.build()
+        built = self.index.version
+
+        # 缩略图等不影响内容的改动：不递增版本号。
+        (cat / "cat_thumb.webp").write_bytes(b"webp")
+        self.assertEqual(self.index.refresh(["cat"]), {"indexed": 0, "removed": 0, "unchanged": 1})
+        self.assertEqual(self.index.version, built)
+        self.assertEqual(self.index.item_versions(["cat", "missing"]), {"cat": cat.stat().st_mtime_ns})
+
+        # 就地改写参数文件不会改变目录修改时间，同样要重新读取。
+        info = cat / "cat_info.txt"
+        info.write_text(info.read_text(encoding="utf-8").replace("一只猫", "一只狗"), encoding="utf-8")
+        make_item(self.gallery, "dog", "2024-05-02 10:00:00")
+        make_item(self.gallery, "bird", "2024-05-03 10:00:00")
+        self.assertEqual(self.index.refresh(["cat", "dog", ".tmp"]), {"indexed": 2, "removed": 0, "unchanged": 0})
+        self.assertEqual(self.index.version, built + 1)
+        self.assertEqual(self.index.get("cat")["prompt"], "一只狗")
+        self.assertIsNone(self.index.get("bird"))
+
+        shutil.rmtree(cat)
+        self.assertEqual(self.index.refresh(["cat", "missing"]), {"indexed": 0, "removed": 1, "unchanged": 1})
+        self.assertEqual(self.index.count(), 1)
+        self.assertEqual(self.index.version, built + 2)
+
+    def test_save_updates_index_in_place(self):
+        image = image_processing.Image.new("RGB", (64, 64), "blue")
+        with patch.object(gallery_index.config_manager, "get", return_value=self.gallery), \
+                redirect_stdout(io.StringIO()):
+            saved = image_processing.save_to_gallery(image, "blue.png", "蓝色", 64, 64, 4, 1.25, "basic")
+            index = gallery_index.get_gallery_index()
+            item = index.get(saved.parent.name)
+            self.assertEqual((item["image"], item["prompt"], item["gen_time"]), ("blue.png", "蓝色", 1.25))
+            self.assertTrue((Path(self.gallery) / gallery_index.INDEX_FILENAME).exists())
+            self.assertEqual(index.repair()["indexed"], 0)
+
+            shutil.rmtree(saved.parent)
+            index.remove(saved.parent.name)
+            self.assertEqual(index.count(), 0)
+            index.close()
+
+    def search(self, **conditions):
+        items, _older, _newer = self.index.page(50, search=GallerySearch(**conditions))
+        return [item["folder"] for item in items]
+
+    def test_full_text_search_over_prompts(self):
+        make_item(self.gallery, "cat", "2024-05-01 10:00:00", prompt="一只橘猫在窗台上晒太阳, watercolor")
+        make_item(self.gallery, "dog", "2024-05-02 10:00:00", prompt="金毛犬在草地上奔跑, Watercolors")
+        make_item(self.gallery, "city", "2024-05-03 10:00:00", prompt="赛博朋克城市夜景，霓虹灯")
+        self.build()
+
+        self.assertEqual(self.search(text="橘猫"), ["cat"])
+        self.assertEqual(self.search(text="在 上"), ["dog", "cat"])
+        self.assertEqual(self.search(text="窗台 晒太阳"), ["cat"])
+        self.assertEqual(self.search(text="猫窗"), [])
+        self.assertEqual(self.search(text="WATERCOLOR"), ["dog", "cat"])
+        self.assertEqual(self.search(text="霓虹"), ["city"])
+        self.assertEqual(self.search(text='"'), ["city", "dog", "cat"])
+        self.assertEqual(build_match_query('a"b 猫'), '"a""b"* AND "猫"*')
+
+    def test_range_filters_and_incremental_updates(self):
+        make_item(self.gallery, "small", "2024-05-01 10:00:00", size="512x512")
+        make_item(self.gallery, "wide", "2024-05-02 23:59:59", size="1536x768")
+        self.build()
+
+        self.assertEqual(self.search(min_width=1024), ["wide"])
+        self.assertEqual(self.search(max_height=600, min_steps=9, max_steps=9), ["small"])
+        self.assertEqual(self.search(optimization_mode="low_vram"), [])
+        self.assertEqual(self.search(min_gen_time=3.5, max_gen_time=3.5), ["wide", "small"])
+        created_from = self.index.get("wide")["created"] - 1
+        self.assertEqual(self.search(created_from=created_from), ["wide"])
+        self.assertEqual(self.index.count(GallerySearch(text="猫", max_width=600)), 1)
+
+        # 重新索引同一目录后旧的全文条目被替换，删除后不再出现在结果中。
+        folder = Path(self.gallery) / "small"
+        (folder / "small_info.txt").write_text("提示词: 一只小狗\n图片尺寸: 512x512\n", encoding="utf-8")
+        self.index.index_folder(folder)
+        self.assertEqual(self.search(text="小狗"), ["small"])
+        self.assertEqual(self.search(text="一只猫"), ["wide"])
+        self.index.remove("wide")
+        self.assertEqual(self.search(text="一只"), ["small"])
+
+
+if __name__ == "__main__":
+    unittest.main()
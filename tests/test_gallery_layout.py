@@ -0,0 +1,104 @@
+import io
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from contextlib import redirect_stdout
+from pathlib import Path
+from unittest.mock import patch
+
+import image_processing
+from gallery_index import GalleryIndex
+from gallery_layout import (
+    SHARDS_DIRNAME, folder_path, iter_item_folders, layout_status, migrate_layout, resolve_folder, shard_for,
+)
+
+
+def make_item(folder, name):
+    folder.mkdir(parents=True)
+    (folder / f"{name}.png").write_bytes(b"png")
+    (folder / f"{name}_info.txt").write_text(
+        f"图片名称: {name}.png\n提示词: 一只猫\n图片尺寸: 64x64\n创建时间: 2024-05-01 10:00:00\n", encoding="utf-8"
+    )
+    # 迁移会跳过最近修改过的目录。
+    old = time.time() - 3600
+    os.utime(folder, (old, old))
+    return folder
+
+
+class GalleryLayoutTests(unittest.TestCase):
+    def setUp(self):
+        self.gallery = Path(tempfile.mkdtemp())
+
+    def tearDown(self):
+        shutil.rmtree(self.gallery, ignore_errors=True)
+
+    def test_resolves_both_layouts(self):
+        flat = make_item(self.gallery / "cat", "cat")
+        sharded = make_item(folder_path(self.gallery, "dog", "sharded"), "dog")
+        (self.gallery / ".cache").mkdir()
+
+        self.assertEqual(sharded.parent.name, shard_for("dog"))
+        self.assertEqual(resolve_folder(self.gallery, "cat"), flat)
+        self.assertEqual(resolve_folder(self.gallery, "dog"), sharded)
+        for name in ("missing", ".cache", SHARDS_DIRNAME, "..", "_shards/00", ""):
+            self.assertIsNone(resolve_folder(self.gallery, name))
+        self.assertEqual(sorted(entry.name for entry in iter_item_folders(self.gallery)), ["cat", "dog"])
+        self.assertEqual(layout_status(self.gallery), {"sharded": 1, "flat": 1})
+
+    def test_save_uses_sharded_layout_and_avoids_flat_names(self):
+        make_item(self.gallery / "red", "red")
+        image = image_processing.Image.new("RGB", (32, 32), "red")
+        with patch.object(image_processing.config_manager, "get", return_value=str(self.gallery)), \
+                redirect_stdout(io.StringIO()):
+            saved = image_processing.save_to_gallery(image, "red.png", "红色", 32, 32, 4, 1.0, "basic")
+            index = image_processing.get_gallery_index()
+            self.assertIsNotNone(index.get(saved.parent.name))
+            index.close()
+
+        self.assertNotEqual(saved.parent.name, "red")
+        self.assertEqual(saved.parent, folder_path(self.gallery, saved.parent.name, "sharded"))
+
+    def test_collision_fallback_keeps_the_prefix_for_hidden_names(self):
+        image = image_processing.Image.new("RGB", (32, 32), "red")
+        with patch.object(image_processing.config_manager, "get", return_value=str(self.gallery)), \
+                patch.object(image_processing, "get_gallery_index"), redirect_stdout(io.StringIO()):
+            first = image_processing.save_to_gallery(image, ".red.png", "红色", 32, 32, 4, 1.0, "basic")
+            second = image_processing.save_to_gallery(image, ".red.png", "红色", 32, 32, 4, 1.0, "basic")
+
+        self.assertEqual(first.parent.name, "image_.red")
+        self.assertTrue(second.parent.name.startswith("image_.red_"))
+        self.assertEqual(sorted(entry.name for entry in iter_item_folders(self.gallery)),
+                         sorted([first.parent.name, second.parent.name]))
+
+    def test_online_migration_keeps_index_version(self):
+        for number in range(5):
+            make_item(self.gallery / f"item{number}", f"item{number}")
+        recent = self.gallery / "recent"
+        make_item(recent, "recent")
+        os.utime(recent)
+        index = GalleryIndex(self.gallery)
+        try:
+            with redirect_stdout(io.StringIO()):
+                index.ensure_built()
+            version = index.version
+            batches = []
+
+            result = migrate_layout(self.gallery, batch_size=2, pause=0, index=index, progress=batches.append)
+            self.assertEqual(result, {"moved": 5, "skipped": 1, "failed": 0, "total": 6})
+            self.assertEqual(len(batches), 3)
+            self.assertEqual(layout_status(self.gallery), {"sharded": 5, "flat": 1})
+            self.assertEqual((index.count(), index.version), (6, version))
+            self.assertEqual(index.repair()["indexed"], 0)
+
+            result = migrate_layout(self.gallery, target="flat", pause=0, min_age=0, index=index)
+            self.assertEqual(result["moved"], 5)
+            self.assertFalse((self.gallery / SHARDS_DIRNAME).exists())
+            self.assertEqual(index.version, version)
+        finally:
+            index.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,186 @@
+import io
+import json
+import shutil
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from pathlib import Path
+from unittest.mock import patch
+
+import gallery_metadata
+import image_processing
+from gallery_metadata import (
+    METADATA_VERSION, describe_metadata, embed_metadata, load_metadata_bulk, migrate_gallery,
+    read_embedded_metadata, read_folder_metadata,
+)
+
+
+def make_legacy_item(gallery, name, created="2024-05-01 10:00:00"):
+    folder = Path(gallery) / name
+    folder.mkdir()
+    (folder / f"{name}.png").write_bytes(b"png")
+    record = json.dumps({"inputs": {"prompt": name}, "result": f"优化: {name}", "source": "api"}, ensure_ascii=False)
+    (folder / f"{name}_info.txt").write_text(
+        f"图片名称: {name}.png\n提示词: 橘猫: 晒太阳\n图片尺寸: 512x768\n推理步数: 9\n"
+        f"优化模式: basic\n生成时间: 3.50秒\n创建时间: {created}\n优化记录: {record}\n",
+        encoding="utf-8",
+    )
+    return folder
+
+
+class GalleryMetadataTests(unittest.TestCase):
+    def setUp(self):
+        self.gallery = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.gallery, ignore_errors=True)
+
+    def save(self, filename, image=None, **options):
+        image = image or image_processing.Image.new("RGB", (32, 32), "red")
+        with patch.object(image_processing.config_manager, "get", return_value=self.gallery), \
+                patch.object(image_processing, "get_gallery_index"), redirect_stdout(io.StringIO()):
+            return image_processing.save_to_gallery(image, filename, "红色", 32, 32, 4, 1.25, "basic", **options)
+
+    def test_save_embeds_versioned_metadata_in_png(self):
+        saved = self.save(
+            "red.png", seed=42, model="Z-Image-Turbo", timings={"prompt_optimization_seconds": 0.5},
+            optimization_record={"inputs": {"prompt": "红"}, "result": "红色" * 600, "source": "api"},
+        )
+
+        data = read_embedded_metadata(saved)
+        self.assertEqual(data["version"], METADATA_VERSION)
+        self.assertEqual((data["prompt"], data["seed"], data["model"]), ("红色", 42, "Z-Image-Turbo"))
+        self.assertEqual(data["timings"], {"prompt_optimization_seconds": 0.5, "generation_seconds": 1.25})
+        self.assertEqual(data["optimization"]["result"], "红色" * 600)
+        self.assertEqual([path.name for path in saved.parent.iterdir() if not path.suffix == ".webp"], ["red.png"])
+        self.assertEqual(read_folder_metadata(saved.parent)["width"], 32)
+        with image_processing.Image.open(saved) as image:
+            self.assertEqual(image.getpixel((0, 0)), (255, 0, 0))
+
+    def test_save_embeds_xmp_in_jpeg(self):
+        saved = self.save("red.jpg", seed=7)
+        self.assertEqual(read_embedded_metadata(saved)["seed"], 7)
+        self.assertEqual(read_folder_metadata(saved.parent)["prompt"], "红色")
+
+    def test_reader_only_parses_headers(self):
+        saved = self.save("noise.png", image=image_processing.Image.effect_noise((256, 256), 64), seed=1)
+        content = saved.read_bytes()
+        # 截断像素数据后头部仍可读取，说明读取过程不依赖像素解码。
+        saved.write_bytes(content[:content.index(b"IDAT") + 64])
+        self.assertEqual(read_embedded_metadata(saved)["seed"], 1)
+        saved.write_bytes(b"not an image")
+        self.assertIsNone(read_embedded_metadata(saved))
+
+    def test_reads_legacy_info_without_migration(self):
+        folder = make_legacy_item(self.gallery, "cat")
+        metadata = read_folder_metadata(folder)
+
+        self.assertEqual((metadata["image"], metadata["prompt"]), ("cat.png", "橘猫: 晒太阳"))
+        self.assertEqual((metadata["width"], metadata["height"], metadata["steps"]), (512, 768, 9))
+        self.assertEqual(metadata["timings"], {"generation_seconds": 3.5})
+        self.assertEqual(metadata["optimization"]["source"], "api")
+        self.assertIsNone(metadata["seed"])
+        self.assertEqual(describe_metadata(metadata)["创建时间"], "2024-05-01 10:00:00")
+
+    def test_bulk_loader_keeps_input_order(self):
+        folders = [make_legacy_item(self.gallery, f"item{index}") for index in range(40)]
+        folders.insert(3, Path(self.gallery) / "missing")
+
+        results = load_metadata_bulk(folders, workers=8)
+        self.assertIsNone(results[3])
+        self.assertEqual(
+            [result["image"] for result in results if result],
+            [f"item{index}.png" for index in range(40)],
+        )
+
+    def test_migration_is_idempotent(self):
+        folder = make_legacy_item(self.gallery, "cat")
+        make_legacy_item(self.gallery, "dog")
+        before = read_folder_metadata(folder)
+
+        self.assertEqual(migrate_gallery(self.gallery), {"migrated": 2, "skipped": 0, "failed": 0})
+        self.assertEqual(read_folder_metadata(folder), before)
+        self.assertEqual(
+            migrate_gallery(self.gallery, remove_legacy=True), {"migrated": 0, "skipped": 2, "failed": 0}
+        )
+        self.assertFalse((folder / "cat_info.txt").exists())
+        self.assertEqual(read_folder_metadata(folder), before)
+        self.assertEqual(migrate_gallery(self.gallery)["skipped"], 2)
+
+    def test_migration_counts_vanished_images_as_failed(self):
+        make_legacy_item(self.gallery, "cat", created="")
+        make_legacy_item(self.gallery, "dog")
+        find_image = gallery_metadata.find_gallery_image
+
+        def find_then_delete(names):
+            # 模拟图片在列出目录之后、读取修改时间之前被删除。
+            image_name = find_image(names)
+            if image_name == "cat.png":
+                (Path(self.gallery) / "cat" / image_name).unlink()
+            return image_name
+
+        with patch.object(gallery_metadata, "find_gallery_image", find_then_delete), redirect_stdout(io.StringIO()):
+            self.assertEqual(migrate_gallery(self.gallery), {"migrated": 1, "skipped": 0, "failed": 1})
+
+    def test_migration_can_embed_into_images(self):
+        folder = make_legacy_item(self.gallery, "cat")
+        image_processing.Image.new("RGB", (8, 8), "green").save(folder / "cat.png")
+        jpeg_folder = make_legacy_item(self.gallery, "dog")
+        (jpeg_folder / "dog.png").unlink()
+        image_processing.Image.new("RGB", (8, 8), "green").save(jpeg_folder / "dog.jpg")
+        before = read_folder_metadata(folder)
+
+        webp_folder = make_legacy_item(self.gallery, "fox")
+        (webp_folder / "fox.png").unlink()
+        image_processing.Image.new("RGBA", (8, 8), (0, 128, 0, 90)).save(webp_folder / "fox.webp", lossless=True)
+
+        self.assertEqual(migrate_gallery(self.gallery, embed=True)["migrated"], 3)
+        self.assertEqual(sorted(path.name for path in folder.iterdir()), ["cat.png"])
+        # WebP 补写 VP8X 头与 XMP 块，像素数据不重新编码。
+        self.assertEqual(sorted(path.name for path in webp_folder.iterdir()), ["fox.webp"])
+        self.assertEqual(read_embedded_metadata(webp_folder / "fox.webp")["prompt"], "橘猫: 晒太阳")
+        with image_processing.Image.open(webp_folder / "fox.webp") as image:
+            self.assertEqual(image.getpixel((0, 0)), (0, 128, 0, 90))
+        self.assertEqual(read_embedded_metadata(folder / "cat.png"), before)
+        self.assertEqual(read_embedded_metadata(jpeg_folder / "dog.jpg")["prompt"], "橘猫: 晒太阳")
+        with image_processing.Image.open(jpeg_folder / "dog.jpg") as image:
+            image.load()
+
+        # 再次写入会替换而不是追加内嵌元数据。
+        self.assertTrue(embed_metadata(folder / "cat.png", {**before, "seed": 3}))
+        self.assertEqual(read_embedded_metadata(folder / "cat.png")["seed"], 3)
+        self.assertEqual((folder / "cat.png").read_bytes().count(b"zimage:metadata"), 1)
+        self.assertEqual(migrate_gallery(self.gallery, embed=True)["skipped"], 3)
+
+    def test_embed_migration_counts_corrupt_images_as_failed(self):
+        folder = make_legacy_item(self.gallery, "cat")
+        image_processing.Image.new("RGB", (8, 8), "green").save(folder / "cat.png")
+        broken = make_legacy_item(self.gallery, "fox")
+        (broken / "fox.png").unlink()
+        (broken / "fox.webp").write_bytes(b"RIFF\x0c\x00\x00\x00WEBPVP8X\x00\x00\x00\x00")
+
+        with redirect_stdout(io.StringIO()):
+            self.assertEqual(migrate_gallery(self.gallery, embed=True), {"migrated": 1, "skipped": 0, "failed": 1})
+        # 写入失败的作品保留原参数文件。
+        self.assertTrue((broken / "fox_info.txt").exists())
+
+        # 读取参数时目录已被删除的作品跳过。
+        make_legacy_item(self.gallery, "dog")
+        with patch.object(gallery_metadata, "read_folder_metadata", return_value=None), \
+                patch.object(gallery_metadata, "embed_metadata") as embed, redirect_stdout(io.StringIO()):
+            self.assertEqual(migrate_gallery(self.gallery, embed=True)["skipped"], 3)
+        embed.assert_not_called()
+
+    def test_rejects_unknown_versions(self):
+        folder = Path(self.gallery) / "odd"
+        folder.mkdir()
+        (folder / "odd.png").write_bytes(b"png")
+        (folder / "odd_meta.json").write_text('{"version": 0, "prompt": "x"}', encoding="utf-8")
+        with redirect_stdout(io.StringIO()):
+            metadata = read_folder_metadata(folder)
+        self.assertEqual((metadata["image"], metadata["prompt"]), ("odd.png", ""))
+        self.assertEqual(gallery_metadata.upgrade_metadata({"version": 1})["timings"], {})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,116 @@
+import io
+import shutil
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from pathlib import Path
+from unittest.mock import patch
+
+import numpy as np
+from PIL import Image
+
+import gallery_index
+import image_processing
+from gallery_metadata import METADATA_SUFFIX, read_embedded_metadata, read_folder_metadata
+from gallery_placeholders import (
+    backfill_placeholders, compute_placeholder, decode_blurhash, dominant_color, normalize_placeholder,
+)
+
+
+def make_gradient(size=(300, 200)):
+    red = Image.linear_gradient("L").resize(size)
+    blue = Image.linear_gradient("L").rotate(90).resize(size)
+    return Image.merge("RGB", (red, Image.new("L", size, 80), blue))
+
+
+class GalleryPlaceholderTests(unittest.TestCase):
+    def setUp(self):
+        self.gallery = Path(tempfile.mkdtemp())
+
+    def tearDown(self):
+        shutil.rmtree(self.gallery, ignore_errors=True)
+
+    def test_blurhash_round_trip_resembles_image(self):
+        image = make_gradient()
+        placeholder = compute_placeholder(image)
+        # 横图 4×3 个分量，竖图 3×4 个分量。
+        self.assertEqual(len(placeholder["blurhash"]), 28)
+        self.assertEqual(placeholder["blurhash"][0], "L")
+        self.assertEqual(compute_placeholder(image.rotate(90, expand=True))["blurhash"][0], "T")
+
+        decoded = decode_blurhash(placeholder["blurhash"], 30, 20).astype(int)
+        expected = np.asarray(image.resize((30, 20), Image.Resampling.BOX)).astype(int)
+        self.assertLess(np.abs(decoded - expected).mean(), 12)
+        self.assertEqual(image.size, (300, 200))
+
+        uniform = compute_placeholder(Image.new("RGB", (64, 64), (10, 120, 230)))
+        self.assertEqual(uniform["color"], "#0a78e6")
+        decoded = decode_blurhash(uniform["blurhash"], 32, 32).astype(int)
+        self.assertLess(np.abs(decoded - (10, 120, 230)).mean(), 6)
+
+    def test_dominant_color_picks_the_largest_bucket(self):
+        pixels = np.zeros((10, 10, 3), dtype=np.uint8)
+        pixels[:7] = (250, 10, 10)
+        pixels[7:] = (10, 10, 250)
+        pixels[0, 0] = (240, 0, 0)
+        self.assertEqual(dominant_color(pixels), "#fa0a0a")
+
+        transparent = Image.new("RGBA", (40, 20), (0, 200, 0, 255))
+        self.assertEqual(compute_placeholder(transparent)["color"], "#00c800")
+
+    def test_rejects_invalid_placeholders(self):
+        valid = compute_placeholder(make_gradient())
+        self.assertEqual(normalize_placeholder({**valid, "extra": 1}), valid)
+        for value in (None, "L", {"blurhash": valid["blurhash"]}, {**valid, "color": "red"},
+                      {**valid, "color": "#FFFFFF"}, {**valid, "blurhash": valid["blurhash"][:-2]},
+                      {**valid, "blurhash": '"><' + valid["blurhash"][3:]}):
+            self.assertIsNone(normalize_placeholder(value))
+
+    def test_save_stores_placeholder_in_metadata_and_index(self):
+        with patch.object(image_processing.config_manager, "get", return_value=str(self.gallery)), \
+                redirect_stdout(io.StringIO()):
+            saved = image_processing.save_to_gallery(make_gradient(), "grad.png", "渐变", 300, 200, 4, 1.0, "basic")
+            index = gallery_index.get_gallery_index()
+            item = index.get(saved.parent.name)
+            index.close()
+        placeholder = read_embedded_metadata(saved)["placeholder"]
+        self.assertEqual(placeholder, compute_placeholder(make_gradient()))
+        self.assertEqual(item["placeholder"], placeholder)
+
+    def test_backfill_writes_missing_placeholders_in_parallel(self):
+        names = {"embedded": ".png", "sidecar": ".png", "webp": ".webp"}
+        for name, suffix in names.items():
+            folder = self.gallery / name
+            folder.mkdir()
+            make_gradient().save(folder / f"{name}{suffix}")
+        (self.gallery / "sidecar" / f"sidecar{METADATA_SUFFIX}").write_text(
+            '{"version": 1, "prompt": "旁注"}', encoding="utf-8",
+        )
+        (self.gallery / "empty").mkdir()
+        image_path = self.gallery / "embedded" / "embedded.png"
+        modified = image_path.stat().st_mtime_ns
+
+        with redirect_stdout(io.StringIO()):
+            self.assertEqual(backfill_placeholders(self.gallery, workers=4), {"updated": 3, "skipped": 1, "failed": 0})
+        # PNG 与 WebP 写入图片头部且修改时间不变；已有 _meta.json 的作品写入 _meta.json。
+        self.assertIsNotNone(read_embedded_metadata(image_path)["placeholder"])
+        self.assertEqual(image_path.stat().st_mtime_ns, modified)
+        self.assertEqual(read_folder_metadata(self.gallery / "sidecar")["prompt"], "旁注")
+        for name in names:
+            metadata = read_folder_metadata(self.gallery / name)
+            self.assertEqual(normalize_placeholder(metadata["placeholder"]), metadata["placeholder"])
+        self.assertFalse((self.gallery / "webp" / f"webp{METADATA_SUFFIX}").exists())
+        self.assertIsNotNone(read_embedded_metadata(self.gallery / "webp" / "webp.webp")["placeholder"])
+
+        self.assertEqual(backfill_placeholders(self.gallery), {"updated": 0, "skipped": 4, "failed": 0})
+        self.assertEqual(backfill_placeholders(self.gallery, force=True)["updated"], 3)
+
+        broken = self.gallery / "broken"
+        broken.mkdir()
+        (broken / "broken.png").write_bytes(b"not a png")
+        with redirect_stdout(io.StringIO()):
+            self.assertEqual(backfill_placeholders(self.gallery)["failed"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
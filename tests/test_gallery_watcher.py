@@ -0,0 +1,194 @@
+import io
+import shutil
+import tempfile
+import time
+import unittest
+from contextlib import redirect_stdout
+from pathlib import Path
+from unittest.mock import patch
+
+import gallery_watcher
+from gallery_index import GalleryIndex
+from gallery_layout import folder_path, shard_for
+from gallery_watcher import GalleryWatcher, InotifySource, PollingSource
+
+
+def make_item(gallery, name, created="2024-05-01 10:00:00"):
+    folder = Path(gallery) / name
+    folder.mkdir()
+    (folder / f"{name}.png").write_bytes(b"png")
+    (folder / f"{name}_info.txt").write_text(
+        f"图片名称: {name}.png\n提示词: 一只猫\n图片尺寸: 512x768\n创建时间: {created}\n", encoding="utf-8"
+    )
+    return folder
+
+
+def make_sharded_item(gallery, name):
+    parent = folder_path(gallery, name, "sharded").parent
+    parent.mkdir(parents=True, exist_ok=True)
+    return make_item(parent, name)
+
+
+def wait_for(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.02)
+    return predicate()
+
+
+def inotify_available():
+    workdir = tempfile.mkdtemp()
+    try:
+        InotifySource(Path(workdir)).close()
+        return True
+    except OSError:
+        return False
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+class RecordingIndex:
+    """只记录刷新调用的索引替身。"""
+
+    def __init__(self, gallery_dir):
+        self.gallery_dir = Path(gallery_dir)
+        self.refreshed = []
+        self.repairs = 0
+
+    def refresh(self, names):
+        self.refreshed.append(set(names))
+        return {"indexed": 0, "removed": 0, "unchanged": len(names)}
+
+    def repair(self):
+        self.repairs += 1
+        return {"indexed": 0, "removed": 0, "total": 0}
+
+
+class GalleryWatcherTests(unittest.TestCase):
+    def setUp(self):
+        self.gallery = tempfile.mkdtemp()
+        self.watcher = None
+
+    def tearDown(self):
+        if self.watcher is not None:
+            self.watcher.stop()
+        shutil.rmtree(self.gallery, ignore_errors=True)
+
+    def start(self, index, **kwargs):
+        self.watcher = GalleryWatcher(index, **kwargs)
+        with redirect_stdout(io.StringIO()):
+            return self.watcher.start()
+
+    def test_polling_source_reports_changed_and_removed_folders(self):
+        make_item(self.gallery, "cat")
+        source = PollingSource(Path(self.gallery), interval=0.1)
+        make_item(self.gallery, "dog")
+        shutil.rmtree(Path(self.gallery) / "cat")
+        (Path(self.gallery) / ".tmp").mkdir()
+
+        changed = set()
+        wait_for(lambda: changed.update(source.poll(0.2)[0]) or changed)
+        source.close()
+        self.assertEqual(changed, {"cat", "dog"})
+
+    def test_polling_source_detects_rewrites_inside_folders(self):
+        folder = make_item(self.gallery, "cat")
+        make_item(self.gallery, "dog")
+        info = folder / "cat_info.txt"
+        source = PollingSource(Path(self.gallery), interval=0.1)
+        folder_mtime = folder.stat().st_mtime_ns
+        # 原地改写文件，作品目录本身的修改时间不变。
+        info.write_text(info.read_text(encoding="utf-8") + "随机种子: 7\n", encoding="utf-8")
+        self.assertEqual(folder.stat().st_mtime_ns, folder_mtime)
+
+        changed = set()
+        wait_for(lambda: changed.update(source.poll(0.2)[0]) or changed)
+        source.close()
+        self.assertEqual(changed, {"cat"})
+
+    def test_polling_source_only_relists_changed_shards(self):
+        for name in ("cat", "dog", "fox"):
+            make_sharded_item(self.gallery, name)
+        source = PollingSource(Path(self.gallery), interval=0.1)
+        # 新作品落在已有的分片中，只有这个分片的修改时间变化。
+        name = next(f"cat{number}" for number in range(10000) if shard_for(f"cat{number}") == shard_for("cat"))
+        added = make_sharded_item(self.gallery, name)
+
+        listed = []
+        list_subdirs = gallery_watcher.list_subdirs
+
+        def recording_list_subdirs(path):
+            listed.append(Path(path))
+            return list_subdirs(path)
+
+        changed = set()
+        with patch.object(gallery_watcher, "list_subdirs", recording_list_subdirs), \
+                patch.object(PollingSource, "ITEMS_PER_POLL", 1):
+            wait_for(lambda: changed.update(source.poll(0.2)[0]) or changed)
+        source.close()
+        self.assertEqual(changed, {name})
+        self.assertEqual(set(listed), {added.parent})
+
+    def test_polling_backend_updates_index(self):
+        index = GalleryIndex(self.gallery)
+        try:
+            with redirect_stdout(io.StringIO()):
+                index.ensure_built()
+                self.assertEqual(self.start(index, backend="polling", debounce=0.05, poll_interval=0.1), "polling")
+                make_item(self.gallery, "cat")
+                self.assertTrue(wait_for(lambda: index.get("cat") is not None))
+                shutil.rmtree(Path(self.gallery) / "cat")
+                self.assertTrue(wait_for(lambda: index.get("cat") is None))
+        finally:
+            self.watcher.stop()
+            index.close()
+
+    @unittest.skipUnless(inotify_available(), "系统不支持 inotify")
+    def test_inotify_coalesces_bursts_and_ignores_thumbnails(self):
+        index = RecordingIndex(self.gallery)
+        make_item(self.gallery, "cat")
+        self.assertEqual(self.start(index, backend="inotify", debounce=0.3), "inotify")
+
+        for number in range(20):
+            make_item(self.gallery, f"item{number}")
+        self.assertTrue(wait_for(lambda: index.refreshed))
+        time.sleep(0.4)
+        self.assertLessEqual(len(index.refreshed), 2)
+        self.assertEqual(set().union(*index.refreshed), {f"item{number}" for number in range(20)})
+
+        index.refreshed.clear()
+        cat = Path(self.gallery) / "cat"
+        (cat / "cat_thumb_256.webp").write_bytes(b"webp")
+        (cat / ".cat.png.tmp").write_bytes(b"png")
+        (Path(self.gallery) / ".cache").mkdir()
+        time.sleep(0.6)
+        self.assertEqual(index.refreshed, [])
+
+        (cat / "cat_info.txt").write_text("提示词: 一只狗\n", encoding="utf-8")
+        self.assertTrue(wait_for(lambda: index.refreshed))
+        self.assertEqual(index.refreshed, [{"cat"}])
+
+    @unittest.skipUnless(inotify_available(), "系统不支持 inotify")
+    def test_inotify_follows_items_into_shards(self):
+        index = RecordingIndex(self.gallery)
+        make_item(self.gallery, "cat")
+        self.start(index, backend="inotify", debounce=0.1)
+
+        # 分片目录在监听开始后才出现，迁移把作品移入其中。
+        migrated = folder_path(self.gallery, "cat", "sharded")
+        migrated.parent.mkdir(parents=True)
+        (Path(self.gallery) / "cat").rename(migrated)
+        self.assertTrue(wait_for(lambda: index.refreshed))
+        self.assertEqual(set().union(*index.refreshed), {"cat"})
+
+        index.refreshed.clear()
+        (migrated / "cat_info.txt").write_text("提示词: 一只狗\n", encoding="utf-8")
+        make_item(migrated.parent, "dog")
+        self.assertTrue(wait_for(lambda: len(set().union(*index.refreshed)) == 2))
+        self.assertEqual(set().union(*index.refreshed), {"cat", "dog"})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,75 @@
+import sys
+import threading
+import types
+import unittest
+from unittest.mock import patch
+
+from generation_worker import GenerationWorker, WorkerState, create_worker_state
+
+
+class FakeDeviceObject:
+    def __init__(self, device):
+        self.device = device
+
+
+class GenerationWorkerTests(unittest.TestCase):
+    def test_jobs_share_persistent_worker_state(self):
+        seen = []
+
+        def handler(job, state):
+            seen.append((job.task_id, job.args, id(state), threading.current_thread().name))
+
+        worker = GenerationWorker(handler, state_factory=lambda index: WorkerState(index=index))
+        for index in range(3):
+            worker.submit(f"task-{index}", index)
+        worker.shutdown()
+
+        self.assertEqual([item[0] for item in seen], ["task-0", "task-1", "task-2"])
+        self.assertEqual(len({item[2] for item in seen}), 1)
+        self.assertEqual(len({item[3] for item in seen}), 1)
+
+    def test_state_follows_the_pipeline_execution_device(self):
+        fake_torch = types.SimpleNamespace(
+            Generator=lambda device: FakeDeviceObject(device),
+            cuda=types.SimpleNamespace(
+                is_available=lambda: True, device_count=lambda: 2, Stream=lambda device: FakeDeviceObject(device),
+            ),
+        )
+        with patch.dict(sys.modules, {"torch": fake_torch}):
+            # 第二个工作线程也跟随管线所在的 cuda:0，而不是按线程编号分到 cuda:1。
+            state = create_worker_state(1)
+            self.assertEqual((state.device, state.generator.device, state.stream), ("cpu", "cpu", None))
+
+            state.bind_device("cuda:0")
+            generator, stream = state.generator, state.stream
+            self.assertEqual((generator.device, stream.device), ("cuda:0", "cuda:0"))
+            state.bind_device("cuda:0")
+            self.assertIs(state.generator, generator)
+            self.assertIs(state.stream, stream)
+
+            state.bind_device(None)
+            self.assertEqual((state.device, state.generator.device, state.stream), ("cpu", "cpu", None))
+
+    def test_shutdown_drains_queue_and_rejects_new_jobs(self):
+        release = threading.Event()
+        finished = []
+
+        def handler(job, _state):
+            release.wait(5)
+            if job.task_id == "boom":
+                raise RuntimeError("handler bug")
+            finished.append(job.task_id)
+
+        worker = GenerationWorker(handler, state_factory=lambda index: WorkerState(index=index))
+        for task_id in ("first", "boom", "second"):
+            worker.submit(task_id)
+        release.set()
+        worker.shutdown()
+
+        self.assertEqual(finished, ["first", "second"])
+        with self.assertRaises(RuntimeError):
+            worker.submit("late")
+
+
+if __name__ == "__main__":
+    unittest.main()
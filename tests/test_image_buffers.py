@@ -0,0 +1,85 @@
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+from image_buffers import ImageBufferPool, to_shared_image
+from image_encoding import ENCODING_POLICIES
+from image_processing import create_gallery_thumbnail, get_thumbnail_path
+
+
+def make_frame(height=48, width=64):
+    # 管线的 numpy 输出：float32，范围 [0, 1]。
+    return np.random.default_rng(7).random((height, width, 3), dtype=np.float32)
+
+
+def diffusers_pil(frame):
+    # diffusers numpy_to_pil 的换算方式，作为对照。
+    return Image.fromarray((frame * 255).round().astype("uint8"))
+
+
+class SharedImageTests(unittest.TestCase):
+    def test_matches_pipeline_pil_output_and_shares_buffer(self):
+        frame = make_frame()
+        expected = diffusers_pil(frame.copy())
+
+        image, buffer = to_shared_image(frame, ImageBufferPool())
+
+        self.assertEqual(image.size, (64, 48))
+        self.assertEqual(image.convert("RGB").tobytes(), expected.tobytes())
+        buffer[0, 0, :3] = (1, 2, 3)
+        self.assertEqual(image.getpixel((0, 0))[:3], (1, 2, 3))
+
+    def test_pil_and_single_channel_frames_are_not_pooled(self):
+        original = Image.new("RGB", (8, 8))
+        self.assertEqual(to_shared_image(original), (original, None))
+
+        image, buffer = to_shared_image(np.full((8, 8, 1), 0.5, dtype=np.float32))
+        self.assertIsNone(buffer)
+        self.assertEqual((image.mode, image.getpixel((0, 0))), ("L", 128))
+
+    def test_pool_reuses_released_buffers_by_shape(self):
+        pool = ImageBufferPool(max_free=1)
+        first = pool.acquire(48, 64)
+        second = pool.acquire(48, 64)
+        self.assertIsNot(first, second)
+
+        pool.release(first)
+        self.assertIs(pool.acquire(48, 64), first)
+        pool.release(first)
+        pool.release(second)
+        self.assertEqual(pool.free_count, 1)
+        self.assertIsNot(pool.acquire(32, 32), second)
+
+
+class SharedImageEncodingTests(unittest.TestCase):
+    def setUp(self):
+        self.workdir = Path(tempfile.mkdtemp())
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+    def test_encoders_and_thumbnails_read_the_shared_image(self):
+        frame = make_frame(900, 1200)
+        expected = diffusers_pil(frame.copy())
+        image, _ = to_shared_image(frame)
+
+        for policy in ENCODING_POLICIES.values():
+            path = self.workdir / f"{policy.name}{policy.extension}"
+            policy.save(image, path)
+            with Image.open(path) as saved:
+                self.assertEqual((saved.mode, saved.size), ("RGB", (1200, 900)))
+                if policy.name.startswith("png"):
+                    self.assertEqual(saved.tobytes(), expected.tobytes())
+
+        image_path = self.workdir / "cat.png"
+        create_gallery_thumbnail(image, image_path, sizes=[256, 640])
+        with Image.open(get_thumbnail_path(image_path, 256)) as thumbnail:
+            self.assertEqual((thumbnail.mode, thumbnail.size), ("RGB", (256, 192)))
+
+
+if __name__ == "__main__":
+    unittest.main()
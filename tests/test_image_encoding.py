@@ -0,0 +1,83 @@
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from PIL import Image
+
+from gallery_metadata import build_metadata, embedded_save_options, find_gallery_image, read_embedded_metadata
+from image_encoding import (
+    ENCODING_POLICIES, THUMBNAIL_POLICY, encode_many, get_encoding_names, output_extension, resolve_policy,
+)
+
+
+class ResolvePolicyTests(unittest.TestCase):
+    def test_auto_follows_filename_extension(self):
+        with patch("image_encoding.config_manager.get", return_value="auto"):
+            self.assertEqual(resolve_policy(None, "cat.png").name, "png")
+            self.assertEqual(resolve_policy(None, "cat.JPEG").name, "jpeg")
+            self.assertEqual(resolve_policy(None, "cat.webp").name, "webp")
+            self.assertEqual(resolve_policy(None, "cat").name, "png")
+
+    def test_explicit_and_configured_policies(self):
+        self.assertEqual(resolve_policy("png-fast", "cat.png").name, "png-fast")
+        with patch("image_encoding.config_manager.get", return_value="jpeg"):
+            self.assertEqual(resolve_policy(None, "cat.png").name, "jpeg")
+        # 配置写错时退回按扩展名选择，请求中写错则报错。
+        with patch("image_encoding.config_manager.get", return_value="gif"):
+            self.assertEqual(resolve_policy(None, "cat.png").name, "png")
+        with self.assertRaises(ValueError):
+            resolve_policy("gif", "cat.png")
+        self.assertEqual(get_encoding_names()[0], "auto")
+
+    def test_output_extension(self):
+        self.assertEqual(output_extension(ENCODING_POLICIES["jpeg"], "cat.jpeg"), ".jpeg")
+        self.assertEqual(output_extension(ENCODING_POLICIES["webp"], "cat.png"), ".webp")
+        self.assertEqual(output_extension(ENCODING_POLICIES["png-fast"], "cat.PNG"), ".PNG")
+        self.assertEqual(output_extension(ENCODING_POLICIES["jpeg"], "cat"), ".jpg")
+
+
+class EncodeManyTests(unittest.TestCase):
+    def setUp(self):
+        self.workdir = Path(tempfile.mkdtemp())
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+    def test_parallel_results_keep_input_order(self):
+        jobs = [
+            (Image.new("RGBA", (64 * index, 48), "teal"), self.workdir / f"out{index}.{policy.extension}",
+             policy, {})
+            for index, policy in enumerate(ENCODING_POLICIES.values(), start=1)
+        ]
+        paths = encode_many(jobs, workers=3)
+
+        self.assertEqual(paths, [path for _, path, _, _ in jobs])
+        for index, (path, policy) in enumerate(zip(paths, ENCODING_POLICIES.values()), start=1):
+            with Image.open(path) as image:
+                self.assertEqual(image.format, policy.format)
+                self.assertEqual(image.size, (64 * index, 48))
+        self.assertEqual(sorted(p.name for p in self.workdir.iterdir()), sorted(p.name for p in paths))
+
+    def test_failed_encode_keeps_existing_file(self):
+        target = self.workdir / "thumb.webp"
+        target.write_bytes(b"old")
+        with self.assertRaises(Exception):
+            encode_many([(Image.new("RGB", (8, 8)), target, THUMBNAIL_POLICY, {"quality": "bad"})], workers=1)
+        self.assertEqual(target.read_bytes(), b"old")
+        self.assertEqual(list(self.workdir.iterdir()), [target])
+
+    def test_webp_original_embeds_metadata(self):
+        path = self.workdir / "cat.webp"
+        metadata = build_metadata(path.name, "一只猫", 32, 32, 9, "basic", seed=7)
+        encode_many([(Image.new("RGB", (32, 32), "gray"), path, ENCODING_POLICIES["webp"],
+                      embedded_save_options(path, metadata))])
+
+        self.assertEqual(read_embedded_metadata(path)["prompt"], "一只猫")
+        self.assertEqual(read_embedded_metadata(path)["seed"], 7)
+        self.assertEqual(find_gallery_image({"cat_thumb.webp", "cat_thumb_256.webp", "cat.webp"}), "cat.webp")
+
+
+if __name__ == "__main__":
+    unittest.main()
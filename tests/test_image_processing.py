@@ -6,11 +6,14 @@ from pathlib import Path
 from unittest.mock import patch
 
 import image_processing
+from gallery_layout import iter_item_folders
 from PIL import Image
 
 
 class FakeImage:
-    def save(self, path):
+    mode = "RGB"
+
+    def save(self, path, **_options):
         Path(path).write_bytes(b"image")
 
 
@@ -28,6 +31,49 @@ class ImageProcessingTests(unittest.TestCase):
                 self.assertLessEqual(thumbnail.width, 640)
                 self.assertLessEqual(thumbnail.height, 640)
 
+    def test_thumbnail_ladder_from_one_decode(self):
+        with tempfile.TemporaryDirectory() as folder:
+            image_path = Path(folder) / "wide.png"
+            Image.new("RGB", (2000, 1000), "blue").save(image_path)
+            with patch.object(image_processing.config_manager, "get", return_value=[1280, 256, 99999, "x"]):
+                self.assertEqual(image_processing.get_thumbnail_sizes(), (256, 640, 1280))
+                primary = image_processing.create_gallery_thumbnail(image_path, image_path)
+
+            self.assertEqual(primary, Path(folder) / "wide_thumb.webp")
+            for size, expected in ((256, (256, 128)), (640, (640, 320)), (1280, (1280, 640))):
+                with Image.open(image_processing.get_thumbnail_path(image_path, size)) as thumbnail:
+                    self.assertEqual(thumbnail.size, expected)
+            self.assertEqual(
+                image_processing.get_thumbnail_widths(2000, 1000, (256, 640, 1280)),
+                [(256, 256), (640, 640), (1280, 1280)],
+            )
+            # 超过原图的尺寸与原图同宽，srcset 中只保留一档。
+            self.assertEqual(
+                image_processing.get_thumbnail_widths(500, 1000, (256, 640, 1280)), [(256, 128), (640, 320), (1280, 500)]
+            )
+            self.assertEqual(image_processing.get_thumbnail_widths(300, 200, (256, 640, 1280)), [(256, 256), (640, 300)])
+            self.assertEqual(image_processing.get_thumbnail_widths(None, None), [])
+
+    def test_fast_path_handles_orientation_and_jpeg_draft(self):
+        with tempfile.TemporaryDirectory() as folder:
+            # 横向存储、EXIF 方向为 6（顺时针旋转 90°）的 JPEG，校正后应为竖图。
+            image_path = Path(folder) / "photo.jpg"
+            exif = Image.Exif()
+            exif[0x0112] = 6
+            Image.new("RGB", (3200, 1600), "green").save(image_path, exif=exif)
+            image_processing.create_gallery_thumbnail(image_path, image_path, sizes=(256, 640))
+            with Image.open(image_processing.get_thumbnail_path(image_path)) as thumbnail:
+                self.assertEqual(thumbnail.size, (320, 640))
+            with Image.open(image_processing.get_thumbnail_path(image_path, 256)) as thumbnail:
+                self.assertEqual(thumbnail.size, (128, 256))
+
+            # 内存中的图像不会被缩放或复制后修改。
+            source = Image.new("P", (900, 300))
+            image_processing.create_gallery_thumbnail(source, Path(folder) / "palette.png", sizes=(640,))
+            self.assertEqual((source.size, source.mode), ((900, 300), "P"))
+            with Image.open(Path(folder) / "palette_thumb.webp") as thumbnail:
+                self.assertEqual((thumbnail.size, thumbnail.mode), ((640, 213), "RGB"))
+
     def test_cancelled_save_removes_partial_folder(self):
         calls = 0
 
@@ -45,7 +91,9 @@ class ImageProcessingTests(unittest.TestCase):
                             FakeImage(), "test.png", "prompt", 1024, 1024, 9, 1.0, "basic",
                             cancellation_check=cancel_after_save,
                         )
-            self.assertEqual(list(Path(gallery).iterdir()), [])
+            # 分片目录可以保留，作品目录与其中的文件都应删除。
+            self.assertEqual(list(iter_item_folders(gallery)), [])
+            self.assertEqual([path for path in Path(gallery).rglob("*") if not path.is_dir()], [])
 
 
 if __name__ == "__main__":
@@ -0,0 +1,158 @@
+import io
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from contextlib import redirect_stdout
+from pathlib import Path
+from unittest.mock import patch
+
+from PIL import Image, ImageFilter
+
+import image_variants
+from image_variants import VariantCache, get_variant_formats, negotiate_format
+
+
+def make_source(folder, name="cat.png", seed=0):
+    folder.mkdir(parents=True, exist_ok=True)
+    path = folder / name
+    noise = Image.effect_noise((256, 256), 40 + seed).filter(ImageFilter.GaussianBlur(1))
+    Image.merge("RGB", (noise, Image.linear_gradient("L").resize((256, 256)), noise)).save(path)
+    return path
+
+
+class ImageVariantTests(unittest.TestCase):
+    def setUp(self):
+        self.workdir = Path(tempfile.mkdtemp())
+        self.source = make_source(self.workdir / "gallery" / "cat")
+        self.cache = VariantCache(self.workdir / "variants")
+        self.webp = next(variant for variant in get_variant_formats() if variant.name == "webp")
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+    def test_negotiates_only_explicitly_accepted_formats(self):
+        with patch.object(image_variants.config_manager, "get", return_value={"webp": 80, "jpeg": 90, "avif": 0}):
+            self.assertEqual([variant.name for variant in get_variant_formats()], ["webp"])
+        with patch.object(image_variants.config_manager, "get", return_value="invalid"):
+            formats = get_variant_formats()
+        self.assertEqual(formats[-1].name, "webp")
+
+        self.assertEqual(negotiate_format(["image/webp", "*/*"], formats), formats[-1])
+        self.assertIsNone(negotiate_format(["*/*", "image/*", "image/png"], formats))
+        self.assertEqual(negotiate_format(["image/avif", "image/webp"], formats), formats[0])
+        self.assertIsNone(negotiate_format(["image/webp"], []))
+
+    def test_encodes_once_and_reuses_variant(self):
+        path = self.cache.get(self.source, self.webp)
+        self.assertEqual(path.suffix, ".webp")
+        with Image.open(path) as variant:
+            self.assertEqual((variant.format, variant.size), ("WEBP", (256, 256)))
+        self.assertLess(path.stat().st_size, self.source.stat().st_size)
+        modified = path.stat().st_mtime_ns
+
+        self.assertEqual(self.cache.get(self.source, self.webp), path)
+        self.assertEqual((self.cache.stats["encoded"], self.cache.stats["hits"]), (1, 1))
+        # 命中只更新访问时间，修改时间（ETag 的来源）不变。
+        self.assertEqual(path.stat().st_mtime_ns, modified)
+
+        # 原图改动后生成新的变体。
+        make_source(self.source.parent, seed=10)
+        os.utime(self.source, ns=(time.time_ns(), time.time_ns() + 10**9))
+        self.assertNotEqual(self.cache.get(self.source, self.webp), path)
+
+    def test_concurrent_requests_share_one_encode(self):
+        started = threading.Event()
+        release = threading.Event()
+        original = image_variants.EncodingPolicy.save
+
+        def slow_save(policy, image, path, **extra):
+            started.set()
+            release.wait(5)
+            original(policy, image, path, **extra)
+
+        results = []
+        with patch.object(image_variants.EncodingPolicy, "save", slow_save):
+            threads = [threading.Thread(target=lambda: results.append(self.cache.get(self.source, self.webp))) for _ in range(4)]
+            threads[0].start()
+            started.wait(5)
+            for thread in threads[1:]:
+                thread.start()
+            time.sleep(0.1)
+            release.set()
+            for thread in threads:
+                thread.join(5)
+
+        self.assertEqual(len(set(results)), 1)
+        self.assertEqual((self.cache.stats["encoded"], self.cache.stats["shared"]), (1, 3))
+
+    def test_interrupted_encode_releases_waiters(self):
+        started = threading.Event()
+        release = threading.Event()
+
+        def interrupted_save(policy, image, path, **extra):
+            started.set()
+            release.wait(5)
+            raise KeyboardInterrupt
+
+        results, errors = [], []
+
+        def owner():
+            try:
+                self.cache.get(self.source, self.webp)
+            except KeyboardInterrupt as error:
+                errors.append(error)
+
+        with patch.object(image_variants.EncodingPolicy, "save", interrupted_save):
+            first = threading.Thread(target=owner, daemon=True)
+            first.start()
+            started.wait(5)
+            waiter = threading.Thread(target=lambda: results.append(self.cache.get(self.source, self.webp)), daemon=True)
+            waiter.start()
+            time.sleep(0.1)
+            release.set()
+            first.join(5)
+            waiter.join(5)
+
+        # 发起转码的线程收到中断，等待者改为提供原图。
+        self.assertEqual(len(errors), 1)
+        self.assertEqual(results, [None])
+        self.assertEqual(self.cache._pending, {})
+
+    def test_serves_original_when_variant_is_not_smaller(self):
+        # 质量很低的 JPEG 转为 WebP 反而更大。
+        low = self.workdir / "gallery" / "low" / "low.jpg"
+        low.parent.mkdir(parents=True)
+        Image.effect_noise((64, 64), 60).convert("RGB").save(low, quality=5)
+        self.assertIsNone(self.cache.get(low, self.webp))
+        self.assertIsNone(self.cache.get(low, self.webp))
+        self.assertEqual((self.cache.stats["encoded"], self.cache.stats["hits"]), (0, 1))
+
+        broken = self.workdir / "gallery" / "broken" / "broken.png"
+        broken.parent.mkdir(parents=True)
+        broken.write_bytes(b"not a png")
+        with redirect_stdout(io.StringIO()):
+            self.assertIsNone(self.cache.get(broken, self.webp))
+        self.assertEqual(self.cache.stats["failed"], 1)
+
+    def test_evicts_least_recently_used_variants(self):
+        sources = [make_source(self.workdir / "gallery" / f"item{number}", seed=number) for number in range(4)]
+        first = self.cache.get(sources[0], self.webp)
+        self.cache.max_bytes = int(first.stat().st_size * 2.5)
+        second = self.cache.get(sources[1], self.webp)
+        # 访问第一张，使第二张成为最久未使用的。
+        os.utime(second, ns=(time.time_ns() - 10**9, second.stat().st_mtime_ns))
+        self.assertEqual(self.cache.get(sources[0], self.webp), first)
+        third = self.cache.get(sources[2], self.webp)
+
+        self.assertTrue(first.exists())
+        self.assertTrue(third.exists())
+        self.assertFalse(second.exists())
+        self.assertEqual(self.cache.stats["evicted"], 1)
+        self.assertLessEqual(self.cache.usage()["bytes"], self.cache.max_bytes)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,103 @@
+import io
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+import prompt_optimizer
+from prompt_cache import PromptCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class PromptCacheTests(unittest.TestCase):
+    def test_memory_lru_and_disk_tier(self):
+        with tempfile.TemporaryDirectory() as folder:
+            db_path = Path(folder) / "cache.sqlite3"
+            cache = PromptCache(db_path, memory_entries=1)
+            cache.put("a", "first")
+            cache.put("b", "second")
+
+            self.assertEqual(cache.get("a"), "first")
+            self.assertEqual(cache.stats()["disk_hits"], 1)
+            self.assertEqual(cache.get("a"), "first")
+            self.assertEqual(cache.stats()["memory_hits"], 1)
+            cache.close()
+
+            reopened = PromptCache(db_path)
+            self.assertEqual(reopened.get("b"), "second")
+            reopened.close()
+
+    def test_entries_expire_after_ttl(self):
+        clock = FakeClock()
+        cache = PromptCache(memory_entries=4, ttl_seconds=60, clock=clock)
+        cache.put("key", "value")
+        clock.now += 61
+        self.assertIsNone(cache.get("key"))
+        self.assertEqual(cache.stats()["misses"], 1)
+
+    def test_bulk_put_writes_disk_only_in_one_pass(self):
+        clock = FakeClock()
+        with tempfile.TemporaryDirectory() as folder:
+            cache = PromptCache(Path(folder) / "cache.sqlite3", memory_entries=2, disk_entries=3,
+                                ttl_seconds=100, clock=clock)
+            cache.put("hot", "live")
+            written = cache.put_many([
+                ("hot", "old", 990.0),
+                ("a", "1", 950.0),
+                ("b", "2", 960.0),
+                ("c", "3", 970.0),
+                ("expired", "x", 850.0),
+                ("empty", "", 999.0),
+            ])
+            # 同键已有条目保持不变；容量只剩两个位置时只写入最新的两条。
+            self.assertEqual(written, 2)
+            self.assertEqual(cache.stats()["memory_entries"], 1)
+            self.assertEqual(cache.get("hot"), "live")
+            self.assertEqual((cache.get("c"), cache.get("b"), cache.get("expired")), ("3", "2", None))
+            self.assertIsNone(cache.get("a"))
+
+            # 磁盘已满时比最旧条目还旧的条目不再写入。
+            self.assertEqual(cache.put_many([("older", "0", 940.0)]), 0)
+            cache.close()
+
+    def test_optimizer_reuses_cached_result_for_equivalent_input(self):
+        response = MagicMock(status_code=200)
+        response.json.return_value = {"choices": [{"message": {"content": "优化结果"}}]}
+        cache = PromptCache()
+        with patch.object(prompt_optimizer, "prompt_cache", cache), \
+                patch.object(prompt_optimizer.config_manager, "get", side_effect=lambda key, default=None: "key" if key == "deepseek_api_key" else default), \
+                patch.object(prompt_optimizer.http_session, "post", return_value=response) as post, \
+                redirect_stdout(io.StringIO()):
+            first = prompt_optimizer.optimize_prompt_detailed("一只猫", art_style="水彩")
+            second = prompt_optimizer.optimize_prompt_detailed("  一只猫 ", art_style="水彩")
+
+        self.assertEqual(first, ("优化结果", "api"))
+        self.assertEqual(second, ("优化结果", "cache"))
+        self.assertEqual(post.call_count, 1)
+
+    def test_prewarm_reads_gallery_optimization_records(self):
+        with tempfile.TemporaryDirectory() as gallery:
+            item = Path(gallery) / "cat"
+            item.mkdir()
+            (item / "cat_info.txt").write_text(
+                '提示词: 优化结果\n优化记录: {"inputs": {"prompt": "一只猫", "art_style": "水彩"}, '
+                '"result": "优化结果", "source": "api"}\n',
+                encoding="utf-8",
+            )
+            cache = PromptCache()
+            with patch.object(prompt_optimizer, "prompt_cache", cache):
+                self.assertEqual(prompt_optimizer.prewarm_cache_from_gallery(gallery), 1)
+                key = prompt_optimizer.optimization_cache_key("一只猫", art_style="水彩")
+                self.assertEqual(cache.get(key), "优化结果")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,130 @@
+import io
+import json
+import unittest
+from contextlib import redirect_stdout
+from unittest.mock import MagicMock, patch
+
+import prompt_optimizer
+from circuit_breaker import CircuitBreaker
+from prompt_cache import PromptCache
+
+
+def sse_lines(*deltas):
+    lines = [": keep-alive", ""]
+    for delta in deltas:
+        event = {"choices": [{"delta": {"content": delta}}]}
+        lines.extend([f"data: {json.dumps(event, ensure_ascii=False)}", ""])
+    lines.append("data: [DONE]")
+    return lines
+
+
+def stream_response(lines, status_code=200):
+    response = MagicMock()
+    response.status_code = status_code
+    response.iter_lines.return_value = iter(lines)
+    response.__enter__.return_value = response
+    return response
+
+
+class StreamOptimizedPromptTests(unittest.TestCase):
+    def setUp(self):
+        self.cache = PromptCache()
+        self.breaker = CircuitBreaker()
+        self.post = MagicMock()
+        self.patches = [
+            patch.object(prompt_optimizer, "get_api_settings", return_value=("key", "http://stub")),
+            patch.object(prompt_optimizer, "prompt_cache", self.cache),
+            patch.object(prompt_optimizer, "deepseek_breaker", self.breaker),
+            patch.object(prompt_optimizer.http_session, "post", self.post),
+        ]
+        for item in self.patches:
+            item.start()
+
+    def tearDown(self):
+        for item in self.patches:
+            item.stop()
+
+    def collect(self, *args, **kwargs):
+        with redirect_stdout(io.StringIO()):
+            return list(prompt_optimizer.stream_optimized_prompt(*args, **kwargs))
+
+    def test_deltas_are_relayed_then_cached(self):
+        self.post.return_value = stream_response(sse_lines("一只", "橘猫", "，水彩风格 "))
+
+        events = self.collect("猫", art_style="水彩")
+
+        self.assertEqual([event["text"] for event in events[:-1]], ["一只", "橘猫", "，水彩风格 "])
+        self.assertEqual(events[-1], {"type": "done", "optimized_prompt": "一只橘猫，水彩风格", "source": "api"})
+        self.assertTrue(self.post.call_args.kwargs["json"]["stream"])
+        self.assertEqual(self.breaker.snapshot()["successes"], 1)
+
+        # 第二次直接命中缓存，不再请求上游。
+        events = self.collect("猫", art_style="水彩")
+        self.assertEqual(events, [{"type": "done", "optimized_prompt": "一只橘猫，水彩风格", "source": "cache"}])
+        self.assertEqual(self.post.call_count, 1)
+
+    def test_empty_stream_falls_back_without_caching(self):
+        self.post.return_value = stream_response(sse_lines(" "))
+
+        events = self.collect("猫", lighting="黄昏")
+
+        self.assertEqual(events[-1]["source"], "fallback")
+        self.assertEqual(events[-1]["optimized_prompt"], "猫, 黄昏 lighting")
+        self.assertEqual(self.cache.stats()["stores"], 0)
+        self.assertEqual(self.breaker.snapshot()["failures"], 1)
+
+    def test_http_error_falls_back(self):
+        self.post.return_value = stream_response([], status_code=503)
+
+        events = self.collect("猫")
+
+        self.assertEqual(events, [{"type": "done", "optimized_prompt": "猫", "source": "fallback"}])
+        self.assertEqual(self.breaker.snapshot()["failures"], 1)
+
+    def test_client_disconnect_does_not_cache_partial_text(self):
+        self.post.return_value = stream_response(sse_lines("一只", "橘猫"))
+
+        stream = prompt_optimizer.stream_optimized_prompt("猫")
+        self.assertEqual(next(stream)["text"], "一只")
+        stream.close()
+
+        self.assertEqual(self.cache.stats()["stores"], 0)
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+        self.assertEqual((self.breaker.snapshot()["successes"], self.breaker.snapshot()["failures"]), (0, 0))
+
+    def test_client_disconnect_releases_half_open_probe_without_closing(self):
+        clock = [0.0]
+        self.breaker = CircuitBreaker(min_requests=1, open_seconds=10, clock=lambda: clock[0])
+        self.breaker.record_failure(1.0)
+        clock[0] = 11.0
+        self.post.return_value = stream_response(sse_lines("一只", "橘猫"))
+
+        with patch.object(prompt_optimizer, "deepseek_breaker", self.breaker), redirect_stdout(io.StringIO()):
+            stream = prompt_optimizer.stream_optimized_prompt("猫")
+            self.assertEqual(next(stream)["text"], "一只")
+            stream.close()
+
+        # 没有看到上游完成，熔断器保持半开，下一个请求仍可作为探测发出。
+        self.assertEqual(self.breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertTrue(self.breaker.allow_request())
+
+
+class PackedResponseTests(unittest.TestCase):
+    def test_invalid_entries_become_none(self):
+        text = """```json
+[{"id": 0, "prompt": " 橘猫 "}, {"id": 0, "prompt": "重复"}, {"id": true, "prompt": "布尔"},
+ {"id": 2, "prompt": ""}, {"id": 9, "prompt": "越界"}, "字符串", {"id": 3, "prompt": "小狗"}]
+```"""
+        self.assertEqual(prompt_optimizer.parse_packed_response(text, 4), ["橘猫", None, None, "小狗"])
+
+    def test_unparseable_response(self):
+        self.assertEqual(prompt_optimizer.parse_packed_response("抱歉，无法完成", 2), [None, None])
+        self.assertEqual(prompt_optimizer.parse_packed_response('[{"id": 0,', 1), [None])
+
+    def test_request_round_trip(self):
+        packed = json.loads(prompt_optimizer.build_packed_request(["原始描述: 猫", "原始描述: 狗"]))
+        self.assertEqual(packed, [{"id": 0, "request": "原始描述: 猫"}, {"id": 1, "request": "原始描述: 狗"}])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -20,6 +20,29 @@ class TaskManagerTests(unittest.TestCase):
         self.assertIsNotNone(second_id)
         self.assertIsNone(active_id)
 
+    def test_queue_admits_up_to_max_active_tasks(self):
+        manager = TaskManager(max_active_tasks=2)
+        first_id, _ = manager.create_task()
+        second_id, _ = manager.create_task()
+        self.assertIsNotNone(second_id)
+
+        third_id, active_id = manager.create_task()
+        self.assertIsNone(third_id)
+        self.assertEqual(active_id, first_id)
+
+        manager.finish_worker(first_id)
+        third_id, _ = manager.create_task()
+        self.assertIsNotNone(third_id)
+        self.assertEqual(manager.active_count(), 2)
+
+    def test_discarded_task_frees_its_slot(self):
+        manager = TaskManager()
+        task_id, _ = manager.create_task()
+        manager.discard(task_id)
+        self.assertIsNone(manager.get(task_id))
+        self.assertEqual(manager.active_count(), 0)
+        self.assertIsNotNone(manager.create_task()[0])
+
     def test_cancel_flag_cannot_be_overwritten_by_worker(self):
         manager = TaskManager()
         task_id, _ = manager.create_task()
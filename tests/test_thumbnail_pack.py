@@ -0,0 +1,143 @@
+import io
+import shutil
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from pathlib import Path
+from unittest.mock import patch
+
+from PIL import Image
+
+import image_processing
+import thumbnail_pack
+from image_processing import create_gallery_thumbnail, get_thumbnail_path
+from thumbnail_pack import PACK_FILENAME, ThumbnailPack, migrate_thumbnails, thumbnails_ready
+from thumbnail_service import find_missing_thumbnails
+
+
+SIZES = (256, 640)
+
+
+def make_item(gallery, name):
+    folder = Path(gallery) / name
+    folder.mkdir()
+    image_path = folder / f"{name}.png"
+    Image.new("RGB", (800, 600), "orange").save(image_path)
+    create_gallery_thumbnail(image_path, image_path, sizes=list(SIZES))
+    return image_path
+
+
+class ThumbnailPackTests(unittest.TestCase):
+    def setUp(self):
+        self.gallery = Path(tempfile.mkdtemp())
+        self.pack = ThumbnailPack(self.gallery / PACK_FILENAME)
+
+    def tearDown(self):
+        self.pack.close()
+        shutil.rmtree(self.gallery, ignore_errors=True)
+
+    def config(self, store):
+        values = {"gallery_dir": str(self.gallery), "thumbnail_store": store, "thumbnail_sizes": list(SIZES)}
+        return patch.object(thumbnail_pack.config_manager, "get", side_effect=lambda key, default=None: values.get(key, default))
+
+    def test_put_lookup_and_range_read(self):
+        self.assertEqual(self.pack.put_many([("cat", 256, b"0123456789")]), 1)
+        entry = self.pack.lookup("cat", 256)
+        self.assertEqual(entry.length, 10)
+        self.assertEqual(self.pack.read(entry), b"0123456789")
+        self.assertEqual(self.pack.read(entry, 2, 5), b"234")
+        self.assertEqual(self.pack.read(entry, 8, 100), b"89")
+        self.assertEqual(self.pack.read(entry, 10), b"")
+        self.assertIsNone(self.pack.lookup("cat", 640))
+
+        # 重新写入同一尺寸会替换内容，ETag 随内容变化。
+        self.pack.put_many([("cat", 256, b"new")])
+        replaced = self.pack.lookup("cat", 256)
+        self.assertNotEqual(replaced.etag, entry.etag)
+        self.assertEqual(self.pack.read(replaced), b"new")
+        self.assertTrue(self.pack.has_sizes("cat", [256]))
+        self.assertFalse(self.pack.has_sizes("cat", SIZES))
+
+    def test_remove_and_compact_return_space(self):
+        self.pack.put_many((f"item{number}", 256, bytes(20000)) for number in range(50))
+        self.pack.put_many([("keep", 256, b"keep")])
+        size = self.pack.stats()["file_bytes"]
+
+        self.assertEqual(self.pack.remove("item0"), 1)
+        self.assertEqual(self.pack.prune({"keep"}), 49)
+        self.assertGreater(self.pack.stats()["free_bytes"], 0)
+        self.assertGreater(self.pack.compact(), 0)
+        stats = self.pack.stats()
+        self.assertEqual((stats["count"], stats["free_bytes"]), (1, 0))
+        self.assertLess(stats["file_bytes"], size)
+
+    def test_migrates_to_pack_and_back(self):
+        images = [make_item(self.gallery, f"item{number}") for number in range(3)]
+        originals = {size: get_thumbnail_path(images[0], size).read_bytes() for size in SIZES}
+
+        with self.config("pack"):
+            self.assertEqual(migrate_thumbnails(self.gallery, self.pack, batch_size=2), {"folders": 3, "thumbnails": 6})
+            self.assertFalse(any(get_thumbnail_path(images[0], size).exists() for size in SIZES))
+            self.assertEqual(self.pack.read(self.pack.lookup("item0", 640)), originals[640])
+
+            # 第二次执行没有剩余的缩略图文件。
+            self.assertEqual(migrate_thumbnails(self.gallery, self.pack), {"folders": 0, "thumbnails": 0})
+
+            shutil.rmtree(images[2].parent)
+            self.assertEqual(migrate_thumbnails(self.gallery, self.pack, target="files"), {"folders": 2, "thumbnails": 4})
+        self.assertEqual({size: get_thumbnail_path(images[0], size).read_bytes() for size in SIZES}, originals)
+        self.assertEqual(self.pack.stats()["count"], 0)
+
+    def test_skips_thumbnails_removed_during_migration(self):
+        images = [make_item(self.gallery, f"item{number}") for number in range(2)]
+        list_loose = thumbnail_pack.loose_thumbnails
+        vanishing = {"item0"}
+
+        def list_then_delete(folder, image_name, sizes):
+            # 模拟缩略图在列出之后、读取之前被删除（作品被删除或缩略图正在重新生成）。
+            files = list_loose(folder, image_name, sizes)
+            if folder.name in vanishing:
+                files[0][1].unlink()
+            return files
+
+        with self.config("pack"), patch.object(thumbnail_pack, "loose_thumbnails", list_then_delete):
+            self.assertEqual(migrate_thumbnails(self.gallery, self.pack), {"folders": 2, "thumbnails": 3})
+            self.assertEqual(self.pack.sizes_by_folder(), {"item0": {640}, "item1": set(SIZES)})
+
+            self.pack.remove("item1")
+            create_gallery_thumbnail(images[1], images[1], sizes=list(SIZES))
+            vanishing = {"item1"}
+            self.assertEqual(thumbnail_pack.pack_folder(self.pack, images[1].parent, images[1].name), 1)
+        self.assertEqual(self.pack.sizes_by_folder(), {"item0": {640}, "item1": {640}})
+
+    def test_pack_mode_counts_packed_sizes_as_present(self):
+        packed = make_item(self.gallery, "packed")
+        loose = make_item(self.gallery, "loose")
+        get_thumbnail_path(loose, 640).unlink()
+
+        with self.config("pack"), patch.object(thumbnail_pack, "get_thumbnail_pack", return_value=self.pack), \
+                patch("thumbnail_service.get_thumbnail_store", return_value="pack"), \
+                patch("thumbnail_service.get_thumbnail_pack", return_value=self.pack):
+            thumbnail_pack.store_thumbnails(packed)
+            self.assertFalse(get_thumbnail_path(packed, 256).exists())
+            self.assertTrue(thumbnails_ready(packed, SIZES))
+            self.assertFalse(thumbnails_ready(loose, SIZES))
+            self.assertEqual(find_missing_thumbnails(self.gallery, SIZES), [loose])
+
+        with self.config("files"):
+            self.assertFalse(thumbnails_ready(packed, SIZES))
+
+    def test_save_to_gallery_packs_new_thumbnails(self):
+        image = Image.new("RGB", (64, 64), "red")
+        # 两个模块共用同一个 config_manager，一次替换即可。
+        with self.config("pack"), patch.object(thumbnail_pack, "get_thumbnail_pack", return_value=self.pack), \
+                redirect_stdout(io.StringIO()):
+            saved = image_processing.save_to_gallery(image, "red.png", "红色", 64, 64, 4, 1.0, "basic")
+            image_processing.get_gallery_index().close()
+
+        self.assertEqual([path.name for path in saved.parent.iterdir() if "_thumb_" in path.name], [])
+        self.assertTrue(self.pack.has_sizes(saved.parent.name, SIZES))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,101 @@
+import io
+import multiprocessing
+import os
+import shutil
+import tempfile
+import unittest
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import redirect_stdout
+from pathlib import Path
+from unittest.mock import patch
+
+from PIL import Image
+
+from image_processing import get_thumbnail_path
+from thumbnail_service import ThumbnailService, find_missing_thumbnails
+
+
+def make_image(gallery, name, size=(800, 600)):
+    folder = Path(gallery) / name
+    folder.mkdir()
+    image_path = folder / f"{name}.png"
+    Image.new("RGB", size, "orange").save(image_path)
+    return image_path
+
+
+class ThumbnailServiceTests(unittest.TestCase):
+    def setUp(self):
+        self.gallery = tempfile.mkdtemp()
+        self.service = ThumbnailService(workers=2)
+
+    def tearDown(self):
+        self.service.close()
+        shutil.rmtree(self.gallery, ignore_errors=True)
+
+    def test_concurrent_requests_share_one_job(self):
+        image_path = make_image(self.gallery, "cat", size=(3000, 2000))
+
+        first = self.service.submit(image_path)
+        second = self.service.submit(str(image_path))
+        self.assertIs(first, second)
+        self.assertEqual(first.result(timeout=30), str(get_thumbnail_path(image_path)))
+        with Image.open(get_thumbnail_path(image_path)) as thumbnail:
+            self.assertLessEqual(max(thumbnail.size), 640)
+
+        # 缩略图已存在时不再提交任务。
+        done = self.service.submit(image_path)
+        self.assertTrue(done.done())
+        self.assertEqual(self.service.pending_count, 0)
+
+    def test_pregenerates_missing_thumbnails_with_progress(self):
+        for index in range(6):
+            make_image(self.gallery, f"item{index}")
+        broken = Path(self.gallery) / "broken"
+        broken.mkdir()
+        (broken / "broken.png").write_bytes(b"not a png")
+        (Path(self.gallery) / ".hidden").mkdir()
+        self.assertEqual(len(find_missing_thumbnails(self.gallery)), 7)
+
+        progress = []
+        with redirect_stdout(io.StringIO()):
+            result = self.service.pregenerate(self.gallery, progress=lambda done, total: progress.append((done, total)))
+
+        self.assertEqual(result, {"total": 7, "generated": 6, "failed": 1})
+        self.assertEqual(progress[-1], (7, 7))
+        self.assertEqual(len(progress), 7)
+        self.assertEqual(find_missing_thumbnails(self.gallery), [broken / "broken.png"])
+
+    def test_backfills_newly_configured_sizes(self):
+        image_path = make_image(self.gallery, "cat")
+        self.service.submit(image_path).result(timeout=30)
+        self.assertEqual(find_missing_thumbnails(self.gallery), [])
+
+        with patch("image_processing.config_manager.get", return_value=[320]):
+            self.assertEqual(find_missing_thumbnails(self.gallery), [image_path])
+            self.assertEqual(self.service.pregenerate(self.gallery)["generated"], 1)
+        with Image.open(get_thumbnail_path(image_path, 320)) as thumbnail:
+            self.assertEqual(thumbnail.size, (320, 240))
+
+    def test_rebuilds_broken_pool_without_forking_the_threaded_process(self):
+        self.service.start()
+        crash = self.service._executor.submit(os._exit, 1)
+        with self.assertRaises(BrokenProcessPool):
+            crash.result(timeout=30)
+
+        image_path = make_image(self.gallery, "fox")
+        self.assertEqual(self.service.submit(image_path).result(timeout=60), str(get_thumbnail_path(image_path)))
+        if "forkserver" in multiprocessing.get_all_start_methods():
+            self.assertEqual(self.service._executor._mp_context.get_start_method(), "forkserver")
+
+    def test_background_pregeneration_reports_progress(self):
+        make_image(self.gallery, "dog")
+        with redirect_stdout(io.StringIO()):
+            self.assertTrue(self.service.start_pregeneration(self.gallery))
+            self.service._job_thread.join(timeout=30)
+        self.assertEqual(
+            self.service.progress, {"running": False, "total": 1, "done": 1, "generated": 1, "failed": 0}
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,388 @@
+"""
+缩略图打包存储模块
+把画廊缩略图存入一个 SQLite 文件（每张一行 BLOB），代替作品目录中的多个小文件：
+画廊翻页只需按 (作品目录名, 尺寸) 查表，不再为每张卡片查找目录、打开文件；支持按字节范围读取，删除后可回收空间
+"""
+
+import argparse
+import datetime
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple, Union
+
+from config_manager import config_manager
+from gallery_layout import iter_item_folders, resolve_folder
+from gallery_metadata import find_gallery_image
+from image_processing import get_thumbnail_path, get_thumbnail_sizes
+
+
+PACK_FILENAME = ".thumbnails.sqlite3"
+THUMBNAIL_STORES = ("files", "pack")
+
+
+def get_thumbnail_store() -> str:
+    """读取缩略图存储方式；配置无效时使用 files。"""
+    store = config_manager.get("thumbnail_store", "files")
+    return store if store in THUMBNAIL_STORES else "files"
+
+
+@dataclass(frozen=True)
+class PackedThumbnail:
+    """打包存储中一张缩略图的位置与校验信息，读取内容前即可用于条件请求。"""
+    id: int
+    length: int
+    etag: str
+    created: float
+
+    @property
+    def last_modified(self) -> datetime.datetime:
+        return datetime.datetime.fromtimestamp(int(self.created), datetime.timezone.utc)
+
+
+class ThumbnailPack:
+    """SQLite 缩略图存储；写入按批提交，删除留下的空闲页由 compact() 逐步归还给文件系统。"""
+
+    def __init__(self, db_path: Union[str, Path]):
+        """
+        Args:
+            db_path: 存储文件路径，默认放在画廊目录中（隐藏文件，不会作为作品或静态文件对外提供）
+        """
+        self.db_path = Path(db_path)
+        self._lock = threading.RLock()
+        self._connection = None
+
+    def _get_connection(self) -> sqlite3.Connection:
+        if self._connection is None:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            connection = sqlite3.connect(str(self.db_path), check_same_thread=False)
+            # auto_vacuum 只能在建表前设置；INCREMENTAL 让删除后的空闲页可以分批截断，不必整库 VACUUM。
+            connection.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS thumbnails ("
+                "id INTEGER PRIMARY KEY, folder TEXT NOT NULL, size INTEGER NOT NULL, "
+                "length INTEGER NOT NULL, etag TEXT NOT NULL, created REAL NOT NULL, data BLOB NOT NULL, "
+                "UNIQUE(folder, size))"
+            )
+            connection.commit()
+            self._connection = connection
+        return self._connection
+
+    def put_many(self, rows: Iterable[Tuple[str, int, bytes]]) -> int:
+        """在一个事务中写入 (作品目录名, 尺寸, WebP 数据)，已存在的同尺寸缩略图会被替换。"""
+        now = time.time()
+        values = [
+            (folder, size, len(data), hashlib.blake2b(data, digest_size=8).hexdigest(), now, sqlite3.Binary(data))
+            for folder, size, data in rows
+        ]
+        if not values:
+            return 0
+        with self._lock:
+            connection = self._get_connection()
+            connection.executemany(
+                "INSERT INTO thumbnails (folder, size, length, etag, created, data) VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(folder, size) DO UPDATE SET length = excluded.length, etag = excluded.etag, "
+                "created = excluded.created, data = excluded.data",
+                values,
+            )
+            connection.commit()
+        return len(values)
+
+    def lookup(self, folder_name: str, size: int) -> Optional[PackedThumbnail]:
+        with self._lock:
+            row = self._get_connection().execute(
+                "SELECT id, length, etag, created FROM thumbnails WHERE folder = ? AND size = ?", (folder_name, size)
+            ).fetchone()
+        return PackedThumbnail(*row) if row is not None else None
+
+    def read(self, entry: PackedThumbnail, start: int = 0, stop: Optional[int] = None) -> bytes:
+        """读取 [start, stop) 字节；Python 3.11 起用增量 BLOB I/O，只读取请求的部分。"""
+        stop = entry.length if stop is None else min(stop, entry.length)
+        if start >= stop:
+            return b""
+        with self._lock:
+            connection = self._get_connection()
+            if hasattr(connection, "blobopen"):
+                with connection.blobopen("thumbnails", "data", entry.id, readonly=True) as blob:
+                    blob.seek(start)
+                    return blob.read(stop - start)
+            row = connection.execute(
+                "SELECT substr(data, ?, ?) FROM thumbnails WHERE id = ?", (start + 1, stop - start, entry.id)
+            ).fetchone()
+        return bytes(row[0]) if row is not None else b""
+
+    def sizes_by_folder(self) -> Dict[str, Set[int]]:
+        sizes: Dict[str, Set[int]] = {}
+        with self._lock:
+            for folder, size in self._get_connection().execute("SELECT folder, size FROM thumbnails"):
+                sizes.setdefault(folder, set()).add(size)
+        return sizes
+
+    def has_sizes(self, folder_name: str, sizes: Iterable[int]) -> bool:
+        sizes = set(sizes)
+        with self._lock:
+            rows = self._get_connection().execute(
+                "SELECT size FROM thumbnails WHERE folder = ?", (folder_name,)
+            ).fetchall()
+        return sizes <= {size for (size,) in rows}
+
+    def remove(self, folder_name: str) -> int:
+        with self._lock:
+            connection = self._get_connection()
+            removed = connection.execute("DELETE FROM thumbnails WHERE folder = ?", (folder_name,)).rowcount
+            connection.commit()
+        return removed
+
+    def prune(self, keep: Set[str]) -> int:
+        """删除不在 keep 中的作品目录的缩略图（作品已在服务外被删除）。"""
+        with self._lock:
+            connection = self._get_connection()
+            stale = [
+                folder for (folder,) in connection.execute("SELECT DISTINCT folder FROM thumbnails")
+                if folder not in keep
+            ]
+            removed = 0
+            for folder in stale:
+                removed += connection.execute("DELETE FROM thumbnails WHERE folder = ?", (folder,)).rowcount
+            connection.commit()
+        return removed
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            connection = self._get_connection()
+            count, data_bytes = connection.execute("SELECT COUNT(*), COALESCE(SUM(length), 0) FROM thumbnails").fetchone()
+            page_size = connection.execute("PRAGMA page_size").fetchone()[0]
+            free_pages = connection.execute("PRAGMA freelist_count").fetchone()[0]
+            pages = connection.execute("PRAGMA page_count").fetchone()[0]
+        return {
+            "count": count, "data_bytes": data_bytes,
+            "file_bytes": pages * page_size, "free_bytes": free_pages * page_size,
+        }
+
+    def compact(self, max_pages: int = 0) -> int:
+        """
+        把删除留下的空闲页归还给文件系统
+
+        Args:
+            max_pages: 本次最多回收的页数，0 表示全部；服务运行时可小批量多次调用，避免长时间占用写锁
+
+        Returns:
+            回收的字节数
+        """
+        with self._lock:
+            connection = self._get_connection()
+            before = self.stats()["free_bytes"]
+            # execute() 只单步执行一次（每步回收一页），executescript() 才会执行到底。
+            connection.executescript(f"PRAGMA incremental_vacuum({max(0, int(max_pages))});")
+            self.checkpoint()
+            return before - self.stats()["free_bytes"]
+
+    def checkpoint(self):
+        """把预写日志合并回主文件并截断，大批量写入后调用，日志文件不会一直占用与批次相当的空间。"""
+        with self._lock:
+            self._get_connection().execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+
+def loose_thumbnails(folder: Path, image_name: str, sizes: Iterable[int]) -> List[Tuple[int, Path]]:
+    """列出作品目录中已存在的缩略图文件 (尺寸, 路径)。"""
+    image_path = folder / image_name
+    return [(size, path) for size in sizes for path in [get_thumbnail_path(image_path, size)] if path.is_file()]
+
+
+def _read_loose(files: Iterable[Tuple[int, Path]]) -> List[Tuple[int, Path, bytes]]:
+    """读取缩略图文件 (尺寸, 路径, 内容)；列出后被删除或无法读取的文件跳过，之后再生成或迁移。"""
+    contents = []
+    for size, path in files:
+        try:
+            contents.append((size, path, path.read_bytes()))
+        except OSError:
+            continue
+    return contents
+
+
+def pack_folder(pack: ThumbnailPack, folder: Path, image_name: str, sizes: Optional[Iterable[int]] = None,
+                remove_loose: bool = True) -> int:
+    """把一个作品目录中的缩略图文件写入打包存储，提交后删除原文件；返回写入的张数。"""
+    contents = _read_loose(loose_thumbnails(folder, image_name, sizes or get_thumbnail_sizes()))
+    written = pack.put_many((folder.name, size, data) for size, _, data in contents)
+    if remove_loose:
+        for _, path, _ in contents:
+            path.unlink(missing_ok=True)
+    return written
+
+
+def migrate_thumbnails(gallery_dir: Union[str, Path], pack: ThumbnailPack, target: str = "pack",
+                       batch_size: int = 200, remove_loose: bool = True) -> Dict[str, int]:
+    """
+    在缩略图文件与打包存储之间迁移，可重复执行，服务运行时也可执行
+
+    Args:
+        gallery_dir: 画廊目录
+        pack: 打包存储
+        target: pack 把文件写入存储并删除文件；files 把存储中的缩略图写回作品目录并清空存储
+        batch_size: 每个事务写入的作品数
+        remove_loose: 迁移到 pack 时删除已写入的文件
+
+    Returns:
+        {"folders": 处理的作品数, "thumbnails": 迁移的缩略图张数}
+    """
+    if target not in THUMBNAIL_STORES:
+        raise ValueError(f"未知的缩略图存储方式: {target}")
+    sizes = get_thumbnail_sizes()
+    counts = {"folders": 0, "thumbnails": 0}
+    if target == "files":
+        for folder_name, folder_sizes in pack.sizes_by_folder().items():
+            folder = resolve_folder(gallery_dir, folder_name)
+            image_name = None
+            if folder is not None:
+                with os.scandir(folder) as entries:
+                    image_name = find_gallery_image(entry.name for entry in entries if entry.is_file())
+            if image_name is None:
+                pack.remove(folder_name)
+                continue
+            for size in sorted(folder_sizes):
+                entry = pack.lookup(folder_name, size)
+                target_path = get_thumbnail_path(folder / image_name, size)
+                temp_path = target_path.with_name(f".{target_path.name}.tmp")
+                temp_path.write_bytes(pack.read(entry))
+                os.replace(temp_path, target_path)
+                counts["thumbnails"] += 1
+            pack.remove(folder_name)
+            counts["folders"] += 1
+        pack.compact()
+        return counts
+
+    batch: List[Tuple[Path, str, List[Tuple[int, Path]]]] = []
+
+    def flush():
+        loaded = [(folder, _read_loose(files)) for folder, _, files in batch]
+        counts["thumbnails"] += pack.put_many(
+            (folder.name, size, data) for folder, contents in loaded for size, _, data in contents
+        )
+        counts["folders"] += len(batch)
+        if remove_loose:
+            for _, contents in loaded:
+                for _, path, _ in contents:
+                    path.unlink(missing_ok=True)
+        batch.clear()
+
+    for entry in iter_item_folders(gallery_dir):
+        try:
+            with os.scandir(entry.path) as items:
+                names = [item.name for item in items if item.is_file()]
+        except OSError:
+            continue
+        image_name = find_gallery_image(names)
+        if not image_name:
+            continue
+        files = loose_thumbnails(Path(entry.path), image_name, sizes)
+        if files:
+            batch.append((Path(entry.path), image_name, files))
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+    pack.checkpoint()
+    return counts
+
+
+def forget_thumbnails(folder_name: str) -> int:
+    """作品被删除时清除其打包缩略图；从未创建过打包存储时不做任何事。"""
+    pack = get_thumbnail_pack()
+    return pack.remove(folder_name) if pack.db_path.exists() else 0
+
+
+def thumbnails_ready(image_path: Union[str, Path], sizes: Iterable[int]) -> bool:
+    """各尺寸缩略图是否都已存在（缩略图文件或打包存储）。"""
+    image_path = Path(image_path)
+    sizes = tuple(sizes)
+    if all(get_thumbnail_path(image_path, size).exists() for size in sizes):
+        return True
+    return get_thumbnail_store() == "pack" and get_thumbnail_pack().has_sizes(image_path.parent.name, sizes)
+
+
+def load_thumbnail(image_path: Union[str, Path], size: int) -> Optional[bytes]:
+    """读取一张缩略图的内容（启用打包存储时先查存储，再查文件）；不存在时返回 None。"""
+    image_path = Path(image_path)
+    if get_thumbnail_store() == "pack":
+        pack = get_thumbnail_pack()
+        entry = pack.lookup(image_path.parent.name, size)
+        if entry is not None:
+            return pack.read(entry)
+    try:
+        return get_thumbnail_path(image_path, size).read_bytes()
+    except OSError:
+        return None
+
+
+def store_thumbnails(image_path: Union[str, Path]) -> int:
+    """缩略图生成后调用：启用打包存储时把该作品的缩略图文件移入存储，否则不做任何事。"""
+    if get_thumbnail_store() != "pack":
+        return 0
+    image_path = Path(image_path)
+    return pack_folder(get_thumbnail_pack(), image_path.parent, image_path.name)
+
+
+_default_pack: Optional[ThumbnailPack] = None
+_default_pack_lock = threading.Lock()
+
+
+def get_thumbnail_pack() -> ThumbnailPack:
+    """获取当前画廊目录对应的共享打包存储；画廊目录配置变化时重新打开。"""
+    global _default_pack
+    db_path = Path(config_manager.get("gallery_dir", "gallery")).resolve() / PACK_FILENAME
+    with _default_pack_lock:
+        if _default_pack is None or _default_pack.db_path != db_path:
+            if _default_pack is not None:
+                _default_pack.close()
+            _default_pack = ThumbnailPack(db_path)
+        return _default_pack
+
+
+def main():
+    parser = argparse.ArgumentParser(description="管理缩略图打包存储")
+    parser.add_argument("command", choices=["status", "migrate", "compact"],
+                        help="status 查看存储大小，migrate 在文件与打包存储之间迁移，compact 清理已删除作品并回收空间")
+    parser.add_argument("--to", default="pack", choices=THUMBNAIL_STORES, help="迁移的目标存储方式")
+    parser.add_argument("--gallery-dir", default=None, help="画廊目录，默认读取配置")
+    parser.add_argument("--batch-size", type=int, default=200, help="每个事务写入的作品数")
+    parser.add_argument("--keep-files", action="store_true", help="迁移到打包存储后保留缩略图文件")
+    args = parser.parse_args()
+
+    config_manager.load_from_env()
+    gallery_dir = Path(args.gallery_dir or config_manager.get("gallery_dir", "gallery")).resolve()
+    pack = ThumbnailPack(gallery_dir / PACK_FILENAME)
+    try:
+        if args.command == "migrate":
+            result = migrate_thumbnails(
+                gallery_dir, pack, target=args.to, batch_size=args.batch_size, remove_loose=not args.keep_files,
+            )
+            print(f"✅ 迁移完成: {result['folders']} 个作品, {result['thumbnails']} 张缩略图")
+            if args.to == "pack" and get_thumbnail_store() != "pack":
+                print("ℹ️ 请把配置 thumbnail_store 设为 pack，新作品的缩略图才会写入打包存储")
+        elif args.command == "compact":
+            removed = pack.prune({entry.name for entry in iter_item_folders(gallery_dir)})
+            print(f"🧹 清理已删除作品的缩略图 {removed} 张，回收 {pack.compact() / 1024 / 1024:.1f} MB")
+        stats = pack.stats()
+        print(
+            f"📦 {pack.db_path}: {stats['count']} 张缩略图, 数据 {stats['data_bytes'] / 1024 / 1024:.1f} MB, "
+            f"文件 {stats['file_bytes'] / 1024 / 1024:.1f} MB（空闲 {stats['free_bytes'] / 1024 / 1024:.1f} MB）"
+        )
+    finally:
+        pack.close()
+
+
+if __name__ == "__main__":
+    main()
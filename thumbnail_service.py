@@ -0,0 +1,250 @@
+"""
+缩略图服务模块
+在独立进程池中生成画廊缩略图：同一张图的并发请求合并为一个任务，请求处理函数只负责排队
+"""
+
+import argparse
+import multiprocessing
+import os
+import threading
+from concurrent.futures import FIRST_COMPLETED, Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+from config_manager import config_manager
+from gallery_layout import iter_item_folders
+from gallery_metadata import find_gallery_image
+from image_processing import create_gallery_thumbnail, get_thumbnail_path, get_thumbnail_sizes
+from thumbnail_pack import get_thumbnail_pack, get_thumbnail_store, store_thumbnails, thumbnails_ready
+
+
+def render_thumbnail(image_path: str, sizes: Tuple[int, ...]) -> str:
+    """在工作进程中生成各尺寸缩略图，返回默认尺寸缩略图的路径。"""
+    return str(create_gallery_thumbnail(image_path, image_path, sizes=sizes))
+
+
+def find_missing_thumbnails(gallery_dir: Union[str, Path], sizes: Optional[Tuple[int, ...]] = None) -> List[Path]:
+    """列出画廊中缺少任一尺寸缩略图的原图，用于补齐新增的尺寸。"""
+    sizes = sizes or get_thumbnail_sizes()
+    packed = get_thumbnail_pack().sizes_by_folder() if get_thumbnail_store() == "pack" else {}
+    missing = []
+    for folder in iter_item_folders(gallery_dir):
+        try:
+            names = {entry.name for entry in os.scandir(folder.path) if entry.is_file()}
+        except OSError:
+            continue
+        image_name = find_gallery_image(names)
+        present = packed.get(folder.name, set())
+        if image_name and any(
+            size not in present and get_thumbnail_path(image_name, size).name not in names for size in sizes
+        ):
+            missing.append(Path(folder.path) / image_name)
+    return sorted(missing)
+
+
+class ThumbnailService:
+    """进程池缩略图服务；按原图路径去重，同一张图同时只会有一个生成任务。"""
+
+    def __init__(self, workers: int = 2):
+        """
+        初始化缩略图服务
+
+        Args:
+            workers: 工作进程数量；进程池在第一次提交任务或调用 start() 时才启动
+        """
+        self.workers = max(1, workers)
+        self._lock = threading.Lock()
+        self._executor: Optional[Executor] = None
+        self._pending: Dict[Path, Future] = {}
+        self._job_thread: Optional[threading.Thread] = None
+        self._rebuilt = False
+        self._progress = {"running": False, "total": 0, "done": 0, "generated": 0, "failed": 0}
+
+    @property
+    def progress(self) -> Dict[str, object]:
+        """后台预生成的进度快照；返回副本，序列化时不会与后台线程的更新交错。"""
+        with self._lock:
+            return dict(self._progress)
+
+    def _update_progress(self, **values):
+        with self._lock:
+            self._progress.update(values)
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            # spawn 方式的子进程会重新执行主模块（flask_app 会导入 torch 并启动生成线程），
+            # 因此只在支持 fork 的平台使用进程池，其他平台退回线程池（Pillow 缩放与编码时释放 GIL）。
+            # 进程池损坏后重建时服务早已启动了多个线程，此时 fork 可能复制出被其他线程持有的锁，
+            # 改用 forkserver：工作进程由单线程的服务进程派生，主模块在服务进程中只导入一次。
+            methods = multiprocessing.get_all_start_methods()
+            if "fork" in methods and not self._rebuilt:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context("fork"),
+                )
+            elif "fork" in methods and "forkserver" in methods:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context("forkserver"),
+                )
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="thumbnail")
+        return self._executor
+
+    def start(self):
+        """提前启动工作进程；应在服务启动早期调用，此时进程中的后台线程最少。"""
+        with self._lock:
+            executor = self._get_executor()
+        executor.submit(os.getpid).result()
+
+    def submit(self, image_path: Union[str, Path]) -> Future:
+        """
+        为原图排队生成全部尺寸的缩略图
+
+        Returns:
+            结果为默认尺寸缩略图路径的 Future；缩略图都已存在时直接返回已完成的 Future，
+            同一张图正在生成时返回同一个 Future
+        """
+        image_path = Path(image_path)
+        sizes = get_thumbnail_sizes()
+        with self._lock:
+            future = self._pending.get(image_path)
+            if future is not None:
+                return future
+            if thumbnails_ready(image_path, sizes):
+                future = Future()
+                future.set_result(str(get_thumbnail_path(image_path)))
+                return future
+            try:
+                future = self._get_executor().submit(render_thumbnail, str(image_path), sizes)
+            except BrokenProcessPool:
+                # 工作进程异常退出后进程池不可再用，换一个新的。
+                self._executor, self._rebuilt = None, True
+                future = self._get_executor().submit(render_thumbnail, str(image_path), sizes)
+            self._pending[image_path] = future
+        future.add_done_callback(lambda done: self._forget(image_path, done))
+        return future
+
+    def _forget(self, image_path: Path, future: Future):
+        if not future.cancelled() and future.exception() is None:
+            # 工作进程只写文件；打包存储由主进程写入，避免多个进程共用 SQLite 连接。
+            try:
+                store_thumbnails(image_path)
+            except Exception as error:
+                print(f"⚠️ 缩略图写入打包存储失败 {image_path}: {error}")
+        with self._lock:
+            if self._pending.get(image_path) is future:
+                del self._pending[image_path]
+        if not future.cancelled() and future.exception() is not None:
+            print(f"⚠️ 无法生成缩略图 {image_path}: {future.exception()}")
+
+    @property
+    def pending_count(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+    def pregenerate(self, gallery_dir: Union[str, Path],
+                    progress: Optional[Callable[[int, int], None]] = None) -> Dict[str, int]:
+        """
+        为画廊中缺少缩略图（含新增尺寸）的作品生成缩略图
+
+        同时排队的任务数限制为工作进程数的 4 倍，大画廊也不会一次塞满任务队列。
+
+        Args:
+            gallery_dir: 画廊目录
+            progress: 每完成一张图调用一次 progress(已完成数, 总数)
+
+        Returns:
+            {"total": 缺少缩略图的作品数, "generated": 成功数, "failed": 失败数}
+        """
+        paths = find_missing_thumbnails(gallery_dir)
+        total = len(paths)
+        counts = {"total": total, "generated": 0, "failed": 0}
+        window = self.workers * 4
+        in_flight = set()
+        queued = iter(paths)
+        done = 0
+        while True:
+            for image_path in queued:
+                in_flight.add(self.submit(image_path))
+                if len(in_flight) >= window:
+                    break
+            if not in_flight:
+                return counts
+            finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in finished:
+                counts["failed" if future.exception() is not None else "generated"] += 1
+                done += 1
+                if progress:
+                    progress(done, total)
+
+    def start_pregeneration(self, gallery_dir: Union[str, Path]) -> bool:
+        """
+        在后台线程中预生成缩略图，进度可通过 self.progress 查询
+
+        Returns:
+            已有预生成在运行时返回 False
+        """
+        with self._lock:
+            if self._progress["running"]:
+                return False
+            self._progress = {"running": True, "total": 0, "done": 0, "generated": 0, "failed": 0}
+
+        def run():
+            try:
+                result = self.pregenerate(gallery_dir, progress=lambda done, total: self._update_progress(
+                    done=done, total=total,
+                ))
+                self._update_progress(**result, done=result["total"])
+                print(f"✅ 缩略图预生成完成: {result}")
+            except Exception as error:
+                print(f"❌ 缩略图预生成失败: {error}")
+            finally:
+                self._update_progress(running=False)
+
+        self._job_thread = threading.Thread(target=run, name="thumbnail-pregenerate", daemon=True)
+        self._job_thread.start()
+        return True
+
+    def close(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+_default_service: Optional[ThumbnailService] = None
+_default_service_lock = threading.Lock()
+
+
+def get_thumbnail_service() -> ThumbnailService:
+    """获取进程内共享的缩略图服务。"""
+    global _default_service
+    with _default_service_lock:
+        if _default_service is None:
+            _default_service = ThumbnailService(workers=int(config_manager.get("thumbnail_workers", 2)))
+        return _default_service
+
+
+def main():
+    parser = argparse.ArgumentParser(description="为画廊中缺少缩略图的作品批量生成缩略图")
+    parser.add_argument("--gallery-dir", default=None, help="画廊目录，默认读取配置")
+    parser.add_argument("--workers", type=int, default=None, help="工作进程数，默认读取配置")
+    args = parser.parse_args()
+
+    config_manager.load_from_env()
+    gallery_dir = Path(args.gallery_dir or config_manager.get("gallery_dir", "gallery")).resolve()
+    service = ThumbnailService(workers=args.workers or int(config_manager.get("thumbnail_workers", 2)))
+
+    def report(done, total):
+        if done % max(1, total // 20) == 0 or done == total:
+            print(f"🖼️ 缩略图进度: {done}/{total} ({done * 100 // total}%)")
+
+    try:
+        result = service.pregenerate(gallery_dir, progress=report)
+    finally:
+        service.close()
+    print(f"✅ 缩略图预生成完成: 生成 {result['generated']} 张, 失败 {result['failed']} 张")
+
+
+if __name__ == "__main__":
+    main()
@@ -34,7 +34,7 @@ def ensure_directory(directory: Union[str, Path]) -> Path:
     return dir_path
 
 
-def validate_file_extension(filename: str, allowed_extensions: Tuple[str, ...] = ('.png', '.jpg', '.jpeg')) -> str:
+def validate_file_extension(filename: str, allowed_extensions: Tuple[str, ...] = ('.png', '.jpg', '.jpeg', '.webp')) -> str:
     """
     验证文件扩展名，如果无效则添加默认扩展名
 